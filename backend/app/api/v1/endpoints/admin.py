@@ -21,6 +21,7 @@ from app.models.points import (
     UserItem, ApiKeyCode, ExchangeItem, ExchangeRecord,
     ScratchCard
 )
+from app.services.game_config_cache import LOTTERY, invalidate_game_config
 
 router = APIRouter()
 
@@ -733,6 +734,7 @@ async def create_lottery_config(
     db.add(config)
     await db.commit()
     await db.refresh(config)
+    await invalidate_game_config(LOTTERY)
 
     return {
         "success": True,
@@ -771,6 +773,7 @@ async def update_lottery_config(
         config.is_active = request.is_active
 
     await db.commit()
+    await invalidate_game_config(LOTTERY)
     return {"success": True}
 
 
@@ -797,6 +800,7 @@ async def create_prize(
     db.add(prize)
     await db.commit()
     await db.refresh(prize)
+    await invalidate_game_config(LOTTERY)
 
     return {"success": True, "id": prize.id}
 
@@ -836,6 +840,7 @@ async def update_prize(
         prize.is_enabled = request.is_enabled
 
     await db.commit()
+    await invalidate_game_config(LOTTERY)
     return {"success": True}
 
 
@@ -852,6 +857,7 @@ async def delete_prize(
         delete(LotteryPrize).where(LotteryPrize.id == prize_id)
     )
     await db.commit()
+    await invalidate_game_config(LOTTERY)
     return {"success": True}
 
 
@@ -1079,7 +1085,7 @@ async def get_apikey_monitor_summary(
     require_admin(current_user)
 
     from app.models.registration import Registration, RegistrationStatus
-    from app.services.quota_service import quota_service
+    from app.services.quota_snapshot import get_quota_map_from_snapshot
     from sqlalchemy.orm import selectinload
 
     # 获取所有有 API Key 的报名
@@ -1107,9 +1113,9 @@ async def get_apikey_monitor_summary(
             "active_count": 0,
         }
 
-    # 批量查询额度
+    # 读取额度快照（缺失部分实时查询）
     api_keys = [(r.id, r.api_key) for r in registrations]
-    quota_map = await quota_service.batch_get_quota(api_keys)
+    quota_map, freshness = await get_quota_map_from_snapshot(api_keys)
 
     # 构建结果
     items = []
@@ -1176,9 +1182,65 @@ async def get_apikey_monitor_summary(
         "active_count": active_count,
         "success_count": len([i for i in items if i["query_status"] == "ok"]),
         "error_count": len([i for i in items if i["query_status"] == "error"]),
+        "snapshot": freshness,
     }
 
 
+@router.get("/apikey-monitor/cache-stats")
+async def get_apikey_monitor_cache_stats(
+    reset: bool = Query(False, description="读取后清空统计"),
+    current_user: User = Depends(get_current_user),
+):
+    """获取额度/在线状态缓存命中统计（当前进程）"""
+    require_admin(current_user)
+
+    from app.services.quota_service import quota_service
+
+    stats = quota_service.get_cache_stats()
+    if reset:
+        quota_service.reset_cache_stats()
+    return stats
+
+
+@router.get("/worker/queue-stats")
+async def get_worker_queue_stats(
+    dead_letters: int = Query(20, ge=0, le=200, description="返回最近的死信条数"),
+    current_user: User = Depends(get_current_user),
+):
+    """获取部署队列积压、各阶段耗时分布与最近死信"""
+    require_admin(current_user)
+
+    from app.services.worker_queue import get_worker_queue_stats as load_worker_queue_stats
+
+    return await load_worker_queue_stats(dead_letter_limit=dead_letters)
+
+
+@router.get("/contest-cache/stats")
+async def get_contest_cache_stats(
+    current_user: User = Depends(get_current_user),
+):
+    """获取比赛元数据缓存命中率（全部进程累计）"""
+    require_admin(current_user)
+
+    from app.services.contest_cache import get_contest_cache_stats as load_contest_cache_stats
+
+    return await load_contest_cache_stats()
+
+
+@router.get("/scheduler/status")
+async def get_scheduler_status(
+    history: int = Query(10, ge=1, le=100, description="每个任务返回的执行记录条数"),
+    current_user: User = Depends(get_current_user),
+):
+    """获取定时任务领导者、执行中的任务与最近执行记录"""
+    require_admin(current_user)
+
+    from app.services.scheduler import JOB_IDS
+    from app.services.scheduler_coordination import get_scheduler_status as load_scheduler_status
+
+    return await load_scheduler_status(list(JOB_IDS), history_limit=history)
+
+
 @router.get("/apikey-monitor/{registration_id}/logs")
 async def get_apikey_monitor_logs(
     registration_id: int,
@@ -1189,7 +1251,7 @@ async def get_apikey_monitor_logs(
     """获取单个参赛者的 API 调用日志"""
     require_admin(current_user)
 
-    import httpx
+    from app.core.http_client import QUOTA, get_http_client
     from app.models.registration import Registration
     from app.core.config import settings
 
@@ -1215,51 +1277,52 @@ async def get_apikey_monitor_logs(
     url = f"{base_url.rstrip('/')}/api/log/token"
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(
-                url,
-                params={
-                    "key": registration.api_key,
-                    "p": 0,
-                    "order": "desc",
-                },
-                headers={"Accept": "application/json"}
-            )
-
-            if resp.status_code != 200:
-                return {
-                    "registration_id": registration_id,
-                    "logs": [],
-                    "status": "error",
-                    "message": f"日志查询失败: {resp.status_code}",
-                }
-
-            data = resp.json()
-            if not data.get("success"):
-                return {
-                    "registration_id": registration_id,
-                    "logs": [],
-                    "status": "error",
-                    "message": "日志查询失败",
-                }
-
-            logs = data.get("data", [])
-            if not isinstance(logs, list):
-                logs = []
+        client = get_http_client(QUOTA)
+        resp = await client.get(
+            url,
+            params={
+                "key": registration.api_key,
+                "p": 0,
+                "order": "desc",
+            },
+            headers={"Accept": "application/json"},
+            timeout=15.0,
+        )
 
-            # API 返回的数据是按时间升序排列的（最早在前）
-            # 我们需要取最后的 limit 条（最新的），然后反转顺序（最新在前）
-            recent_logs = logs[-limit:] if len(logs) > limit else logs
-            recent_logs = list(reversed(recent_logs))  # 反转，最新的在前面
+        if resp.status_code != 200:
+            return {
+                "registration_id": registration_id,
+                "logs": [],
+                "status": "error",
+                "message": f"日志查询失败: {resp.status_code}",
+            }
 
+        data = resp.json()
+        if not data.get("success"):
             return {
                 "registration_id": registration_id,
-                "title": registration.title,
-                "logs": recent_logs,
-                "total": len(logs),
-                "status": "ok",
+                "logs": [],
+                "status": "error",
+                "message": "日志查询失败",
             }
 
+        logs = data.get("data", [])
+        if not isinstance(logs, list):
+            logs = []
+
+        # API 返回的数据是按时间升序排列的（最早在前）
+        # 我们需要取最后的 limit 条（最新的），然后反转顺序（最新在前）
+        recent_logs = logs[-limit:] if len(logs) > limit else logs
+        recent_logs = list(reversed(recent_logs))  # 反转，最新的在前面
+
+        return {
+            "registration_id": registration_id,
+            "title": registration.title,
+            "logs": recent_logs,
+            "total": len(logs),
+            "status": "ok",
+        }
+
     except Exception as e:
         return {
             "registration_id": registration_id,
@@ -1278,7 +1341,7 @@ async def get_all_apikey_logs(
     """获取所有参赛者的 API 调用日志汇总"""
     require_admin(current_user)
 
-    import httpx
+    from app.core.http_client import QUOTA, get_http_client
     from app.models.registration import Registration, RegistrationStatus
     from app.core.config import settings
     from sqlalchemy.orm import selectinload
@@ -1303,43 +1366,44 @@ async def get_all_apikey_logs(
     base_url = settings.QUOTA_BASE_URLS[0] if settings.QUOTA_BASE_URLS else "https://api.ikuncode.cc"
     url = f"{base_url.rstrip('/')}/api/log/token"
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        for reg in registrations:
-            if not reg.api_key:
-                continue
-
-            try:
-                resp = await client.get(
-                    url,
-                    params={
-                        "key": reg.api_key,
-                        "p": 0,
-                        "order": "desc",
-                    },
-                    headers={"Accept": "application/json"}
-                )
+    client = get_http_client(QUOTA)
+    for reg in registrations:
+        if not reg.api_key:
+            continue
 
-                if resp.status_code == 200:
-                    data = resp.json()
-                    if data.get("success"):
-                        logs = data.get("data", [])
-                        if isinstance(logs, list):
-                            # API 返回的数据是按时间升序排列的（最早在前）
-                            # 取最后 50 条（最新的）
-                            recent_logs = logs[-50:] if len(logs) > 50 else logs
-                            # 添加用户信息到每条日志
-                            for log in recent_logs:
-                                log["_registration_id"] = reg.id
-                                log["_title"] = reg.title
-                                log["_user"] = {
-                                    "id": reg.user.id,
-                                    "username": reg.user.username,
-                                    "display_name": reg.user.display_name,
-                                    "avatar_url": reg.user.avatar_url,
-                                } if reg.user else None
-                                all_logs.append(log)
-            except Exception:
-                continue
+        try:
+            resp = await client.get(
+                url,
+                params={
+                    "key": reg.api_key,
+                    "p": 0,
+                    "order": "desc",
+                },
+                headers={"Accept": "application/json"},
+                timeout=15.0,
+            )
+
+            if resp.status_code == 200:
+                data = resp.json()
+                if data.get("success"):
+                    logs = data.get("data", [])
+                    if isinstance(logs, list):
+                        # API 返回的数据是按时间升序排列的（最早在前）
+                        # 取最后 50 条（最新的）
+                        recent_logs = logs[-50:] if len(logs) > 50 else logs
+                        # 添加用户信息到每条日志
+                        for log in recent_logs:
+                            log["_registration_id"] = reg.id
+                            log["_title"] = reg.title
+                            log["_user"] = {
+                                "id": reg.user.id,
+                                "username": reg.user.username,
+                                "display_name": reg.user.display_name,
+                                "avatar_url": reg.user.avatar_url,
+                            } if reg.user else None
+                            all_logs.append(log)
+        except Exception:
+            continue
 
     # 按时间排序
     all_logs.sort(key=lambda x: x.get("created_at", 0), reverse=True)
@@ -1526,6 +1590,8 @@ async def get_request_logs(
                     "user_agent": log.user_agent,
                     "status_code": log.status_code,
                     "response_time_ms": log.response_time_ms,
+                    "db_query_count": log.db_query_count,
+                    "db_time_ms": log.db_time_ms,
                     "error_message": log.error_message,
                     "created_at": log.created_at.isoformat() if log.created_at else None,
                 }
@@ -1691,6 +1757,57 @@ async def get_request_logs_stats(
         }
 
 
+@router.get("/request-logs/pipeline")
+async def get_request_logs_pipeline(
+    current_user: User = Depends(get_current_user),
+):
+    """
+    获取请求日志写入管道状态（当前进程）
+
+    返回缓冲区积压、已入队、已写入、丢弃、采样丢弃、写入失败等计数
+    """
+    require_admin(current_user)
+
+    from app.services.request_log_buffer import request_log_buffer
+
+    return request_log_buffer.stats()
+
+
+@router.get("/db-stats")
+async def get_db_stats(
+    order_by: str = Query("avg_queries", description="排序字段: avg_queries/max_queries/avg_db_ms/total_db_ms/requests"),
+    limit: int = Query(50, ge=1, le=500),
+    reset: bool = Query(False, description="读取后清空汇总"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    获取数据库开销统计（当前进程）
+
+    - pool: 连接池状态
+    - routes: 按路由模板汇总的 SQL 条数与耗时，平均条数高的接口通常存在 N+1 查询
+    """
+    require_admin(current_user)
+
+    from app.core.database import engine
+    from app.core.db_metrics import get_route_stats, reset_route_stats
+
+    pool = engine.pool
+    routes = get_route_stats(order_by=order_by, limit=limit)
+    if reset:
+        reset_route_stats()
+
+    return {
+        "pool": {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "status": pool.status(),
+        },
+        "routes": routes,
+    }
+
+
 # ========== 活动统计 ==========
 
 @router.get("/activity/stats")
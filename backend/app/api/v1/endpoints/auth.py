@@ -22,7 +22,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.core.database import get_db
 from app.core.rate_limit import limiter, RateLimits
-from app.core.security import create_access_token, decode_token, get_password_hash, verify_password
+from app.core.security import (
+    create_access_token,
+    get_password_hash,
+    get_request_token_payload,
+    verify_password,
+)
 from app.models.user import User
 from app.models.password_reset import PasswordResetToken
 from app.schemas.user import UserResponse
@@ -657,8 +662,7 @@ async def refresh_token(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="请先登录",
         )
-    token = auth_header.split(" ", 1)[1].strip()
-    payload = decode_token(token)
+    payload = get_request_token_payload(request)
     if not payload or "sub" not in payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
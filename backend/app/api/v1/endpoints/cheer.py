@@ -23,7 +23,7 @@ from app.models.cheer import Cheer, CheerType, CheerStats
 from app.models.user import User
 from app.models.points import UserItem
 from app.api.v1.endpoints.registration import get_current_user, get_optional_user, get_contest_or_404
-from app.services import achievement_service
+from app.services import achievement_service, leaderboard_service
 
 # 道具分数配置（给选手加的分数）
 ITEM_POINTS = {
@@ -188,7 +188,8 @@ async def cheer_registration(
         contest_start_date = contest_result.scalar_one_or_none()
 
     newly_unlocked = await achievement_service.check_and_unlock_achievements(
-        db, current_user.id, user_stats, contest_start_date
+        db, current_user.id, user_stats, contest_start_date,
+        stat_types=[achievement_service.STAT_CHEER],
     )
 
     # 确保 cheer 有 id
@@ -210,6 +211,9 @@ async def cheer_registration(
 
     await db.commit()
 
+    if registration.contest_id:
+        await leaderboard_service.record_cheer(registration.contest_id, current_user.id, item_points)
+
     response_message = "打气成功！"
     if newly_unlocked:
         response_message += f" 解锁新成就: {len(newly_unlocked)}个"
@@ -22,9 +22,12 @@ from app.models.project_favorite import ProjectFavorite
 from app.models.project_like import ProjectLike
 from app.models.project_review import ProjectReview
 from app.models.project_review_assignment import ProjectReviewAssignment
+from app.models.project_review_stats import ProjectReviewStats
 from app.models.registration import Registration, RegistrationStatus
 from app.models.submission import Submission, SubmissionStatus
 from app.models.user import User
+from app.services import contest_cache, contest_ranking
+from app.services.contest_phase import ContestLike, notify_contest_schedule_changed
 from app.services.media_service import delete_media_file, ensure_local_media_url, save_upload_file
 from app.services.security_challenge import guard_challenge
 from app.schemas.review_center import ReviewStatsResponse
@@ -203,7 +206,7 @@ def require_admin(user: User) -> None:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="需要管理员权限")
 
 
-def ensure_contest_visible(contest: Contest, user: Optional[User]) -> None:
+def ensure_contest_visible(contest: ContestLike, user: Optional[User]) -> None:
     """确保比赛对当前用户可见"""
     if contest.visibility != ContestVisibility.PUBLISHED.value:
         if not (user and user.is_admin):
@@ -293,83 +296,56 @@ def validate_contest_schedule(schedule: dict) -> None:
     check_order(submit_end, vote_start, "提交截止时间", "投票开始时间")
 
 
+def build_review_stats_from_summary(summary: Optional[ProjectReviewStats]) -> ReviewStatsResponse:
+    """根据物化的评分汇总构建评分统计"""
+    if summary is None or not summary.review_count:
+        return build_empty_review_stats()
+    return build_review_stats(
+        review_count=summary.review_count,
+        total_score=summary.score_sum,
+        avg_score=summary.score_sum / summary.review_count,
+        min_score=summary.score_min,
+        max_score=summary.score_max,
+    )
+
+
 async def build_project_ranking_items(
     db: AsyncSession,
     contest_id: int,
-) -> list[ProjectRankingItem]:
-    """构建比赛作品排行榜列表"""
+    offset: int = 0,
+    limit: int = 50,
+) -> tuple[list[ProjectRankingItem], int]:
+    """构建比赛作品排行榜的一页，返回 (列表, 上榜总数)"""
+    page, total = await contest_ranking.get_ranking_page(db, contest_id, offset, limit)
+    if not page:
+        return [], total
+
+    project_ids = [project_id for _, project_id in page]
     project_result = await db.execute(
         select(Project)
-        .join(
-            Registration,
-            (Registration.contest_id == Project.contest_id)
-            & (Registration.user_id == Project.user_id),
-        )
         .options(selectinload(Project.user))
-        .where(
-            Project.contest_id == contest_id,
-            Project.status.in_({ProjectStatus.SUBMITTED.value, ProjectStatus.ONLINE.value}),
-            Registration.status != RegistrationStatus.WITHDRAWN.value,
-        )
-    )
-    projects = project_result.scalars().all()
-    if not projects:
-        return []
-
-    project_ids = [project.id for project in projects]
-    stats_result = await db.execute(
-        select(
-            ProjectReview.project_id.label("project_id"),
-            func.count(ProjectReview.id).label("count"),
-            func.sum(ProjectReview.score).label("sum"),
-            func.avg(ProjectReview.score).label("avg"),
-            func.min(ProjectReview.score).label("min"),
-            func.max(ProjectReview.score).label("max"),
-        )
-        .where(ProjectReview.project_id.in_(project_ids))
-        .group_by(ProjectReview.project_id)
+        .where(Project.id.in_(project_ids))
     )
-    stats_map = {row.project_id: row for row in stats_result}
+    project_map = {project.id: project for project in project_result.scalars().all()}
+    stats_map = await contest_ranking.get_review_stats_map(db, project_ids)
 
-    entries = []
-    for project in projects:
-        row = stats_map.get(project.id)
-        stats = build_review_stats(
-            review_count=row.count if row else 0,
-            total_score=row.sum if row else None,
-            avg_score=row.avg if row else None,
-            min_score=row.min if row else None,
-            max_score=row.max if row else None,
-        )
-        owner = UserBrief.model_validate(project.user) if project.user else None
-        entries.append({
-            "project": project,
-            "stats": stats,
-            "owner": owner,
-        })
-
-    def sort_key(entry: dict) -> tuple[float, int, int]:
-        stats = entry["stats"]
-        score_value = float(stats.final_score) if stats.final_score is not None else -1.0
-        project = entry["project"]
-        return (score_value, stats.review_count, project.id)
-
-    entries.sort(key=sort_key, reverse=True)
     ranked_items: list[ProjectRankingItem] = []
-    for rank, entry in enumerate(entries, 1):
-        project = entry["project"]
+    for rank, project_id in page:
+        project = project_map.get(project_id)
+        if project is None:
+            continue
         ranked_items.append(
             ProjectRankingItem(
                 rank=rank,
                 project_id=project.id,
                 title=project.title,
                 status=project.status_enum,
-                user=entry["owner"],
-                stats=entry["stats"],
+                user=UserBrief.model_validate(project.user) if project.user else None,
+                stats=build_review_stats_from_summary(stats_map.get(project.id)),
             )
         )
 
-    return ranked_items
+    return ranked_items, total
 
 
 @router.get("/", response_model=ContestListResponse)
@@ -402,18 +378,11 @@ async def get_current_contest(
     - include_ended=True 时，若未找到进行中的比赛，则回退到最新一场。
     """
     is_admin = current_user is not None and current_user.is_admin
-    query = select(Contest).where(Contest.phase != ContestPhase.ENDED.value)
-    if not is_admin:
-        query = query.where(Contest.visibility == ContestVisibility.PUBLISHED.value)
-    result = await db.execute(query.order_by(Contest.id.desc()))
-    contest = result.scalars().first()
-
-    if contest is None and include_ended:
-        fallback_query = select(Contest)
-        if not is_admin:
-            fallback_query = fallback_query.where(Contest.visibility == ContestVisibility.PUBLISHED.value)
-        fallback_result = await db.execute(fallback_query.order_by(Contest.id.desc()))
-        contest = fallback_result.scalars().first()
+    contest = await contest_cache.get_current_contest(
+        db,
+        include_hidden=is_admin,
+        include_ended=include_ended,
+    )
 
     if contest is None:
         raise HTTPException(
@@ -431,15 +400,7 @@ async def get_contest(
     current_user: Optional[User] = Depends(get_optional_user),
 ):
     """获取比赛详情"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
-
+    contest = await contest_cache.get_contest_or_404(db, contest_id)
     ensure_contest_visible(contest, current_user)
     return ContestResponse.model_validate(contest)
 
@@ -457,13 +418,7 @@ async def get_contest_stats(
     """获取比赛统计汇总"""
     require_admin(current_user)
 
-    contest_result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = contest_result.scalar_one_or_none()
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在",
-        )
+    await contest_cache.get_contest_or_404(db, contest_id)
 
     registration_rows = (
         await db.execute(
@@ -566,26 +521,21 @@ async def get_contest_stats(
 async def get_ranking(
     contest_id: int,
     limit: int = 50,
+    offset: int = 0,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_user),
 ):
-    """获取排行榜"""
+    """获取排行榜（分页）"""
     # 验证比赛存在
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
+    contest = await contest_cache.get_contest_or_404(db, contest_id)
     ensure_contest_visible(contest, current_user)
 
     if limit < 1 or limit > 200:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="limit 必须在 1-200 之间")
-    ranked_items = await build_project_ranking_items(db, contest_id)
-    total = len(ranked_items)
-    return ContestRankingResponse(items=ranked_items[:limit], total=total)
+    if offset < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="offset 不能为负数")
+    ranked_items, total = await build_project_ranking_items(db, contest_id, offset, limit)
+    return ContestRankingResponse(items=ranked_items, total=total)
 
 
 @router.get(
@@ -600,13 +550,7 @@ async def get_ranking_detail(
     current_user: Optional[User] = Depends(get_optional_user),
 ):
     """获取排行榜详情"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
+    contest = await contest_cache.get_contest_or_404(db, contest_id)
     ensure_contest_visible(contest, current_user)
 
     project_result = await db.execute(
@@ -622,13 +566,13 @@ async def get_ranking_detail(
     if project is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="作品不存在")
 
-    ranked_items = await build_project_ranking_items(db, contest_id)
-    target_item = next((item for item in ranked_items if item.project_id == project_id), None)
-    if target_item is None:
+    rank = await contest_ranking.get_project_rank(db, contest_id, project_id)
+    if rank is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="作品未进入排行榜")
+    stats_map = await contest_ranking.get_review_stats_map(db, [project_id])
 
     return ProjectRankingDetailResponse(
-        rank=target_item.rank,
+        rank=rank,
         project_id=project.id,
         title=project.title,
         summary=project.summary,
@@ -637,8 +581,8 @@ async def get_ranking_detail(
         demo_url=project.demo_url,
         readme_url=project.readme_url,
         status=project.status_enum,
-        user=target_item.user,
-        stats=target_item.stats,
+        user=UserBrief.model_validate(project.user) if project.user else None,
+        stats=build_review_stats_from_summary(stats_map.get(project_id)),
     )
 
 
@@ -655,13 +599,7 @@ async def get_interaction_leaderboard(
     current_user: Optional[User] = Depends(get_optional_user),
 ):
     """获取作品点赞/收藏排行榜"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
+    contest = await contest_cache.get_contest_or_404(db, contest_id)
     ensure_contest_visible(contest, current_user)
 
     if type not in {"like", "favorite"}:
@@ -778,6 +716,7 @@ async def create_contest(
     db.add(contest)
     await db.commit()
     await db.refresh(contest)
+    await notify_contest_schedule_changed(contest)
     return ContestResponse.model_validate(contest)
 
 
@@ -821,6 +760,7 @@ async def update_contest(
 
     await db.commit()
     await db.refresh(contest)
+    await notify_contest_schedule_changed(contest)
     return ContestResponse.model_validate(contest)
 
 
@@ -851,6 +791,7 @@ async def upload_contest_banner(
     contest.banner_url = media.url
     await db.commit()
     await db.refresh(contest)
+    await contest_cache.invalidate_contest(contest.id)
 
     delete_media_file(old_url)
     return ContestResponse.model_validate(contest)
@@ -879,4 +820,22 @@ async def update_contest_phase(
     contest.auto_phase_enabled = False
     await db.commit()
     await db.refresh(contest)
+    await notify_contest_schedule_changed(contest)
     return ContestResponse.model_validate(contest)
+
+
+@router.post("/{contest_id}/ranking/rebuild", summary="重建排行榜（管理员）")
+async def rebuild_ranking(
+    contest_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """按评分记录全量重算作品评分汇总并重建排行榜缓存"""
+    require_admin(current_user)
+
+    result = await db.execute(select(Contest.id).where(Contest.id == contest_id))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="比赛不存在")
+
+    project_count = await contest_ranking.rebuild_contest_review_stats(db, contest_id)
+    return {"contest_id": contest_id, "project_count": project_count}
@@ -3,14 +3,14 @@
 消耗积分随机获得积分/道具/徽章/API Key 兑换码
 完全从数据库读取配置，支持后台管理
 """
-import random
 import json
+from dataclasses import dataclass
 from datetime import datetime, date
 from decimal import Decimal
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from pydantic import BaseModel
-from sqlalchemy import select, func, and_, update
+from sqlalchemy import select, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.orm import selectinload
@@ -21,7 +21,10 @@ from app.api.v1.endpoints.user import get_current_user_dep as get_current_user
 from app.models.user import User
 from app.models.points import PointsReason, UserItem
 from app.models.gacha import GachaConfig, GachaPrize, GachaDraw, GachaPrizeType
+from app.services import daily_play_limit
+from app.services.game_config_cache import GACHA, get_game_config, invalidate_game_config
 from app.services.points_service import PointsService
+from app.services.prize_sampler import WeightedSampler
 
 router = APIRouter()
 
@@ -116,8 +119,39 @@ class GachaPrizeUpdate(BaseModel):
 
 # ========== 辅助函数 ==========
 
-async def get_active_config(db: AsyncSession) -> Optional[GachaConfig]:
-    """获取当前激活的扭蛋机配置"""
+@dataclass(frozen=True)
+class CachedGachaPrize:
+    """扭蛋机奖品快照（只读）"""
+    id: int
+    prize_type: GachaPrizeType
+    prize_name: str
+    prize_value: Any
+    weight: float
+    stock: Optional[int]
+    is_rare: bool
+    is_enabled: bool
+
+
+@dataclass(frozen=True)
+class CachedGachaConfig:
+    """扭蛋机配置快照，附带预编译的奖池别名表"""
+    id: int
+    name: str
+    is_active: bool
+    cost_points: int
+    daily_limit: Optional[int]
+    prizes: Tuple[CachedGachaPrize, ...]
+    sampler: Optional[WeightedSampler]
+
+    def select_prize(self) -> CachedGachaPrize:
+        """根据权重随机选择奖品（O(1)）"""
+        if self.sampler is None:
+            raise ValueError("没有可用的奖品")
+        return self.sampler.pick()
+
+
+async def _load_active_config(db: AsyncSession) -> Optional[CachedGachaConfig]:
+    """加载当前激活的扭蛋机配置并预编译奖池"""
     result = await db.execute(
         select(GachaConfig)
         .options(selectinload(GachaConfig.prizes))
@@ -125,42 +159,33 @@ async def get_active_config(db: AsyncSession) -> Optional[GachaConfig]:
         .order_by(GachaConfig.id.desc())
         .limit(1)
     )
-    return result.scalar_one_or_none()
-
-
-def weighted_random_choice(prizes: List[GachaPrize]) -> GachaPrize:
-    """根据权重随机选择奖品"""
-    enabled_prizes = [p for p in prizes if p.is_enabled and (p.stock is None or p.stock > 0)]
-    if not enabled_prizes:
-        raise ValueError("没有可用的奖品")
+    config = result.scalar_one_or_none()
+    if config is None:
+        return None
 
-    total_weight = sum(float(p.weight) for p in enabled_prizes)
-    rand = random.uniform(0, total_weight)
-    current_weight = 0
+    prizes = tuple(
+        CachedGachaPrize(
+            id=p.id, prize_type=p.prize_type, prize_name=p.prize_name, prize_value=p.prize_value,
+            weight=float(p.weight), stock=p.stock, is_rare=p.is_rare, is_enabled=p.is_enabled
+        )
+        for p in config.prizes
+    )
+    available = [p for p in prizes if p.is_enabled and (p.stock is None or p.stock > 0)]
+    return CachedGachaConfig(
+        id=config.id, name=config.name, is_active=config.is_active,
+        cost_points=config.cost_points, daily_limit=config.daily_limit,
+        prizes=prizes, sampler=WeightedSampler.build(available, lambda p: p.weight)
+    )
 
-    for prize in enabled_prizes:
-        current_weight += float(prize.weight)
-        if rand < current_weight:
-            return prize
 
-    return enabled_prizes[-1]
+async def get_active_config(db: AsyncSession) -> Optional[CachedGachaConfig]:
+    """获取当前激活的扭蛋机配置（进程内缓存，管理员修改或有限库存奖品被抽中后失效）"""
+    return await get_game_config(db, GACHA, _load_active_config)
 
 
 async def get_today_gacha_count(db: AsyncSession, user_id: int, config_id: int) -> int:
-    """获取用户今日扭蛋次数"""
-    today_start = datetime.combine(date.today(), datetime.min.time())
-    result = await db.execute(
-        select(func.count(GachaDraw.id))
-        .where(
-            and_(
-                GachaDraw.user_id == user_id,
-                GachaDraw.config_id == config_id,
-                GachaDraw.used_ticket == False,  # 只统计积分消耗的次数
-                GachaDraw.created_at >= today_start
-            )
-        )
-    )
-    return result.scalar() or 0
+    """获取用户今日扭蛋次数（只统计积分消耗的次数）"""
+    return await daily_play_limit.get_play_count(db, daily_play_limit.GACHA, user_id, config_id)
 
 
 async def grant_points_reward(db: AsyncSession, user_id: int, amount: int, description: str) -> None:
@@ -290,6 +315,7 @@ async def play_gacha(
 
     user_id = current_user.id
     use_ticket = body.use_ticket if body else False
+    play = None
 
     try:
         config = await get_active_config(db)
@@ -310,10 +336,10 @@ async def play_gacha(
         else:
             # 管理员不受日限限制
             is_admin = current_user.role == "admin"
-            if config.daily_limit and not is_admin:
-                today_count = await get_today_gacha_count(db, user_id, config.id)
-                if today_count >= config.daily_limit:
-                    raise HTTPException(status_code=400, detail=f"今日次数已用完（{today_count}/{config.daily_limit}）")
+            daily_limit = None if is_admin else config.daily_limit
+            play = await daily_play_limit.consume_play(db, daily_play_limit.GACHA, user_id, config.id, daily_limit)
+            if play is None:
+                raise HTTPException(status_code=400, detail=f"今日次数已用完（{config.daily_limit}/{config.daily_limit}）")
 
             user_balance = await PointsService.get_balance(db, user_id)
             if user_balance < config.cost_points:
@@ -326,7 +352,7 @@ async def play_gacha(
             )
 
         # 随机抽取奖品
-        prize = weighted_random_choice(config.prizes)
+        prize = config.select_prize()
         prize_value = prize.prize_value or {}
         if isinstance(prize_value, str):
             prize_value = json.loads(prize_value)
@@ -375,8 +401,9 @@ async def play_gacha(
                 {"prize_id": prize.id}
             )
             if deduct_result.rowcount == 0:
-                # 库存扣减失败（已被其他请求抢完）
+                # 库存扣减失败（已被其他请求抢完），缓存中的库存已过期
                 await db.rollback()
+                await invalidate_game_config(GACHA)
                 raise ValueError("奖品库存不足，请重试")
 
         # 记录抽奖
@@ -399,12 +426,17 @@ async def play_gacha(
 
         # 更新成就进度并检测解锁
         from app.services.achievement_service import (
-            update_user_stats_on_gacha, check_and_unlock_achievements
+            STAT_GACHA, update_user_stats_on_gacha, check_and_unlock_achievements
         )
         user_stats = await update_user_stats_on_gacha(db, user_id, result_is_rare)
-        await check_and_unlock_achievements(db, user_id, user_stats)
+        await check_and_unlock_achievements(db, user_id, user_stats, stat_types=[STAT_GACHA])
 
         await db.commit()
+        # 已提交，之后的异常不再归还次数
+        play = None
+        if prize.stock is not None:
+            # 库存已变化，刷新各进程的可抽奖池
+            await invalidate_game_config(GACHA)
 
         remaining_balance = await PointsService.get_balance(db, user_id)
 
@@ -415,12 +447,19 @@ async def play_gacha(
         )
 
     except HTTPException:
+        await db.rollback()
+        if play is not None:
+            await play.release()
         raise
     except ValueError as e:
         await db.rollback()
+        if play is not None:
+            await play.release()
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         await db.rollback()
+        if play is not None:
+            await play.release()
         import logging
         import traceback
         logging.error(f"扭蛋机处理失败: user_id={user_id}, error={str(e)}")
@@ -487,6 +526,7 @@ async def update_gacha_config(
         setattr(config, key, value)
 
     await db.commit()
+    await invalidate_game_config(GACHA)
     return {"success": True, "message": "配置已更新"}
 
 
@@ -546,6 +586,7 @@ async def create_gacha_prize(
     db.add(prize)
     await db.commit()
     await db.refresh(prize)
+    await invalidate_game_config(GACHA)
 
     return {"success": True, "id": prize.id}
 
@@ -576,6 +617,7 @@ async def update_gacha_prize(
         setattr(prize, key, value)
 
     await db.commit()
+    await invalidate_game_config(GACHA)
     return {"success": True}
 
 
@@ -598,6 +640,7 @@ async def delete_gacha_prize(
 
     await db.delete(prize)
     await db.commit()
+    await invalidate_game_config(GACHA)
     return {"success": True}
 
 
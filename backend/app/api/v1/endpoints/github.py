@@ -18,7 +18,9 @@ from sqlalchemy.orm import selectinload
 from app.core.database import get_db
 from app.models.registration import Registration, RegistrationStatus
 from app.models.github_stats import GitHubStats, GitHubSyncLog
+from app.services.github_commit_store import build_daily_stats, sync_repo_commits
 from app.services.github_service import github_service, GitHubService
+from app.services.github_sync import upsert_daily_stats
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -330,54 +332,29 @@ async def sync_github_stats(
     results = []
     total_api_calls = 0
 
-    # 同步多天数据
+    # 增量同步提交缓存（只请求新提交与未获取过详情的提交）
+    try:
+        sync_result = await sync_repo_commits(db, owner, repo)
+        total_api_calls = sync_result["api_calls"]
+        sync_error = None
+    except Exception as e:
+        logger.error(f"GitHub API 调用失败 ({owner}/{repo}): {e}")
+        sync_error = str(e)
+
+    # 由提交缓存汇总多天数据
     for i in range(days):
         sync_date = target_date - timedelta(days=i)
 
-        try:
-            daily_stats = await github_service.get_daily_stats(owner, repo, sync_date)
-        except Exception as e:
-            logger.error(f"GitHub API 调用失败 ({sync_date}): {e}")
+        if sync_error is not None:
             results.append({
                 "date": str(sync_date),
                 "success": False,
-                "error": str(e),
+                "error": sync_error,
             })
             continue
 
-        # 更新或创建统计记录
-        existing_query = select(GitHubStats).where(
-            GitHubStats.registration_id == registration_id,
-            GitHubStats.stat_date == sync_date,
-        )
-        existing_result = await db.execute(existing_query)
-        existing = existing_result.scalar_one_or_none()
-
-        if existing:
-            existing.commits_count = daily_stats["commits_count"]
-            existing.additions = daily_stats["additions"]
-            existing.deletions = daily_stats["deletions"]
-            existing.files_changed = daily_stats["files_changed"]
-            existing.commits_detail = daily_stats["commits_detail"]
-            existing.hourly_activity = daily_stats["hourly_activity"]
-        else:
-            new_stat = GitHubStats(
-                registration_id=registration_id,
-                stat_date=sync_date,
-                repo_url=repo_url,
-                repo_owner=owner,
-                repo_name=repo,
-                commits_count=daily_stats["commits_count"],
-                additions=daily_stats["additions"],
-                deletions=daily_stats["deletions"],
-                files_changed=daily_stats["files_changed"],
-                commits_detail=daily_stats["commits_detail"],
-                hourly_activity=daily_stats["hourly_activity"],
-            )
-            db.add(new_stat)
-
-        api_calls = 1 + daily_stats["commits_count"]
-        total_api_calls += api_calls
+        daily_stats = await build_daily_stats(db, owner, repo, sync_date)
+        await upsert_daily_stats(db, registration_id, sync_date, repo_url, owner, repo, daily_stats)
 
         results.append({
             "date": str(sync_date),
@@ -393,6 +370,7 @@ async def sync_github_stats(
         sync_type="manual",
         status="success" if any(r.get("success") for r in results) else "failed",
         api_calls_used=total_api_calls,
+        rate_limit_remaining=github_service.rate_limiter.remaining,
     )
     db.add(sync_log)
 
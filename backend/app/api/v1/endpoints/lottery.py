@@ -169,11 +169,23 @@ async def get_recent_winners(
 @router.get("/leaderboard")
 async def get_lucky_leaderboard(
     limit: int = Query(50, ge=1, le=200, description="返回数量"),
-    db: AsyncSession = Depends(get_db)
+    around: int = Query(0, ge=0, le=20, description="返回当前用户前后各多少名"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional),
 ):
     """获取欧皇榜 - 按稀有奖品中奖次数排行"""
-    leaderboard = await LotteryService.get_lucky_leaderboard(db, limit)
-    return {"items": leaderboard, "total": len(leaderboard)}
+    leaderboard = await LotteryService.get_lucky_leaderboard(
+        db,
+        limit,
+        user_id=current_user.id if current_user else None,
+        around=around,
+    )
+    return {
+        "items": leaderboard["items"],
+        "total": len(leaderboard["items"]),
+        "my_rank": leaderboard["my_rank"],
+        "neighbors": leaderboard["neighbors"],
+    }
 
 
 # ========== 用户物品接口 ==========
@@ -1,22 +1,190 @@
 """
 媒体文件访问
+
+媒体文件均以 UUID 命名、写入后不再修改，因此：
+- 长期缓存（Cache-Control: immutable），强 ETag 由文件名与大小生成，支持条件请求（304）
+- 支持单段 Range 请求（206/416）
+- 配置 MEDIA_X_ACCEL_REDIRECT_PREFIX 后只返回 X-Accel-Redirect 头，由 Nginx 直接 sendfile 文件内容
+- ?w=宽度 返回不小于该宽度的最小档位 WebP 缩放版本（不支持的图片返回原图）
 """
+import os
+import stat as stat_module
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import FileResponse
+import aiofiles
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
-from app.services.media_service import MEDIA_CATEGORIES, _build_storage_path
+from app.core.config import settings
+from app.services.media_derivatives import resolve_variant
+from app.services.media_service import MEDIA_CATEGORIES, _build_storage_path, _media_root
 
 router = APIRouter()
 
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
+
+
+def _media_type(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return _MEDIA_TYPES.get(extension, "application/octet-stream")
+
+
+def _build_etag(filename: str, size: int) -> str:
+    """强 ETag：文件名（UUID）+ 大小"""
+    stem = os.path.splitext(filename)[0]
+    return f'"{stem}-{size:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 比较（弱比较，忽略 W/ 前缀）"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(value.removeprefix("W/") == etag for value in candidates)
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    解析单段 Range（bytes=a-b / a- / -n）
+
+    Returns:
+        (start, end)，end 含；无法满足时抛出 ValueError，多段/格式不支持时返回 None（回退整文件）
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        if not end or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(0, size - end), size - 1
+    end = size - 1 if end is None else end
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def _iter_file_range(path: str, start: int, end: int):
+    async with aiofiles.open(path, "rb") as file:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await file.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _stat_file(path: Path) -> Optional[os.stat_result]:
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat_result if stat_module.S_ISREG(stat_result.st_mode) else None
+
+
+def _serve_file(
+    request: Request,
+    path: Path,
+    stat_result: os.stat_result,
+    etag_name: str,
+    immutable: bool = True,
+):
+    size = stat_result.st_size
+    etag = _build_etag(etag_name, size)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": (
+            f"public, max-age={settings.MEDIA_CACHE_MAX_AGE_SECONDS}, immutable" if immutable else "public, no-cache"
+        ),
+        "Accept-Ranges": "bytes",
+    }
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.MEDIA_X_ACCEL_REDIRECT_PREFIX:
+        # Nginx 内部跳转：Range/sendfile 由 Nginx 处理，Python 不读取文件内容
+        prefix = settings.MEDIA_X_ACCEL_REDIRECT_PREFIX.rstrip("/")
+        relative = path.relative_to(_media_root()).as_posix()
+        headers["X-Accel-Redirect"] = f"{prefix}/{relative}"
+        return Response(headers=headers, media_type=_media_type(path.name))
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file_range(str(path), start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                headers=headers,
+                media_type=_media_type(path.name),
+            )
+
+    return FileResponse(path, stat_result=stat_result, headers=headers, media_type=_media_type(path.name))
+
 
 @router.get("/{category}/{filename}", summary="获取媒体文件")
-async def get_media_file(category: str, filename: str):
+async def get_media_file(
+    category: str,
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="目标宽度（返回 WebP 缩放版本）"),
+):
     """获取媒体文件"""
     if category not in MEDIA_CATEGORIES:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
     path = _build_storage_path(category, filename)
-    if not Path(path).exists():
+    stat_result = _stat_file(path)
+    if stat_result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
-    return FileResponse(path)
+
+    if w is not None:
+        variant = await resolve_variant(path, w)
+        variant_stat = _stat_file(variant) if variant is not None else None
+        if variant_stat is not None:
+            return _serve_file(request, variant, variant_stat, f"{path.stem}-{variant.stem}")
+        # ?w= 回退原图：衍生版本之后可能生成，不能让客户端长期缓存原图
+        return _serve_file(request, path, stat_result, path.name, immutable=False)
+
+    return _serve_file(request, path, stat_result, path.name)
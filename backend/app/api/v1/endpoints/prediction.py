@@ -395,6 +395,24 @@ async def settle_market(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/admin/markets/{market_id}/settle/resume")
+async def resume_settlement(
+    market_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """继续结算（管理员，分批结算中途失败后处理剩余下注）"""
+    real_role = current_user.original_role or current_user.role
+    if real_role != "admin":
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+    try:
+        stats = await PredictionService.resume_settlement(db, market_id)
+        return {"success": True, **stats}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/admin/markets/{market_id}/cancel")
 async def cancel_market(
     market_id: int,
@@ -20,16 +20,16 @@ from app.api.v1.endpoints.submission import (
 from app.core.config import settings
 from app.core.database import get_db
 from app.core.rate_limit import limiter, RateLimits
-from app.core.redis import close_redis, get_redis
+from app.core.redis import get_redis
 from app.services.media_service import (
     delete_media_file,
     ensure_local_media_url,
     ensure_local_media_urls,
     save_upload_file,
 )
-from app.services.worker_queue import enqueue_worker_action
+from app.services.worker_queue import build_job_payload, enqueue_image_prepull, enqueue_worker_action
 from app.services.security_challenge import guard_challenge
-from app.models.contest import Contest, ContestPhase
+from app.models.contest import ContestPhase
 from app.models.project import Project, ProjectStatus
 from app.models.project_like import ProjectLike
 from app.models.project_favorite import ProjectFavorite
@@ -54,7 +54,10 @@ from app.schemas.project import (
     ProjectReviewerListResponse,
 )
 from app.schemas.submission import UserBrief
+from app.services.contest_cache import get_contest_or_404
+from app.services.contest_phase import ContestLike, effective_phase
 from app.services.project_domain import build_project_domain
+from app.services.project_submission_status import append_status_history, apply_submission_status
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -74,15 +77,6 @@ def require_admin(user: User) -> None:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="需要管理员权限")
 
 
-async def get_contest_or_404(db: AsyncSession, contest_id: int) -> Contest:
-    """获取比赛，不存在则抛出 404"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-    if contest is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="比赛不存在")
-    return contest
-
-
 async def get_project_or_404(db: AsyncSession, project_id: int) -> Project:
     """获取作品，不存在则抛出 404"""
     result = await db.execute(
@@ -111,18 +105,18 @@ def ensure_owner_or_admin(project: Project, user: Optional[User]) -> None:
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="无权限访问该作品")
 
 
-def check_project_phase(contest: Contest) -> None:
+def check_project_phase(contest: ContestLike) -> None:
     """检查比赛是否允许创建/编辑作品"""
-    if contest.phase not in {ContestPhase.SIGNUP.value, ContestPhase.SUBMISSION.value}:
+    if effective_phase(contest) not in {ContestPhase.SIGNUP.value, ContestPhase.SUBMISSION.value}:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="当前比赛阶段不允许创建或编辑作品"
         )
 
 
-def check_submission_phase(contest: Contest) -> None:
+def check_submission_phase(contest: ContestLike) -> None:
     """检查比赛是否处于作品提交阶段"""
-    if contest.phase != ContestPhase.SUBMISSION.value:
+    if effective_phase(contest) != ContestPhase.SUBMISSION.value:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="当前比赛不在提交阶段"
@@ -173,24 +167,6 @@ async def ensure_public_repo_url(repo_url: str) -> None:
         )
 
 
-def append_status_history(
-    submission: ProjectSubmission,
-    status_value: str,
-    now: datetime,
-    message: Optional[str] = None,
-    error_code: Optional[str] = None,
-) -> None:
-    """追加状态历史"""
-    history = submission.status_history or []
-    history.append({
-        "status": status_value,
-        "timestamp": now.isoformat(),
-        "message": message,
-        "error_code": error_code,
-    })
-    submission.status_history = history
-
-
 def build_project_response(
     project: Project,
     interaction: Optional[dict] = None,
@@ -843,15 +819,13 @@ async def create_project_submission(
     await db.flush()
 
     queued = False
-    redis_client = None
     try:
+        await enqueue_image_prepull(submission.image_ref)
         redis_client = await get_redis()
-        await redis_client.rpush(settings.WORKER_QUEUE_KEY, str(submission.id))
+        await redis_client.rpush(settings.WORKER_QUEUE_KEY, build_job_payload("deploy", submission.id))
         queued = True
     except Exception as exc:
         logger.warning("提交入队失败: submission_id=%s, error=%s", submission.id, exc)
-    finally:
-        await close_redis(redis_client)
 
     if queued:
         submission.status = ProjectSubmissionStatus.QUEUED.value
@@ -976,41 +950,15 @@ async def update_project_submission_status(
     if submission is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="提交记录不存在")
 
-    now = datetime.utcnow()
-    submission.status = payload.status.value
-    submission.status_message = payload.status_message
-    submission.error_code = payload.error_code
-    if payload.domain:
-        submission.domain = payload.domain
-
-    if payload.log_append:
-        if submission.log:
-            submission.log += f"\n{payload.log_append}"
-        else:
-            submission.log = payload.log_append
-
-    append_status_history(
-        submission=submission,
-        status_value=payload.status.value,
-        now=now,
+    apply_submission_status(
+        submission,
+        payload.status,
         message=payload.status_message,
         error_code=payload.error_code,
+        log_append=payload.log_append,
+        domain=payload.domain,
     )
 
-    if payload.status == ProjectSubmissionStatus.ONLINE:
-        submission.online_at = now
-        if submission.project:
-            submission.project.current_submission_id = submission.id
-            submission.project.status = ProjectStatus.ONLINE.value
-    elif payload.status == ProjectSubmissionStatus.FAILED:
-        submission.failed_at = now
-        if submission.project and submission.project.current_submission_id == submission.id:
-            submission.project.status = ProjectStatus.OFFLINE.value
-    elif payload.status == ProjectSubmissionStatus.STOPPED:
-        submission.failed_at = None
-        if submission.project and submission.project.current_submission_id == submission.id:
-            submission.project.status = ProjectStatus.OFFLINE.value
-
     await db.commit()
     await db.refresh(submission)
     return ProjectSubmissionResponse.model_validate(submission)
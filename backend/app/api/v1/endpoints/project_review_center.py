@@ -25,6 +25,7 @@ from app.schemas.review_center import (
     ReviewerStatsResponse,
 )
 from app.schemas.submission import UserBrief
+from app.services import contest_ranking
 from app.services.project_domain import build_project_domain
 
 router = APIRouter()
@@ -399,7 +400,11 @@ async def submit_project_review(
         )
         logger.info("评审员 %s 对作品 #%s 评分: %s", reviewer.username, project_id, payload.score)
 
+    await db.flush()
+    contest_id = assignment.project.contest_id
+    await contest_ranking.refresh_project_review_stats(db, project_id, contest_id)
     await db.commit()
+    await contest_ranking.sync_project_rank(contest_id, project_id)
     await db.refresh(assignment.project)
     return await build_project_review_detail(db, reviewer, assignment.project)
 
@@ -430,6 +435,10 @@ async def delete_project_review(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="评分不存在")
 
     await db.delete(existing_review)
+    await db.flush()
+    contest_id = assignment.project.contest_id
+    await contest_ranking.refresh_project_review_stats(db, project_id, contest_id)
     await db.commit()
+    await contest_ranking.sync_project_rank(contest_id, project_id)
     await db.refresh(assignment.project)
     return await build_project_review_detail(db, reviewer, assignment.project)
@@ -4,17 +4,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, text
+from sqlalchemy import bindparam, select, update, text
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from typing import List, Optional
 import json
+import logging
 
 from app.core.database import get_db
 from app.api.v1.endpoints.user import get_current_user_dep as get_current_user, get_current_user_optional
 from app.models.user import User
+from app.services import leaderboard_service
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # ============ 进度同步相关 ============
 
@@ -73,6 +76,7 @@ async def sync_puzzle_progress(
         "level_errors": json.dumps(request.error_counts),
     })
     await db.commit()
+    await leaderboard_service.record_puzzle_progress(current_user.id, total_solved, total_time)
 
     return {
         "success": True,
@@ -119,16 +123,12 @@ async def get_my_puzzle_progress(
 
 # ============ 排行榜相关 ============
 
-@router.get("/leaderboard")
-async def get_puzzle_leaderboard(
-    limit: int = Query(50, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user_optional)
-):
-    """
-    获取码神挑战排行榜
-    按完成关卡数排序，关卡数相同则按用时排序
-    """
+async def build_puzzle_entries(db: AsyncSession, ranked: list) -> list:
+    """补全码神挑战榜条目（只查询本页用户）"""
+    user_ids = list({user_id for _, user_id, _ in ranked})
+    if not user_ids:
+        return []
+
     sql = text("""
         SELECT
             p.user_id,
@@ -141,17 +141,18 @@ async def get_puzzle_leaderboard(
             u.avatar_url
         FROM puzzle_progress p
         JOIN users u ON p.user_id = u.id
-        WHERE p.total_solved > 0
-        ORDER BY p.total_solved DESC, p.total_time ASC
-        LIMIT :limit
-    """)
-    result = await db.execute(sql, {"limit": limit})
-    rows = result.fetchall()
+        WHERE p.user_id IN :user_ids
+    """).bindparams(bindparam("user_ids", expanding=True))
+    result = await db.execute(sql, {"user_ids": user_ids})
+    row_map = {row.user_id: row for row in result.fetchall()}
 
     items = []
-    for idx, row in enumerate(rows):
+    for rank, user_id, _ in ranked:
+        row = row_map.get(user_id)
+        if not row:
+            continue
         items.append({
-            "rank": idx + 1,
+            "rank": rank,
             "user": {
                 "id": row.user_id,
                 "username": row.username,
@@ -165,34 +166,41 @@ async def get_puzzle_leaderboard(
             "is_completed": row.total_solved >= 42,
             "is_half": row.total_solved >= 21
         })
+    return items
 
-    # 查询当前用户排名
-    my_rank = None
-    if current_user:
-        # 先检查用户是否有进度记录
-        check_sql = text("SELECT total_solved, total_time FROM puzzle_progress WHERE user_id = :user_id")
-        check_result = await db.execute(check_sql, {"user_id": current_user.id})
-        user_progress = check_result.fetchone()
-
-        if user_progress and user_progress.total_solved > 0:
-            # 用户有记录，计算排名
-            rank_sql = text("""
-                SELECT COUNT(*) + 1 as user_rank FROM puzzle_progress
-                WHERE total_solved > :user_solved
-                OR (total_solved = :user_solved AND total_time < :user_time)
-            """)
-            rank_result = await db.execute(rank_sql, {
-                "user_solved": user_progress.total_solved,
-                "user_time": user_progress.total_time
-            })
-            rank_row = rank_result.fetchone()
-            if rank_row:
-                my_rank = rank_row.user_rank
 
+@router.get("/leaderboard")
+async def get_puzzle_leaderboard(
+    limit: int = Query(50, ge=1, le=100),
+    around: int = Query(0, ge=0, le=20, description="返回当前用户前后各多少名"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    获取码神挑战排行榜
+    按完成关卡数排序，关卡数相同则按用时排序
+    """
+    board = leaderboard_service.PUZZLE
+    user_id = current_user.id if current_user else None
+    my_rank = None
+    window = []
+    try:
+        top = await leaderboard_service.get_top(db, board, limit=limit)
+        if user_id is not None:
+            my_rank = await leaderboard_service.get_rank(db, board, user_id)
+            if my_rank and around:
+                window = await leaderboard_service.get_window(db, board, user_id, around)
+    except leaderboard_service.LeaderboardUnavailable as exc:
+        logger.warning("码神挑战榜缓存不可用，回退数据库: %s", exc)
+        scores = await leaderboard_service.load_scores(db, board)
+        top, my_rank, window = leaderboard_service.rank_in_memory(scores, limit, user_id, around)
+
+    items = await build_puzzle_entries(db, top)
     return {
         "items": items,
         "total": len(items),
-        "my_rank": my_rank
+        "my_rank": my_rank[0] if my_rank else None,
+        "neighbors": await build_puzzle_entries(db, window) if window else [],
     }
 
 
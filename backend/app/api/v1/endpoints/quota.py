@@ -9,7 +9,6 @@
 """
 import asyncio
 import logging
-import httpx
 import time
 from dataclasses import dataclass
 from typing import Optional
@@ -22,8 +21,10 @@ from sqlalchemy.orm import selectinload
 
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.http_client import QUOTA, get_http_client
 from app.models.registration import Registration, RegistrationStatus
 from app.services.quota_service import quota_service, QuotaInfo
+from app.services.quota_snapshot import get_quota_map_from_snapshot
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -111,7 +112,7 @@ async def _get_contest_online_status_cached(
 @router.get(
     "/contests/{contest_id}/quota-leaderboard",
     summary="获取额度消耗排行榜",
-    description="获取比赛选手的 API 额度消耗排行榜（实时查询）。",
+    description="获取比赛选手的 API 额度消耗排行榜（读取后台轮询的额度快照，snapshot 字段给出新鲜度）。",
 )
 async def get_quota_leaderboard(
     contest_id: int,
@@ -144,9 +145,9 @@ async def get_quota_leaderboard(
             "message": "暂无选手设置 API Key",
         }
 
-    # 批量查询额度
+    # 读取额度快照（缺失部分实时查询）
     api_keys = [(r.id, r.api_key) for r in registrations]
-    quota_map = await quota_service.batch_get_quota(api_keys)
+    quota_map, freshness = await get_quota_map_from_snapshot(api_keys)
 
     # 构建结果并排序
     items = []
@@ -204,6 +205,7 @@ async def get_quota_leaderboard(
         "total": len(items),
         "successful_queries": len([i for i in items if i["status"] == "ok"]),
         "failed_queries": len([i for i in items if i["status"] == "error"]),
+        "snapshot": freshness,
     }
 
 
@@ -337,52 +339,52 @@ async def get_registration_quota_logs(
     url = f"{base_url.rstrip('/')}/api/log/token"
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # 添加排序参数，获取最新的日志
-            resp = await client.get(
-                url,
-                params={
-                    "key": registration.api_key,
-                    "p": 0,  # 第一页
-                    "order": "desc",  # 倒序（最新的在前）
-                },
-                headers={"Accept": "application/json"}
-            )
+        client = get_http_client(QUOTA)
+        # 添加排序参数，获取最新的日志
+        resp = await client.get(
+            url,
+            params={
+                "key": registration.api_key,
+                "p": 0,  # 第一页
+                "order": "desc",  # 倒序（最新的在前）
+            },
+            headers={"Accept": "application/json"}
+        )
 
-            if resp.status_code != 200:
-                return {
-                    "registration_id": registration_id,
-                    "logs": [],
-                    "status": "error",
-                    "message": f"日志查询失败: {resp.status_code}",
-                }
-
-            data = resp.json()
-            if not data.get("success"):
-                return {
-                    "registration_id": registration_id,
-                    "logs": [],
-                    "status": "error",
-                    "message": "日志查询失败",
-                }
-
-            logs = data.get("data", [])
-            if not isinstance(logs, list):
-                logs = []
-
-            # API 返回的数据是按时间升序排列的（最早在前）
-            # 取最后的 limit 条（最新的），然后反转顺序（最新在前）
-            total_logs = len(logs)
-            recent_logs = logs[-limit:] if len(logs) > limit else logs
-            recent_logs = list(reversed(recent_logs))  # 反转，最新的在前面
+        if resp.status_code != 200:
+            return {
+                "registration_id": registration_id,
+                "logs": [],
+                "status": "error",
+                "message": f"日志查询失败: {resp.status_code}",
+            }
 
+        data = resp.json()
+        if not data.get("success"):
             return {
                 "registration_id": registration_id,
-                "logs": recent_logs,
-                "total": total_logs,
-                "status": "ok",
+                "logs": [],
+                "status": "error",
+                "message": "日志查询失败",
             }
 
+        logs = data.get("data", [])
+        if not isinstance(logs, list):
+            logs = []
+
+        # API 返回的数据是按时间升序排列的（最早在前）
+        # 取最后的 limit 条（最新的），然后反转顺序（最新在前）
+        total_logs = len(logs)
+        recent_logs = logs[-limit:] if len(logs) > limit else logs
+        recent_logs = list(reversed(recent_logs))  # 反转，最新的在前面
+
+        return {
+            "registration_id": registration_id,
+            "logs": recent_logs,
+            "total": total_logs,
+            "status": "ok",
+        }
+
     except Exception as e:
         logger.warning("获取调用日志失败: %s", e)
         return {
@@ -11,15 +11,18 @@ import logging
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.api.v1.endpoints.user import (
+    get_current_user_dep as get_current_user,
+    get_current_user_optional as get_optional_user,
+)
 from app.core.database import get_db
-from app.core.security import decode_token
-from app.models.contest import Contest, ContestPhase
+from app.models.contest import ContestPhase
 from app.models.project import Project, ProjectStatus
 from app.models.project_submission import ProjectSubmission, ProjectSubmissionStatus
 from app.models.registration import Registration, RegistrationStatus
@@ -29,116 +32,18 @@ from app.schemas.registration import (
     RegistrationResponse,
     RegistrationUpdate,
 )
+from app.services.contest_cache import get_contest_or_404
+from app.services.contest_phase import ContestLike, effective_phase
 from app.services.worker_queue import enqueue_worker_action
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-# ============================================================================
-# 依赖注入
-# ============================================================================
-
-async def get_current_user(
-    authorization: str = Header(None, alias="Authorization"),
-    db: AsyncSession = Depends(get_db),
-) -> User:
-    """
-    JWT 认证依赖：解析 Bearer Token 并返回当前用户
-
-    Raises:
-        HTTPException 401: Token 无效或用户不存在
-    """
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="请先登录",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    token = authorization.split(" ", 1)[1].strip()
-    payload = decode_token(token)
-
-    if not payload or "sub" not in payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="登录已过期，请重新登录",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    try:
-        user_id = int(payload["sub"])
-    except (TypeError, ValueError):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="无效的认证信息",
-        )
-
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在",
-        )
-
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="账号已被禁用",
-        )
-
-    return user
-
-
-async def get_optional_user(
-    authorization: Optional[str] = Header(None, alias="Authorization"),
-    db: AsyncSession = Depends(get_db),
-) -> Optional[User]:
-    """可选的用户认证：未登录时返回 None"""
-    if not authorization or not authorization.startswith("Bearer "):
-        return None
-
-    try:
-        token = authorization.split(" ", 1)[1].strip()
-        payload = decode_token(token)
-
-        if not payload or "sub" not in payload:
-            return None
-
-        user_id = int(payload["sub"])
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-
-        if user and user.is_active:
-            return user
-    except (TypeError, ValueError) as e:
-        logger.debug(f"Token 解析失败: {e}")
-    except Exception as e:
-        logger.warning(f"可选用户认证异常: {e}")
-
-    return None
-
-
 # ============================================================================
 # 辅助函数
 # ============================================================================
 
-async def get_contest_or_404(db: AsyncSession, contest_id: int) -> Contest:
-    """获取比赛，不存在则抛出 404"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
-
-    return contest
-
-
 async def get_user_registration(
     db: AsyncSession,
     contest_id: int,
@@ -158,16 +63,17 @@ async def get_user_registration(
     return result.scalar_one_or_none()
 
 
-def check_signup_phase(contest: Contest) -> None:
+def check_signup_phase(contest: ContestLike) -> None:
     """检查比赛是否处于报名阶段"""
-    if contest.phase != ContestPhase.SIGNUP.value:
+    phase = effective_phase(contest)
+    if phase != ContestPhase.SIGNUP.value:
         phase_messages = {
             ContestPhase.UPCOMING.value: "比赛尚未开始报名",
             ContestPhase.SUBMISSION.value: "报名已截止，当前为作品提交阶段",
             ContestPhase.VOTING.value: "报名已截止，当前为投票阶段",
             ContestPhase.ENDED.value: "比赛已结束",
         }
-        message = phase_messages.get(contest.phase, "当前比赛不在报名阶段")
+        message = phase_messages.get(phase, "当前比赛不在报名阶段")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=message
@@ -399,7 +305,7 @@ async def withdraw_my_registration(
         )
 
     is_retired = (
-        contest.phase != ContestPhase.SIGNUP.value
+        effective_phase(contest) != ContestPhase.SIGNUP.value
         and registration.status == RegistrationStatus.APPROVED.value
     )
     status_message = "已退赛，已下线" if is_retired else "报名已撤回，已下线"
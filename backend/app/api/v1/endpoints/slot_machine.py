@@ -14,6 +14,7 @@ from app.core.database import get_db
 from app.api.v1.endpoints.user import get_current_user_dep as get_current_user, get_current_user_optional
 from app.models.user import User
 from app.models.slot_machine import SlotMachineRule, SlotMachineConfig, SlotRuleType
+from app.services.game_config_cache import SLOT_MACHINE, invalidate_game_config
 from app.services.slot_machine_service import SlotMachineService
 
 
@@ -371,6 +372,7 @@ async def create_slot_rule(
     db.add(rule)
     await db.commit()
     await db.refresh(rule)
+    await invalidate_game_config(SLOT_MACHINE)
 
     return {"success": True, "id": rule.id}
 
@@ -400,6 +402,7 @@ async def update_slot_rule(
         setattr(rule, key, value)
 
     await db.commit()
+    await invalidate_game_config(SLOT_MACHINE)
     return {"success": True}
 
 
@@ -419,6 +422,7 @@ async def delete_slot_rule(
 
     await db.delete(rule)
     await db.commit()
+    await invalidate_game_config(SLOT_MACHINE)
     return {"success": True}
 
 
@@ -29,7 +29,6 @@ from fastapi import (
     Depends,
     File,
     Form,
-    Header,
     HTTPException,
     Request,
     Query,
@@ -40,11 +39,14 @@ from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.api.v1.endpoints.user import (
+    get_current_user_dep as get_current_user,
+    get_current_user_optional as get_optional_user,
+)
 from app.core.config import settings
 from app.core.database import get_db
 from app.core.rate_limit import limiter, RateLimits
-from app.core.security import decode_token
-from app.models.contest import Contest, ContestPhase
+from app.models.contest import ContestPhase
 from app.models.registration import Registration, RegistrationStatus
 from app.models.submission import (
     AttachmentType,
@@ -66,6 +68,8 @@ from app.schemas.submission import (
     SubmissionValidateResponse,
     ValidationError,
 )
+from app.services.contest_cache import get_contest_or_404
+from app.services.contest_phase import ContestLike, effective_phase
 from app.services.security_challenge import guard_challenge
 from app.services.upload_quota import commit_upload_quota, ensure_upload_quota
 
@@ -130,87 +134,6 @@ VIDEO_DURATION_TOLERANCE = 10  # 容差10秒
 # 认证依赖
 # ============================================================================
 
-async def get_current_user(
-    authorization: str = Header(None, alias="Authorization"),
-    db: AsyncSession = Depends(get_db),
-) -> User:
-    """
-    JWT 认证依赖：解析 Bearer Token 并返回当前用户
-
-    Raises:
-        HTTPException 401: Token 无效或用户不存在
-        HTTPException 403: 用户已被禁用
-    """
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="请先登录",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    token = authorization.split(" ", 1)[1].strip()
-    payload = decode_token(token)
-
-    if not payload or "sub" not in payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="登录已过期，请重新登录",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    try:
-        user_id = int(payload["sub"])
-    except (TypeError, ValueError):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="无效的认证信息",
-        )
-
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在",
-        )
-
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="账号已被禁用",
-        )
-
-    return user
-
-
-async def get_optional_user(
-    authorization: Optional[str] = Header(None, alias="Authorization"),
-    db: AsyncSession = Depends(get_db),
-) -> Optional[User]:
-    """可选的用户认证：未登录时返回 None"""
-    if not authorization or not authorization.startswith("Bearer "):
-        return None
-
-    try:
-        token = authorization.split(" ", 1)[1].strip()
-        payload = decode_token(token)
-
-        if not payload or "sub" not in payload:
-            return None
-
-        user_id = int(payload["sub"])
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-
-        if user and user.is_active:
-            return user
-    except Exception as e:
-        logger.debug(f"可选认证失败: {e}")
-
-    return None
-
-
 async def require_admin_or_reviewer(
     current_user: User = Depends(get_current_user),
 ) -> User:
@@ -234,30 +157,17 @@ def sanitize_filename(filename: str) -> str:
     return name[:120] if name else "file"
 
 
-async def get_contest_or_404(db: AsyncSession, contest_id: int) -> Contest:
-    """获取比赛，不存在则抛出 404"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在"
-        )
-
-    return contest
-
-
-def check_submission_phase(contest: Contest) -> None:
+def check_submission_phase(contest: ContestLike) -> None:
     """检查比赛是否处于作品提交阶段"""
-    if contest.phase != ContestPhase.SUBMISSION.value:
+    phase = effective_phase(contest)
+    if phase != ContestPhase.SUBMISSION.value:
         phase_messages = {
             ContestPhase.UPCOMING.value: "比赛尚未开始，当前不可提交作品",
             ContestPhase.SIGNUP.value: "当前为报名阶段，作品提交通道尚未开放",
             ContestPhase.VOTING.value: "当前为投票阶段，作品提交通道已关闭",
             ContestPhase.ENDED.value: "比赛已结束，作品提交通道已关闭",
         }
-        message = phase_messages.get(contest.phase, "当前比赛不在作品提交阶段")
+        message = phase_messages.get(phase, "当前比赛不在作品提交阶段")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=message
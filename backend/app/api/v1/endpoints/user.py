@@ -4,19 +4,20 @@
 from datetime import datetime
 from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Request, status, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Request, status, File, UploadFile
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.core.rate_limit import limiter, RateLimits
-from app.core.security import decode_token
+from app.core.security import get_bearer_token, get_request_token_payload
 from app.core.config import settings
 from app.models.user import User
 from app.schemas.user import UserResponse, UserPublicResponse, UserUpdateRequest
 from app.services.media_service import AVATAR_MAX_BYTES, delete_media_file, save_upload_file
 from app.services.security_challenge import guard_challenge
+from app.services.user_cache import load_user
 
 router = APIRouter()
 
@@ -28,15 +29,11 @@ SELECTABLE_ROLES = ["contestant", "spectator"]
 
 
 async def get_current_user_optional(
-    authorization: str = Header(None, alias="Authorization"),
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> Optional[User]:
     """可选 JWT 认证依赖，未登录返回 None"""
-    if not authorization or not authorization.startswith("Bearer "):
-        return None
-
-    token = authorization.split(" ", 1)[1].strip()
-    payload = decode_token(token)
+    payload = get_request_token_payload(request)
 
     if not payload or "sub" not in payload:
         return None
@@ -46,8 +43,7 @@ async def get_current_user_optional(
     except (TypeError, ValueError):
         return None
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await load_user(db, user_id)
 
     if user is None or not user.is_active:
         return None
@@ -56,19 +52,23 @@ async def get_current_user_optional(
 
 
 async def get_current_user_dep(
-    authorization: str = Header(None, alias="Authorization"),
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> User:
-    """JWT 认证依赖"""
-    if not authorization or not authorization.startswith("Bearer "):
+    """
+    JWT 认证依赖
+
+    Token 在每个请求内只解码一次（与请求日志、限流共用 request.state 上的结果），
+    用户行按 AUTH_USER_CACHE_BACKEND 走缓存。其他模块的 get_current_user 均复用此依赖。
+    """
+    if get_bearer_token(request) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="请先登录",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    token = authorization.split(" ", 1)[1].strip()
-    payload = decode_token(token)
+    payload = get_request_token_payload(request)
 
     if not payload or "sub" not in payload:
         raise HTTPException(
@@ -85,8 +85,7 @@ async def get_current_user_dep(
             detail="无效的认证信息",
         )
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await load_user(db, user_id)
 
     if user is None:
         raise HTTPException(
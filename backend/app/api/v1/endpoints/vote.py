@@ -1,28 +1,35 @@
 """
 投票相关 API
 """
+import logging
 from datetime import datetime
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from pydantic import BaseModel
-from sqlalchemy import func, select
+from sqlalchemy import delete, func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.api.v1.endpoints.submission import get_current_user
+from app.api.v1.endpoints.submission import get_current_user, get_optional_user
 from app.core.database import get_db
 from app.core.rate_limit import limiter, RateLimits
-from app.models.contest import Contest, ContestPhase
+from app.models.contest import ContestPhase
 from app.models.registration import Registration, RegistrationStatus
 from app.models.submission import Submission, SubmissionStatus
 from app.models.task import TaskType
 from app.models.user import User
 from app.models.vote import Vote
+from app.services import leaderboard_service
+from app.services.contest_cache import get_contest_or_404
+from app.services.contest_phase import ContestLike, effective_phase
 from app.services.log_service import log_vote
 from app.services.task_service import TaskService
+from app.services.vote_counter import adjust_vote_count
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 class VoteActionResponse(BaseModel):
@@ -46,18 +53,6 @@ class MyVoteListResponse(BaseModel):
     total: int
 
 
-async def get_contest_or_404(db: AsyncSession, contest_id: int) -> Contest:
-    """获取比赛，不存在则抛出 404"""
-    result = await db.execute(select(Contest).where(Contest.id == contest_id))
-    contest = result.scalar_one_or_none()
-    if contest is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="比赛不存在",
-        )
-    return contest
-
-
 async def get_submission_or_404(db: AsyncSession, submission_id: int) -> Submission:
     """获取作品，不存在则抛出 404"""
     result = await db.execute(select(Submission).where(Submission.id == submission_id))
@@ -70,23 +65,15 @@ async def get_submission_or_404(db: AsyncSession, submission_id: int) -> Submiss
     return submission
 
 
-def ensure_voting_phase(contest: Contest) -> None:
-    """确保比赛处于投票阶段"""
-    if contest.phase != ContestPhase.VOTING.value:
+def ensure_voting_phase(contest: ContestLike) -> None:
+    """确保比赛处于投票阶段（按时间窗口计算，边界到达即生效）"""
+    if effective_phase(contest) != ContestPhase.VOTING.value:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="当前比赛不在投票阶段",
         )
 
 
-async def refresh_submission_vote_count(db: AsyncSession, submission: Submission) -> None:
-    """刷新作品票数"""
-    count_result = await db.execute(
-        select(func.count(Vote.id)).where(Vote.submission_id == submission.id)
-    )
-    submission.vote_count = int(count_result.scalar() or 0)
-
-
 @router.post(
     "/{submission_id}",
     response_model=VoteActionResponse,
@@ -145,8 +132,6 @@ async def vote_submission(
     )
     existing_vote = existing_result.scalar_one_or_none()
     if existing_vote:
-        await refresh_submission_vote_count(db, submission)
-        await db.commit()
         return VoteActionResponse(
             submission_id=submission.id,
             vote_count=submission.vote_count,
@@ -160,15 +145,13 @@ async def vote_submission(
     except IntegrityError:
         await db.rollback()
         submission = await get_submission_or_404(db, submission_id)
-        await refresh_submission_vote_count(db, submission)
-        await db.commit()
         return VoteActionResponse(
             submission_id=submission.id,
             vote_count=submission.vote_count,
             voted=True,
         )
 
-    await refresh_submission_vote_count(db, submission)
+    await adjust_vote_count(db, submission.id, 1)
     await log_vote(db, current_user.id, submission.title, request=request)
     await TaskService.record_event(
         db=db,
@@ -215,17 +198,16 @@ async def cancel_vote(
     )
     existing_vote = existing_result.scalar_one_or_none()
     if existing_vote is None:
-        await refresh_submission_vote_count(db, submission)
-        await db.commit()
         return VoteActionResponse(
             submission_id=submission.id,
             vote_count=submission.vote_count,
             voted=False,
         )
 
-    await db.delete(existing_vote)
-    await db.flush()
-    await refresh_submission_vote_count(db, submission)
+    # 按影响行数判断，避免并发取消同一票时重复扣减
+    delete_result = await db.execute(delete(Vote).where(Vote.id == existing_vote.id))
+    if delete_result.rowcount:
+        await adjust_vote_count(db, submission.id, -1)
     await db.commit()
     await db.refresh(submission)
     return VoteActionResponse(
@@ -270,97 +252,97 @@ async def get_my_votes(
     return MyVoteListResponse(items=items, total=len(items))
 
 
-@router.get("/leaderboard")
-async def get_heat_leaderboard(
-    contest_id: int = Query(1, description="比赛ID"),
-    limit: int = Query(50, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db)
-):
-    """获取热力榜 - 按用户打赏消耗的积分（热力值）排行，展示最热心的吃瓜群众"""
-    from app.models.registration import Registration, RegistrationStatus
-    from app.models.cheer import Cheer, CheerType
-
-    # 道具分数配置
-    ITEM_POINTS = {
-        CheerType.CHEER: 1,
-        CheerType.COFFEE: 2,
-        CheerType.ENERGY: 3,
-        CheerType.PIZZA: 4,
-        CheerType.STAR: 5,
-    }
+async def build_heat_entries(
+    db: AsyncSession,
+    contest_id: int,
+    ranked: list[tuple[int, int, int]],
+) -> list[dict]:
+    """补全热力榜条目的用户信息与道具明细"""
+    from app.models.cheer import Cheer
 
-    # 获取比赛的所有报名ID
-    reg_query = select(Registration.id).where(
-        Registration.contest_id == contest_id,
-        Registration.status.in_([
-            RegistrationStatus.SUBMITTED.value,
-            RegistrationStatus.APPROVED.value,
-        ])
-    )
-    reg_result = await db.execute(reg_query)
-    registration_ids = [r for r in reg_result.scalars().all()]
-
-    if not registration_ids:
-        return {"items": [], "total": 0}
-
-    # 统计每个用户的打气次数（按类型分组）
-    stats_query = (
-        select(
-            Cheer.user_id,
-            Cheer.cheer_type,
-            func.count(Cheer.id).label("count")
+    user_ids = list({user_id for _, user_id, _ in ranked})
+    if not user_ids:
+        return []
+
+    user_result = await db.execute(select(User).where(User.id.in_(user_ids)))
+    user_map = {u.id: u for u in user_result.scalars().all()}
+
+    # 只统计本页用户的道具明细
+    stats_result = await db.execute(
+        select(Cheer.user_id, Cheer.cheer_type, func.count(Cheer.id).label("count"))
+        .join(Registration, Registration.id == Cheer.registration_id)
+        .where(
+            Registration.contest_id == contest_id,
+            Registration.status.in_(leaderboard_service.HEAT_REGISTRATION_STATUSES),
+            Cheer.user_id.in_(user_ids),
         )
-        .where(Cheer.registration_id.in_(registration_ids))
         .group_by(Cheer.user_id, Cheer.cheer_type)
     )
-    stats_result = await db.execute(stats_query)
-    raw_stats = stats_result.all()
-
-    # 汇总每个用户的热力值
-    user_stats = {}
-    for user_id, cheer_type, count in raw_stats:
-        if user_id not in user_stats:
-            user_stats[user_id] = {
-                "cheer": 0, "coffee": 0, "energy": 0, "pizza": 0, "star": 0,
-                "total_count": 0,  # 总打气次数
-                "heat_value": 0,   # 总热力值（积分）
-            }
-        type_key = cheer_type.value
-        user_stats[user_id][type_key] = count
-        user_stats[user_id]["total_count"] += count
-        user_stats[user_id]["heat_value"] += count * ITEM_POINTS.get(cheer_type, 1)
-
-    if not user_stats:
-        return {"items": [], "total": 0}
-
-    # 按热力值排序
-    sorted_users = sorted(user_stats.items(), key=lambda x: x[1]["heat_value"], reverse=True)[:limit]
-
-    # 获取用户详情
-    user_ids = [u[0] for u in sorted_users]
-    user_query = select(User).where(User.id.in_(user_ids))
-    user_result = await db.execute(user_query)
-    user_map = {u.id: u for u in user_result.scalars().all()}
+    type_stats: dict[int, dict] = {}
+    for user_id, cheer_type, count in stats_result.all():
+        entry = type_stats.setdefault(user_id, {
+            "cheer": 0, "coffee": 0, "energy": 0, "pizza": 0, "star": 0,
+            "total_count": 0,
+        })
+        entry[cheer_type.value] = count
+        entry["total_count"] += count
 
     items = []
-    for rank, (user_id, stats) in enumerate(sorted_users, 1):
+    for rank, user_id, heat_value in ranked:
         user = user_map.get(user_id)
-        if user:
-            items.append({
-                "rank": rank,
-                "user_id": user_id,
-                "username": user.username,
-                "display_name": user.display_name,
-                "avatar_url": user.avatar_url,
-                "heat_value": stats["heat_value"],
-                "total_count": stats["total_count"],
-                "stats": {
-                    "cheer": stats["cheer"],
-                    "coffee": stats["coffee"],
-                    "energy": stats["energy"],
-                    "pizza": stats["pizza"],
-                    "star": stats["star"],
-                },
-            })
-
-    return {"items": items, "total": len(items)}
+        if not user:
+            continue
+        stats = type_stats.get(user_id, {
+            "cheer": 0, "coffee": 0, "energy": 0, "pizza": 0, "star": 0,
+            "total_count": 0,
+        })
+        items.append({
+            "rank": rank,
+            "user_id": user_id,
+            "username": user.username,
+            "display_name": user.display_name,
+            "avatar_url": user.avatar_url,
+            "heat_value": heat_value,
+            "total_count": stats["total_count"],
+            "stats": {
+                "cheer": stats["cheer"],
+                "coffee": stats["coffee"],
+                "energy": stats["energy"],
+                "pizza": stats["pizza"],
+                "star": stats["star"],
+            },
+        })
+    return items
+
+
+@router.get("/leaderboard")
+async def get_heat_leaderboard(
+    contest_id: int = Query(1, description="比赛ID"),
+    limit: int = Query(50, ge=1, le=100, description="返回数量"),
+    around: int = Query(0, ge=0, le=20, description="返回当前用户前后各多少名"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """获取热力榜 - 按用户打赏消耗的积分（热力值）排行，展示最热心的吃瓜群众"""
+    board = leaderboard_service.HEAT
+    user_id = current_user.id if current_user else None
+    my_rank = None
+    window: list[tuple[int, int, int]] = []
+    try:
+        top = await leaderboard_service.get_top(db, board, contest_id, limit)
+        if user_id is not None:
+            my_rank = await leaderboard_service.get_rank(db, board, user_id, contest_id)
+            if my_rank and around:
+                window = await leaderboard_service.get_window(db, board, user_id, around, contest_id)
+    except leaderboard_service.LeaderboardUnavailable as exc:
+        logger.warning("热力榜缓存不可用，回退数据库: %s", exc)
+        scores = await leaderboard_service.load_scores(db, board, contest_id)
+        top, my_rank, window = leaderboard_service.rank_in_memory(scores, limit, user_id, around)
+
+    items = await build_heat_entries(db, contest_id, top)
+    return {
+        "items": items,
+        "total": len(items),
+        "my_rank": my_rank[0] if my_rank else None,
+        "neighbors": await build_heat_entries(db, contest_id, window) if window else [],
+    }
@@ -5,13 +5,33 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.core.db_metrics import install_query_stats
+
+
+def _build_connect_args() -> dict:
+    connect_args = {"charset": "utf8mb4"}
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        # MySQL 仅对只读 SELECT 生效，超时后语句被服务端中止
+        connect_args["init_command"] = (
+            f"SET SESSION max_execution_time={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+        )
+    return connect_args
+
 
 engine = create_async_engine(
     settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    connect_args={"charset": "utf8mb4"},
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args=_build_connect_args(),
 )
 
+# 按请求统计 SQL 条数与耗时
+install_query_stats(engine.sync_engine)
+
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
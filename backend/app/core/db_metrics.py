@@ -0,0 +1,114 @@
+"""
+数据库查询统计
+
+通过 SQLAlchemy 游标事件统计每个请求的 SQL 条数与耗时：
+- 请求日志中间件在请求开始时调用 start_request_stats()，结束时取回结果写入请求日志
+- 同时按路由模板累计到进程内汇总，供管理后台定位 N+1 接口
+"""
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class QueryStats:
+    """单个请求的查询统计"""
+    count: int = 0
+    total_ms: float = 0.0
+
+
+@dataclass
+class RouteDBStats:
+    """单个路由的累计查询统计"""
+    requests: int = 0
+    queries: int = 0
+    db_ms: float = 0.0
+    max_queries: int = 0
+    max_db_ms: float = 0.0
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("db_query_stats", default=None)
+_route_stats: dict[str, RouteDBStats] = {}
+
+# 路由汇总的上限，防止异常路径把字典撑大
+_MAX_ROUTES = 1000
+
+
+def start_request_stats() -> QueryStats:
+    """为当前请求开启统计"""
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def record_route_stats(route: str, stats: QueryStats) -> None:
+    """把一次请求的统计累计到路由汇总"""
+    entry = _route_stats.get(route)
+    if entry is None:
+        if len(_route_stats) >= _MAX_ROUTES:
+            return
+        entry = _route_stats[route] = RouteDBStats()
+    entry.requests += 1
+    entry.queries += stats.count
+    entry.db_ms += stats.total_ms
+    entry.max_queries = max(entry.max_queries, stats.count)
+    entry.max_db_ms = max(entry.max_db_ms, stats.total_ms)
+
+
+def get_route_stats(order_by: str = "avg_queries", limit: int = 50) -> list[dict[str, Any]]:
+    """路由汇总（按平均查询数/平均耗时等排序）"""
+    items = []
+    for route, entry in _route_stats.items():
+        if not entry.requests:
+            continue
+        items.append({
+            "route": route,
+            "requests": entry.requests,
+            "avg_queries": round(entry.queries / entry.requests, 2),
+            "max_queries": entry.max_queries,
+            "avg_db_ms": round(entry.db_ms / entry.requests, 2),
+            "max_db_ms": round(entry.max_db_ms, 2),
+            "total_db_ms": round(entry.db_ms, 2),
+        })
+    if items and order_by in items[0]:
+        items.sort(key=lambda item: item[order_by], reverse=True)
+    return items[:limit]
+
+
+def reset_route_stats() -> None:
+    """清空路由汇总"""
+    _route_stats.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start_time")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def install_query_stats(engine: Engine) -> None:
+    """在同步引擎上注册游标事件（异步引擎传入 engine.sync_engine）"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,97 @@
+"""
+出站 HTTP 客户端注册表
+
+每个上游一个长连接 httpx.AsyncClient（keep-alive 复用 TCP/TLS，上游支持时走 HTTP/2），
+API 进程在 lifespan 中创建、退出时统一关闭（Worker/脚本首次使用时按需创建）；
+调用方不再自行建连/关闭。
+单次请求的超时仍可通过 client.get(..., timeout=...) 覆盖。
+共享客户端不保存 Cookie：上游的 Set-Cookie 不会带入后续其他用户的请求。
+"""
+import logging
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 上游名称
+GITHUB_API = "github_api"
+GITHUB_OAUTH = "github_oauth"
+LINUX_DO = "linux_do"
+QUOTA = "quota"
+MEDIA = "media"
+CAPTCHA = "captcha"
+
+try:  # HTTP/2 依赖 h2（httpx[http2]），未安装时回退 HTTP/1.1
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# 各上游的默认参数（未列出的字段使用通用配置）
+_PROFILES: dict[str, dict] = {
+    GITHUB_API: {"timeout": 15.0, "http2": True},
+    GITHUB_OAUTH: {"timeout": 15.0, "http2": True},
+    LINUX_DO: {"timeout": 15.0, "http2": True},
+    QUOTA: {
+        "timeout": settings.QUOTA_TIMEOUT_SECONDS,
+        "max_connections": max(settings.QUOTA_MAX_CONCURRENCY, settings.HTTP_CLIENT_MAX_KEEPALIVE),
+    },
+    # 头像等任意外部地址：允许重定向，读超时单独限制
+    MEDIA: {"timeout": httpx.Timeout(10.0, read=10.0), "follow_redirects": True},
+    CAPTCHA: {"timeout": 10.0, "http2": True},
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _reject_all_cookies() -> CookieJar:
+    """不接受任何域名 Cookie 的 CookieJar（客户端跨用户共享，不能保留会话状态）"""
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    profile = _PROFILES.get(name, {})
+    max_connections = profile.get("max_connections", settings.HTTP_CLIENT_MAX_CONNECTIONS)
+    return httpx.AsyncClient(
+        timeout=profile.get("timeout", settings.HTTP_CLIENT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_connections, settings.HTTP_CLIENT_MAX_KEEPALIVE),
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        http2=bool(profile.get("http2")) and settings.HTTP_CLIENT_HTTP2 and _HTTP2_AVAILABLE,
+        follow_redirects=profile.get("follow_redirects", False),
+        cookies=_reject_all_cookies(),
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """获取指定上游的共享客户端（首次调用时创建）"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+def init_http_clients() -> None:
+    """预先创建全部上游客户端（启动时调用，连接在首次请求时建立）"""
+    for name in _PROFILES:
+        get_http_client(name)
+    logger.info("出站 HTTP 客户端已初始化（HTTP/2 %s）", "可用" if _HTTP2_AVAILABLE else "不可用")
+
+
+async def shutdown_http_clients(names: Optional[list[str]] = None) -> None:
+    """关闭共享客户端（退出时调用）"""
+    for name in list(names or _clients.keys()):
+        client = _clients.pop(name, None)
+        if client is None:
+            continue
+        try:
+            await client.aclose()
+        except Exception as exc:
+            logger.warning("关闭 HTTP 客户端失败 (%s): %s", name, exc)
@@ -54,17 +54,14 @@ def get_user_identifier(request: Request) -> str:
     获取用户标识符，用于速率限制的 key
     优先使用用户 ID（从 JWT 解析），否则使用 IP 地址
     """
-    # 尝试从 Authorization header 获取用户信息
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer "):
-        try:
-            from app.core.security import decode_token
-            token = auth_header.split(" ", 1)[1].strip()
-            payload = decode_token(token)
-            if payload and "sub" in payload:
-                return f"user:{payload['sub']}"
-        except Exception:
-            pass
+    # 尝试从 Authorization header 获取用户信息（与认证依赖共用本次请求的解码结果）
+    try:
+        from app.core.security import get_request_token_payload
+        payload = get_request_token_payload(request)
+        if payload and "sub" in payload:
+            return f"user:{payload['sub']}"
+    except Exception:
+        pass
 
     # 回退到 IP 地址
     return get_client_ip(request)
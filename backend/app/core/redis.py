@@ -1,19 +1,92 @@
 """
 Redis 客户端封装
+
+进程内共享一个连接池：API 进程在 lifespan 中初始化，Worker 在主循环启动时初始化。
+连接带健康检查与断线重试，调用方不再需要每次建连/关闭。
 """
+import logging
 from typing import Optional
 
-from redis.asyncio import Redis
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.commands.core import AsyncScript
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
 
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ConnectionPool] = None
+_client: Optional[Redis] = None
+_scripts: dict[str, AsyncScript] = {}
+
+
+def _build_pool() -> ConnectionPool:
+    return ConnectionPool.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_keepalive=True,
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), settings.REDIS_RETRY_ATTEMPTS),
+        retry_on_error=[RedisConnectionError, RedisTimeoutError],
+    )
+
+
+def _ensure_client() -> Redis:
+    global _pool, _client
+    if _client is None:
+        _pool = _build_pool()
+        _client = Redis(connection_pool=_pool)
+    return _client
+
+
+async def init_redis() -> Redis:
+    """初始化共享连接池（启动时调用，连接失败只告警不阻断启动）"""
+    client = _ensure_client()
+    try:
+        await client.ping()
+    except Exception as exc:
+        logger.warning("Redis 连接检查失败，将在首次使用时重连: %s", exc)
+    return client
+
+
+async def shutdown_redis() -> None:
+    """关闭共享连接池（退出时调用）"""
+    global _pool, _client
+    client, pool = _client, _pool
+    _client = None
+    _pool = None
+    _scripts.clear()
+    if client is not None:
+        await client.aclose()
+    if pool is not None:
+        await pool.disconnect()
+
 
 async def get_redis() -> Redis:
-    """创建 Redis 客户端（异步）"""
-    return Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    """获取共享 Redis 客户端（异步）"""
+    return _ensure_client()
 
 
 async def close_redis(client: Optional[Redis]) -> None:
-    """关闭 Redis 客户端"""
-    if client is not None:
-        await client.close()
+    """
+    关闭 Redis 客户端
+
+    共享客户端由 shutdown_redis 统一关闭，这里只处理调用方自建的客户端。
+    """
+    if client is not None and client is not _client:
+        await client.aclose()
+
+
+def get_script(name: str, source: str) -> AsyncScript:
+    """获取注册在共享客户端上的 Lua 脚本（EVALSHA，未加载时自动回退 EVAL）"""
+    script = _scripts.get(name)
+    if script is None:
+        script = _ensure_client().register_script(source)
+        _scripts[name] = script
+    return script
@@ -1,10 +1,13 @@
 """
 安全相关配置
 """
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
 from jose import JWTError, jwt
+from starlette.requests import HTTPConnection
 from passlib.context import CryptContext
 
 from app.core.config import settings
@@ -43,3 +46,64 @@ def decode_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
+
+
+# 已验证 Token -> claims 的短期 LRU 缓存（只缓存验证通过的 Token）
+_token_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+# request.state 上保存本次请求解析结果的属性名
+_STATE_PAYLOAD = "auth_payload"
+
+
+def decode_token_cached(token: str) -> Optional[dict]:
+    """解码令牌（带 TTL 的 LRU 缓存，过期时间不超过 Token 自身的 exp）"""
+    ttl = settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+    if ttl <= 0:
+        return decode_token(token)
+
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is not None:
+        expires_at, payload = cached
+        if now < expires_at:
+            _token_cache.move_to_end(token)
+            return payload
+        _token_cache.pop(token, None)
+
+    payload = decode_token(token)
+    if payload is None:
+        return None
+
+    expires_at = now + ttl
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        expires_at = min(expires_at, float(exp))
+    _token_cache[token] = (expires_at, payload)
+    while len(_token_cache) > settings.AUTH_TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
+
+def get_bearer_token(conn: HTTPConnection) -> Optional[str]:
+    """从 Authorization 头提取 Bearer Token（没有 Bearer 头返回 None）"""
+    authorization = conn.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    return authorization.split(" ", 1)[1].strip()
+
+
+def get_request_token_payload(conn: HTTPConnection) -> Optional[dict]:
+    """
+    获取本次请求的 Token claims
+
+    每个请求只解码一次，结果保存在 request.state 上，
+    供请求日志中间件、限流 key 和认证依赖共用。
+    """
+    state = conn.state
+    if hasattr(state, _STATE_PAYLOAD):
+        return getattr(state, _STATE_PAYLOAD)
+
+    token = get_bearer_token(conn)
+    payload = decode_token_cached(token) if token else None
+    setattr(state, _STATE_PAYLOAD, payload)
+    return payload
@@ -10,9 +10,14 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from app.core.config import settings
+from app.core.http_client import init_http_clients, shutdown_http_clients
+from app.core.redis import init_redis, shutdown_redis
 from app.core.rate_limit import limiter, rate_limit_exceeded_handler
 from app.api.v1 import router as api_router
+from app.services.contest_cache import start_contest_cache_listener, stop_contest_cache_listener
+from app.services.media_derivatives import shutdown_derivative_pool
 from app.services.scheduler import start_scheduler, shutdown_scheduler
+from app.services.request_log_buffer import request_log_buffer
 from app.middleware import RequestLoggerMiddleware
 
 logger = logging.getLogger(__name__)
@@ -24,11 +29,31 @@ async def lifespan(app: FastAPI):
     # 启动时检查关键配置
     _check_security_config()
 
+    # 初始化共享 Redis 连接池
+    await init_redis()
+
+    # 初始化出站 HTTP 长连接客户端
+    init_http_clients()
+
+    # 订阅比赛缓存失效广播
+    start_contest_cache_listener()
+
+    # 启动请求日志批量写入
+    request_log_buffer.start()
+
     # 启动定时任务
     start_scheduler()
     yield
     # 关闭时执行
-    shutdown_scheduler()
+    await shutdown_scheduler()
+
+    # 刷写剩余的请求日志
+    await request_log_buffer.stop()
+
+    await stop_contest_cache_listener()
+    shutdown_derivative_pool()
+    await shutdown_http_clients()
+    await shutdown_redis()
 
 
 def _check_security_config():
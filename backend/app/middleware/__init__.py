@@ -1,6 +1,9 @@
 """
 中间件模块
 """
-from app.middleware.request_logger import RequestLoggerMiddleware
+from app.middleware.request_logger import (
+    BaseHTTPRequestLoggerMiddleware,
+    RequestLoggerMiddleware,
+)
 
-__all__ = ["RequestLoggerMiddleware"]
+__all__ = ["RequestLoggerMiddleware", "BaseHTTPRequestLoggerMiddleware"]
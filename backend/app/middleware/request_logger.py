@@ -5,15 +5,16 @@
 import json
 import time
 import logging
+from datetime import datetime
 from typing import Optional, Callable
 
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.core.database import AsyncSessionLocal
-from app.core.security import decode_token
-from app.models.request_log import RequestLog
+from app.core.db_metrics import record_route_stats, start_request_stats
+from app.core.security import get_request_token_payload
+from app.services.request_log_buffer import request_log_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -33,9 +34,91 @@ EXCLUDED_PREFIXES = (
 )
 
 
-class RequestLoggerMiddleware(BaseHTTPMiddleware):
+class _RequestLogMixin:
+    """两种中间件实现共用的跳过规则、信息提取与日志入队逻辑"""
+
+    def _should_skip(self, path: str) -> bool:
+        """判断是否跳过日志记录"""
+        if path in EXCLUDED_PATHS:
+            return True
+        if path.startswith(EXCLUDED_PREFIXES):
+            return True
+        # 跳过 OpenAPI 相关路径
+        if "/openapi.json" in path:
+            return True
+        return False
+
+    def _get_client_ip(self, request: Request) -> Optional[str]:
+        """获取客户端真实 IP"""
+        # 优先从代理头获取
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+
+        real_ip = request.headers.get("X-Real-IP")
+        if real_ip:
+            return real_ip
+
+        # 从连接获取
+        if request.client:
+            return request.client.host
+
+        return None
+
+    def _extract_user_info(self, request: Request) -> tuple[Optional[int], Optional[str]]:
+        """从请求中提取用户信息"""
+        user_id = None
+        username = None
+
+        # 从 Authorization header 解析 token，结果保存在 request.state 供后续复用
+        payload = get_request_token_payload(request)
+        if payload:
+            user_id = payload.get("sub")
+            if user_id:
+                try:
+                    user_id = int(user_id)
+                except (ValueError, TypeError):
+                    user_id = None
+            username = payload.get("username")
+
+        return user_id, username
+
+    def _save_log(
+        self,
+        method: str,
+        path: str,
+        query_params: Optional[str],
+        user_id: Optional[int],
+        username: Optional[str],
+        ip_address: Optional[str],
+        user_agent: Optional[str],
+        status_code: int,
+        response_time_ms: int,
+        error_message: Optional[str],
+        db_query_count: Optional[int] = None,
+        db_time_ms: Optional[int] = None,
+    ):
+        """放入请求日志缓冲区，由后台任务批量写入数据库"""
+        request_log_buffer.enqueue({
+            "method": method,
+            "path": path[:500],
+            "query_params": query_params,
+            "user_id": user_id,
+            "username": username[:50] if username else username,
+            "ip_address": ip_address[:50] if ip_address else ip_address,
+            "user_agent": user_agent,
+            "status_code": status_code,
+            "response_time_ms": response_time_ms,
+            "error_message": error_message,
+            "db_query_count": db_query_count,
+            "db_time_ms": db_time_ms,
+            "created_at": datetime.utcnow(),
+        })
+
+
+class RequestLoggerMiddleware(_RequestLogMixin):
     """
-    请求日志记录中间件
+    请求日志记录中间件（纯 ASGI 实现）
 
     记录每个 API 请求的：
     - HTTP 方法和路径
@@ -43,6 +126,94 @@ class RequestLoggerMiddleware(BaseHTTPMiddleware):
     - 客户端 IP 和 User-Agent
     - 响应状态码和耗时
     - 错误信息（如果有）
+
+    只包装 send 以捕获状态码，不额外创建任务和内存流，
+    FileResponse 等流式响应直接透传。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 检查是否需要跳过日志记录
+        path = scope["path"]
+        if self._should_skip(path):
+            await self.app(scope, receive, send)
+            return
+
+        # 记录开始时间，并开启本请求的 SQL 统计
+        start_time = time.time()
+        db_stats = start_request_stats()
+
+        request = Request(scope)
+
+        # 提取用户信息
+        user_id, username = self._extract_user_info(request)
+
+        # 提取客户端信息
+        ip_address = self._get_client_ip(request)
+        user_agent = request.headers.get("User-Agent", "")[:500]
+
+        # 提取查询参数
+        query_params = dict(request.query_params) if request.query_params else None
+
+        # 执行请求
+        error_message = None
+        status_code = 500  # 默认错误状态
+        response_time_ms: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_time_ms
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # 与旧实现一致：耗时统计到响应头发出为止，不含流式响应体
+                response_time_ms = int((time.time() - start_time) * 1000)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            error_message = str(e)[:1000]
+            logger.error(f"Request error: {path} - {e}")
+            raise
+        finally:
+            if response_time_ms is None:
+                response_time_ms = int((time.time() - start_time) * 1000)
+
+            # 按路由模板（如 /api/v1/contests/{contest_id}）累计 SQL 开销
+            route = scope.get("route")
+            record_route_stats(getattr(route, "path", None) or path, db_stats)
+
+            # 放入批量写入缓冲区，不阻塞响应
+            try:
+                self._save_log(
+                    method=request.method,
+                    path=path,
+                    query_params=json.dumps(query_params, ensure_ascii=False) if query_params else None,
+                    user_id=user_id,
+                    username=username,
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    status_code=status_code,
+                    response_time_ms=response_time_ms,
+                    error_message=error_message,
+                    db_query_count=db_stats.count,
+                    db_time_ms=int(db_stats.total_ms),
+                )
+            except Exception as e:
+                logger.warning(f"Failed to save request log: {e}")
+
+
+class BaseHTTPRequestLoggerMiddleware(_RequestLogMixin, BaseHTTPMiddleware):
+    """
+    基于 BaseHTTPMiddleware 的旧版实现
+
+    每个响应都会多包一层任务和内存流，保留仅用于基准对比
+    （见 scripts/bench_request_logger.py），线上使用 RequestLoggerMiddleware。
     """
 
     def __init__(self, app: ASGIApp):
@@ -58,7 +229,7 @@ class RequestLoggerMiddleware(BaseHTTPMiddleware):
         start_time = time.time()
 
         # 提取用户信息
-        user_id, username = await self._extract_user_info(request)
+        user_id, username = self._extract_user_info(request)
 
         # 提取客户端信息
         ip_address = self._get_client_ip(request)
@@ -82,9 +253,9 @@ class RequestLoggerMiddleware(BaseHTTPMiddleware):
         # 计算响应时间
         response_time_ms = int((time.time() - start_time) * 1000)
 
-        # 异步写入日志
+        # 放入批量写入缓冲区，不阻塞响应
         try:
-            await self._save_log(
+            self._save_log(
                 method=request.method,
                 path=path,
                 query_params=json.dumps(query_params, ensure_ascii=False) if query_params else None,
@@ -100,86 +271,3 @@ class RequestLoggerMiddleware(BaseHTTPMiddleware):
             logger.warning(f"Failed to save request log: {e}")
 
         return response
-
-    def _should_skip(self, path: str) -> bool:
-        """判断是否跳过日志记录"""
-        if path in EXCLUDED_PATHS:
-            return True
-        if path.startswith(EXCLUDED_PREFIXES):
-            return True
-        # 跳过 OpenAPI 相关路径
-        if "/openapi.json" in path:
-            return True
-        return False
-
-    def _get_client_ip(self, request: Request) -> Optional[str]:
-        """获取客户端真实 IP"""
-        # 优先从代理头获取
-        forwarded = request.headers.get("X-Forwarded-For")
-        if forwarded:
-            return forwarded.split(",")[0].strip()
-
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-
-        # 从连接获取
-        if request.client:
-            return request.client.host
-
-        return None
-
-    async def _extract_user_info(self, request: Request) -> tuple[Optional[int], Optional[str]]:
-        """从请求中提取用户信息"""
-        user_id = None
-        username = None
-
-        # 尝试从 Authorization header 获取 token
-        auth_header = request.headers.get("Authorization", "")
-        if auth_header.startswith("Bearer "):
-            token = auth_header[7:]
-            payload = decode_token(token)
-            if payload:
-                user_id = payload.get("sub")
-                if user_id:
-                    try:
-                        user_id = int(user_id)
-                    except (ValueError, TypeError):
-                        user_id = None
-                username = payload.get("username")
-
-        return user_id, username
-
-    async def _save_log(
-        self,
-        method: str,
-        path: str,
-        query_params: Optional[str],
-        user_id: Optional[int],
-        username: Optional[str],
-        ip_address: Optional[str],
-        user_agent: Optional[str],
-        status_code: int,
-        response_time_ms: int,
-        error_message: Optional[str],
-    ):
-        """保存日志到数据库"""
-        try:
-            async with AsyncSessionLocal() as session:
-                log = RequestLog(
-                    method=method,
-                    path=path,
-                    query_params=query_params,
-                    user_id=user_id,
-                    username=username,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    status_code=status_code,
-                    response_time_ms=response_time_ms,
-                    error_message=error_message,
-                )
-                session.add(log)
-                await session.commit()
-        except Exception as e:
-            # 日志记录失败不应影响主请求
-            logger.warning(f"Failed to save request log: {e}")
@@ -12,9 +12,10 @@ from app.models.project import Project, ProjectStatus
 from app.models.project_submission import ProjectSubmission, ProjectSubmissionStatus
 from app.models.project_review_assignment import ProjectReviewAssignment
 from app.models.project_review import ProjectReview
+from app.models.project_review_stats import ProjectReviewStats
 from app.models.project_like import ProjectLike
 from app.models.project_favorite import ProjectFavorite
-from app.models.github_stats import GitHubStats, GitHubSyncLog
+from app.models.github_stats import GitHubCommit, GitHubStats, GitHubSyncLog
 from app.models.cheer import Cheer, CheerType, CheerStats
 from app.models.achievement import (
     AchievementDefinition,
@@ -48,10 +49,12 @@ __all__ = [
     "ProjectSubmissionStatus",
     "ProjectReviewAssignment",
     "ProjectReview",
+    "ProjectReviewStats",
     "ProjectLike",
     "ProjectFavorite",
     "GitHubStats",
     "GitHubSyncLog",
+    "GitHubCommit",
     "Cheer",
     "CheerType",
     "CheerStats",
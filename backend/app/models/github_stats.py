@@ -3,10 +3,13 @@ GitHub 统计数据模型
 
 存储选手每日的 GitHub 活动数据，包括 commits 数量、代码增删行数等。
 支持按日期聚合统计，用于展示选手开发进度和活跃度。
+每日统计与累计数据由本地提交缓存（github_commits）汇总得出。
 """
 from datetime import date
 from sqlalchemy import (
+    Boolean,
     Column,
+    DateTime,
     String,
     Text,
     Integer,
@@ -121,3 +124,36 @@ class GitHubSyncLog(BaseModel):
 
     def __repr__(self):
         return f"<GitHubSyncLog(registration_id={self.registration_id}, status={self.status})>"
+
+
+class GitHubCommit(BaseModel):
+    """
+    GitHub 提交缓存表
+
+    按 (仓库, sha) 存储已拉取的提交及其代码行数统计。
+    同步时只请求最近一次提交之后的新提交，并只为未获取详情的 sha 拉取详情。
+    """
+    __tablename__ = "github_commits"
+
+    repo_owner = Column(String(100), nullable=False, comment="仓库所有者")
+    repo_name = Column(String(100), nullable=False, comment="仓库名称")
+    sha = Column(String(40), nullable=False, comment="提交 SHA")
+
+    authored_at = Column(DateTime, nullable=False, comment="作者提交时间（UTC，用于按日统计）")
+    committed_at = Column(DateTime, nullable=False, comment="提交者时间（UTC，用于增量拉取游标）")
+    message = Column(String(200), nullable=True, comment="提交说明首行")
+
+    additions = Column(Integer, nullable=False, default=0, comment="新增行数")
+    deletions = Column(Integer, nullable=False, default=0, comment="删除行数")
+    files_changed = Column(Integer, nullable=False, default=0, comment="修改文件数")
+    detail_synced = Column(Boolean, nullable=False, default=False, comment="是否已获取详情统计")
+
+    __table_args__ = (
+        UniqueConstraint("repo_owner", "repo_name", "sha", name="uq_github_commits_repo_sha"),
+        Index("ix_github_commits_repo_authored", "repo_owner", "repo_name", "authored_at"),
+        Index("ix_github_commits_repo_committed", "repo_owner", "repo_name", "committed_at"),
+        Index("ix_github_commits_pending", "repo_owner", "repo_name", "detail_synced"),
+    )
+
+    def __repr__(self):
+        return f"<GitHubCommit(repo={self.repo_owner}/{self.repo_name}, sha={self.sha[:7]})>"
@@ -0,0 +1,35 @@
+"""
+作品评分汇总模型（排行榜物化数据）
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Numeric
+
+from app.models.base import Base
+
+
+class ProjectReviewStats(Base):
+    """
+    作品评分汇总表
+
+    每个作品一行，评审员提交/删除评分时按作品重算，
+    排行榜直接读取该表，不再每次聚合 project_reviews。
+    """
+    __tablename__ = "project_review_stats"
+    __table_args__ = (
+        Index("ix_project_review_stats_rank", "contest_id", "final_score", "review_count", "project_id"),
+    )
+
+    project_id = Column(
+        Integer,
+        ForeignKey("projects.id", ondelete="CASCADE"),
+        primary_key=True,
+        comment="关联作品ID",
+    )
+    contest_id = Column(Integer, nullable=False, comment="关联比赛ID")
+    review_count = Column(Integer, nullable=False, default=0, comment="评分数量")
+    score_sum = Column(Integer, nullable=False, default=0, comment="评分总和")
+    score_min = Column(Integer, nullable=True, comment="最低分")
+    score_max = Column(Integer, nullable=True, comment="最高分")
+    final_score = Column(Numeric(6, 2), nullable=True, comment="最终得分（去掉最高最低后的平均分）")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
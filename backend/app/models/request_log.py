@@ -34,6 +34,10 @@ class RequestLog(Base):
     status_code = Column(Integer, nullable=False, comment="HTTP 响应状态码")
     response_time_ms = Column(Integer, nullable=False, comment="响应时间(毫秒)")
 
+    # 数据库开销
+    db_query_count = Column(Integer, nullable=True, comment="SQL 条数")
+    db_time_ms = Column(Integer, nullable=True, comment="SQL 累计耗时(毫秒)")
+
     # 错误信息
     error_message = Column(Text, nullable=True, comment="错误信息")
 
@@ -0,0 +1,53 @@
+"""
+独立定时任务进程
+
+与 API 进程中的调度器相同，通过 Redis 选主保证同一时刻只有一个进程执行定时任务。
+配合 SCHEDULER_MODE=external 使用时，API 进程不再运行调度器，定时任务只在本进程执行。
+
+用法（在 backend 目录下）：
+    python -m app.scheduler
+"""
+import asyncio
+import logging
+import signal
+
+from app.core.database import engine
+from app.core.http_client import init_http_clients, shutdown_http_clients
+from app.core.redis import init_redis, shutdown_redis
+from app.services.scheduler import shutdown_scheduler, start_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+async def _scheduler_loop() -> None:
+    """调度进程主循环（收到 SIGTERM/SIGINT 后让出领导者并退出）"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        await init_redis()
+        init_http_clients()
+        start_scheduler(standalone=True)
+        logger.info("定时任务进程已启动")
+        await stop.wait()
+        logger.info("定时任务进程正在退出")
+    finally:
+        await shutdown_scheduler()
+        await shutdown_http_clients()
+        await shutdown_redis()
+        await engine.dispose()
+
+
+def main() -> None:
+    """启动入口"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(_scheduler_loop())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@
 成就系统服务
 负责成就进度计算、解锁检测和统计更新
 """
+import asyncio
+import logging
+import time
 from datetime import date, datetime, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 
-from sqlalchemy import func, select, update
+from sqlalchemy import event, func, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from app.core.redis import get_redis
 from app.models.achievement import (
     AchievementDefinition,
     AchievementStatus,
@@ -18,6 +23,8 @@ from app.models.achievement import (
 from app.models.cheer import Cheer
 
 
+logger = logging.getLogger(__name__)
+
 # 成就规则配置
 ACHIEVEMENT_RULES = {
     # ========== 打气类成就 ==========
@@ -66,6 +73,45 @@ ACHIEVEMENT_RULES = {
     "prediction_king": {"type": "prediction_accuracy", "target": 80},  # 预言家（准确率>80%）
 }
 
+# 统计事件类型：写入路径只需声明本次变化了哪类统计，引擎只评估受影响的规则
+STAT_CHEER = "cheer"
+STAT_GACHA = "gacha"
+STAT_PREDICTION = "prediction"
+
+STAT_RULE_TYPES = {
+    STAT_CHEER: ("cheer_count", "cheer_types", "message_count", "streak", "unique_projects", "early_bird"),
+    STAT_GACHA: ("gacha_count", "gacha_rare"),
+    STAT_PREDICTION: ("prediction_accuracy",),
+}
+
+# 全量评估兜底：其他途径变化的统计（任务类统计、账号合并）与重新启用的成就定义不在增量范围内，
+# 每个用户每个周期内的第一次检查评估全部规则；request_full_check 可让用户下次检查立即全量评估
+FULL_CHECK_INTERVAL_SECONDS = 3600
+_FULL_CHECK_KEY_PREFIX = "achievement:full_check:"
+_SESSION_INFO_KEY = "achievement_full_check_user_ids"
+
+# 规则类型 -> 成就 key 列表
+RULES_BY_TYPE: dict[str, list[str]] = {}
+for _key, _rule in ACHIEVEMENT_RULES.items():
+    RULES_BY_TYPE.setdefault(_rule["type"], []).append(_key)
+
+# 直接取统计字段作为进度的规则
+_STAT_GETTERS = {
+    "cheer_count": lambda stats: stats.total_cheers_given,
+    "cheer_types": lambda stats: len(stats.cheer_types_used or []),
+    "message_count": lambda stats: stats.total_cheers_with_message,
+    "streak": lambda stats: stats.consecutive_days,
+    "gacha_count": lambda stats: stats.total_gacha_count,
+    "gacha_rare": lambda stats: stats.gacha_rare_count,
+    "daily_task_streak": lambda stats: stats.max_daily_task_streak,
+    "weekly_task_complete": lambda stats: stats.weekly_tasks_completed,
+}
+
+# 启用的成就 key 进程内缓存：成就定义没有管理接口、只通过 SQL 变更，仅靠 TTL 过期（变更后最多 60 秒生效，
+# 重新启用的成就由全量评估兜底）
+ACTIVE_KEYS_CACHE_TTL_SECONDS = 60
+_active_keys_cache: Optional[tuple[float, frozenset[str]]] = None
+
 
 async def get_or_create_user_stats(db: AsyncSession, user_id: int) -> UserStats:
     """获取或创建用户统计（并发安全）"""
@@ -76,7 +122,6 @@ async def get_or_create_user_stats(db: AsyncSession, user_id: int) -> UserStats:
 
     if not stats:
         # 使用 INSERT IGNORE 避免并发冲突
-        from sqlalchemy import text
         await db.execute(
             text("""
                 INSERT IGNORE INTO user_stats (user_id, total_cheers_given, total_cheers_with_message,
@@ -109,7 +154,6 @@ async def get_or_create_user_achievement(
 
     if not achievement:
         # 使用 INSERT IGNORE 避免并发冲突
-        from sqlalchemy import text
         await db.execute(
             text("""
                 INSERT IGNORE INTO user_achievements (user_id, achievement_key, status, progress_value)
@@ -179,123 +223,280 @@ async def update_user_stats_on_cheer(
     return stats
 
 
-async def check_and_unlock_achievements(
-    db: AsyncSession,
-    user_id: int,
+async def get_active_achievement_keys(db: AsyncSession) -> frozenset[str]:
+    """获取启用的成就 key（进程内短期缓存，定义极少变更）"""
+    global _active_keys_cache
+    now = time.monotonic()
+    if _active_keys_cache is not None and now - _active_keys_cache[0] < ACTIVE_KEYS_CACHE_TTL_SECONDS:
+        return _active_keys_cache[1]
+
+    result = await db.execute(
+        select(AchievementDefinition.achievement_key).where(AchievementDefinition.is_active == True)
+    )
+    keys = frozenset(result.scalars().all())
+    _active_keys_cache = (now, keys)
+    return keys
+
+
+def _candidate_keys(active_keys: frozenset[str], stat_types: Optional[Iterable[str]]) -> list[str]:
+    """按变化的统计类型筛选需要评估的成就"""
+    if stat_types is None:
+        rule_types = RULES_BY_TYPE.keys()
+    else:
+        rule_types = {rule_type for stat in stat_types for rule_type in STAT_RULE_TYPES.get(stat, ())}
+    return [
+        key
+        for rule_type in rule_types
+        for key in RULES_BY_TYPE.get(rule_type, ())
+        if key in active_keys
+    ]
+
+
+def _evaluate_rule(
+    rule: dict,
     stats: UserStats,
-    contest_start_date: Optional[date] = None,
-) -> list[str]:
-    """检查并解锁成就，返回新解锁的成就key列表"""
-    newly_unlocked = []
+    unique_projects: int,
+    contest_start_date: Optional[date],
+) -> Optional[tuple[int, bool]]:
+    """计算单条规则的 (进度, 是否解锁)，不自动检测的规则返回 None"""
+    rule_type = rule["type"]
+    target = rule["target"]
+
+    if rule_type == "easter_egg":
+        # 彩蛋成就通过特定 API 手动颁发，这里跳过
+        return None
+
+    if rule_type == "unique_projects":
+        return unique_projects, unique_projects >= target
+
+    if rule_type == "early_bird":
+        # 早期支持者：比赛开始 N 天内打气
+        if contest_start_date and stats.total_cheers_given > 0:
+            deadline = contest_start_date + timedelta(days=rule.get("days_from_start", 3))
+            if date.today() <= deadline:
+                return 1, True
+        return 0, False
+
+    if rule_type == "prediction_accuracy":
+        # 竞猜准确率需要至少10次竞猜
+        if stats.prediction_total >= 10:
+            progress = int((stats.prediction_correct / stats.prediction_total) * 100)
+            return progress, progress >= target
+        return 0, False
+
+    getter = _STAT_GETTERS.get(rule_type)
+    if getter is None:
+        return None
+    progress = getter(stats)
+    return progress, progress >= target
+
+
+async def _load_unique_project_counts(db: AsyncSession, user_ids: list[int]) -> dict[int, int]:
+    if not user_ids:
+        return {}
+    result = await db.execute(
+        select(Cheer.user_id, func.count(func.distinct(Cheer.registration_id)))
+        .where(Cheer.user_id.in_(user_ids))
+        .group_by(Cheer.user_id)
+    )
+    return {user_id: count for user_id, count in result.all()}
+
 
-    # 获取所有活跃成就定义
+async def _load_user_achievements(
+    db: AsyncSession,
+    user_ids: list[int],
+    keys: list[str],
+) -> dict[tuple[int, str], UserAchievement]:
     result = await db.execute(
-        select(AchievementDefinition).where(AchievementDefinition.is_active == True)
+        select(UserAchievement).where(
+            UserAchievement.user_id.in_(user_ids),
+            UserAchievement.achievement_key.in_(keys),
+        )
     )
-    definitions = result.scalars().all()
+    return {(ua.user_id, ua.achievement_key): ua for ua in result.scalars().all()}
 
-    for definition in definitions:
-        key = definition.achievement_key
-        rule = ACHIEVEMENT_RULES.get(key)
-        if not rule:
-            continue
 
-        # 获取用户成就记录
-        user_ach = await get_or_create_user_achievement(db, user_id, key)
+async def _claim_full_checks(user_ids: list[int]) -> set[int]:
+    """返回本周期内需要全量评估的用户（Redis 不可用时全部全量评估）"""
+    try:
+        client = await get_redis()
+        async with client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.set(f"{_FULL_CHECK_KEY_PREFIX}{user_id}", 1, nx=True, ex=FULL_CHECK_INTERVAL_SECONDS)
+            claimed = await pipe.execute()
+    except Exception as exc:
+        logger.warning("读取成就全量评估标记失败，按全量评估: %s", exc)
+        return set(user_ids)
+    return {user_id for user_id, ok in zip(user_ids, claimed) if ok}
 
-        # 已解锁则跳过
-        if user_ach.status != AchievementStatus.LOCKED.value:
-            continue
 
-        # 计算进度和是否解锁
-        progress = 0
-        should_unlock = False
+def request_full_check(db: AsyncSession, user_id: int) -> None:
+    """统计在增量路径之外发生变化（如账号合并）：事务提交后让该用户下次检查全量评估"""
+    db.info.setdefault(_SESSION_INFO_KEY, set()).add(user_id)
 
-        rule_type = rule["type"]
-        target = rule["target"]
 
-        if rule_type == "cheer_count":
-            progress = stats.total_cheers_given
-            should_unlock = progress >= target
+async def _reset_full_checks(*user_ids: int) -> None:
+    try:
+        client = await get_redis()
+        await client.delete(*[f"{_FULL_CHECK_KEY_PREFIX}{user_id}" for user_id in user_ids])
+    except Exception as exc:
+        logger.warning("重置成就全量评估标记失败: user_ids=%s, error=%s", user_ids, exc)
 
-        elif rule_type == "cheer_types":
-            progress = len(stats.cheer_types_used or [])
-            should_unlock = progress >= target
 
-        elif rule_type == "message_count":
-            progress = stats.total_cheers_with_message
-            should_unlock = progress >= target
+@event.listens_for(Session, "after_commit")
+def _reset_committed_full_checks(session: Session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not user_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(_reset_full_checks(*user_ids))
 
-        elif rule_type == "streak":
-            progress = stats.consecutive_days
-            should_unlock = progress >= target
 
-        elif rule_type == "unique_projects":
-            # 查询用户打气过的不同项目数
-            result = await db.execute(
-                select(func.count(func.distinct(Cheer.registration_id))).where(
-                    Cheer.user_id == user_id
+async def check_and_unlock_achievements_bulk(
+    db: AsyncSession,
+    stats_by_user: dict[int, UserStats],
+    stat_types: Optional[Iterable[str]] = None,
+    contest_start_date: Optional[date] = None,
+) -> dict[int, list[str]]:
+    """
+    批量检查并解锁成就，返回 {用户ID: 新解锁的成就key列表}
+
+    只评估受 stat_types 影响的规则（None 表示全部）；本周期内尚未全量评估的用户评估全部规则。
+    """
+    if stat_types is None or not stats_by_user:
+        return await _check_and_unlock(db, stats_by_user, None, contest_start_date)
+
+    full_ids = await _claim_full_checks(list(stats_by_user))
+    newly_unlocked: dict[int, list[str]] = {}
+    for user_ids, types in ((full_ids, None), (set(stats_by_user) - full_ids, stat_types)):
+        if user_ids:
+            newly_unlocked.update(
+                await _check_and_unlock(
+                    db,
+                    {user_id: stats_by_user[user_id] for user_id in user_ids},
+                    types,
+                    contest_start_date,
                 )
             )
-            progress = result.scalar() or 0
-            should_unlock = progress >= target
-
-        elif rule_type == "early_bird":
-            # 早期支持者：比赛开始 N 天内打气
-            if contest_start_date and stats.total_cheers_given > 0:
-                days_from_start = rule.get("days_from_start", 3)
-                deadline = contest_start_date + timedelta(days=days_from_start)
-                if date.today() <= deadline:
-                    progress = 1
-                    should_unlock = True
-
-        # ========== 扭蛋类成就 ==========
-        elif rule_type == "gacha_count":
-            progress = stats.total_gacha_count
-            should_unlock = progress >= target
-
-        elif rule_type == "gacha_rare":
-            progress = stats.gacha_rare_count
-            should_unlock = progress >= target
-
-        # ========== 任务类成就 ==========
-        elif rule_type == "daily_task_streak":
-            progress = stats.max_daily_task_streak
-            should_unlock = progress >= target
-
-        elif rule_type == "weekly_task_complete":
-            progress = stats.weekly_tasks_completed
-            should_unlock = progress >= target
-
-        # ========== 竞猜类成就 ==========
-        elif rule_type == "prediction_accuracy":
-            # 竞猜准确率需要至少10次竞猜
-            if stats.prediction_total >= 10:
-                accuracy = (stats.prediction_correct / stats.prediction_total) * 100
-                progress = int(accuracy)
-                should_unlock = progress >= target
-
-        # ========== 彩蛋类成就（手动颁发，这里不自动检测）==========
-        elif rule_type == "easter_egg":
-            # 彩蛋成就通过特定 API 手动颁发，这里跳过
+    return newly_unlocked
+
+
+async def _check_and_unlock(
+    db: AsyncSession,
+    stats_by_user: dict[int, UserStats],
+    stat_types: Optional[Iterable[str]],
+    contest_start_date: Optional[date],
+) -> dict[int, list[str]]:
+    """
+    评估规则并解锁（用户成就记录一次性批量读取，缺失的记录只在有进度时才批量补建）
+    """
+    newly_unlocked: dict[int, list[str]] = {user_id: [] for user_id in stats_by_user}
+    if not stats_by_user:
+        return newly_unlocked
+
+    active_keys = await get_active_achievement_keys(db)
+    keys = _candidate_keys(active_keys, stat_types)
+    if not keys:
+        return newly_unlocked
+
+    user_ids = list(stats_by_user)
+    user_achs = await _load_user_achievements(db, user_ids, keys)
+
+    # 只为仍未解锁“探索类”成就的用户统计不同项目数
+    unique_project_keys = [key for key in keys if ACHIEVEMENT_RULES[key]["type"] == "unique_projects"]
+    pending_unique_users = [
+        user_id
+        for user_id in user_ids
+        if any(
+            (user_achs.get((user_id, key)) is None
+             or user_achs[(user_id, key)].status == AchievementStatus.LOCKED.value)
+            for key in unique_project_keys
+        )
+    ]
+    unique_counts = await _load_unique_project_counts(db, pending_unique_users)
+
+    evaluations: list[tuple[int, str, int, bool]] = []
+    missing: list[dict] = []
+    for user_id, stats in stats_by_user.items():
+        for key in keys:
+            user_ach = user_achs.get((user_id, key))
+            if user_ach is not None and user_ach.status != AchievementStatus.LOCKED.value:
+                continue
+            evaluated = _evaluate_rule(
+                ACHIEVEMENT_RULES[key],
+                stats,
+                unique_counts.get(user_id, 0),
+                contest_start_date,
+            )
+            if evaluated is None:
+                continue
+            progress, should_unlock = evaluated
+            if user_ach is None:
+                if not progress and not should_unlock:
+                    continue
+                missing.append({"user_id": user_id, "achievement_key": key})
+            evaluations.append((user_id, key, progress, should_unlock))
+
+    if missing:
+        # 使用 INSERT IGNORE 避免并发冲突，随后一次性读回
+        await db.execute(
+            text("""
+                INSERT IGNORE INTO user_achievements (user_id, achievement_key, status, progress_value)
+                VALUES (:user_id, :achievement_key, 'locked', 0)
+            """),
+            missing,
+        )
+        user_achs.update(
+            await _load_user_achievements(
+                db,
+                list({row["user_id"] for row in missing}),
+                list({row["achievement_key"] for row in missing}),
+            )
+        )
+
+    now = datetime.utcnow()
+    for user_id, key, progress, should_unlock in evaluations:
+        user_ach = user_achs.get((user_id, key))
+        if user_ach is None or user_ach.status != AchievementStatus.LOCKED.value:
             continue
 
         # 更新进度
-        user_ach.progress_value = progress
+        if user_ach.progress_value != progress:
+            user_ach.progress_value = progress
 
         # 解锁成就
         if should_unlock:
             user_ach.status = AchievementStatus.UNLOCKED.value
-            user_ach.unlocked_at = datetime.utcnow()
-            newly_unlocked.append(key)
+            user_ach.unlocked_at = now
+            newly_unlocked[user_id].append(key)
 
             # 更新用户统计中的解锁数
-            stats.achievements_unlocked += 1
+            stats_by_user[user_id].achievements_unlocked += 1
 
     await db.flush()
     return newly_unlocked
 
 
+async def check_and_unlock_achievements(
+    db: AsyncSession,
+    user_id: int,
+    stats: UserStats,
+    contest_start_date: Optional[date] = None,
+    stat_types: Optional[Iterable[str]] = None,
+) -> list[str]:
+    """检查并解锁成就，返回新解锁的成就key列表（stat_types 为本次变化的统计类型）"""
+    unlocked = await check_and_unlock_achievements_bulk(
+        db,
+        {user_id: stats},
+        stat_types=stat_types,
+        contest_start_date=contest_start_date,
+    )
+    return unlocked[user_id]
+
+
 async def claim_achievement(
     db: AsyncSession, user_id: int, achievement_key: str
 ) -> tuple[bool, int]:
@@ -508,6 +709,50 @@ async def update_user_stats_on_prediction(
     return stats
 
 
+async def update_user_stats_on_prediction_bulk(
+    db: AsyncSession,
+    results: dict[int, bool],
+) -> dict[int, UserStats]:
+    """
+    竞猜结算后批量更新用户统计
+
+    results 为 {用户ID: 是否猜中}，每个参与者计一次；返回更新后的统计。
+    """
+    if not results:
+        return {}
+    user_ids = sorted(results)
+    winner_ids = [user_id for user_id in user_ids if results[user_id]]
+
+    await db.execute(
+        text("""
+            INSERT IGNORE INTO user_stats (user_id, total_cheers_given, total_cheers_with_message,
+                consecutive_days, max_consecutive_days, total_points, achievements_unlocked)
+            VALUES (:user_id, 0, 0, 0, 0, 0, 0)
+        """),
+        [{"user_id": user_id} for user_id in user_ids],
+    )
+    await db.execute(
+        update(UserStats)
+        .where(UserStats.user_id.in_(user_ids))
+        .values(prediction_total=UserStats.prediction_total + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if winner_ids:
+        await db.execute(
+            update(UserStats)
+            .where(UserStats.user_id.in_(winner_ids))
+            .values(prediction_correct=UserStats.prediction_correct + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    result = await db.execute(
+        select(UserStats)
+        .where(UserStats.user_id.in_(user_ids))
+        .execution_options(populate_existing=True)
+    )
+    return {stats.user_id: stats for stats in result.scalars().all()}
+
+
 # ========== 任务成就触发 ==========
 
 async def update_user_stats_on_task_complete(
@@ -0,0 +1,285 @@
+"""
+比赛元数据缓存（进程内，带版本号）
+
+比赛一天只变更几次，但投票、报名、作品、排行榜等几乎每个请求都要读取比赛（存在性、可见性、阶段）：
+- 进程内读穿缓存：按 contest_id 缓存比赛快照（CachedContest），并缓存「当前比赛」查询结果
+- 版本号：Redis 哈希 contest_cache:versions 中每个比赛一个递增版本；写入方 HINCRBY 后
+  在 CONTEST_CACHE_CHANNEL 广播 "contest_id:version"，各进程收到后丢弃旧版本条目
+- 未命中时先读版本号再查库，期间若已收到更新的版本则不写入缓存（避免旧数据回填）
+- 订阅断开期间可能漏掉消息：重连后清空缓存；另有 CONTEST_CACHE_TTL_SECONDS 兜底
+- 命中/未命中/失效计数定期累加到 Redis contest_cache:metrics
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.contest import Contest, ContestPhase, ContestVisibility
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_KEY = "contest_cache:versions"
+METRICS_KEY = "contest_cache:metrics"
+METRICS_FLUSH_INTERVAL_SECONDS = 10
+
+
+@dataclass(frozen=True)
+class CachedContest:
+    """比赛快照（只读，字段与 Contest 一致）"""
+    id: int
+    title: str
+    description: Optional[str]
+    phase: Optional[str]
+    visibility: Optional[str]
+    banner_url: Optional[str]
+    rules_md: Optional[str]
+    prizes_md: Optional[str]
+    review_rules_md: Optional[str]
+    faq_md: Optional[str]
+    signup_start: Optional[datetime]
+    signup_end: Optional[datetime]
+    submit_start: Optional[datetime]
+    submit_end: Optional[datetime]
+    vote_start: Optional[datetime]
+    vote_end: Optional[datetime]
+    auto_phase_enabled: bool
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @classmethod
+    def from_contest(cls, contest: Contest) -> "CachedContest":
+        values = {field.name: getattr(contest, field.name) for field in fields(cls)}
+        values["auto_phase_enabled"] = values["auto_phase_enabled"] is not False
+        return cls(**values)
+
+    @property
+    def phase_enum(self) -> ContestPhase:
+        return ContestPhase(self.phase) if self.phase else ContestPhase.UPCOMING
+
+
+# contest_id -> (过期时间, 版本, 快照)
+_entries: dict[int, tuple[float, int, CachedContest]] = {}
+# (包含未发布, 回退到已结束) -> (过期时间, 代数, contest_id)
+_current: dict[tuple[bool, bool], tuple[float, int, Optional[int]]] = {}
+# 已知的最新版本（来自失效广播）
+_versions: dict[int, int] = {}
+# 任一比赛失效即递增，用于「当前比赛」这类跨比赛查询
+_generation = 0
+_stats: Counter = Counter()
+_listener_task: Optional[asyncio.Task] = None
+
+
+def _expires_at() -> float:
+    return time.monotonic() + settings.CONTEST_CACHE_TTL_SECONDS
+
+
+def _apply_invalidation(contest_id: Optional[int], version: int = 0) -> None:
+    """丢弃本进程中旧版本条目（contest_id 为 None 时清空全部）"""
+    global _generation
+    _generation += 1
+    _current.clear()
+    _stats["invalidations"] += 1
+    if contest_id is None:
+        _entries.clear()
+        return
+    if version > _versions.get(contest_id, 0):
+        _versions[contest_id] = version
+    _entries.pop(contest_id, None)
+
+
+async def _read_version(contest_id: int) -> int:
+    try:
+        redis_client = await get_redis()
+        value = await redis_client.hget(VERSIONS_KEY, str(contest_id))
+        return int(value or 0)
+    except Exception as exc:
+        logger.warning("读取比赛缓存版本失败: contest=%s, error=%s", contest_id, exc)
+        return _versions.get(contest_id, 0)
+
+
+async def get_contest(db: AsyncSession, contest_id: int) -> Optional[CachedContest]:
+    """获取比赛快照（读穿缓存），不存在时返回 None"""
+    entry = _entries.get(contest_id)
+    if entry is not None and entry[0] > time.monotonic() and entry[1] >= _versions.get(contest_id, 0):
+        _stats["hits"] += 1
+        return entry[2]
+
+    _stats["misses"] += 1
+    version = await _read_version(contest_id)
+    result = await db.execute(select(Contest).where(Contest.id == contest_id))
+    contest = result.scalar_one_or_none()
+    if contest is None:
+        _entries.pop(contest_id, None)
+        return None
+
+    snapshot = CachedContest.from_contest(contest)
+    if version >= _versions.get(contest_id, 0):
+        _entries[contest_id] = (_expires_at(), version, snapshot)
+    return snapshot
+
+
+async def get_contest_or_404(db: AsyncSession, contest_id: int) -> CachedContest:
+    """获取比赛快照，不存在则抛出 404"""
+    contest = await get_contest(db, contest_id)
+    if contest is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="比赛不存在")
+    return contest
+
+
+async def get_current_contest(
+    db: AsyncSession,
+    *,
+    include_hidden: bool,
+    include_ended: bool,
+) -> Optional[CachedContest]:
+    """
+    获取当前比赛（最新一场未结束的比赛）
+
+    include_hidden=True 时包含草稿/隐藏比赛（管理员）；include_ended=True 时无进行中比赛则回退到最新一场。
+    """
+    key = (include_hidden, include_ended)
+    entry = _current.get(key)
+    if entry is not None and entry[0] > time.monotonic() and entry[1] == _generation:
+        _stats["hits"] += 1
+        contest_id = entry[2]
+    else:
+        _stats["misses"] += 1
+        generation = _generation
+        query = select(Contest.id).where(Contest.phase != ContestPhase.ENDED.value)
+        if not include_hidden:
+            query = query.where(Contest.visibility == ContestVisibility.PUBLISHED.value)
+        contest_id = (await db.execute(query.order_by(Contest.id.desc()).limit(1))).scalar_one_or_none()
+
+        if contest_id is None and include_ended:
+            fallback_query = select(Contest.id)
+            if not include_hidden:
+                fallback_query = fallback_query.where(Contest.visibility == ContestVisibility.PUBLISHED.value)
+            contest_id = (
+                await db.execute(fallback_query.order_by(Contest.id.desc()).limit(1))
+            ).scalar_one_or_none()
+
+        if generation == _generation:
+            _current[key] = (_expires_at(), generation, contest_id)
+
+    if contest_id is None:
+        return None
+    return await get_contest(db, contest_id)
+
+
+async def invalidate_contest(contest_id: int) -> None:
+    """
+    比赛写入后调用：递增版本号并广播失效
+
+    本进程立即生效；Redis 不可用时其他进程依赖 TTL 过期。
+    """
+    try:
+        redis_client = await get_redis()
+        version = int(await redis_client.hincrby(VERSIONS_KEY, str(contest_id), 1))
+    except Exception as exc:
+        logger.warning("递增比赛缓存版本失败: contest=%s, error=%s", contest_id, exc)
+        _apply_invalidation(contest_id)
+        return
+
+    _apply_invalidation(contest_id, version)
+    try:
+        await redis_client.publish(settings.CONTEST_CACHE_CHANNEL, f"{contest_id}:{version}")
+    except Exception as exc:
+        logger.warning("广播比赛缓存失效失败: contest=%s, error=%s", contest_id, exc)
+
+
+async def _flush_metrics() -> None:
+    """把本进程的计数增量累加到 Redis"""
+    if not _stats:
+        return
+    deltas = dict(_stats)
+    _stats.clear()
+    try:
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for name, value in deltas.items():
+                pipe.hincrby(METRICS_KEY, name, value)
+            await pipe.execute()
+    except Exception as exc:
+        _stats.update(deltas)
+        logger.warning("写入比赛缓存指标失败: %s", exc)
+
+
+async def _listen() -> None:
+    """订阅失效广播，并定期上报命中率计数"""
+    next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL_SECONDS
+    while True:
+        pubsub = None
+        try:
+            redis_client = await get_redis()
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(settings.CONTEST_CACHE_CHANNEL)
+            # 断线期间可能漏掉失效消息
+            _apply_invalidation(None)
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    contest_id, _, version = str(message["data"]).partition(":")
+                    try:
+                        _apply_invalidation(int(contest_id), int(version or 0))
+                    except ValueError:
+                        pass
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL_SECONDS
+                    await _flush_metrics()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("比赛缓存失效订阅异常，1 秒后重连: %s", exc)
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+def start_contest_cache_listener() -> None:
+    """启动失效订阅（API 进程启动时调用）"""
+    global _listener_task
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen())
+
+
+async def stop_contest_cache_listener() -> None:
+    """停止失效订阅并上报剩余计数（退出时调用）"""
+    global _listener_task
+    task, _listener_task = _listener_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await _flush_metrics()
+
+
+async def get_contest_cache_stats() -> dict[str, Any]:
+    """全部进程累计的命中率指标（含本进程尚未上报的部分）"""
+    redis_client = await get_redis()
+    totals = Counter({name: int(value) for name, value in (await redis_client.hgetall(METRICS_KEY)).items()})
+    totals.update(_stats)
+    lookups = totals["hits"] + totals["misses"]
+    return {
+        "hits": totals["hits"],
+        "misses": totals["misses"],
+        "invalidations": totals["invalidations"],
+        "hit_rate": round(totals["hits"] / lookups, 4) if lookups else None,
+        "local_entries": len(_entries),
+    }
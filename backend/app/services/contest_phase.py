@@ -0,0 +1,99 @@
+"""
+比赛阶段计算与定时切换
+
+阶段由 signup_start…vote_end 时间窗口决定：
+- effective_phase：按时间戳直接计算当前阶段（自动阶段开启时），不依赖 contests.phase 是否已写回；
+  热路径配合 contest_cache 的比赛快照使用，阶段校验无需查询数据库
+- next_phase_boundary：下一个阶段边界，调度器据此注册一次性定时器，到点写回 contests.phase
+- notify_contest_schedule_changed：管理员修改时间配置后通知调度器重新规划（Redis 发布订阅）
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Optional, Union
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.contest import Contest, ContestPhase
+from app.services.contest_cache import CachedContest, invalidate_contest
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_FIELDS = ("signup_start", "signup_end", "submit_start", "submit_end", "vote_start", "vote_end")
+
+ContestLike = Union[Contest, CachedContest]
+
+
+def resolve_contest_phase(contest: ContestLike, now: datetime) -> Optional[str]:
+    """根据时间配置计算比赛阶段（无时间配置则返回 None）"""
+    if not any(getattr(contest, field) for field in SCHEDULE_FIELDS):
+        return None
+
+    if contest.vote_end and now >= contest.vote_end:
+        return ContestPhase.ENDED.value
+
+    if contest.vote_start and now >= contest.vote_start:
+        if contest.vote_end is None or now < contest.vote_end:
+            return ContestPhase.VOTING.value
+
+    if contest.submit_start and now >= contest.submit_start:
+        if contest.submit_end is None or now < contest.submit_end:
+            return ContestPhase.SUBMISSION.value
+
+    if contest.signup_start and now >= contest.signup_start:
+        if contest.signup_end is None or now < contest.signup_end:
+            return ContestPhase.SIGNUP.value
+
+    if contest.submit_end and now >= contest.submit_end and contest.vote_start is None:
+        return ContestPhase.ENDED.value
+
+    if contest.signup_end and now >= contest.signup_end and contest.submit_start is None and contest.vote_start is None:
+        return ContestPhase.ENDED.value
+
+    return ContestPhase.UPCOMING.value
+
+
+def effective_phase(contest: ContestLike, now: Optional[datetime] = None) -> str:
+    """
+    当前生效的比赛阶段
+
+    自动阶段开启且配置了时间窗口时按时间计算（边界到达即生效，无需等待定时器写回）；
+    否则使用管理员设置的阶段。
+    """
+    if contest.auto_phase_enabled is not False:
+        phase = resolve_contest_phase(contest, now or datetime.now())
+        if phase:
+            return phase
+    return contest.phase or ContestPhase.UPCOMING.value
+
+
+def next_phase_boundary(contest: ContestLike, now: datetime) -> Optional[datetime]:
+    """下一个阶段边界（自动阶段关闭或已无后续边界时返回 None）"""
+    if contest.auto_phase_enabled is False:
+        return None
+    upcoming = [value for value in (getattr(contest, field) for field in SCHEDULE_FIELDS) if value and value > now]
+    return min(upcoming, default=None)
+
+
+def apply_contest_phase(contest: Contest, now: datetime) -> bool:
+    """按时间窗口更新 contest.phase（不提交），返回是否变更"""
+    if contest.auto_phase_enabled is False:
+        return False
+    target_phase = resolve_contest_phase(contest, now)
+    if not target_phase or contest.phase == target_phase:
+        return False
+    logger.info("比赛 %s 阶段变更：%s -> %s", contest.id, contest.phase, target_phase)
+    contest.phase = target_phase
+    return True
+
+
+async def notify_contest_schedule_changed(contest: Contest) -> None:
+    """比赛时间配置/阶段变更后失效比赛缓存，并通知调度器重新规划定时器"""
+    await invalidate_contest(contest.id)
+    try:
+        redis_client = await get_redis()
+        await redis_client.publish(settings.CONTEST_PHASE_CHANNEL, str(contest.id))
+    except Exception as exc:
+        # 通知失败时由定期对账兜底
+        logger.warning("发布比赛阶段重新规划通知失败: contest=%s, error=%s", contest.id, exc)
@@ -0,0 +1,394 @@
+"""
+比赛作品排行榜
+
+- 评分汇总物化在 project_review_stats 表，评审员提交/删除评分时只重算该作品一行
+- 有资格上榜的作品（已提交/已上线且报名未撤回）以 Redis 有序集合维护排名：
+  单个作品排名用 ZREVRANK（O(log n)），列表用 ZREVRANGE 分页
+- 评分变化提交后锁定汇总行重新读取并 ZADD XX 增量更新（同一作品的并发评分按提交顺序生效）；
+  作品状态、报名状态变化后整体失效，下次读取时从汇总表重建
+- 重建期间（contest:ranking:{id}:building 写入计数存在）跳过的增量与失效只递增计数，
+  重建结果写入临时键，计数未变才换入，否则重新读取
+- Redis 不可用时回退到汇总表上的 SQL 排序
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import delete, event, func, inspect, select, tuple_
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.redis import get_redis, get_script
+from app.models.project import Project, ProjectStatus
+from app.models.project_review import ProjectReview
+from app.models.project_review_stats import ProjectReviewStats
+from app.models.registration import Registration, RegistrationStatus
+
+
+logger = logging.getLogger(__name__)
+
+ELIGIBLE_PROJECT_STATUSES = {ProjectStatus.SUBMITTED.value, ProjectStatus.ONLINE.value}
+
+_SESSION_INFO_KEY = "contest_ranking_invalidate_ids"
+
+# 排序分值编码：(最终得分, 评分数量, 作品ID) 依次降序，需保证不超过 2^53
+_COUNT_SLOTS = 10_000
+_ID_SLOTS = 10_000_000
+
+# 重建时读库期间发生写入的最大重试次数
+_REBUILD_MAX_ATTEMPTS = 3
+_BUILDING_TTL_SECONDS = 300
+
+# 榜单存在时只更新已在榜的作品；榜单缺失且重建进行中时记录一次写入
+_UPDATE_RANK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('INCR', KEYS[2])
+    end
+    return 0
+end
+return redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[2])
+"""
+
+# 换入重建结果：重建期间无写入（计数未变）时用临时键替换榜单，否则丢弃临时键
+_SWAP_IF_UNCHANGED_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    redis.call('DEL', KEYS[3])
+    return 0
+end
+redis.call('RENAME', KEYS[3], KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# 失效：删除榜单，进行中的重建记录一次写入（使其重新读取）
+_INVALIDATE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('INCR', KEYS[2])
+end
+return 1
+"""
+
+
+class RankingRebuildConflict(Exception):
+    """重建期间持续有写入，本次无法换入（调用方回退数据库）"""
+
+
+def _ranking_key(contest_id: int) -> str:
+    return f"contest:ranking:{contest_id}"
+
+
+def _building_key(contest_id: int) -> str:
+    return f"contest:ranking:{contest_id}:building"
+
+
+def compute_final_score(
+    review_count: int,
+    score_sum: Optional[int],
+    score_min: Optional[int],
+    score_max: Optional[int],
+) -> Optional[Decimal]:
+    """最终得分：3 个及以上评分去掉最高最低后取平均，否则取平均分"""
+    if not review_count or score_sum is None:
+        return None
+    if review_count >= 3 and score_min is not None and score_max is not None:
+        value = Decimal(str(score_sum - score_max - score_min)) / Decimal(review_count - 2)
+    else:
+        value = Decimal(str(score_sum)) / Decimal(review_count)
+    return value.quantize(Decimal("0.01"))
+
+
+def rank_score(final_score: Optional[Decimal], review_count: int, project_id: int) -> int:
+    """把排序三元组编码为有序集合分值"""
+    score_cents = int(final_score * 100) + 1 if final_score is not None else 0
+    count = min(max(review_count or 0, 0), _COUNT_SLOTS - 1)
+    return (score_cents * _COUNT_SLOTS + count) * _ID_SLOTS + (project_id % _ID_SLOTS)
+
+
+def _eligible_projects_query(contest_id: int):
+    return (
+        select(
+            Project.id.label("project_id"),
+            func.coalesce(ProjectReviewStats.final_score, -1).label("score_key"),
+            func.coalesce(ProjectReviewStats.review_count, 0).label("count_key"),
+            ProjectReviewStats.final_score,
+        )
+        .join(
+            Registration,
+            (Registration.contest_id == Project.contest_id)
+            & (Registration.user_id == Project.user_id),
+        )
+        .outerjoin(ProjectReviewStats, ProjectReviewStats.project_id == Project.id)
+        .where(
+            Project.contest_id == contest_id,
+            Project.status.in_(ELIGIBLE_PROJECT_STATUSES),
+            Registration.status != RegistrationStatus.WITHDRAWN.value,
+        )
+    )
+
+
+async def refresh_project_review_stats(
+    db: AsyncSession,
+    project_id: int,
+    contest_id: int,
+) -> Optional[ProjectReviewStats]:
+    """
+    重算单个作品的评分汇总（需在写评分的同一事务内、commit 前调用）
+
+    聚合使用锁定读，能看到并发事务已提交的评分，同一作品的重算因此串行。
+    """
+    row = (
+        await db.execute(
+            select(
+                func.count(ProjectReview.id).label("count"),
+                func.sum(ProjectReview.score).label("sum"),
+                func.min(ProjectReview.score).label("min"),
+                func.max(ProjectReview.score).label("max"),
+            )
+            .where(ProjectReview.project_id == project_id)
+            .with_for_update()
+        )
+    ).one()
+
+    review_count = int(row.count or 0)
+    if review_count == 0:
+        await db.execute(delete(ProjectReviewStats).where(ProjectReviewStats.project_id == project_id))
+        return None
+
+    values = {
+        "project_id": project_id,
+        "contest_id": contest_id,
+        "review_count": review_count,
+        "score_sum": int(row.sum),
+        "score_min": int(row.min),
+        "score_max": int(row.max),
+        "final_score": compute_final_score(review_count, int(row.sum), int(row.min), int(row.max)),
+    }
+    stmt = insert(ProjectReviewStats).values(**values)
+    stmt = stmt.on_duplicate_key_update(
+        contest_id=stmt.inserted.contest_id,
+        review_count=stmt.inserted.review_count,
+        score_sum=stmt.inserted.score_sum,
+        score_min=stmt.inserted.score_min,
+        score_max=stmt.inserted.score_max,
+        final_score=stmt.inserted.final_score,
+    )
+    await db.execute(stmt)
+    return ProjectReviewStats(**values)
+
+
+async def sync_project_rank(contest_id: int, project_id: int) -> None:
+    """
+    评分提交后更新有序集合中该作品的分值（只更新已在榜的作品）
+
+    在新会话中锁定汇总行后读取最新提交的汇总并写入 Redis：并发评分的同步按锁顺序执行，
+    后写入的一定是更新的汇总，不会被先提交事务的旧分值覆盖。
+    """
+    try:
+        async with async_session_maker() as db:
+            stats = (
+                await db.execute(
+                    select(ProjectReviewStats.final_score, ProjectReviewStats.review_count)
+                    .where(ProjectReviewStats.project_id == project_id)
+                    .with_for_update()
+                )
+            ).first()
+            final_score = stats.final_score if stats else None
+            review_count = int(stats.review_count) if stats else 0
+            await get_redis()
+            await get_script("contest_ranking_update", _UPDATE_RANK_SCRIPT)(
+                keys=[_ranking_key(contest_id), _building_key(contest_id)],
+                args=[rank_score(final_score, review_count, project_id), str(project_id)],
+            )
+            await db.commit()
+    except Exception as exc:
+        logger.warning("排行榜增量更新失败: contest_id=%s, project_id=%s, error=%s", contest_id, project_id, exc)
+
+
+async def invalidate_contest_ranking(*contest_ids: int) -> None:
+    """丢弃比赛排行榜缓存，下次读取时重建"""
+    ids = [contest_id for contest_id in contest_ids if contest_id]
+    if not ids:
+        return
+    try:
+        await get_redis()
+        script = get_script("contest_ranking_invalidate", _INVALIDATE_SCRIPT)
+        for contest_id in ids:
+            await script(keys=[_ranking_key(contest_id), _building_key(contest_id)])
+    except Exception as exc:
+        logger.warning("排行榜缓存失效失败: contest_ids=%s, error=%s", ids, exc)
+
+
+async def _rebuild_ranking(contest_id: int) -> int:
+    """
+    从汇总表重建排行榜，返回上榜数
+
+    读库前记录写入计数，每次读取使用新会话（快照晚于计数记录），计数未变才换入；
+    重试耗尽时抛出 RankingRebuildConflict。
+    """
+    client = await get_redis()
+    key = _ranking_key(contest_id)
+    building_key = _building_key(contest_id)
+    swap = get_script("contest_ranking_swap", _SWAP_IF_UNCHANGED_SCRIPT)
+    for _ in range(_REBUILD_MAX_ATTEMPTS):
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.set(building_key, 0, nx=True)
+            pipe.expire(building_key, _BUILDING_TTL_SECONDS)
+            pipe.get(building_key)
+            _, _, writes = await pipe.execute()
+
+        async with async_session_maker() as db:
+            rows = (await db.execute(_eligible_projects_query(contest_id))).all()
+        if not rows:
+            return 0
+        mapping = {
+            str(row.project_id): rank_score(row.final_score, int(row.count_key), row.project_id)
+            for row in rows
+        }
+        staging_key = f"{key}:staging:{uuid.uuid4().hex[:12]}"
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.zadd(staging_key, mapping)
+            pipe.expire(staging_key, _BUILDING_TTL_SECONDS)
+            await pipe.execute()
+        if await swap(
+            keys=[key, building_key, staging_key],
+            args=[writes, settings.CONTEST_RANKING_CACHE_TTL_SECONDS],
+        ):
+            return len(mapping)
+    raise RankingRebuildConflict(f"排行榜重建期间持续有写入: contest_id={contest_id}")
+
+
+async def _ensure_ranking(contest_id: int) -> int:
+    client = await get_redis()
+    total = await client.zcard(_ranking_key(contest_id))
+    if total:
+        return int(total)
+    return await _rebuild_ranking(contest_id)
+
+
+def _ordered(query):
+    return query.order_by(
+        func.coalesce(ProjectReviewStats.final_score, -1).desc(),
+        func.coalesce(ProjectReviewStats.review_count, 0).desc(),
+        Project.id.desc(),
+    )
+
+
+async def get_ranking_page(
+    db: AsyncSession,
+    contest_id: int,
+    offset: int,
+    limit: int,
+) -> tuple[list[tuple[int, int]], int]:
+    """获取一页排行，返回 ([(名次, 作品ID)], 上榜总数)"""
+    try:
+        total = await _ensure_ranking(contest_id)
+        if total == 0 or offset >= total:
+            return [], total
+        client = await get_redis()
+        members = await client.zrevrange(_ranking_key(contest_id), offset, offset + limit - 1)
+        return [(offset + index + 1, int(member)) for index, member in enumerate(members)], total
+    except Exception as exc:
+        logger.warning("排行榜缓存不可用，回退数据库: contest_id=%s, error=%s", contest_id, exc)
+
+    base = _eligible_projects_query(contest_id).subquery()
+    total = int(await db.scalar(select(func.count()).select_from(base)) or 0)
+    rows = (
+        await db.execute(_ordered(_eligible_projects_query(contest_id)).offset(offset).limit(limit))
+    ).all()
+    return [(offset + index + 1, row.project_id) for index, row in enumerate(rows)], total
+
+
+async def get_project_rank(db: AsyncSession, contest_id: int, project_id: int) -> Optional[int]:
+    """获取单个作品名次（未上榜返回 None）"""
+    try:
+        if await _ensure_ranking(contest_id) == 0:
+            return None
+        client = await get_redis()
+        rank = await client.zrevrank(_ranking_key(contest_id), str(project_id))
+        return int(rank) + 1 if rank is not None else None
+    except Exception as exc:
+        logger.warning("排行榜缓存不可用，回退数据库: contest_id=%s, error=%s", contest_id, exc)
+
+    query = _eligible_projects_query(contest_id)
+    target = (await db.execute(query.where(Project.id == project_id))).first()
+    if target is None:
+        return None
+    ahead = await db.scalar(
+        select(func.count()).select_from(
+            query.where(
+                tuple_(
+                    func.coalesce(ProjectReviewStats.final_score, -1),
+                    func.coalesce(ProjectReviewStats.review_count, 0),
+                    Project.id,
+                )
+                > tuple_(target.score_key, target.count_key, project_id)
+            ).subquery()
+        )
+    )
+    return int(ahead or 0) + 1
+
+
+async def get_review_stats_map(db: AsyncSession, project_ids: list[int]) -> dict[int, ProjectReviewStats]:
+    """批量读取作品评分汇总"""
+    if not project_ids:
+        return {}
+    result = await db.execute(
+        select(ProjectReviewStats).where(ProjectReviewStats.project_id.in_(project_ids))
+    )
+    return {row.project_id: row for row in result.scalars()}
+
+
+async def rebuild_contest_review_stats(db: AsyncSession, contest_id: int) -> int:
+    """按 project_reviews 全量重算比赛内所有作品的汇总（修复用），返回作品数"""
+    project_ids = (
+        await db.execute(select(Project.id).where(Project.contest_id == contest_id))
+    ).scalars().all()
+    await db.execute(delete(ProjectReviewStats).where(ProjectReviewStats.contest_id == contest_id))
+    for project_id in project_ids:
+        await refresh_project_review_stats(db, project_id, contest_id)
+    await db.commit()
+    await invalidate_contest_ranking(contest_id)
+    return len(project_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_ranking_changes(session: Session, flush_context) -> None:
+    """作品状态、报名状态变化会影响上榜资格，记录受影响的比赛"""
+    contest_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Project):
+            state = inspect(obj)
+            if obj in session.dirty and not (
+                state.attrs.status.history.has_changes() or state.attrs.contest_id.history.has_changes()
+            ):
+                continue
+            contest_ids.add(obj.contest_id)
+            contest_ids.update(state.attrs.contest_id.history.deleted or ())
+        elif isinstance(obj, Registration):
+            if obj in session.dirty and not inspect(obj).attrs.status.history.has_changes():
+                continue
+            contest_ids.add(obj.contest_id)
+    contest_ids.discard(None)
+    if contest_ids:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(contest_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_rankings(session: Session) -> None:
+    contest_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not contest_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(invalidate_contest_ranking(*contest_ids))
@@ -0,0 +1,186 @@
+"""
+每日游玩次数限制（抽奖、刮刮乐、扭蛋机、老虎机共用）
+
+- Redis 计数 daily_play:{game}:{config_id}:{user_id}:{YYYYMMDD}：一次 Lua 调用完成「检查 + 递增」，
+  次日零点过期
+- daily_play_counts 表为持久化兜底：每次游玩在同一事务内 UPSERT +1，随事务提交/回滚；
+  Redis 键不存在（新的一天或键丢失）时用表中计数恢复，Redis 不可用时直接按表中计数（行锁）校验
+- 占用次数后若游玩失败，调用方需 release() 归还 Redis 中的计数（表中计数随事务回滚）
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis import get_redis, get_script
+
+logger = logging.getLogger(__name__)
+
+LOTTERY = "lottery"
+SCRATCH = "scratch"
+GACHA = "gacha"
+SLOT_MACHINE = "slot_machine"
+
+# 返回 -2：键不存在且未提供恢复值；-1：已达上限（不递增）；否则返回递增后的次数
+_CONSUME_PLAY_LUA = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    if ARGV[3] == '' then
+        return -2
+    end
+    current = ARGV[3]
+    redis.call('SET', KEYS[1], current)
+    redis.call('EXPIREAT', KEYS[1], ARGV[2])
+end
+local limit = tonumber(ARGV[1])
+if limit > 0 and tonumber(current) >= limit then
+    return -1
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+_RELEASE_PLAY_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+_SELECT_COUNT_SQL = text("""
+    SELECT play_count FROM daily_play_counts
+    WHERE user_id = :user_id AND game = :game AND config_id = :config_id AND play_date = :play_date
+""")
+
+_UPSERT_COUNT_SQL = text("""
+    INSERT INTO daily_play_counts (user_id, game, config_id, play_date, play_count)
+    VALUES (:user_id, :game, :config_id, :play_date, 1)
+    ON DUPLICATE KEY UPDATE play_count = play_count + 1
+""")
+
+
+def _counter_key(game: str, user_id: int, config_id: int, today: date) -> str:
+    return f"daily_play:{game}:{config_id}:{user_id}:{today.strftime('%Y%m%d')}"
+
+
+def _next_midnight_timestamp(today: date) -> int:
+    return int(datetime.combine(today + timedelta(days=1), time.min).timestamp())
+
+
+def _params(game: str, user_id: int, config_id: int, today: date) -> dict:
+    return {"user_id": user_id, "game": game, "config_id": config_id, "play_date": today.isoformat()}
+
+
+async def _load_db_count(db: AsyncSession, game: str, user_id: int, config_id: int, today: date) -> int:
+    result = await db.execute(_SELECT_COUNT_SQL, _params(game, user_id, config_id, today))
+    return int(result.scalar() or 0)
+
+
+@dataclass
+class DailyPlay:
+    """已占用的一次游玩次数"""
+    game: str
+    user_id: int
+    config_id: int
+    play_date: date
+    count: int
+    # 是否已在 Redis 中递增（Redis 不可用时为 False，无需归还）
+    counted_in_redis: bool
+
+    async def release(self) -> None:
+        """游玩失败时归还 Redis 中的计数"""
+        if not self.counted_in_redis:
+            return
+        self.counted_in_redis = False
+        try:
+            await get_redis()
+            await get_script("daily_play_release", _RELEASE_PLAY_LUA)(
+                keys=[_counter_key(self.game, self.user_id, self.config_id, self.play_date)],
+            )
+        except Exception as exc:
+            logger.warning("归还每日游玩次数失败: game=%s, user=%s, error=%s", self.game, self.user_id, exc)
+
+
+async def _consume_in_redis(
+    db: AsyncSession,
+    game: str,
+    user_id: int,
+    config_id: int,
+    limit: int,
+    today: date,
+) -> int:
+    await get_redis()
+    script = get_script("daily_play_consume", _CONSUME_PLAY_LUA)
+    key = _counter_key(game, user_id, config_id, today)
+    expire_at = _next_midnight_timestamp(today)
+    result = int(await script(keys=[key], args=[limit, expire_at, ""]))
+    if result == -2:
+        # 当天首次游玩或键丢失：用表中计数恢复
+        seed = await _load_db_count(db, game, user_id, config_id, today)
+        result = int(await script(keys=[key], args=[limit, expire_at, seed]))
+    return result
+
+
+async def consume_play(
+    db: AsyncSession,
+    game: str,
+    user_id: int,
+    config_id: int,
+    limit: Optional[int] = None,
+) -> Optional[DailyPlay]:
+    """
+    占用一次当日游玩次数（在游玩事务内调用，事务由调用方提交）
+
+    limit 为空或 <= 0 时不限次数，只计数（如使用券、管理员）。已达上限时返回 None。
+    """
+    today = date.today()
+    cap = limit if limit and limit > 0 else 0
+    counted_in_redis = False
+    try:
+        count = await _consume_in_redis(db, game, user_id, config_id, cap, today)
+        if count < 0:
+            return None
+        counted_in_redis = True
+    except Exception as exc:
+        logger.warning("Redis 每日游玩计数失败，使用数据库计数: game=%s, user=%s, error=%s", game, user_id, exc)
+        count = None
+
+    play = DailyPlay(
+        game=game,
+        user_id=user_id,
+        config_id=config_id,
+        play_date=today,
+        count=count or 0,
+        counted_in_redis=counted_in_redis,
+    )
+    try:
+        await db.execute(_UPSERT_COUNT_SQL, _params(game, user_id, config_id, today))
+    except Exception:
+        # 调用方拿不到 DailyPlay，无法归还，这里先归还 Redis 中已占用的次数
+        await play.release()
+        raise
+
+    if count is None:
+        # UPSERT 已对计数行加锁，同一用户的并发游玩在此串行
+        play.count = await _load_db_count(db, game, user_id, config_id, today)
+        if cap and play.count > cap:
+            return None
+
+    return play
+
+
+async def get_play_count(db: AsyncSession, game: str, user_id: int, config_id: int) -> int:
+    """获取用户当日游玩次数（展示用）"""
+    today = date.today()
+    try:
+        redis_client = await get_redis()
+        value = await redis_client.get(_counter_key(game, user_id, config_id, today))
+        if value is not None:
+            return int(value)
+    except Exception as exc:
+        logger.warning("读取每日游玩计数失败: game=%s, user=%s, error=%s", game, user_id, exc)
+    return await _load_db_count(db, game, user_id, config_id, today)
@@ -0,0 +1,78 @@
+"""
+抽奖类玩法配置缓存（进程内，带版本号）
+
+抽奖/刮刮乐、扭蛋机、老虎机的配置只在管理员修改时变化，但每次抽奖都要读取：
+- 每个玩法缓存一份预编译快照（奖池别名表、老虎机规则匹配器等），由各玩法提供加载函数
+- 版本号：Redis 哈希 game_config:versions 中每个玩法一个递增版本；管理员写入后调用
+  invalidate_game_config 递增版本，各进程读取时比对版本（一次 HGET），版本变化即重新加载
+- Redis 不可用时退化为 GAME_CONFIG_CACHE_TTL_SECONDS 过期
+- 有限库存奖品被抽中后同样需要失效，保证各进程的可抽奖池与数据库库存一致
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_KEY = "game_config:versions"
+
+LOTTERY = "lottery"
+GACHA = "gacha"
+SLOT_MACHINE = "slot_machine"
+
+T = TypeVar("T")
+
+# 玩法 -> (过期时间, 版本, 快照)
+_entries: dict[str, tuple[float, Optional[int], Any]] = {}
+
+
+async def _read_version(game: str) -> Optional[int]:
+    """读取玩法配置版本，Redis 不可用时返回 None"""
+    try:
+        redis_client = await get_redis()
+        return int(await redis_client.hget(VERSIONS_KEY, game) or 0)
+    except Exception as exc:
+        logger.warning("读取玩法配置版本失败: game=%s, error=%s", game, exc)
+        return None
+
+
+async def get_game_config(
+    db: AsyncSession,
+    game: str,
+    loader: Callable[[AsyncSession], Awaitable[T]],
+) -> T:
+    """获取玩法配置快照（读穿缓存）"""
+    version = await _read_version(game)
+    entry = _entries.get(game)
+    if (
+        entry is not None
+        and entry[0] > time.monotonic()
+        and (version is None or entry[1] == version)
+    ):
+        return entry[2]
+
+    snapshot = await loader(db)
+    _entries[game] = (time.monotonic() + settings.GAME_CONFIG_CACHE_TTL_SECONDS, version, snapshot)
+    return snapshot
+
+
+async def invalidate_game_config(game: str) -> None:
+    """
+    配置写入（提交）后调用：递增版本号
+
+    本进程立即生效；Redis 不可用时其他进程依赖 TTL 过期。
+    """
+    _entries.pop(game, None)
+    try:
+        redis_client = await get_redis()
+        await redis_client.hincrby(VERSIONS_KEY, game, 1)
+    except Exception as exc:
+        logger.warning("递增玩法配置版本失败: game=%s, error=%s", game, exc)
+
@@ -0,0 +1,296 @@
+"""
+GitHub 提交缓存（github_commits）
+
+按 (仓库, sha) 在本地保存提交及其代码行数，GitHub API 只用于补齐增量：
+- 提交列表：以已缓存的最新提交时间为游标（回退 GITHUB_COMMIT_SINCE_OVERLAP_HOURS 兜底乱序推送），
+  只拉取 since 之后的提交；首次同步最多回填 GITHUB_COMMIT_BACKFILL_PAGES 页
+- 提交详情：只为 detail_synced=0 的提交拉取，新提交优先，每次同步最多 GITHUB_COMMIT_DETAIL_MAX_PER_SYNC 个，
+  未完成的留到下次同步
+- 每日统计（GitHubStats 当日字段）与累计统计（截至当日）由缓存汇总，不再重复请求 API
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.github_stats import GitHubCommit
+from app.services.github_service import github_service, track_requests
+
+
+logger = logging.getLogger(__name__)
+
+COMMITS_PER_PAGE = 100
+DETAIL_BATCH_SIZE = 50
+
+
+def _parse_github_time(value: Optional[str]) -> Optional[datetime]:
+    """解析 GitHub 时间字符串，返回 UTC naive datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def _commit_row(owner: str, repo: str, commit: dict, now: datetime) -> Optional[dict]:
+    """把提交列表中的一项转换为 github_commits 行"""
+    sha = commit.get("sha")
+    if not sha:
+        return None
+    commit_data = commit.get("commit") or {}
+    authored_at = _parse_github_time((commit_data.get("author") or {}).get("date"))
+    committed_at = _parse_github_time((commit_data.get("committer") or {}).get("date"))
+    if authored_at is None and committed_at is None:
+        return None
+    return {
+        "repo_owner": owner,
+        "repo_name": repo,
+        "sha": sha,
+        "authored_at": authored_at or committed_at,
+        "committed_at": committed_at or authored_at,
+        "message": (commit_data.get("message") or "").split("\n")[0][:200],
+        "additions": 0,
+        "deletions": 0,
+        "files_changed": 0,
+        "detail_synced": False,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def _latest_committed_at(db: AsyncSession, owner: str, repo: str) -> Optional[datetime]:
+    result = await db.execute(
+        select(func.max(GitHubCommit.committed_at)).where(
+            GitHubCommit.repo_owner == owner,
+            GitHubCommit.repo_name == repo,
+        )
+    )
+    return result.scalar()
+
+
+async def _fetch_new_commits(owner: str, repo: str, since: Optional[datetime]) -> list[dict]:
+    """
+    分页拉取 since 之后的提交（无游标时为首次回填，受页数上限约束）
+
+    任一页失败即抛出异常，不返回部分结果：否则只写入前几页会把游标推进到缺失页之后，
+    缺失的提交再也不会被拉取。
+    """
+    max_pages = None if since else max(1, settings.GITHUB_COMMIT_BACKFILL_PAGES)
+    commits: list[dict] = []
+    page = 1
+    while max_pages is None or page <= max_pages:
+        items = await github_service.get_commits(
+            owner, repo, since=since, per_page=COMMITS_PER_PAGE, page=page, strict=True
+        )
+        commits.extend(items)
+        if len(items) < COMMITS_PER_PAGE:
+            break
+        page += 1
+    return commits
+
+
+async def _store_commits(db: AsyncSession, owner: str, repo: str, rows: list[dict]) -> int:
+    """写入未缓存过的提交，返回新增数"""
+    if not rows:
+        return 0
+    existing = set((await db.execute(
+        select(GitHubCommit.sha).where(
+            GitHubCommit.repo_owner == owner,
+            GitHubCommit.repo_name == repo,
+            GitHubCommit.sha.in_([row["sha"] for row in rows]),
+        )
+    )).scalars().all())
+    new_rows = list({row["sha"]: row for row in rows if row["sha"] not in existing}.values())
+    if not new_rows:
+        return 0
+    stmt = insert(GitHubCommit).values(new_rows)
+    # 并发同步同一仓库时可能撞上唯一约束（uq_github_commits_repo_sha），保留已有行与详情
+    stmt = stmt.on_duplicate_key_update(sha=GitHubCommit.sha)
+    await db.execute(stmt)
+    await db.commit()
+    return len(new_rows)
+
+
+async def _sync_commit_details(db: AsyncSession, owner: str, repo: str) -> tuple[int, int]:
+    """
+    为缺少详情的提交拉取代码行数（新提交优先）
+
+    Returns:
+        (本次补齐数, 剩余未补齐数)
+    """
+    limit = max(0, settings.GITHUB_COMMIT_DETAIL_MAX_PER_SYNC)
+    pending_filter = (
+        GitHubCommit.repo_owner == owner,
+        GitHubCommit.repo_name == repo,
+        GitHubCommit.detail_synced.is_(False),
+    )
+    result = await db.execute(
+        select(GitHubCommit.id, GitHubCommit.sha)
+        .where(*pending_filter)
+        .order_by(GitHubCommit.committed_at.desc())
+        .limit(limit)
+    )
+    pending = result.all()
+
+    fetched = 0
+    for offset in range(0, len(pending), DETAIL_BATCH_SIZE):
+        batch = pending[offset:offset + DETAIL_BATCH_SIZE]
+        details = await asyncio.gather(*[
+            github_service.get_commit_detail(owner, repo, row.sha) for row in batch
+        ])
+        now = datetime.utcnow()
+        updates = []
+        for row, detail in zip(batch, details):
+            if not detail:
+                continue  # 请求失败，保留 detail_synced=0 等下次重试
+            stats = detail.get("stats") or {}
+            updates.append({
+                "id": row.id,
+                "additions": stats.get("additions", 0),
+                "deletions": stats.get("deletions", 0),
+                "files_changed": len(detail.get("files") or []),
+                "detail_synced": True,
+                "updated_at": now,
+            })
+        if updates:
+            await db.execute(update(GitHubCommit), updates)
+            await db.commit()
+            fetched += len(updates)
+
+    remaining = (await db.execute(
+        select(func.count(GitHubCommit.id)).where(*pending_filter)
+    )).scalar() or 0
+    return fetched, remaining
+
+
+async def sync_repo_commits(db: AsyncSession, owner: str, repo: str) -> dict:
+    """
+    增量同步仓库提交到本地缓存
+
+    Returns:
+        {
+            "new_commits": int,        # 新增缓存的提交数
+            "details_fetched": int,    # 本次补齐详情的提交数
+            "details_pending": int,    # 仍缺少详情的提交数（下次同步继续）
+            "api_calls": int,          # 实际消耗限额的请求数
+            "not_modified": int,       # 命中 304 的请求数
+        }
+
+    Raises:
+        GitHubRateLimited: 限额耗尽（已写入的提交与详情保留，下次从缓存继续）
+        GitHubRequestFailed: 提交列表某页请求失败（本次不写入任何提交，游标不变）
+    """
+    with track_requests() as stats:
+        latest = await _latest_committed_at(db, owner, repo)
+        since = None
+        if latest is not None:
+            since = latest - timedelta(hours=max(0, settings.GITHUB_COMMIT_SINCE_OVERLAP_HOURS))
+
+        now = datetime.utcnow()
+        rows = []
+        for commit in await _fetch_new_commits(owner, repo, since):
+            row = _commit_row(owner, repo, commit, now)
+            if row is not None:
+                rows.append(row)
+        new_commits = await _store_commits(db, owner, repo, rows)
+        details_fetched, details_pending = await _sync_commit_details(db, owner, repo)
+
+    return {
+        "new_commits": new_commits,
+        "details_fetched": details_fetched,
+        "details_pending": details_pending,
+        "api_calls": stats["api_calls"],
+        "not_modified": stats["not_modified"],
+    }
+
+
+def _day_range(target_date: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(target_date, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+async def build_daily_stats(db: AsyncSession, owner: str, repo: str, target_date: date) -> dict:
+    """
+    从提交缓存汇总指定日期（UTC，按作者提交时间）的统计
+
+    Returns:
+        {
+            "commits_count": int,
+            "additions": int,
+            "deletions": int,
+            "files_changed": int,
+            "commits_detail": [...],
+            "hourly_activity": {...},
+            "total_commits": int,      # 截至当日的累计数据
+            "total_additions": int,
+            "total_deletions": int,
+        }
+    """
+    start, end = _day_range(target_date)
+    result = await db.execute(
+        select(GitHubCommit).where(
+            GitHubCommit.repo_owner == owner,
+            GitHubCommit.repo_name == repo,
+            GitHubCommit.authored_at >= start,
+            GitHubCommit.authored_at < end,
+        ).order_by(GitHubCommit.authored_at.desc())
+    )
+    commits = result.scalars().all()
+
+    hourly = {str(h): 0 for h in range(24)}
+    commits_detail = []
+    for commit in commits:
+        hourly[str(commit.authored_at.hour)] += 1
+        commits_detail.append({
+            "sha": commit.sha[:7],
+            "message": (commit.message or "")[:100],
+            "timestamp": commit.authored_at.isoformat() + "Z",
+            "additions": commit.additions,
+            "deletions": commit.deletions,
+        })
+
+    daily = {
+        "commits_count": len(commits),
+        "additions": sum(c.additions for c in commits),
+        "deletions": sum(c.deletions for c in commits),
+        "files_changed": sum(c.files_changed for c in commits),
+        "commits_detail": commits_detail,
+        "hourly_activity": hourly,
+    }
+    daily.update(await build_repo_totals(db, owner, repo, until=end))
+    return daily
+
+
+async def build_repo_totals(
+    db: AsyncSession,
+    owner: str,
+    repo: str,
+    until: Optional[datetime] = None,
+) -> dict:
+    """从提交缓存汇总仓库累计统计（until 为不含的截止时间，UTC）"""
+    conditions = [GitHubCommit.repo_owner == owner, GitHubCommit.repo_name == repo]
+    if until is not None:
+        conditions.append(GitHubCommit.authored_at < until)
+    row = (await db.execute(
+        select(
+            func.count(GitHubCommit.id),
+            func.coalesce(func.sum(GitHubCommit.additions), 0),
+            func.coalesce(func.sum(GitHubCommit.deletions), 0),
+        ).where(*conditions)
+    )).one()
+    return {
+        "total_commits": int(row[0] or 0),
+        "total_additions": int(row[1] or 0),
+        "total_deletions": int(row[2] or 0),
+    }
@@ -3,14 +3,148 @@ GitHub 数据采集服务
 
 通过 GitHub API 获取选手仓库的 commits、代码行数等统计数据。
 支持公开仓库的免授权访问，以及通过 Token 提高 API 限额。
+
+请求统一经过 _get_json：
+- 条件请求：缓存 ETag 与响应（Redis），命中 304 时直接复用且不消耗限额
+- 自适应节流：根据 X-RateLimit-Remaining/Reset 响应头在剩余次数偏低时均匀摊开请求，
+  低于保留值时等待重置；需等待过久则抛出 GitHubRateLimited，由调用方中止并续跑
+
+每日/累计统计不在此处计算，由 github_commit_store 基于本地提交缓存汇总。
 """
+import asyncio
+import hashlib
+import json
+import logging
 import re
-import httpx
-from datetime import date, datetime, timedelta
-from typing import Optional
-from urllib.parse import urlparse
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Iterator, Optional
+from urllib.parse import urlencode, urlparse
 
 from app.core.config import settings
+from app.core.http_client import GITHUB_API, get_http_client
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+ETAG_CACHE_PREFIX = "github:etag:"
+
+# 当前同步任务的请求计数（track_requests 内设置，并发子任务共享同一个 Counter）
+_request_stats: ContextVar[Optional[Counter]] = ContextVar("github_request_stats", default=None)
+
+
+@contextmanager
+def track_requests() -> Iterator[Counter]:
+    """统计块内（含并发子任务）的请求数：api_calls 为实际消耗限额的请求，not_modified 为命中 304 的请求"""
+    stats = Counter()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+class GitHubRateLimited(Exception):
+    """GitHub API 限额耗尽且需等待时间超过上限"""
+
+    def __init__(self, reset_at: float):
+        super().__init__(f"GitHub API 限额耗尽，{max(0, int(reset_at - time.time()))} 秒后重置")
+        self.reset_at = reset_at
+
+
+class GitHubRequestFailed(Exception):
+    """严格模式下 GitHub API 请求失败（非 200/304 响应或响应格式不符）"""
+
+
+class GitHubRateLimiter:
+    """
+    GitHub 限额自适应节流（进程内共享）
+
+    - 剩余次数充足时不限速
+    - 低于 GITHUB_RATE_LIMIT_PACE_BELOW 时按「距重置秒数 / 可用次数」均匀排队
+    - 低于 GITHUB_RATE_LIMIT_RESERVE 或被 403/429 限流时等待到重置/Retry-After
+    """
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: float = 0.0
+        self._blocked_until: float = 0.0
+        self._next_slot: float = 0.0
+        self._lock = asyncio.Lock()
+
+    def update(self, headers) -> None:
+        """根据响应头更新限额状态"""
+        try:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Reset" in headers:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+        except (TypeError, ValueError):
+            pass
+
+    def block(self, headers) -> None:
+        """被限流（403/429）：按 Retry-After 或重置时间暂停"""
+        now = time.time()
+        retry_after = headers.get("Retry-After")
+        try:
+            until = now + float(retry_after) if retry_after else max(self.reset_at, now + 60)
+        except ValueError:
+            until = max(self.reset_at, now + 60)
+        self._blocked_until = max(self._blocked_until, until)
+        self.remaining = 0
+
+    def _wait_seconds(self, now: float) -> float:
+        if self._blocked_until > now:
+            return self._blocked_until - now
+        if self.remaining is None or self.reset_at <= now:
+            return 0.0
+        reserve = max(0, settings.GITHUB_RATE_LIMIT_RESERVE)
+        available = self.remaining - reserve
+        if available <= 0:
+            return self.reset_at - now + 1
+        if self.remaining < settings.GITHUB_RATE_LIMIT_PACE_BELOW:
+            spacing = (self.reset_at - now) / available
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + spacing
+            return slot - now
+        return 0.0
+
+    async def acquire(self) -> None:
+        """发起请求前调用，必要时等待"""
+        async with self._lock:
+            now = time.time()
+            wait = self._wait_seconds(now)
+            if wait > settings.GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise GitHubRateLimited(now + wait)
+            if self.remaining is not None and self.remaining > 0:
+                # 乐观扣减，避免并发请求同时看到同一个剩余值
+                self.remaining -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _shape_commit_detail(data: dict) -> dict:
+    """提交详情只保留统计需要的字段（不缓存 patch 内容）"""
+    return {
+        "sha": data.get("sha"),
+        "commit": data.get("commit", {}),
+        "stats": data.get("stats", {}),
+        "files": [
+            {
+                "filename": item.get("filename"),
+                "status": item.get("status"),
+                "additions": item.get("additions", 0),
+                "deletions": item.get("deletions", 0),
+            }
+            for item in data.get("files", []) or []
+        ],
+    }
 
 
 class GitHubService:
@@ -32,6 +166,92 @@ class GitHubService:
         }
         if self.token:
             self.headers["Authorization"] = f"token {self.token}"
+        self.rate_limiter = GitHubRateLimiter()
+        # 提交详情并发上限（跨仓库共享）
+        self._detail_semaphore = asyncio.Semaphore(max(1, settings.GITHUB_SYNC_COMMIT_CONCURRENCY))
+
+    @staticmethod
+    def _etag_key(url: str, params: Optional[dict]) -> str:
+        raw = f"{url}?{urlencode(sorted((params or {}).items()))}"
+        return f"{ETAG_CACHE_PREFIX}{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    async def _etag_get(self, key: str) -> Optional[dict]:
+        try:
+            redis = await get_redis()
+            raw = await redis.get(key)
+            return json.loads(raw) if raw else None
+        except Exception as exc:
+            logger.debug("读取 GitHub ETag 缓存失败: %s", exc)
+            return None
+
+    async def _etag_set(self, key: str, etag: str, body: Any) -> None:
+        try:
+            redis = await get_redis()
+            await redis.set(
+                key,
+                json.dumps({"etag": etag, "body": body}, ensure_ascii=False),
+                ex=settings.GITHUB_ETAG_CACHE_TTL_SECONDS,
+            )
+        except Exception as exc:
+            logger.debug("写入 GitHub ETag 缓存失败: %s", exc)
+
+    async def _get_json(
+        self,
+        path: str,
+        *,
+        params: Optional[dict] = None,
+        timeout: float = 10.0,
+        shape: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """
+        发起 GET 请求（条件请求 + 限额节流）
+
+        Args:
+            shape: 对响应 JSON 的裁剪函数（裁剪后的结果才会被缓存和返回）
+
+        Returns:
+            200/304 时返回 JSON，其他状态返回 None
+
+        Raises:
+            GitHubRateLimited: 限额耗尽且等待时间超过上限
+        """
+        url = f"{self.BASE_URL}{path}"
+        cache_key = self._etag_key(url, params)
+        cached = await self._etag_get(cache_key)
+        headers = dict(self.headers)
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
+        stats = _request_stats.get()
+        client = get_http_client(GITHUB_API)
+        for _ in range(2):
+            await self.rate_limiter.acquire()
+            resp = await client.get(url, headers=headers, params=params, timeout=timeout)
+            self.rate_limiter.update(resp.headers)
+            if resp.status_code in (403, 429) and (
+                resp.headers.get("Retry-After") or resp.headers.get("X-RateLimit-Remaining") == "0"
+            ):
+                # 主/次级限流：暂停后重试一次（等待过久时 acquire 会抛出 GitHubRateLimited）
+                self.rate_limiter.block(resp.headers)
+                continue
+            break
+
+        if resp.status_code == 304 and cached:
+            if stats is not None:
+                stats["not_modified"] += 1
+            return cached.get("body")
+        if stats is not None:
+            stats["api_calls"] += 1
+        if resp.status_code != 200:
+            return None
+
+        data = resp.json()
+        if shape is not None:
+            data = shape(data)
+        etag = resp.headers.get("ETag")
+        if etag:
+            await self._etag_set(cache_key, etag, data)
+        return data
 
     @staticmethod
     def parse_repo_url(repo_url: str) -> tuple[str, str] | None:
@@ -59,18 +279,12 @@ class GitHubService:
 
     async def get_repo_info(self, owner: str, repo: str) -> dict | None:
         """获取仓库基本信息"""
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    f"{self.BASE_URL}/repos/{owner}/{repo}",
-                    headers=self.headers,
-                    timeout=10.0,
-                )
-                if resp.status_code == 200:
-                    return resp.json()
-                return None
-            except Exception:
-                return None
+        try:
+            return await self._get_json(f"/repos/{owner}/{repo}", timeout=10.0)
+        except GitHubRateLimited:
+            raise
+        except Exception:
+            return None
 
     async def get_commits(
         self,
@@ -79,9 +293,11 @@ class GitHubService:
         since: Optional[datetime] = None,
         until: Optional[datetime] = None,
         per_page: int = 100,
+        page: int = 1,
+        strict: bool = False,
     ) -> list[dict]:
         """
-        获取仓库提交记录
+        获取仓库提交记录（按提交时间倒序）
 
         Args:
             owner: 仓库所有者
@@ -89,193 +305,68 @@ class GitHubService:
             since: 开始时间
             until: 结束时间
             per_page: 每页数量
+            page: 页码（从 1 开始）
+            strict: 请求失败或响应不是列表时抛出异常（默认返回空列表），
+                    供分页调用方区分「已到最后一页」与「本页失败」
 
         Returns:
             提交记录列表
+
+        Raises:
+            GitHubRequestFailed: strict 模式下响应为非 200/304 或不是列表
         """
         params = {"per_page": per_page}
+        if page > 1:
+            params["page"] = page
         if since:
             params["since"] = since.isoformat() + "Z"  # GitHub API 需要 UTC 时区标识
         if until:
             params["until"] = until.isoformat() + "Z"
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    f"{self.BASE_URL}/repos/{owner}/{repo}/commits",
-                    headers=self.headers,
-                    params=params,
-                    timeout=15.0,
-                )
-                if resp.status_code == 200:
-                    return resp.json()
-                return []
-            except Exception:
-                return []
+        try:
+            data = await self._get_json(f"/repos/{owner}/{repo}/commits", params=params, timeout=15.0)
+            if isinstance(data, list):
+                return data
+            if strict:
+                raise GitHubRequestFailed(f"获取提交列表失败: {owner}/{repo} 第 {page} 页")
+            return []
+        except (GitHubRateLimited, GitHubRequestFailed):
+            raise
+        except Exception:
+            if strict:
+                raise
+            return []
 
     async def get_commit_detail(self, owner: str, repo: str, sha: str) -> dict | None:
         """获取单个提交的详细信息（包含代码行数统计）"""
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    f"{self.BASE_URL}/repos/{owner}/{repo}/commits/{sha}",
-                    headers=self.headers,
+        try:
+            async with self._detail_semaphore:
+                return await self._get_json(
+                    f"/repos/{owner}/{repo}/commits/{sha}",
                     timeout=10.0,
+                    shape=_shape_commit_detail,
                 )
-                if resp.status_code == 200:
-                    return resp.json()
-                return None
-            except Exception:
-                return None
-
-    async def get_daily_stats(
-        self,
-        owner: str,
-        repo: str,
-        target_date: date,
-    ) -> dict:
-        """
-        获取指定日期的统计数据
-
-        Args:
-            owner: 仓库所有者
-            repo: 仓库名称
-            target_date: 目标日期
-
-        Returns:
-            {
-                "commits_count": int,
-                "additions": int,
-                "deletions": int,
-                "files_changed": int,
-                "commits_detail": [...],
-                "hourly_activity": {...}
-            }
-        """
-        # 构建时间范围（当天 00:00:00 到 23:59:59 UTC）
-        # GitHub API 使用 UTC 时间，所以我们需要查询 UTC 日期范围
-        since = datetime.combine(target_date, datetime.min.time())
-        until = datetime.combine(target_date, datetime.max.time())
-
-        # 获取当天提交
-        commits = await self.get_commits(owner, repo, since=since, until=until)
-
-        result = {
-            "commits_count": len(commits),
-            "additions": 0,
-            "deletions": 0,
-            "files_changed": 0,
-            "commits_detail": [],
-            "hourly_activity": {},
-        }
-
-        # 初始化小时统计
-        hourly = {str(h): 0 for h in range(24)}
-
-        for commit in commits:
-            sha = commit.get("sha", "")
-            commit_data = commit.get("commit", {})
-            message = commit_data.get("message", "").split("\n")[0][:100]  # 只取第一行，限制长度
-
-            # 解析提交时间
-            author_info = commit_data.get("author", {})
-            commit_time_str = author_info.get("date", "")
-            commit_hour = 0
-            if commit_time_str:
-                try:
-                    commit_time = datetime.fromisoformat(commit_time_str.replace("Z", "+00:00"))
-                    commit_hour = commit_time.hour
-                except Exception:
-                    pass
-
-            # 统计小时活动
-            hourly[str(commit_hour)] = hourly.get(str(commit_hour), 0) + 1
-
-            # 获取详细统计（代码行数）
-            detail = await self.get_commit_detail(owner, repo, sha)
-            additions = 0
-            deletions = 0
-            files_count = 0
-
-            if detail:
-                stats = detail.get("stats", {})
-                additions = stats.get("additions", 0)
-                deletions = stats.get("deletions", 0)
-                files_count = len(detail.get("files", []))
-
-            result["additions"] += additions
-            result["deletions"] += deletions
-            result["files_changed"] += files_count
-
-            result["commits_detail"].append({
-                "sha": sha[:7],
-                "message": message,
-                "timestamp": commit_time_str,
-                "additions": additions,
-                "deletions": deletions,
-            })
-
-        # 只保留有数据的小时
-        result["hourly_activity"] = {k: v for k, v in hourly.items() if v > 0}
-
-        return result
-
-    async def get_total_stats(self, owner: str, repo: str) -> dict:
-        """
-        获取仓库累计统计数据
-
-        Returns:
-            {
-                "total_commits": int,
-                "total_additions": int,
-                "total_deletions": int,
-            }
-        """
-        # 获取所有提交（最多获取最近500个）
-        all_commits = []
-        page = 1
-        while page <= 5:  # 最多5页，每页100个
-            commits = await self.get_commits(owner, repo, per_page=100)
-            if not commits:
-                break
-            all_commits.extend(commits)
-            if len(commits) < 100:
-                break
-            page += 1
-
-        total_additions = 0
-        total_deletions = 0
-
-        # 为了不消耗太多 API 限额，只统计最近50个提交的代码行数
-        for commit in all_commits[:50]:
-            sha = commit.get("sha", "")
-            detail = await self.get_commit_detail(owner, repo, sha)
-            if detail:
-                stats = detail.get("stats", {})
-                total_additions += stats.get("additions", 0)
-                total_deletions += stats.get("deletions", 0)
-
-        return {
-            "total_commits": len(all_commits),
-            "total_additions": total_additions,
-            "total_deletions": total_deletions,
-        }
+        except GitHubRateLimited:
+            raise
+        except Exception:
+            return None
 
     async def get_rate_limit(self) -> dict:
         """获取当前 API 限额状态"""
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    f"{self.BASE_URL}/rate_limit",
-                    headers=self.headers,
-                    timeout=5.0,
-                )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return data.get("rate", {})
-                return {}
-            except Exception:
-                return {}
+        client = get_http_client(GITHUB_API)
+        try:
+            resp = await client.get(
+                f"{self.BASE_URL}/rate_limit",
+                headers=self.headers,
+                timeout=5.0,
+            )
+            self.rate_limiter.update(resp.headers)
+            if resp.status_code == 200:
+                data = resp.json()
+                return data.get("rate", {})
+            return {}
+        except Exception:
+            return {}
 
 
 # 全局服务实例
@@ -0,0 +1,261 @@
+"""
+GitHub 同步引擎
+
+并发同步所有选手仓库的每日统计：
+- 每个仓库先增量同步本地提交缓存（github_commit_store），再由缓存汇总当日与累计统计
+- 仓库级并发由 GITHUB_SYNC_REPO_CONCURRENCY 控制，提交详情并发由 GitHubService 内部控制
+- 请求经过 GitHubService 的条件请求与限额节流；限额耗尽时中止本轮，保留进度
+- 进度持久化在 Redis，每完成一个报名即落库并记录；中断（重启/限额）后下次运行跳过已完成的报名
+- 因限额中止时记录 paused_until（限额重置时间），此前的触发（续跑或新一轮）直接跳过
+
+Redis 键：
+- github:sync:run        当前一轮的元信息（run_id/target_date/sync_type/status/...）
+- github:sync:run:done   当前一轮已完成的报名ID集合
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.redis import get_redis
+from app.models.github_stats import GitHubStats, GitHubSyncLog
+from app.models.registration import Registration, RegistrationStatus
+from app.services.github_commit_store import build_daily_stats, sync_repo_commits
+from app.services.github_service import GitHubRateLimited, GitHubService, github_service
+
+
+logger = logging.getLogger(__name__)
+
+RUN_KEY = "github:sync:run"
+RUN_DONE_KEY = "github:sync:run:done"
+RUN_TTL_SECONDS = 2 * 86400
+
+RUN_RUNNING = "running"
+RUN_FINISHED = "finished"
+
+SYNC_REGISTRATION_STATUSES = [
+    RegistrationStatus.SUBMITTED.value,
+    RegistrationStatus.APPROVED.value,
+]
+
+# 同一进程内同时只跑一轮（定时任务与启动续跑可能重叠）
+_run_lock = asyncio.Lock()
+
+
+async def upsert_daily_stats(
+    db,
+    registration_id: int,
+    stat_date: date,
+    repo_url: str,
+    owner: str,
+    repo: str,
+    daily_stats: dict,
+) -> None:
+    """写入/覆盖某报名某天的统计（依赖 uq_github_stats_reg_date 唯一约束）"""
+    now = datetime.utcnow()
+    stmt = insert(GitHubStats).values(
+        registration_id=registration_id,
+        stat_date=stat_date,
+        repo_url=repo_url,
+        repo_owner=owner,
+        repo_name=repo,
+        commits_count=daily_stats["commits_count"],
+        additions=daily_stats["additions"],
+        deletions=daily_stats["deletions"],
+        files_changed=daily_stats["files_changed"],
+        total_commits=daily_stats["total_commits"],
+        total_additions=daily_stats["total_additions"],
+        total_deletions=daily_stats["total_deletions"],
+        commits_detail=daily_stats["commits_detail"],
+        hourly_activity=daily_stats["hourly_activity"],
+        created_at=now,
+        updated_at=now,
+    )
+    stmt = stmt.on_duplicate_key_update(
+        repo_url=stmt.inserted.repo_url,
+        repo_owner=stmt.inserted.repo_owner,
+        repo_name=stmt.inserted.repo_name,
+        commits_count=stmt.inserted.commits_count,
+        additions=stmt.inserted.additions,
+        deletions=stmt.inserted.deletions,
+        files_changed=stmt.inserted.files_changed,
+        total_commits=stmt.inserted.total_commits,
+        total_additions=stmt.inserted.total_additions,
+        total_deletions=stmt.inserted.total_deletions,
+        commits_detail=stmt.inserted.commits_detail,
+        hourly_activity=stmt.inserted.hourly_activity,
+        updated_at=stmt.inserted.updated_at,
+    )
+    await db.execute(stmt)
+
+
+async def _load_registrations() -> list[tuple[int, str]]:
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Registration.id, Registration.repo_url).where(
+                Registration.status.in_(SYNC_REGISTRATION_STATUSES)
+            )
+        )
+        return [(row.id, row.repo_url) for row in result.all()]
+
+
+async def _sync_registration(
+    registration_id: int,
+    repo_url: str,
+    target_date: date,
+    sync_type: str,
+) -> str:
+    """同步单个报名并落库，返回 success/failed/skipped"""
+    parsed = GitHubService.parse_repo_url(repo_url) if repo_url else None
+    if not parsed:
+        if repo_url:
+            logger.warning(f"报名 {registration_id} 的 repo_url 无效: {repo_url}")
+        return "skipped"
+    owner, repo = parsed
+
+    try:
+        async with async_session_maker() as db:
+            sync_result = await sync_repo_commits(db, owner, repo)
+    except GitHubRateLimited:
+        raise
+    except Exception as e:
+        logger.error(f"报名 {registration_id} 同步失败: {e}")
+        async with async_session_maker() as db:
+            db.add(GitHubSyncLog(
+                registration_id=registration_id,
+                sync_type=sync_type,
+                status="failed",
+                error_message=str(e)[:500],
+                rate_limit_remaining=github_service.rate_limiter.remaining,
+            ))
+            await db.commit()
+        return "failed"
+
+    async with async_session_maker() as db:
+        daily_stats = await build_daily_stats(db, owner, repo, target_date)
+        await upsert_daily_stats(db, registration_id, target_date, repo_url, owner, repo, daily_stats)
+        db.add(GitHubSyncLog(
+            registration_id=registration_id,
+            sync_type=sync_type,
+            status="success",
+            api_calls_used=sync_result["api_calls"],
+            rate_limit_remaining=github_service.rate_limiter.remaining,
+        ))
+        await db.commit()
+    logger.debug(
+        f"报名 {registration_id} 同步成功: {daily_stats['commits_count']} commits, "
+        f"新增缓存 {sync_result['new_commits']} 个, 待补详情 {sync_result['details_pending']} 个, "
+        f"{sync_result['api_calls']} 次调用, {sync_result['not_modified']} 次未变更"
+    )
+    return "success"
+
+
+async def _execute_run(run: dict) -> dict:
+    """执行（或续跑）一轮同步"""
+    redis = await get_redis()
+    target_date = date.fromisoformat(run["target_date"])
+    sync_type = run["sync_type"]
+    done = {int(value) for value in await redis.smembers(RUN_DONE_KEY)}
+    pending = [(reg_id, repo_url) for reg_id, repo_url in await _load_registrations() if reg_id not in done]
+
+    logger.info(
+        f"GitHub 同步 {run['run_id']}（{target_date}）：待同步 {len(pending)} 个，已完成 {len(done)} 个"
+    )
+
+    semaphore = asyncio.Semaphore(max(1, settings.GITHUB_SYNC_REPO_CONCURRENCY))
+    counts = {"success": 0, "failed": 0, "skipped": 0}
+    rate_limited: Optional[GitHubRateLimited] = None
+
+    async def worker(registration_id: int, repo_url: str) -> None:
+        nonlocal rate_limited
+        async with semaphore:
+            if rate_limited is not None:
+                return
+            try:
+                outcome = await _sync_registration(registration_id, repo_url, target_date, sync_type)
+            except GitHubRateLimited as exc:
+                rate_limited = exc
+                return
+            counts[outcome] += 1
+            await redis.sadd(RUN_DONE_KEY, registration_id)
+
+    await asyncio.gather(*[worker(reg_id, repo_url) for reg_id, repo_url in pending])
+
+    if rate_limited is not None:
+        logger.warning(f"GitHub 同步 {run['run_id']} 因限额中止，下次运行续跑: {rate_limited}")
+        await redis.hset(RUN_KEY, mapping={"paused_until": int(rate_limited.reset_at)})
+    else:
+        await redis.hset(RUN_KEY, mapping={
+            "status": RUN_FINISHED,
+            "finished_at": datetime.utcnow().isoformat(),
+        })
+    return {
+        "run_id": run["run_id"],
+        "target_date": run["target_date"],
+        "completed": rate_limited is None,
+        **counts,
+    }
+
+
+async def run_github_sync(
+    sync_type: str = "hourly",
+    target_date: Optional[date] = None,
+    *,
+    resume_only: bool = False,
+) -> list[dict]:
+    """
+    运行 GitHub 同步
+
+    先续跑未完成的一轮（若有），再开始新一轮；resume_only=True 时只续跑。
+
+    Returns:
+        每一轮的统计
+    """
+    if _run_lock.locked():
+        logger.info("GitHub 同步正在进行，跳过本次触发")
+        return []
+
+    async with _run_lock:
+        redis = await get_redis()
+        summaries = []
+
+        run = await redis.hgetall(RUN_KEY)
+        if run and run.get("status") == RUN_RUNNING:
+            paused_until = int(run.get("paused_until") or 0)
+            if paused_until > time.time():
+                # 限额未重置：续跑或开新一轮都会立即再次被限流，等下次触发
+                logger.info(f"GitHub 同步 {run['run_id']} 限额暂停中，{paused_until - int(time.time())} 秒后续跑")
+                return summaries
+            summary = await _execute_run(run)
+            summaries.append(summary)
+            if not summary["completed"]:
+                return summaries
+
+        if resume_only:
+            return summaries
+
+        run = {
+            "run_id": uuid.uuid4().hex[:12],
+            "target_date": (target_date or date.today()).isoformat(),
+            "sync_type": sync_type,
+            "status": RUN_RUNNING,
+            "started_at": datetime.utcnow().isoformat(),
+        }
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(RUN_KEY, RUN_DONE_KEY)
+            pipe.hset(RUN_KEY, mapping=run)
+            pipe.expire(RUN_KEY, RUN_TTL_SECONDS)
+            pipe.sadd(RUN_DONE_KEY, 0)  # 占位，保证集合存在以便设置过期时间
+            pipe.expire(RUN_DONE_KEY, RUN_TTL_SECONDS)
+            await pipe.execute()
+        summaries.append(await _execute_run(run))
+        return summaries
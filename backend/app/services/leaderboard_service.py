@@ -0,0 +1,423 @@
+"""
+排行榜服务（Redis 有序集合）
+
+热力榜、欧皇榜、码神挑战榜由写入路径增量维护，读取时直接 ZREVRANGE/ZREVRANK：
+- leaderboard:{name}:{scope}        有序集合，member 为用户ID
+- leaderboard:{name}:{scope}:ready  就绪标记，只有标记存在时才增量更新，
+                                    缺失时（首次读取/过期/被失效）从 MySQL 重建
+- leaderboard:{name}:{scope}:building  重建进行中的写入计数：重建期间未就绪的增量更新只递增该计数，
+                                    重建在临时键中完成，换入时计数有变化说明读库期间有写入，
+                                    丢弃本次结果重新读取（避免增量丢失）
+- Redis 不可用时由调用方回退到按 MySQL 全量计算（load_scores 后内存排序）
+
+分值编码（均为整数，保证不超过 2^53）：
+- heat:   热力值（道具分数之和）
+- lucky:  稀有奖品次数 * 1e10 + 最近中奖时间戳（次数相同按最近中奖优先）
+- puzzle: 完成关卡数 * 1e10 + (1e10 - 1 - 总用时)（关卡数相同按用时少优先）
+"""
+from __future__ import annotations
+
+import asyncio
+import calendar
+import logging
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.redis import get_redis, get_script
+from app.models.cheer import Cheer, CheerType
+from app.models.points import LotteryDraw
+from app.models.registration import Registration, RegistrationStatus
+
+
+logger = logging.getLogger(__name__)
+
+HEAT = "heat"
+LUCKY = "lucky"
+PUZZLE = "puzzle"
+
+GLOBAL_SCOPE = "global"
+
+# 道具分数配置（与打气接口一致）
+CHEER_ITEM_POINTS = {
+    CheerType.CHEER: 1,
+    CheerType.COFFEE: 2,
+    CheerType.ENERGY: 3,
+    CheerType.PIZZA: 4,
+    CheerType.STAR: 5,
+}
+
+HEAT_REGISTRATION_STATUSES = [
+    RegistrationStatus.SUBMITTED.value,
+    RegistrationStatus.APPROVED.value,
+]
+
+_SCORE_UNIT = 10_000_000_000
+_SESSION_INFO_KEY = "leaderboard_invalidate_heat_contests"
+
+# 重建时读库期间发生写入的最大重试次数
+_REBUILD_MAX_ATTEMPTS = 3
+_BUILDING_TTL_SECONDS = 300
+
+# 未就绪时跳过增量（等待重建），重建进行中则记录一次写入
+_NOT_READY_PRELUDE = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        redis.call('INCR', KEYS[3])
+    end
+    return 0
+end
+"""
+
+# 就绪时对成员分值做增量
+_INCR_IF_READY_SCRIPT = _NOT_READY_PRELUDE + """
+redis.call('ZINCRBY', KEYS[1], ARGV[2], ARGV[1])
+return 1
+"""
+
+# 就绪时设置成员分值，分值小于 0 表示移出榜单
+_SET_IF_READY_SCRIPT = _NOT_READY_PRELUDE + """
+if tonumber(ARGV[2]) < 0 then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+# 就绪时把“次数 * 单位 + 时间戳”编码的分值次数加一并更新时间戳
+_BUMP_IF_READY_SCRIPT = _NOT_READY_PRELUDE + """
+local unit = tonumber(ARGV[2])
+local current = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]) or '0')
+local count = math.floor(current / unit)
+redis.call('ZADD', KEYS[1], (count + 1) * unit + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# 换入重建结果：重建期间无写入（计数未变）时用临时键替换榜单并设置就绪标记，否则丢弃临时键
+_SWAP_IF_UNCHANGED_SCRIPT = """
+if redis.call('GET', KEYS[3]) ~= ARGV[1] then
+    redis.call('DEL', KEYS[4])
+    return 0
+end
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    redis.call('RENAME', KEYS[4], KEYS[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+else
+    redis.call('DEL', KEYS[1])
+end
+redis.call('SET', KEYS[2], 1, 'EX', ARGV[2])
+return 1
+"""
+
+# 失效：删除榜单与就绪标记，进行中的重建记录一次写入（使其重新读取）
+_INVALIDATE_SCRIPT = """
+redis.call('DEL', KEYS[1], KEYS[2])
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    redis.call('INCR', KEYS[3])
+end
+return 1
+"""
+
+
+class LeaderboardUnavailable(Exception):
+    """排行榜缓存不可用（调用方应回退数据库）"""
+
+
+def _board_key(board: str, scope) -> str:
+    return f"leaderboard:{board}:{scope}"
+
+
+def _ready_key(board: str, scope) -> str:
+    return f"leaderboard:{board}:{scope}:ready"
+
+
+def _building_key(board: str, scope) -> str:
+    return f"leaderboard:{board}:{scope}:building"
+
+
+def _board_keys(board: str, scope) -> list[str]:
+    return [_board_key(board, scope), _ready_key(board, scope), _building_key(board, scope)]
+
+
+def _epoch(value: Optional[datetime]) -> int:
+    return calendar.timegm(value.utctimetuple()) if value else 0
+
+
+def lucky_score(win_count: int, last_win_at: Optional[datetime]) -> int:
+    return int(win_count) * _SCORE_UNIT + _epoch(last_win_at)
+
+
+def puzzle_score(total_solved: int, total_time: int) -> int:
+    if not total_solved or total_solved <= 0:
+        return -1
+    clamped_time = min(max(int(total_time or 0), 0), _SCORE_UNIT - 1)
+    return int(total_solved) * _SCORE_UNIT + (_SCORE_UNIT - 1 - clamped_time)
+
+
+def split_encoded_score(score: float) -> tuple[int, int]:
+    """拆分 lucky/puzzle 的编码分值为 (主序, 次序)"""
+    value = int(score)
+    return value // _SCORE_UNIT, value % _SCORE_UNIT
+
+
+# ========== 从 MySQL 计算分值 ==========
+
+async def _load_heat_scores(db: AsyncSession, scope) -> dict[int, int]:
+    result = await db.execute(
+        select(Cheer.user_id, Cheer.cheer_type, func.count(Cheer.id).label("count"))
+        .join(Registration, Registration.id == Cheer.registration_id)
+        .where(
+            Registration.contest_id == int(scope),
+            Registration.status.in_(HEAT_REGISTRATION_STATUSES),
+        )
+        .group_by(Cheer.user_id, Cheer.cheer_type)
+    )
+    scores: dict[int, int] = {}
+    for user_id, cheer_type, count in result.all():
+        scores[user_id] = scores.get(user_id, 0) + count * CHEER_ITEM_POINTS.get(cheer_type, 1)
+    return scores
+
+
+async def _load_lucky_scores(db: AsyncSession, scope) -> dict[int, int]:
+    result = await db.execute(
+        select(
+            LotteryDraw.user_id,
+            func.count(LotteryDraw.id).label("win_count"),
+            func.max(LotteryDraw.created_at).label("last_win_at"),
+        )
+        .where(LotteryDraw.is_rare == True)
+        .group_by(LotteryDraw.user_id)
+    )
+    return {row.user_id: lucky_score(row.win_count, row.last_win_at) for row in result.all()}
+
+
+async def _load_puzzle_scores(db: AsyncSession, scope) -> dict[int, int]:
+    result = await db.execute(
+        text("SELECT user_id, total_solved, total_time FROM puzzle_progress WHERE total_solved > 0")
+    )
+    return {row.user_id: puzzle_score(row.total_solved, row.total_time) for row in result.fetchall()}
+
+
+_LOADERS: dict[str, Callable[[AsyncSession, object], Awaitable[dict[int, int]]]] = {
+    HEAT: _load_heat_scores,
+    LUCKY: _load_lucky_scores,
+    PUZZLE: _load_puzzle_scores,
+}
+
+
+async def load_scores(db: AsyncSession, board: str, scope=GLOBAL_SCOPE) -> dict[int, int]:
+    """按 MySQL 全量计算榜单分值（重建与回退共用）"""
+    return await _LOADERS[board](db, scope)
+
+
+# ========== 重建 / 失效 ==========
+
+async def rebuild(board: str, scope=GLOBAL_SCOPE) -> int:
+    """
+    从 MySQL 重建榜单，返回上榜人数
+
+    读库前记录写入计数，结果写入临时键后仅在计数未变时换入；
+    读库期间有写入（其增量因未就绪被跳过）则重新读取；重试耗尽时保持未就绪并抛出
+    LeaderboardUnavailable（调用方回退数据库），下次读取再重建。
+    每次读取使用新会话，保证事务快照晚于写入计数的记录时间。
+    """
+    client = await get_redis()
+    keys = _board_keys(board, scope)
+    building_key = keys[2]
+    ttl = settings.LEADERBOARD_CACHE_TTL_SECONDS
+    swap = get_script("leaderboard_swap", _SWAP_IF_UNCHANGED_SCRIPT)
+    for _ in range(_REBUILD_MAX_ATTEMPTS):
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.set(building_key, 0, nx=True)
+            pipe.expire(building_key, _BUILDING_TTL_SECONDS)
+            pipe.get(building_key)
+            _, _, writes = await pipe.execute()
+
+        async with async_session_maker() as db:
+            scores = await load_scores(db, board, scope)
+
+        staging_key = f"{keys[0]}:staging:{uuid.uuid4().hex[:12]}"
+        if scores:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.zadd(staging_key, {str(user_id): score for user_id, score in scores.items()})
+                pipe.expire(staging_key, _BUILDING_TTL_SECONDS)
+                await pipe.execute()
+        if await swap(keys=keys + [staging_key], args=[writes, ttl]):
+            return len(scores)
+
+    raise LeaderboardUnavailable(f"排行榜重建期间持续有写入: board={board}, scope={scope}")
+
+
+async def invalidate(board: str, *scopes) -> None:
+    """丢弃榜单缓存，下次读取时重建"""
+    if not scopes:
+        return
+    try:
+        await get_redis()
+        script = get_script("leaderboard_invalidate", _INVALIDATE_SCRIPT)
+        for scope in scopes:
+            await script(keys=_board_keys(board, scope))
+    except Exception as exc:
+        logger.warning("排行榜缓存失效失败: board=%s, scopes=%s, error=%s", board, scopes, exc)
+
+
+async def _ensure(board: str, scope) -> None:
+    client = await get_redis()
+    if not await client.exists(_ready_key(board, scope)):
+        await rebuild(board, scope)
+
+
+# ========== 读取 ==========
+
+async def get_top(
+    db: AsyncSession,
+    board: str,
+    scope=GLOBAL_SCOPE,
+    limit: int = 50,
+) -> list[tuple[int, int, int]]:
+    """前 N 名，返回 [(名次, 用户ID, 分值)]"""
+    try:
+        await _ensure(board, scope)
+        client = await get_redis()
+        members = await client.zrevrange(_board_key(board, scope), 0, limit - 1, withscores=True)
+    except Exception as exc:
+        raise LeaderboardUnavailable(str(exc)) from exc
+    return [(index + 1, int(member), int(score)) for index, (member, score) in enumerate(members)]
+
+
+async def get_rank(
+    db: AsyncSession,
+    board: str,
+    user_id: int,
+    scope=GLOBAL_SCOPE,
+) -> Optional[tuple[int, int]]:
+    """用户名次，返回 (名次, 分值)，未上榜返回 None"""
+    try:
+        await _ensure(board, scope)
+        client = await get_redis()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(_board_key(board, scope), str(user_id))
+            pipe.zscore(_board_key(board, scope), str(user_id))
+            rank, score = await pipe.execute()
+    except Exception as exc:
+        raise LeaderboardUnavailable(str(exc)) from exc
+    if rank is None or score is None:
+        return None
+    return int(rank) + 1, int(score)
+
+
+async def get_window(
+    db: AsyncSession,
+    board: str,
+    user_id: int,
+    radius: int,
+    scope=GLOBAL_SCOPE,
+) -> list[tuple[int, int, int]]:
+    """用户前后各 radius 名，返回 [(名次, 用户ID, 分值)]"""
+    try:
+        await _ensure(board, scope)
+        client = await get_redis()
+        key = _board_key(board, scope)
+        rank = await client.zrevrank(key, str(user_id))
+        if rank is None:
+            return []
+        start = max(0, int(rank) - radius)
+        members = await client.zrevrange(key, start, int(rank) + radius, withscores=True)
+    except Exception as exc:
+        raise LeaderboardUnavailable(str(exc)) from exc
+    return [(start + index + 1, int(member), int(score)) for index, (member, score) in enumerate(members)]
+
+
+def rank_in_memory(
+    scores: dict[int, int],
+    limit: int,
+    user_id: Optional[int] = None,
+    radius: int = 0,
+) -> tuple[list[tuple[int, int, int]], Optional[tuple[int, int]], list[tuple[int, int, int]]]:
+    """
+    数据库回退：按与有序集合相同的顺序排名
+
+    返回 (前 N 名, 用户名次, 用户前后窗口)。
+    """
+    ordered = sorted(scores.items(), key=lambda item: (item[1], str(item[0])), reverse=True)
+    ranked = [(index + 1, member, score) for index, (member, score) in enumerate(ordered)]
+    my_rank = None
+    window: list[tuple[int, int, int]] = []
+    if user_id is not None:
+        position = next((index for index, entry in enumerate(ranked) if entry[1] == user_id), None)
+        if position is not None:
+            my_rank = (position + 1, ranked[position][2])
+            if radius:
+                window = ranked[max(0, position - radius):position + radius + 1]
+    return ranked[:limit], my_rank, window
+
+
+# ========== 写入路径（提交后调用） ==========
+
+async def _run_if_ready(name: str, source: str, board: str, scope, args: list) -> None:
+    try:
+        script = get_script(name, source)
+        await script(keys=_board_keys(board, scope), args=args)
+    except Exception as exc:
+        logger.warning("排行榜增量更新失败: board=%s, scope=%s, error=%s", board, scope, exc)
+
+
+async def record_cheer(contest_id: int, user_id: int, points: int) -> None:
+    """打气后增加用户热力值"""
+    await _run_if_ready("leaderboard_incr", _INCR_IF_READY_SCRIPT, HEAT, contest_id, [str(user_id), points])
+
+
+async def record_rare_draw(user_id: int, drawn_at: Optional[datetime]) -> None:
+    """抽中稀有奖品后更新欧皇榜"""
+    await _run_if_ready(
+        "leaderboard_bump",
+        _BUMP_IF_READY_SCRIPT,
+        LUCKY,
+        GLOBAL_SCOPE,
+        [str(user_id), _SCORE_UNIT, _epoch(drawn_at or datetime.utcnow())],
+    )
+
+
+async def record_puzzle_progress(user_id: int, total_solved: int, total_time: int) -> None:
+    """同步码神挑战进度后更新排名"""
+    await _run_if_ready(
+        "leaderboard_set",
+        _SET_IF_READY_SCRIPT,
+        PUZZLE,
+        GLOBAL_SCOPE,
+        [str(user_id), puzzle_score(total_solved, total_time)],
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_heat_changes(session: Session, flush_context) -> None:
+    """报名状态变化会改变热力榜统计范围，记录受影响的比赛"""
+    contest_ids = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Registration):
+            continue
+        if obj in session.dirty and not inspect(obj).attrs.status.history.has_changes():
+            continue
+        contest_ids.add(obj.contest_id)
+    contest_ids.discard(None)
+    if contest_ids:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(contest_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_heat(session: Session) -> None:
+    contest_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not contest_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(invalidate(HEAT, *contest_ids))
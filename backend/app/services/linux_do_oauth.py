@@ -3,9 +3,8 @@ Linux.do OAuth2 服务
 """
 from typing import Any, Dict, Optional
 
-import httpx
-
 from app.core.config import settings
+from app.core.http_client import LINUX_DO, get_http_client
 
 
 class LinuxDoOAuthError(RuntimeError):
@@ -65,13 +64,13 @@ async def exchange_code_for_token(code: str) -> str:
         "redirect_uri": settings.LINUX_DO_REDIRECT_URI,
     }
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(
-            settings.LINUX_DO_TOKEN_URL,
-            data=payload,
-            headers={"Accept": "application/json"},
-            auth=(settings.LINUX_DO_CLIENT_ID, settings.LINUX_DO_CLIENT_SECRET),
-        )
+    client = get_http_client(LINUX_DO)
+    resp = await client.post(
+        settings.LINUX_DO_TOKEN_URL,
+        data=payload,
+        headers={"Accept": "application/json"},
+        auth=(settings.LINUX_DO_CLIENT_ID, settings.LINUX_DO_CLIENT_SECRET),
+    )
 
     if resp.status_code >= 400:
         raise LinuxDoOAuthError(
@@ -99,14 +98,14 @@ async def fetch_linuxdo_userinfo(access_token: str) -> Dict[str, Any]:
     Raises:
         LinuxDoOAuthError: 获取失败时抛出
     """
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.get(
-            settings.LINUX_DO_USERINFO_URL,
-            headers={
-                "Accept": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            },
-        )
+    client = get_http_client(LINUX_DO)
+    resp = await client.get(
+        settings.LINUX_DO_USERINFO_URL,
+        headers={
+            "Accept": "application/json",
+            "Authorization": f"Bearer {access_token}",
+        },
+    )
 
     if resp.status_code >= 400:
         raise LinuxDoOAuthError(
@@ -1,10 +1,11 @@
 """
 抽奖系统服务
 """
-import random
+import logging
 import uuid
-from datetime import datetime, date
-from typing import Optional, List, Dict, Any
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
 
 from sqlalchemy import select, func, and_, update
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,83 +15,133 @@ from app.models.points import (
     LotteryConfig, LotteryPrize, LotteryDraw, ApiKeyCode, UserItem,
     PointsReason, PrizeType, ApiKeyStatus, ScratchCard, ScratchCardStatus
 )
+from app.services import daily_play_limit, leaderboard_service
+from app.services.game_config_cache import LOTTERY, get_game_config, invalidate_game_config
 from app.services.points_service import PointsService
+from app.services.prize_sampler import WeightedSampler
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_CONFIG_KEYWORD = "刮刮乐"
+
+
+@dataclass(frozen=True)
+class CachedLotteryPrize:
+    """奖品快照（只读）"""
+    id: int
+    prize_type: PrizeType
+    prize_name: str
+    prize_value: Optional[str]
+    weight: int
+    stock: Optional[int]
+    is_rare: bool
+    is_enabled: bool
+
+    @classmethod
+    def from_prize(cls, prize: LotteryPrize) -> "CachedLotteryPrize":
+        return cls(
+            id=prize.id,
+            prize_type=prize.prize_type,
+            prize_name=prize.prize_name,
+            prize_value=prize.prize_value,
+            weight=prize.weight,
+            stock=prize.stock,
+            is_rare=prize.is_rare,
+            is_enabled=getattr(prize, "is_enabled", True),
+        )
+
+
+@dataclass(frozen=True)
+class CachedLotteryConfig:
+    """抽奖/刮刮乐配置快照，附带预编译的奖池别名表"""
+    id: int
+    name: str
+    cost_points: int
+    daily_limit: Optional[int]
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+    prizes: Tuple[CachedLotteryPrize, ...]
+    sampler: Optional[WeightedSampler]
+    # 所有奖品都没库存时返回的「谢谢参与」
+    fallback_prize: Optional[CachedLotteryPrize]
+
+    @classmethod
+    def from_config(cls, config: LotteryConfig) -> "CachedLotteryConfig":
+        prizes = tuple(CachedLotteryPrize.from_prize(p) for p in sorted(config.prizes, key=lambda p: p.id))
+        # 过滤掉禁用的和库存为0的奖品
+        available = [p for p in prizes if p.is_enabled and (p.stock is None or p.stock > 0)]
+        fallback = next((p for p in prizes if p.prize_type == PrizeType.EMPTY and p.is_enabled), None)
+        return cls(
+            id=config.id,
+            name=config.name,
+            cost_points=config.cost_points,
+            daily_limit=config.daily_limit,
+            starts_at=config.starts_at,
+            ends_at=config.ends_at,
+            prizes=prizes,
+            sampler=WeightedSampler.build(available, lambda p: p.weight),
+            fallback_prize=fallback if not available else None,
+        )
+
+    def is_open(self, now: datetime) -> bool:
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or self.ends_at >= now)
+
+    def select_prize(self) -> CachedLotteryPrize:
+        """根据权重随机选择奖品（O(1)）"""
+        if self.sampler is not None:
+            return self.sampler.pick()
+        if self.fallback_prize is not None:
+            return self.fallback_prize
+        raise ValueError("没有可用的奖品")
+
+
+async def _load_lottery_configs(db: AsyncSession) -> Tuple[CachedLotteryConfig, ...]:
+    """加载全部启用的抽奖配置（时间窗口在读取时判断）"""
+    result = await db.execute(
+        select(LotteryConfig)
+        .where(LotteryConfig.is_active == True)
+        .order_by(LotteryConfig.id.asc())
+    )
+    return tuple(CachedLotteryConfig.from_config(config) for config in result.scalars().all())
 
 
 class LotteryService:
     """抽奖服务"""
 
-    @staticmethod
-    async def get_active_config(db: AsyncSession) -> Optional[LotteryConfig]:
-        """获取当前激活的抽奖配置"""
-        now = datetime.now()
-        result = await db.execute(
-            select(LotteryConfig)
-            .where(
-                and_(
-                    LotteryConfig.is_active == True,
-                    (LotteryConfig.starts_at.is_(None) | (LotteryConfig.starts_at <= now)),
-                    (LotteryConfig.ends_at.is_(None) | (LotteryConfig.ends_at >= now))
-                )
-            )
-            .limit(1)
-        )
-        return result.scalar_one_or_none()
-
     @staticmethod
     async def get_today_draw_count(db: AsyncSession, user_id: int, config_id: int) -> int:
         """获取用户今日抽奖次数"""
-        today = date.today()
-        result = await db.execute(
-            select(func.count(LotteryDraw.id))
-            .where(
-                and_(
-                    LotteryDraw.user_id == user_id,
-                    LotteryDraw.config_id == config_id,
-                    func.date(LotteryDraw.created_at) == today
-                )
-            )
-        )
-        return result.scalar() or 0
-
-    @staticmethod
-    async def get_prizes(db: AsyncSession, config_id: int) -> List[LotteryPrize]:
-        """获取奖池配置"""
-        result = await db.execute(
-            select(LotteryPrize)
-            .where(LotteryPrize.config_id == config_id)
-        )
-        return result.scalars().all()
+        return await daily_play_limit.get_play_count(db, daily_play_limit.LOTTERY, user_id, config_id)
 
     @staticmethod
-    async def _select_prize(prizes: List[LotteryPrize]) -> LotteryPrize:
-        """根据权重随机选择奖品"""
-        # 过滤掉禁用的和库存为0的奖品
-        available_prizes = [
-            p for p in prizes
-            if getattr(p, 'is_enabled', True) and (p.stock is None or p.stock > 0)
-        ]
-
-        if not available_prizes:
-            # 所有奖品都没库存了，返回谢谢参与
-            empty_prizes = [p for p in prizes if p.prize_type == PrizeType.EMPTY and getattr(p, 'is_enabled', True)]
-            if empty_prizes:
-                return empty_prizes[0]
-            raise ValueError("没有可用的奖品")
-
-        # 计算总权重
-        total_weight = sum(p.weight for p in available_prizes)
+    async def get_cached_config(db: AsyncSession, scratch: bool = False) -> Optional[CachedLotteryConfig]:
+        """
+        获取当前进行中的抽奖（scratch=True 时为刮刮乐）配置快照
 
-        # 随机选择
-        rand = random.randint(1, total_weight)
-        current = 0
-        for prize in available_prizes:
-            current += prize.weight
-            if rand <= current:
-                return prize
+        读取进程内缓存，奖池已预编译为别名表；管理员修改配置或有限库存奖品被抽中后失效。
+        """
+        now = datetime.now()
+        configs = await get_game_config(db, LOTTERY, _load_lottery_configs)
+        for config in configs:
+            if scratch and SCRATCH_CONFIG_KEYWORD not in config.name:
+                continue
+            if config.is_open(now):
+                return config
+        return None
 
-        # 兜底返回最后一个
-        return available_prizes[-1]
+    @staticmethod
+    async def _deduct_prize_stock(db: AsyncSession, prize: CachedLotteryPrize) -> None:
+        """扣减奖品库存（使用原子 UPDATE 防止并发超卖），失败时回滚并失效配置缓存"""
+        from sqlalchemy import text
+        deduct_result = await db.execute(
+            text("UPDATE lottery_prizes SET stock = stock - 1 WHERE id = :prize_id AND stock > 0"),
+            {"prize_id": prize.id}
+        )
+        if deduct_result.rowcount == 0:
+            # 库存扣减失败（已被其他请求抢完），缓存中的库存已过期
+            await db.rollback()
+            await invalidate_game_config(LOTTERY)
+            raise ValueError("奖品库存不足，请重试")
 
     @staticmethod
     async def _assign_api_key(
@@ -190,10 +241,11 @@ class LotteryService:
             }
 
         # 获取抽奖配置
-        config = await LotteryService.get_active_config(db)
+        config = await LotteryService.get_cached_config(db)
         if not config:
             raise ValueError("当前没有进行中的抽奖活动")
 
+        play = None
         try:
             # 检查是否使用抽奖券（券不受日限约束）
             used_ticket = False
@@ -203,16 +255,17 @@ class LotteryService:
                 # 尝试使用抽奖券
                 used_ticket = await ExchangeService.use_ticket(db, user_id, "LOTTERY_TICKET")
 
+            # 占用当日次数（使用券和管理员不受日限约束，但同样计数）
+            daily_limit = None if used_ticket or is_admin else config.daily_limit
+            play = await daily_play_limit.consume_play(db, daily_play_limit.LOTTERY, user_id, config.id, daily_limit)
+            if play is None:
+                raise ValueError(f"今日抽奖次数已达上限（{config.daily_limit}次）")
+
             if used_ticket:
-                # 使用了抽奖券：不受日限约束，不扣积分
+                # 使用了抽奖券：不扣积分
                 actual_cost = 0
             else:
-                # 没有券或不使用券：检查日限（管理员不受限制），扣除积分
-                if config.daily_limit and not is_admin:
-                    today_count = await LotteryService.get_today_draw_count(db, user_id, config.id)
-                    if today_count >= config.daily_limit:
-                        raise ValueError(f"今日抽奖次数已达上限（{config.daily_limit}次）")
-
+                # 没有券或不使用券：扣除积分
                 await PointsService.deduct_points(
                     db=db,
                     user_id=user_id,
@@ -222,9 +275,8 @@ class LotteryService:
                     auto_commit=False
                 )
 
-            # 获取奖池并抽奖
-            prizes = await LotteryService.get_prizes(db, config.id)
-            prize = await LotteryService._select_prize(prizes)
+            # 抽奖
+            prize = config.select_prize()
 
             # 处理奖品发放
             prize_name = prize.prize_name
@@ -270,17 +322,9 @@ class LotteryService:
                     )
                 extra_message = f"获得{points_amount}积分"
 
-            # 扣减奖品库存（使用原子 UPDATE 防止并发超卖）
+            # 扣减奖品库存
             if prize.stock is not None:
-                from sqlalchemy import text
-                deduct_result = await db.execute(
-                    text("UPDATE lottery_prizes SET stock = stock - 1 WHERE id = :prize_id AND stock > 0"),
-                    {"prize_id": prize.id}
-                )
-                if deduct_result.rowcount == 0:
-                    # 库存扣减失败（已被其他请求抢完）
-                    await db.rollback()
-                    raise ValueError("奖品库存不足，请重试")
+                await LotteryService._deduct_prize_stock(db, prize)
 
             # 创建抽奖记录（使用可能被修改的奖品信息）
             draw = LotteryDraw(
@@ -296,6 +340,7 @@ class LotteryService:
             )
             db.add(draw)
             await db.flush()
+            drawn_at = draw.created_at
 
             # 记录任务进度（抽奖任务）
             from app.services.task_service import TaskService
@@ -316,6 +361,8 @@ class LotteryService:
 
         except IntegrityError:
             await db.rollback()
+            if play is not None:
+                await play.release()
             # 可能是 request_id 重复，重新查询
             result = await db.execute(
                 select(LotteryDraw)
@@ -335,8 +382,17 @@ class LotteryService:
 
         except Exception:
             await db.rollback()
+            if play is not None:
+                await play.release()
             raise
 
+        if prize.stock is not None:
+            # 库存已变化，刷新各进程的可抽奖池
+            await invalidate_game_config(LOTTERY)
+
+        if is_rare:
+            await leaderboard_service.record_rare_draw(user_id, drawn_at)
+
         # 获取更新后的余额
         balance = await PointsService.get_balance(db, user_id)
 
@@ -358,12 +414,11 @@ class LotteryService:
     @staticmethod
     async def get_lottery_info(db: AsyncSession, user_id: int = None) -> Dict[str, Any]:
         """获取抽奖活动信息"""
-        config = await LotteryService.get_active_config(db)
+        config = await LotteryService.get_cached_config(db)
         if not config:
             return {"active": False, "message": "当前没有进行中的抽奖活动"}
 
         # 获取奖池（不显示权重）
-        prizes = await LotteryService.get_prizes(db, config.id)
         prize_list = [
             {
                 "id": p.id,
@@ -372,7 +427,7 @@ class LotteryService:
                 "is_rare": p.is_rare,
                 "has_stock": p.stock is None or p.stock > 0
             }
-            for p in prizes
+            for p in config.prizes
         ]
 
         result = {
@@ -506,39 +561,57 @@ class LotteryService:
         ]
 
     @staticmethod
-    async def get_lucky_leaderboard(db: AsyncSession, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取欧皇榜 - 按稀有奖品中奖次数排行"""
-        from app.models.user import User
-        from sqlalchemy import desc
+    async def get_lucky_leaderboard(
+        db: AsyncSession,
+        limit: int = 50,
+        user_id: Optional[int] = None,
+        around: int = 0,
+    ) -> Dict[str, Any]:
+        """获取欧皇榜 - 按稀有奖品中奖次数排行（Redis 有序集合，不可用时回退数据库）"""
+        board = leaderboard_service.LUCKY
+        my_rank = None
+        window = []
+        try:
+            top = await leaderboard_service.get_top(db, board, limit=limit)
+            if user_id is not None:
+                my_rank = await leaderboard_service.get_rank(db, board, user_id)
+                if my_rank and around:
+                    window = await leaderboard_service.get_window(db, board, user_id, around)
+        except leaderboard_service.LeaderboardUnavailable as exc:
+            logger.warning("欧皇榜缓存不可用，回退数据库: %s", exc)
+            scores = await leaderboard_service.load_scores(db, board)
+            top, my_rank, window = leaderboard_service.rank_in_memory(scores, limit, user_id, around)
+
+        entries = await LotteryService._build_lucky_entries(db, top + window)
+        return {
+            "items": [entries[user_id] for _, user_id, _ in top if user_id in entries],
+            "my_rank": my_rank[0] if my_rank else None,
+            "neighbors": [entries[user_id] for _, user_id, _ in window if user_id in entries],
+        }
 
-        # 统计每个用户获得稀有奖品的次数
-        result = await db.execute(
-            select(
-                LotteryDraw.user_id,
-                func.count(LotteryDraw.id).label("win_count"),
-                func.max(LotteryDraw.created_at).label("last_win_at")
-            )
-            .where(LotteryDraw.is_rare == True)
-            .group_by(LotteryDraw.user_id)
-            .order_by(desc("win_count"), desc("last_win_at"))
-            .limit(limit)
-        )
-        rankings = result.fetchall()
+    @staticmethod
+    async def _build_lucky_entries(
+        db: AsyncSession,
+        ranked: List[tuple],
+    ) -> Dict[int, Dict[str, Any]]:
+        """补全欧皇榜条目的用户信息与中奖明细（只查询本页用户）"""
+        from app.models.user import User
 
-        if not rankings:
-            return []
+        user_ids = list({user_id for _, user_id, _ in ranked})
+        if not user_ids:
+            return {}
 
-        # 获取用户详情
-        user_ids = [r[0] for r in rankings]
         user_result = await db.execute(
             select(User).where(User.id.in_(user_ids))
         )
         user_map = {u.id: u for u in user_result.scalars().all()}
 
-        # 获取每个用户最近中的奖品名称
+        # 获取每个用户中奖次数、最近中奖时间与奖品名称
         prize_result = await db.execute(
             select(
                 LotteryDraw.user_id,
+                func.count(LotteryDraw.id).label("win_count"),
+                func.max(LotteryDraw.created_at).label("last_win_at"),
                 func.group_concat(
                     func.distinct(LotteryDraw.prize_name)
                 ).label("prizes")
@@ -549,65 +622,39 @@ class LotteryService:
             )
             .group_by(LotteryDraw.user_id)
         )
-        prize_map = {r[0]: r[1] for r in prize_result.fetchall()}
+        prize_map = {r.user_id: r for r in prize_result.fetchall()}
 
-        leaderboard = []
-        for rank, (user_id, win_count, last_win_at) in enumerate(rankings, 1):
+        entries = {}
+        for rank, user_id, score in ranked:
             user = user_map.get(user_id)
-            if user:
-                leaderboard.append({
-                    "rank": rank,
-                    "user_id": user_id,
-                    "username": user.username,
-                    "display_name": user.display_name,
-                    "avatar_url": user.avatar_url,
-                    "win_count": win_count,
-                    "last_win_at": last_win_at.isoformat() if last_win_at else None,
-                    "prizes_won": prize_map.get(user_id, "").split(",") if prize_map.get(user_id) else []
-                })
-
-        return leaderboard
+            if not user:
+                continue
+            row = prize_map.get(user_id)
+            win_count = row.win_count if row else leaderboard_service.split_encoded_score(score)[0]
+            last_win_at = row.last_win_at if row else None
+            entries[user_id] = {
+                "rank": rank,
+                "user_id": user_id,
+                "username": user.username,
+                "display_name": user.display_name,
+                "avatar_url": user.avatar_url,
+                "win_count": win_count,
+                "last_win_at": last_win_at.isoformat() if last_win_at else None,
+                "prizes_won": row.prizes.split(",") if row and row.prizes else []
+            }
+        return entries
 
     # ========== 刮刮乐相关方法 ==========
 
-    @staticmethod
-    async def get_scratch_config(db: AsyncSession) -> Optional[LotteryConfig]:
-        """获取刮刮乐配置（复用抽奖配置，名称包含'刮刮乐'的配置）"""
-        now = datetime.now()
-        result = await db.execute(
-            select(LotteryConfig)
-            .where(
-                and_(
-                    LotteryConfig.is_active == True,
-                    LotteryConfig.name.like("%刮刮乐%"),
-                    (LotteryConfig.starts_at.is_(None) | (LotteryConfig.starts_at <= now)),
-                    (LotteryConfig.ends_at.is_(None) | (LotteryConfig.ends_at >= now))
-                )
-            )
-            .limit(1)
-        )
-        return result.scalar_one_or_none()
-
     @staticmethod
     async def get_today_scratch_count(db: AsyncSession, user_id: int, config_id: int) -> int:
         """获取用户今日刮刮乐购买次数"""
-        today = date.today()
-        result = await db.execute(
-            select(func.count(ScratchCard.id))
-            .where(
-                and_(
-                    ScratchCard.user_id == user_id,
-                    ScratchCard.config_id == config_id,
-                    func.date(ScratchCard.created_at) == today
-                )
-            )
-        )
-        return result.scalar() or 0
+        return await daily_play_limit.get_play_count(db, daily_play_limit.SCRATCH, user_id, config_id)
 
     @staticmethod
     async def get_scratch_info(db: AsyncSession, user_id: int = None) -> Dict[str, Any]:
         """获取刮刮乐信息"""
-        config = await LotteryService.get_scratch_config(db)
+        config = await LotteryService.get_cached_config(db, scratch=True)
         if not config:
             return {
                 "active": False,
@@ -662,10 +709,11 @@ class LotteryService:
         """
         from app.services.exchange_service import ExchangeService
 
-        config = await LotteryService.get_scratch_config(db)
+        config = await LotteryService.get_cached_config(db, scratch=True)
         if not config:
             raise ValueError("当前没有进行中的刮刮乐活动")
 
+        play = None
         try:
             # 检查是否使用刮刮乐券（券不受日限约束）
             used_ticket = False
@@ -674,16 +722,17 @@ class LotteryService:
             if use_ticket:
                 used_ticket = await ExchangeService.use_ticket(db, user_id, "SCRATCH_TICKET")
 
+            # 占用当日次数（使用券和管理员不受日限约束，但同样计数）
+            daily_limit = None if used_ticket or is_admin else config.daily_limit
+            play = await daily_play_limit.consume_play(db, daily_play_limit.SCRATCH, user_id, config.id, daily_limit)
+            if play is None:
+                raise ValueError(f"今日刮刮乐次数已达上限（{config.daily_limit}次）")
+
             if used_ticket:
-                # 使用了刮刮乐券：不受日限约束，不扣积分
+                # 使用了刮刮乐券：不扣积分
                 actual_cost = 0
             else:
-                # 没有券或不使用券：检查日限（管理员不受限制），扣除积分
-                if config.daily_limit and not is_admin:
-                    today_count = await LotteryService.get_today_scratch_count(db, user_id, config.id)
-                    if today_count >= config.daily_limit:
-                        raise ValueError(f"今日刮刮乐次数已达上限（{config.daily_limit}次）")
-
+                # 没有券或不使用券：扣除积分
                 await PointsService.deduct_points(
                     db=db,
                     user_id=user_id,
@@ -693,9 +742,8 @@ class LotteryService:
                     auto_commit=False
                 )
 
-            # 获取奖池并预选奖品
-            prizes = await LotteryService.get_prizes(db, config.id)
-            prize = await LotteryService._select_prize(prizes)
+            # 预选奖品
+            prize = config.select_prize()
 
             # 创建刮刮乐卡片记录
             card = ScratchCard(
@@ -712,19 +760,16 @@ class LotteryService:
             db.add(card)
             await db.flush()  # 获取 card.id
 
-            # 扣减奖品库存（使用原子 UPDATE 防止并发超卖）
+            # 扣减奖品库存
             if prize.stock is not None:
-                from sqlalchemy import text
-                deduct_result = await db.execute(
-                    text("UPDATE lottery_prizes SET stock = stock - 1 WHERE id = :prize_id AND stock > 0"),
-                    {"prize_id": prize.id}
-                )
-                if deduct_result.rowcount == 0:
-                    # 库存扣减失败（已被其他请求抢完）
-                    await db.rollback()
-                    raise ValueError("奖品库存不足，请重试")
+                await LotteryService._deduct_prize_stock(db, prize)
 
             await db.commit()
+            # 已提交，之后的异常不再归还次数
+            play = None
+            if prize.stock is not None:
+                # 库存已变化，刷新各进程的可抽奖池
+                await invalidate_game_config(LOTTERY)
 
             # 获取更新后的余额
             balance = await PointsService.get_balance(db, user_id)
@@ -739,6 +784,8 @@ class LotteryService:
 
         except Exception:
             await db.rollback()
+            if play is not None:
+                await play.release()
             raise
 
     @staticmethod
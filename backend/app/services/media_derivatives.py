@@ -0,0 +1,219 @@
+"""
+媒体图片衍生版本（缩放 WebP）
+
+上传后在进程池中为图片生成多个宽度的 WebP 版本（按 EXIF 方向校正后重新编码，不保留元数据），
+媒体接口通过 ?w= 选择不小于请求宽度的最小档位；档位文件不存在时按需生成并落盘缓存。
+不放大：请求档位大于原图宽度对应的最大档位时返回该最大档位（按原尺寸重新编码的版本）。
+
+存储位置：{MEDIA_ROOT}/_variants/{category}/{文件名去扩展名}/w{宽度}.webp
+动图（多帧 GIF/WebP）与无法解码的文件不生成衍生版本，直接返回原图。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIRNAME = "_variants"
+VARIANT_EXTENSION = ".webp"
+
+_executor: Optional[ProcessPoolExecutor] = None
+# 进行中的生成任务（按原图路径合并）
+_inflight: dict[str, asyncio.Future] = {}
+# 后台任务引用（防止被垃圾回收）
+_background: set[asyncio.Task] = set()
+# 不生成衍生版本的原图（动图/无法解码），避免重复尝试
+_unsupported: dict[str, None] = {}
+_UNSUPPORTED_MAX_ENTRIES = 10000
+# 原图的最大档位（第一个不小于原图宽度的档位，更大的档位不会生成）
+_covering_widths: dict[str, int] = {}
+_COVERING_MAX_ENTRIES = 10000
+
+
+def derivative_widths() -> list[int]:
+    return sorted({int(width) for width in settings.MEDIA_DERIVATIVE_WIDTHS if int(width) > 0})
+
+
+def pick_width(requested: int) -> Optional[int]:
+    """选择不小于请求宽度的最小档位（超过最大档位时取最大档位）"""
+    widths = derivative_widths()
+    if not widths or requested <= 0:
+        return None
+    for width in widths:
+        if width >= requested:
+            return width
+    return widths[-1]
+
+
+def variant_dir(original: Path) -> Path:
+    """原图对应的衍生版本目录"""
+    root = Path(settings.MEDIA_ROOT).resolve()
+    relative = original.resolve().relative_to(root)
+    return root / VARIANTS_DIRNAME / relative.parent / relative.stem
+
+
+def variant_path(original: Path, width: int) -> Path:
+    return variant_dir(original) / f"w{width}{VARIANT_EXTENSION}"
+
+
+def render_variants(source: str, dest_dir: str, widths: list[int], quality: int) -> list[int]:
+    """
+    生成衍生版本（在子进程中执行）
+
+    Returns:
+        已存在或本次生成的宽度列表；动图/无法解码（含截断、解压炸弹）/写入失败时返回空列表
+    """
+    from PIL import Image, ImageOps
+
+    tmp_path = None
+    try:
+        with Image.open(source) as image:
+            if getattr(image, "n_frames", 1) > 1:
+                return []
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+            os.makedirs(dest_dir, exist_ok=True)
+            done = []
+            for width in sorted(widths):
+                target = os.path.join(dest_dir, f"w{width}{VARIANT_EXTENSION}")
+                if not os.path.exists(target):
+                    if image.width > width:
+                        height = max(1, round(image.height * width / image.width))
+                        resized = image.resize((width, height), Image.LANCZOS)
+                    else:
+                        resized = image
+                    tmp_path = f"{target}.{os.getpid()}.tmp"
+                    resized.save(tmp_path, "WEBP", quality=quality, method=4)
+                    os.replace(tmp_path, target)
+                    tmp_path = None
+                done.append(width)
+                # 不放大：第一个不小于原图宽度的档位按原尺寸重新编码，更大的档位不再生成（请求时使用原图）
+                if image.width <= width:
+                    break
+            return done
+    except Exception:
+        # 解码错误可能在 exif_transpose/convert/resize/save 时才出现（截断文件等），统一视为不支持
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return []
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, settings.MEDIA_DERIVATIVE_WORKERS))
+    return _executor
+
+
+def shutdown_derivative_pool() -> None:
+    """关闭进程池（退出时调用）"""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def generate_variants(original: Path, widths: Optional[list[int]] = None) -> list[int]:
+    """在进程池中生成衍生版本（同一原图的并发请求共享一次生成）"""
+    key = str(original)
+    if key in _unsupported:
+        return []
+    future = _inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _get_executor(),
+            render_variants,
+            key,
+            str(variant_dir(original)),
+            widths or derivative_widths(),
+            settings.MEDIA_DERIVATIVE_QUALITY,
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    done = await asyncio.shield(future)
+    if not done:
+        _unsupported[key] = None
+        if len(_unsupported) > _UNSUPPORTED_MAX_ENTRIES:
+            _unsupported.pop(next(iter(_unsupported)))
+    elif max(done) < max(widths or derivative_widths()):
+        _covering_widths[key] = max(done)
+        if len(_covering_widths) > _COVERING_MAX_ENTRIES:
+            _covering_widths.pop(next(iter(_covering_widths)))
+    return done
+
+
+def schedule_variants(original: Path) -> None:
+    """上传完成后在后台生成全部档位（失败只记录日志）"""
+    if not settings.MEDIA_DERIVATIVE_ENABLED or not derivative_widths():
+        return
+
+    async def run() -> None:
+        try:
+            await generate_variants(original)
+        except Exception as exc:
+            logger.warning("生成图片衍生版本失败: path=%s, error=%s", original, exc)
+
+    task = asyncio.create_task(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def resolve_variant(original: Path, requested_width: int) -> Optional[Path]:
+    """
+    获取 ?w= 对应的衍生版本路径
+
+    已生成时直接返回；未生成时按需生成全部档位后返回；请求档位大于原图的最大档位时返回最大档位；
+    不支持时返回 None（使用原图）。
+    """
+    if not settings.MEDIA_DERIVATIVE_ENABLED:
+        return None
+    width = pick_width(requested_width)
+    if width is None:
+        return None
+    covering = _covering_widths.get(str(original))
+    if covering is not None and width > covering:
+        width = covering
+    path = variant_path(original, width)
+    if path.is_file():
+        return path
+    try:
+        done = await generate_variants(original)
+    except Exception as exc:
+        logger.warning("生成图片衍生版本失败: path=%s, error=%s", original, exc)
+        return None
+    if not done:
+        return None
+    # done 为从最小档位到最大档位的连续档位，未包含的请求档位只能大于最大档位
+    return variant_path(original, width if width in done else max(done))
+
+
+def delete_variants(original: Path) -> None:
+    """删除原图的全部衍生版本"""
+    _covering_widths.pop(str(original), None)
+    _unsupported.pop(str(original), None)
+    directory = variant_dir(original)
+    if not directory.is_dir():
+        return
+    for child in directory.iterdir():
+        try:
+            child.unlink()
+        except OSError:
+            pass
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
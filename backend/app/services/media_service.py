@@ -15,6 +15,8 @@ import httpx
 from fastapi import HTTPException, UploadFile, status
 
 from app.core.config import settings
+from app.core.http_client import MEDIA, get_http_client
+from app.services.media_derivatives import delete_variants, schedule_variants
 from app.services.upload_quota import commit_upload_quota
 
 
@@ -150,6 +152,7 @@ async def save_upload_file(
                 pass
             raise
 
+    schedule_variants(dest_path)
     return MediaFile(
         url=_build_public_url(category, filename),
         size_bytes=total_bytes,
@@ -164,15 +167,14 @@ async def download_image_to_media(
 ) -> Optional[MediaFile]:
     if not url:
         return None
-    timeout = httpx.Timeout(10.0, read=10.0)
-    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-        try:
-            resp = await client.get(url)
-        except httpx.HTTPError as exc:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"头像下载失败: {exc}",
-            ) from exc
+    client = get_http_client(MEDIA)
+    try:
+        resp = await client.get(url)
+    except httpx.HTTPError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"头像下载失败: {exc}",
+        ) from exc
 
     if resp.status_code >= 400:
         raise HTTPException(
@@ -198,6 +200,7 @@ async def download_image_to_media(
     async with aiofiles.open(dest_path, "wb") as out_file:
         await out_file.write(content)
 
+    schedule_variants(dest_path)
     return MediaFile(
         url=_build_public_url(category, filename),
         size_bytes=len(content),
@@ -225,3 +228,4 @@ def delete_media_file(url: Optional[str]) -> None:
         path.unlink()
     except Exception:
         pass
+    delete_variants(path)
@@ -7,13 +7,15 @@ from datetime import datetime
 from decimal import Decimal
 from typing import Optional, List, Dict, Any
 
-from sqlalchemy import select, func, and_, update
+from sqlalchemy import select, func, and_, case, update
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.core.config import settings
 from app.models.points import (
     PredictionMarket, PredictionOption, PredictionBet,
-    MarketStatus, BetStatus, PointsReason
+    MarketStatus, BetStatus, PointsLedger, PointsReason, UserPoints
 )
 from app.services.points_service import PointsService
 
@@ -102,13 +104,19 @@ class PredictionService:
     async def settle_market(
         db: AsyncSession,
         market_id: int,
-        winner_option_ids: List[int]
+        winner_option_ids: List[int],
+        chunk_size: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
         结算竞猜
         winner_option_ids: 赢家选项ID列表（支持多选赢家）
         使用行锁和原子状态更新防止并发结算
+
+        按参与用户分批集合式结算：每批一次性更新下注状态、批量写入账本、
+        一条 UPDATE … JOIN 入账并批量更新成就统计。超过一批时每批单独提交，
+        中途失败可通过 resume_settlement 继续。
         """
+        chunk_size = chunk_size or settings.PREDICTION_SETTLE_CHUNK_SIZE
         try:
             # 使用行锁获取市场，防止并发结算
             result = await db.execute(
@@ -144,120 +152,263 @@ class PredictionService:
                 option.is_winner = option.id in winner_option_ids
                 option.odds = None  # 结算后赔率无意义
 
-            # 计算奖池和分配
-            total_pool = market.total_pool
-            fee_rate = min(max(float(market.fee_rate), 0), 1)  # 限制在 [0, 1]
-            fee = int(total_pool * fee_rate)
-            payout_pool = total_pool - fee
+            return await PredictionService._settle_pending_bets(
+                db, market, list(winner_option_ids), chunk_size
+            )
+
+        except Exception:
+            await db.rollback()
+            raise
+
+    @staticmethod
+    async def resume_settlement(
+        db: AsyncSession,
+        market_id: int,
+        chunk_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """继续处理已结算竞猜中尚未处理的下注（分批结算中途失败时使用）"""
+        chunk_size = chunk_size or settings.PREDICTION_SETTLE_CHUNK_SIZE
+        try:
+            result = await db.execute(
+                select(PredictionMarket)
+                .options(selectinload(PredictionMarket.options))
+                .where(PredictionMarket.id == market_id)
+                .with_for_update()
+            )
+            market = result.scalar_one_or_none()
+            if not market:
+                raise ValueError("竞猜不存在")
+            if market.status != MarketStatus.SETTLED:
+                raise ValueError(f"只能继续结算已结算的竞猜，当前状态: {market.status}")
+
+            winner_option_ids = [option.id for option in market.options if option.is_winner]
+            return await PredictionService._settle_pending_bets(
+                db, market, winner_option_ids, chunk_size
+            )
+
+        except Exception:
+            await db.rollback()
+            raise
+
+    @staticmethod
+    async def _settle_pending_bets(
+        db: AsyncSession,
+        market: PredictionMarket,
+        winner_option_ids: List[int],
+        chunk_size: int,
+    ) -> Dict[str, Any]:
+        """按用户分批处理市场中状态仍为 PLACED 的下注，每批提交一次"""
+        # 计算奖池和分配
+        total_pool = market.total_pool
+        fee_rate = min(max(float(market.fee_rate), 0), 1)  # 限制在 [0, 1]
+        fee = int(total_pool * fee_rate)
+        payout_pool = total_pool - fee
 
-            # 获取赢家选项的总下注
+        # 获取赢家选项的总下注（含续结算时已处理的赢家下注）
+        winner_total_stake = 0
+        if winner_option_ids:
             result = await db.execute(
                 select(func.sum(PredictionBet.stake_points))
                 .where(
                     and_(
-                        PredictionBet.market_id == market_id,
+                        PredictionBet.market_id == market.id,
                         PredictionBet.option_id.in_(winner_option_ids),
-                        PredictionBet.status == BetStatus.PLACED
+                        PredictionBet.status.in_([BetStatus.PLACED, BetStatus.WON])
                     )
                 )
             )
-            winner_total_stake = result.scalar() or 0
-
-            # 统计信息
-            stats = {
-                "total_pool": total_pool,
-                "fee": fee,
-                "payout_pool": payout_pool,
-                "winner_total_stake": winner_total_stake,
-                "winner_count": 0,
-                "loser_count": 0,
-                "total_payout": 0
-            }
+            winner_total_stake = int(result.scalar() or 0)
+
+        # 统计信息
+        stats = {
+            "total_pool": total_pool,
+            "fee": fee,
+            "payout_pool": payout_pool,
+            "winner_total_stake": winner_total_stake,
+            "winner_count": 0,
+            "loser_count": 0,
+            "total_payout": 0
+        }
 
-            if winner_total_stake > 0:
-                # 获取所有赢家下注（带行锁防止重复处理）
-                # 按 user_id 排序，保证锁定顺序一致，避免死锁
-                result = await db.execute(
-                    select(PredictionBet)
-                    .where(
-                        and_(
-                            PredictionBet.market_id == market_id,
-                            PredictionBet.option_id.in_(winner_option_ids),
-                            PredictionBet.status == BetStatus.PLACED
-                        )
-                    )
-                    .order_by(PredictionBet.user_id, PredictionBet.id)
-                    .with_for_update()
-                )
-                winner_bets = result.scalars().all()
-
-                # 分配奖金
-                for bet in winner_bets:
-                    # 按比例分配: payout = payout_pool * (user_stake / winner_total_stake)
-                    payout = int(payout_pool * bet.stake_points / winner_total_stake)
-                    bet.payout_points = payout
-                    bet.status = BetStatus.WON
-
-                    # 发放奖金（不自动提交，最后统一提交）
-                    if payout > 0:
-                        await PointsService.add_points(
-                            db=db,
-                            user_id=bet.user_id,
-                            amount=payout,
-                            reason=PointsReason.BET_PAYOUT,
-                            ref_type="prediction_bet",
-                            ref_id=bet.id,
-                            description=f"竞猜获胜: {market.title}",
-                            auto_commit=False
-                        )
-                        stats["total_payout"] += payout
-
-                    stats["winner_count"] += 1
-
-            # 标记输家（带行锁防止重复处理）
-            # 按 user_id 排序，保证锁定顺序一致
+        result = await db.execute(
+            select(PredictionBet.user_id)
+            .where(
+                PredictionBet.market_id == market.id,
+                PredictionBet.status == BetStatus.PLACED
+            )
+            .distinct()
+            .order_by(PredictionBet.user_id)
+        )
+        user_ids = result.scalars().all()
+
+        # 按 user_id 升序分批，保证锁定顺序一致，避免死锁
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            counts = await PredictionService._settle_chunk(
+                db, market, winner_option_ids, chunk, payout_pool, winner_total_stake
+            )
+            for key, value in counts.items():
+                stats[key] += value
+            await db.commit()
+
+        if not user_ids:
+            await db.commit()
+        return stats
+
+    @staticmethod
+    async def _settle_chunk(
+        db: AsyncSession,
+        market: PredictionMarket,
+        winner_option_ids: List[int],
+        user_ids: List[int],
+        payout_pool: int,
+        winner_total_stake: int,
+    ) -> Dict[str, int]:
+        """结算一批用户的全部下注（集合式更新，不逐注加载）"""
+        from app.services.achievement_service import (
+            STAT_PREDICTION,
+            check_and_unlock_achievements_bulk,
+            update_user_stats_on_prediction_bulk,
+        )
+
+        base_filter = and_(
+            PredictionBet.market_id == market.id,
+            PredictionBet.user_id.in_(user_ids),
+            PredictionBet.status == BetStatus.PLACED,
+        )
+
+        # 赢家按比例分配: payout = payout_pool * stake / winner_total_stake（整数除法向下取整）
+        winner_count = 0
+        if winner_total_stake > 0:
             result = await db.execute(
-                select(PredictionBet)
-                .where(
-                    and_(
-                        PredictionBet.market_id == market_id,
-                        ~PredictionBet.option_id.in_(winner_option_ids),
-                        PredictionBet.status == BetStatus.PLACED
-                    )
+                update(PredictionBet)
+                .where(base_filter, PredictionBet.option_id.in_(winner_option_ids))
+                .values(
+                    status=BetStatus.WON,
+                    payout_points=(PredictionBet.stake_points * payout_pool).op("DIV")(winner_total_stake),
                 )
-                .order_by(PredictionBet.user_id, PredictionBet.id)
-                .with_for_update()
+                .execution_options(synchronize_session=False)
+            )
+            winner_count = result.rowcount
+
+        # 其余下注均为输家
+        result = await db.execute(
+            update(PredictionBet)
+            .where(base_filter)
+            .values(status=BetStatus.LOST, payout_points=0)
+            .execution_options(synchronize_session=False)
+        )
+        loser_count = result.rowcount
+
+        total_payout = await PredictionService._credit_payouts(db, market, user_ids)
+
+        # 更新成就统计（每个参与者计一次，任一注猜中即算猜中）
+        result = await db.execute(
+            select(
+                PredictionBet.user_id,
+                func.max(case((PredictionBet.status == BetStatus.WON, 1), else_=0)).label("is_winner"),
             )
-            loser_bets = result.scalars().all()
-            for bet in loser_bets:
-                bet.status = BetStatus.LOST
-                bet.payout_points = 0
-                stats["loser_count"] += 1
-
-            # 更新成就统计（为所有参与者更新）
-            from app.services.achievement_service import (
-                update_user_stats_on_prediction, check_and_unlock_achievements
+            .where(
+                PredictionBet.market_id == market.id,
+                PredictionBet.user_id.in_(user_ids),
             )
-            # 收集所有参与用户
-            all_user_ids = set()
-            if winner_total_stake > 0:
-                for bet in winner_bets:
-                    all_user_ids.add(bet.user_id)
-            for bet in loser_bets:
-                all_user_ids.add(bet.user_id)
-
-            # 为每个用户更新成就统计
-            for user_id in all_user_ids:
-                is_winner = user_id in {bet.user_id for bet in winner_bets} if winner_total_stake > 0 else False
-                user_stats = await update_user_stats_on_prediction(db, user_id, is_winner)
-                await check_and_unlock_achievements(db, user_id, user_stats)
+            .group_by(PredictionBet.user_id)
+        )
+        participant_results = {row.user_id: bool(row.is_winner) for row in result.all()}
+        stats_by_user = await update_user_stats_on_prediction_bulk(db, participant_results)
+        await check_and_unlock_achievements_bulk(db, stats_by_user, stat_types=[STAT_PREDICTION])
 
-            await db.commit()
-            return stats
+        return {
+            "winner_count": winner_count,
+            "loser_count": loser_count,
+            "total_payout": total_payout,
+        }
 
-        except Exception:
-            await db.rollback()
-            raise
+    @staticmethod
+    async def _credit_payouts(
+        db: AsyncSession,
+        market: PredictionMarket,
+        user_ids: List[int],
+    ) -> int:
+        """为一批用户发放奖金：批量写账本 + 一条 UPDATE … JOIN 入账，返回发放总额"""
+        result = await db.execute(
+            select(PredictionBet.id, PredictionBet.user_id, PredictionBet.payout_points)
+            .where(
+                PredictionBet.market_id == market.id,
+                PredictionBet.user_id.in_(user_ids),
+                PredictionBet.status == BetStatus.WON,
+                PredictionBet.payout_points > 0,
+            )
+            .order_by(PredictionBet.user_id, PredictionBet.id)
+        )
+        payouts = result.all()
+        if not payouts:
+            return 0
+
+        paid_user_ids = sorted({row.user_id for row in payouts})
+
+        # 补建缺失的积分记录后，按 user_id 顺序锁定余额
+        await db.execute(
+            insert(UserPoints)
+            .values([
+                {"user_id": user_id, "balance": 0, "total_earned": 0, "total_spent": 0}
+                for user_id in paid_user_ids
+            ])
+            .prefix_with("IGNORE")
+        )
+        result = await db.execute(
+            select(UserPoints.user_id, UserPoints.balance)
+            .where(UserPoints.user_id.in_(paid_user_ids))
+            .order_by(UserPoints.user_id)
+            .with_for_update()
+        )
+        balances = {row.user_id: row.balance for row in result.all()}
+
+        # 账本记录：同一用户多注按下注顺序累计余额
+        now = datetime.utcnow()
+        description = f"竞猜获胜: {market.title}"
+        ledger_rows = []
+        for row in payouts:
+            balances[row.user_id] += row.payout_points
+            ledger_rows.append({
+                "user_id": row.user_id,
+                "amount": row.payout_points,
+                "balance_after": balances[row.user_id],
+                "reason": PointsReason.BET_PAYOUT,
+                "ref_type": "prediction_bet",
+                "ref_id": row.id,
+                "description": description,
+                "request_id": f"prediction_payout:{row.id}",
+                "created_at": now,
+                "updated_at": now,
+            })
+        await db.execute(insert(PointsLedger).values(ledger_rows))
+
+        # 一条 UPDATE … JOIN 入账
+        user_totals = (
+            select(
+                PredictionBet.user_id.label("user_id"),
+                func.sum(PredictionBet.payout_points).label("total"),
+            )
+            .where(
+                PredictionBet.market_id == market.id,
+                PredictionBet.user_id.in_(paid_user_ids),
+                PredictionBet.status == BetStatus.WON,
+                PredictionBet.payout_points > 0,
+            )
+            .group_by(PredictionBet.user_id)
+            .subquery()
+        )
+        await db.execute(
+            update(UserPoints)
+            .where(UserPoints.user_id == user_totals.c.user_id)
+            .values(
+                balance=UserPoints.balance + user_totals.c.total,
+                total_earned=UserPoints.total_earned + user_totals.c.total,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return sum(row.payout_points for row in payouts)
 
     @staticmethod
     async def cancel_market(db: AsyncSession, market_id: int) -> Dict[str, Any]:
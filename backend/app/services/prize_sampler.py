@@ -0,0 +1,84 @@
+"""
+加权随机抽样（Walker/Vose 别名法）
+
+抽奖、刮刮乐、扭蛋机、老虎机都按权重选择奖品/符号：
+- 配置加载时 O(n) 预处理出别名表，每次抽样只需两次随机数，O(1)
+- 权重 <= 0 的项永远不会被抽中；全部权重无效时构造失败（ValueError）
+- 分布正确性校验见 scripts/check_prize_sampler.py
+"""
+from __future__ import annotations
+
+import random
+from typing import Callable, Generic, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+class AliasTable:
+    """Vose 别名表：按权重返回下标"""
+
+    __slots__ = ("size", "_prob", "_alias")
+
+    def __init__(self, weights: Sequence[float]):
+        size = len(weights)
+        values = [max(0.0, float(weight)) for weight in weights]
+        total = sum(values)
+        if size == 0 or total <= 0:
+            raise ValueError("权重配置无效")
+
+        # 归一化到平均值 1：小于 1 的槽位由「大」项补齐
+        scaled = [value * size / total for value in values]
+        prob = [0.0] * size
+        alias = list(range(size))
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # 剩余项只差浮点误差，视为满槽
+        for index in large + small:
+            prob[index] = 1.0
+
+        self.size = size
+        self._prob = prob
+        self._alias = alias
+
+    def sample(self, rng: Callable[[], float] = random.random) -> int:
+        """抽取一个下标"""
+        index = int(rng() * self.size)
+        if rng() < self._prob[index]:
+            return index
+        return self._alias[index]
+
+
+class WeightedSampler(Generic[T]):
+    """按权重抽取元素（构造后不可变，可在协程间共享）"""
+
+    __slots__ = ("items", "_table")
+
+    def __init__(self, items: Sequence[T], weights: Sequence[float]):
+        if len(items) != len(weights):
+            raise ValueError("元素与权重数量不一致")
+        self.items = tuple(items)
+        self._table = AliasTable(weights)
+
+    @classmethod
+    def build(cls, items: Sequence[T], weight: Callable[[T], float]) -> Optional["WeightedSampler[T]"]:
+        """只保留权重 > 0 的元素；没有可抽元素时返回 None"""
+        candidates = [(item, float(weight(item))) for item in items]
+        candidates = [(item, value) for item, value in candidates if value > 0]
+        if not candidates:
+            return None
+        return cls([item for item, _ in candidates], [value for _, value in candidates])
+
+    def pick(self, rng: Callable[[], float] = random.random) -> T:
+        """抽取一个元素"""
+        return self.items[self._table.sample(rng)]
@@ -0,0 +1,79 @@
+"""
+作品提交状态流转
+
+Worker 回写接口与 Worker 直写数据库共用同一套状态变更逻辑。
+"""
+from datetime import datetime
+from typing import Optional
+
+from app.models.project import ProjectStatus
+from app.models.project_submission import ProjectSubmission, ProjectSubmissionStatus
+
+
+def append_status_history(
+    submission: ProjectSubmission,
+    status_value: str,
+    now: datetime,
+    message: Optional[str] = None,
+    error_code: Optional[str] = None,
+) -> None:
+    """追加状态历史"""
+    history = submission.status_history or []
+    history.append({
+        "status": status_value,
+        "timestamp": now.isoformat(),
+        "message": message,
+        "error_code": error_code,
+    })
+    submission.status_history = history
+
+
+def apply_submission_status(
+    submission: ProjectSubmission,
+    status: ProjectSubmissionStatus,
+    *,
+    message: Optional[str] = None,
+    error_code: Optional[str] = None,
+    log_append: Optional[str] = None,
+    domain: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> None:
+    """
+    更新提交状态并联动作品状态（需预先加载 submission.project）
+
+    上线时作品切换到该提交；失败/停止时若为当前提交则作品下线。
+    """
+    now = now or datetime.utcnow()
+    submission.status = status.value
+    submission.status_message = message
+    submission.error_code = error_code
+    if domain:
+        submission.domain = domain
+
+    if log_append:
+        if submission.log:
+            submission.log += f"\n{log_append}"
+        else:
+            submission.log = log_append
+
+    append_status_history(
+        submission=submission,
+        status_value=status.value,
+        now=now,
+        message=message,
+        error_code=error_code,
+    )
+
+    if status == ProjectSubmissionStatus.ONLINE:
+        submission.online_at = now
+        if submission.project:
+            submission.project.current_submission_id = submission.id
+            submission.project.status = ProjectStatus.ONLINE.value
+    elif status == ProjectSubmissionStatus.FAILED:
+        submission.failed_at = now
+        if submission.project and submission.project.current_submission_id == submission.id:
+            submission.project.status = ProjectStatus.OFFLINE.value
+    elif status == ProjectSubmissionStatus.STOPPED:
+        submission.failed_at = None
+        if submission.project and submission.project.current_submission_id == submission.id:
+            submission.project.status = ProjectStatus.OFFLINE.value
@@ -7,13 +7,18 @@
 import asyncio
 import hashlib
 import httpx
+import json
 import logging
+import math
 import time
+from collections import Counter, OrderedDict
 from datetime import date, timedelta
-from typing import Optional, Literal
-from dataclasses import dataclass
+from typing import Any, Optional, Literal
+from dataclasses import asdict, dataclass
 
 from app.core.config import settings
+from app.core.http_client import QUOTA, get_http_client
+from app.core.redis import get_redis
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +26,12 @@ logger = logging.getLogger(__name__)
 # 缓存缺失标记
 _MISSING = object()
 
+# Redis 共享缓存 key 前缀（key 指纹为 sha256，不含明文）
+SHARED_CACHE_PREFIX = {
+    "quota": "quota:cache:",
+    "online": "quota:online:",
+}
+
 
 @dataclass
 class QuotaInfo:
@@ -72,12 +83,41 @@ class _OnlineCacheEntry:
     last_error: Optional[str] = None
 
 
+class _LRUCache:
+    """进程内 LRU 缓存（OrderedDict 实现，读写与淘汰均为 O(1)）"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._data: OrderedDict[str, Any] = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        value = self._data.get(key, _MISSING)
+        if value is not _MISSING:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 class QuotaService:
     """
     额度查询服务
 
     支持多种查询策略（OpenAI billing API / NewAPI /api/user/self），
     自动降级、缓存和错误处理。
+
+    缓存分两级：进程内 LRU + Redis 共享层（多 worker 共用），
+    陈旧期内先返回旧值再后台刷新，同一 key 的并发未命中合并为一次上游查询。
     """
 
     # 无限额度阈值（大于等于此值视为无限）
@@ -119,10 +159,17 @@ class QuotaService:
         self.online_cache_ttl_stale = settings.ONLINE_STATUS_CACHE_TTL_STALE_SECONDS
         self.online_cache_ttl_error = settings.ONLINE_STATUS_CACHE_TTL_ERROR_SECONDS
 
-        # 内部状态
-        self._cache: dict[str, _CacheEntry] = {}
-        self._preferred_base_url: dict[str, str] = {}  # 记录每个 key 上次成功的 base_url
-        self._online_cache: dict[str, _OnlineCacheEntry] = {}  # 在线状态缓存
+        # 内部状态：进程内 LRU（一级）+ Redis 共享缓存（二级，所有 worker 共用）
+        self.shared_cache_enabled = settings.QUOTA_SHARED_CACHE_ENABLED
+        self._cache = _LRUCache(self.MAX_CACHE_ENTRIES)
+        self._preferred_base_url = _LRUCache(self.MAX_CACHE_ENTRIES)  # 记录每个 key 上次成功的 base_url
+        self._online_cache = _LRUCache(self.MAX_CACHE_ENTRIES)  # 在线状态缓存
+        # 单飞：同一 key 并发未命中时只发起一次上游查询，其余请求等待同一结果
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._online_inflight: dict[str, asyncio.Task] = {}
+        # 后台刷新（stale-while-revalidate）并发上限
+        self._refresh_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._stats: dict[str, Counter] = {"quota": Counter(), "online": Counter()}
 
     @staticmethod
     def _normalize_url(url: str) -> str:
@@ -133,8 +180,8 @@ class QuotaService:
     MAX_CACHE_ENTRIES = 1000
 
     @staticmethod
-    def _fingerprint(api_key: str) -> str:
-        """生成 API Key 的指纹（用于缓存键，使用完整 sha256 避免碰撞）"""
+    def fingerprint(api_key: str) -> str:
+        """生成 API Key 的指纹（用于缓存键与额度快照，使用完整 sha256 避免碰撞）"""
         return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
 
     @staticmethod
@@ -142,53 +189,154 @@ class QuotaService:
         """获取 API Key 后 4 位（用于日志）"""
         return api_key[-4:] if len(api_key) >= 4 else "****"
 
-    def _cache_get(self, key_fp: str) -> _CacheEntry | object:
-        """从缓存获取结果"""
-        entry = self._cache.get(key_fp)
-        if entry is None:
-            return _MISSING
-
-        now = time.monotonic()
-        if now >= entry.stale_until:
-            # 超过陈旧期，删除缓存
-            self._cache.pop(key_fp, None)
-            return _MISSING
+    # ========== 缓存统计 ==========
+
+    CACHE_STAT_NAMES = ("hits", "misses", "stale_serves", "coalesced", "refreshes", "shared_loads", "shared_errors")
+
+    def get_cache_stats(self) -> dict:
+        """获取缓存命中统计（当前进程）"""
+        result = {}
+        for kind, cache, inflight in (
+            ("quota", self._cache, self._inflight),
+            ("online", self._online_cache, self._online_inflight),
+        ):
+            counter = self._stats[kind]
+            result[kind] = {name: counter.get(name, 0) for name in self.CACHE_STAT_NAMES}
+            result[kind]["entries"] = len(cache)
+            result[kind]["inflight"] = len(inflight)
+        result["shared_cache_enabled"] = self.shared_cache_enabled
+        return result
+
+    def reset_cache_stats(self) -> None:
+        """清空缓存命中统计"""
+        for counter in self._stats.values():
+            counter.clear()
+
+    # ========== 共享缓存（Redis）方法 ==========
+
+    async def _shared_get(self, kind: str, key_fp: str) -> Optional[dict]:
+        """读取 Redis 共享缓存，Redis 不可用时视为未命中"""
+        if not self.shared_cache_enabled:
+            return None
+        try:
+            redis = await get_redis()
+            raw = await redis.get(f"{SHARED_CACHE_PREFIX[kind]}{key_fp}")
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            self._stats[kind]["shared_errors"] += 1
+            logger.debug("Quota shared cache read failed (%s): %s", kind, e)
+            return None
 
-        return entry
+    async def _shared_set(self, kind: str, key_fp: str, payload: dict, entry) -> None:
+        """
+        写入 Redis 共享缓存
 
-    def _evict_oldest_cache(self) -> None:
-        """清理最旧的 10% 缓存条目"""
-        if not self._cache:
+        进程内条目使用 monotonic 时间，跨进程时换算为剩余秒数 + 写入时的墙钟时间。
+        """
+        if not self.shared_cache_enabled:
+            return
+        now = time.monotonic()
+        ttl = math.ceil(entry.stale_until - now)
+        if ttl <= 0:
             return
-        # 按 stale_until 排序，删除最旧的 10%
-        sorted_keys = sorted(
-            self._cache.keys(),
-            key=lambda k: self._cache[k].stale_until
+        payload = {
+            **payload,
+            "fresh_in": entry.fresh_until - now,
+            "stale_in": entry.stale_until - now,
+            "written_at": time.time(),
+            "last_error": entry.last_error,
+        }
+        try:
+            redis = await get_redis()
+            await redis.set(f"{SHARED_CACHE_PREFIX[kind]}{key_fp}", json.dumps(payload), ex=ttl)
+        except Exception as e:
+            self._stats[kind]["shared_errors"] += 1
+            logger.debug("Quota shared cache write failed (%s): %s", kind, e)
+
+    @staticmethod
+    def _shared_deadlines(data: dict) -> tuple[float, float]:
+        """把共享缓存中的剩余秒数换算为本进程的 monotonic 截止时间"""
+        elapsed = max(0.0, time.time() - float(data.get("written_at") or 0))
+        now = time.monotonic()
+        return (
+            now + float(data.get("fresh_in") or 0) - elapsed,
+            now + float(data.get("stale_in") or 0) - elapsed,
         )
-        to_remove = max(1, len(sorted_keys) // 10)
-        for key in sorted_keys[:to_remove]:
-            self._cache.pop(key, None)
 
-    def _cache_set(
+    def _single_flight(self, kind: str, inflight: dict[str, asyncio.Task], key_fp: str, factory) -> asyncio.Task:
+        """同一 key 只保留一个进行中的上游查询，并发请求复用该任务"""
+        task = inflight.get(key_fp)
+        if task is not None:
+            self._stats[kind]["coalesced"] += 1
+            return task
+
+        task = asyncio.ensure_future(factory())
+        inflight[key_fp] = task
+
+        def _done(finished: asyncio.Task) -> None:
+            if inflight.get(key_fp) is finished:
+                inflight.pop(key_fp, None)
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.warning("Quota query task failed (%s): %s", kind, finished.exception())
+
+        task.add_done_callback(_done)
+        return task
+
+    # ========== 额度缓存方法 ==========
+
+    async def _cache_get(self, key_fp: str) -> _CacheEntry | object:
+        """
+        从缓存获取结果
+
+        进程内条目仍新鲜时直接返回；否则查 Redis 共享层，
+        若其他 worker 已写入更新的结果则回填进程内缓存。
+        """
+        now = time.monotonic()
+        entry = self._cache.get(key_fp)
+        if entry is not _MISSING:
+            if now < entry.fresh_until:
+                return entry
+            if now >= entry.stale_until:
+                # 超过陈旧期，删除缓存
+                self._cache.pop(key_fp)
+                entry = _MISSING
+
+        data = await self._shared_get("quota", key_fp)
+        if data is not None:
+            fresh_until, stale_until = self._shared_deadlines(data)
+            if now < stale_until and (entry is _MISSING or fresh_until > entry.fresh_until):
+                value = data.get("value")
+                entry = _CacheEntry(
+                    value=QuotaInfo(**value) if value else None,
+                    fresh_until=fresh_until,
+                    stale_until=stale_until,
+                    last_error=data.get("last_error"),
+                )
+                self._cache.set(key_fp, entry)
+                if data.get("base_url"):
+                    self._preferred_base_url.set(key_fp, data["base_url"])
+                self._stats["quota"]["shared_loads"] += 1
+
+        return entry
+
+    async def _cache_set(
         self,
         key_fp: str,
         value: Optional[QuotaInfo],
         *,
         ok: bool,
         last_error: Optional[str] = None,
+        error_ttl: Optional[int] = None,
+        base_url: Optional[str] = None,
     ) -> None:
-        """设置缓存"""
+        """设置缓存（进程内 + 共享层）"""
         now = time.monotonic()
 
-        # 缓存达到上限时清理最旧的条目
-        if len(self._cache) >= self.MAX_CACHE_ENTRIES:
-            self._evict_oldest_cache()
-
         if ok:
             # 成功：设置新鲜期和陈旧期
             fresh_ttl = max(1, self.cache_ttl_ok)
             stale_ttl = fresh_ttl + max(1, self.cache_ttl_stale)
-            self._cache[key_fp] = _CacheEntry(
+            entry = _CacheEntry(
                 value=value,
                 fresh_until=now + fresh_ttl,
                 stale_until=now + stale_ttl,
@@ -196,42 +344,51 @@ class QuotaService:
             )
         else:
             # 失败：只设置短期缓存
-            ttl = max(1, self.cache_ttl_error)
-            self._cache[key_fp] = _CacheEntry(
+            ttl = max(1, error_ttl or self.cache_ttl_error)
+            entry = _CacheEntry(
                 value=value,
                 fresh_until=now + ttl,
                 stale_until=now + ttl,
                 last_error=last_error,
             )
 
-    # ========== 在线状态缓存方法 ==========
+        self._cache.set(key_fp, entry)
+        await self._shared_set(
+            "quota",
+            key_fp,
+            {"value": asdict(value) if value else None, "base_url": base_url},
+            entry,
+        )
 
-    def _online_cache_get(self, key_fp: str) -> _OnlineCacheEntry | object:
-        """从在线状态缓存获取结果"""
-        entry = self._online_cache.get(key_fp)
-        if entry is None:
-            return _MISSING
+    # ========== 在线状态缓存方法 ==========
 
+    async def _online_cache_get(self, key_fp: str) -> _OnlineCacheEntry | object:
+        """从在线状态缓存获取结果（先进程内，再 Redis 共享层）"""
         now = time.monotonic()
-        if now >= entry.stale_until:
-            self._online_cache.pop(key_fp, None)
-            return _MISSING
+        entry = self._online_cache.get(key_fp)
+        if entry is not _MISSING:
+            if now < entry.fresh_until:
+                return entry
+            if now >= entry.stale_until:
+                self._online_cache.pop(key_fp)
+                entry = _MISSING
+
+        data = await self._shared_get("online", key_fp)
+        if data is not None:
+            fresh_until, stale_until = self._shared_deadlines(data)
+            if now < stale_until and (entry is _MISSING or fresh_until > entry.fresh_until):
+                entry = _OnlineCacheEntry(
+                    value=bool(data.get("value")),
+                    fresh_until=fresh_until,
+                    stale_until=stale_until,
+                    last_error=data.get("last_error"),
+                )
+                self._online_cache.set(key_fp, entry)
+                self._stats["online"]["shared_loads"] += 1
 
         return entry
 
-    def _evict_oldest_online_cache(self) -> None:
-        """清理最旧的 10% 在线状态缓存条目"""
-        if not self._online_cache:
-            return
-        sorted_keys = sorted(
-            self._online_cache.keys(),
-            key=lambda k: self._online_cache[k].stale_until
-        )
-        to_remove = max(1, len(sorted_keys) // 10)
-        for key in sorted_keys[:to_remove]:
-            self._online_cache.pop(key, None)
-
-    def _online_cache_set(
+    async def _online_cache_set(
         self,
         key_fp: str,
         value: bool,
@@ -239,16 +396,13 @@ class QuotaService:
         ok: bool,
         last_error: Optional[str] = None,
     ) -> None:
-        """设置在线状态缓存"""
+        """设置在线状态缓存（进程内 + 共享层）"""
         now = time.monotonic()
 
-        if len(self._online_cache) >= self.MAX_CACHE_ENTRIES:
-            self._evict_oldest_online_cache()
-
         if ok:
             fresh_ttl = max(1, self.online_cache_ttl_ok)
             stale_ttl = fresh_ttl + max(1, self.online_cache_ttl_stale)
-            self._online_cache[key_fp] = _OnlineCacheEntry(
+            entry = _OnlineCacheEntry(
                 value=value,
                 fresh_until=now + fresh_ttl,
                 stale_until=now + stale_ttl,
@@ -256,13 +410,16 @@ class QuotaService:
             )
         else:
             ttl = max(1, self.online_cache_ttl_error)
-            self._online_cache[key_fp] = _OnlineCacheEntry(
+            entry = _OnlineCacheEntry(
                 value=value,
                 fresh_until=now + ttl,
                 stale_until=now + ttl,
                 last_error=last_error,
             )
 
+        self._online_cache.set(key_fp, entry)
+        await self._shared_set("online", key_fp, {"value": value}, entry)
+
     async def _query_openai_billing(
         self,
         api_key: str,
@@ -483,6 +640,9 @@ class QuotaService:
         """
         查询 API Key 的额度信息
 
+        新鲜缓存直接返回；陈旧期内先返回旧值并在后台刷新；
+        未命中时同一 key 的并发请求只发起一次上游查询。
+
         Args:
             api_key: 用户的 API Key
             client: 可复用的 HTTP 客户端
@@ -493,34 +653,64 @@ class QuotaService:
         if not api_key:
             return None
 
-        key_fp = self._fingerprint(api_key)
-        key_suffix = self._key_suffix(api_key)
+        key_fp = self.fingerprint(api_key)
+        stats = self._stats["quota"]
 
         # 检查缓存
-        cached = self._cache_get(key_fp)
+        cached = await self._cache_get(key_fp)
         if cached is not _MISSING:
             entry = cached
             now = time.monotonic()
             if now < entry.fresh_until:
                 # 缓存仍新鲜，直接返回
+                stats["hits"] += 1
+                return entry.value
+            if entry.value is not None:
+                # 陈旧期内：先返回旧值，后台刷新
+                stats["stale_serves"] += 1
+                self._refresh_quota_in_background(api_key, key_fp, entry)
                 return entry.value
 
-        owns_client = client is None
-        try:
-            if client is None:
-                client = httpx.AsyncClient(
-                    timeout=self.timeout,
-                    limits=httpx.Limits(
-                        max_connections=self.max_concurrency,
-                        max_keepalive_connections=self.max_concurrency
-                    ),
-                    follow_redirects=False,
-                )
+        stats["misses"] += 1
+        task = self._single_flight(
+            "quota",
+            self._inflight,
+            key_fp,
+            lambda: self._fetch_quota(api_key, key_fp, cached=cached, client=client),
+        )
+        return await asyncio.shield(task)
+
+    def _refresh_quota_in_background(self, api_key: str, key_fp: str, cached: _CacheEntry) -> None:
+        """后台刷新陈旧的额度缓存（同一 key 已有查询在进行时跳过）"""
+        if key_fp in self._inflight:
+            return
+        self._stats["quota"]["refreshes"] += 1
+
+        async def refresh() -> Optional[QuotaInfo]:
+            async with self._refresh_semaphore:
+                return await self._fetch_quota(api_key, key_fp, cached=cached, client=None)
+
+        self._single_flight("quota", self._inflight, key_fp, refresh)
 
+    async def _fetch_quota(
+        self,
+        api_key: str,
+        key_fp: str,
+        *,
+        cached: _CacheEntry | object,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Optional[QuotaInfo]:
+        """向上游查询额度并写入缓存（失败时按原策略回退陈旧缓存/写入负缓存）"""
+        key_suffix = self._key_suffix(api_key)
+
+        if client is None:
+            client = get_http_client(QUOTA)
+
+        try:
             # base_url 尝试顺序：优先上次成功的
             preferred = self._preferred_base_url.get(key_fp)
             base_urls = list(self.base_urls)
-            if preferred and preferred in base_urls:
+            if preferred is not _MISSING and preferred in base_urls:
                 base_urls.remove(preferred)
                 base_urls.insert(0, preferred)
 
@@ -557,8 +747,8 @@ class QuotaService:
                             group=info.group,
                         )
 
-                        self._preferred_base_url[key_fp] = base_url
-                        self._cache_set(key_fp, info, ok=True)
+                        self._preferred_base_url.set(key_fp, base_url)
+                        await self._cache_set(key_fp, info, ok=True, base_url=base_url)
                         logger.debug(
                             "Quota query success (key=***%s, base_url=%s, strategy=%s, today=$%.2f)",
                             key_suffix, base_url, strategy, today_used
@@ -605,11 +795,11 @@ class QuotaService:
             # 写入负缓存
             if any_auth_failed:
                 # 认证失败使用更长的缓存时间
-                self._cache_set(key_fp, None, ok=False, last_error=last_error)
-                self._cache[key_fp].fresh_until = time.monotonic() + self.cache_ttl_auth_error
-                self._cache[key_fp].stale_until = self._cache[key_fp].fresh_until
+                await self._cache_set(
+                    key_fp, None, ok=False, last_error=last_error, error_ttl=self.cache_ttl_auth_error
+                )
             else:
-                self._cache_set(key_fp, None, ok=False, last_error=last_error)
+                await self._cache_set(key_fp, None, ok=False, last_error=last_error)
 
             logger.debug(
                 "Quota query failed for key=***%s: %s",
@@ -619,29 +809,30 @@ class QuotaService:
 
         except httpx.TimeoutException:
             logger.warning("Quota API timeout (key=***%s)", key_suffix)
-            self._cache_set(key_fp, None, ok=False, last_error="timeout")
+            await self._cache_set(key_fp, None, ok=False, last_error="timeout")
             return None
         except httpx.RequestError as e:
             logger.warning("Quota API request error (key=***%s): %s", key_suffix, e)
-            self._cache_set(key_fp, None, ok=False, last_error=str(e))
+            await self._cache_set(key_fp, None, ok=False, last_error=str(e))
             return None
         except Exception as e:
             logger.exception("Quota API unexpected error (key=***%s): %s", key_suffix, e)
-            self._cache_set(key_fp, None, ok=False, last_error=str(e))
+            await self._cache_set(key_fp, None, ok=False, last_error=str(e))
             return None
-        finally:
-            if owns_client and client is not None:
-                await client.aclose()
 
     async def batch_get_quota(
         self,
-        api_keys: list[tuple[int, str]]
+        api_keys: list[tuple[int, str]],
+        *,
+        use_cache: bool = True,
     ) -> dict[int, Optional[QuotaInfo]]:
         """
         批量查询多个 API Key 的额度信息
 
         Args:
             api_keys: [(registration_id, api_key), ...] 列表
+            use_cache: False 时跳过缓存直接查询上游（结果仍写入缓存，失败时不回退陈旧缓存），
+                供额度快照轮询使用
 
         Returns:
             {registration_id: QuotaInfo | None} 字典
@@ -658,22 +849,16 @@ class QuotaService:
 
         # 并发控制
         semaphore = asyncio.Semaphore(self.max_concurrency)
-        limits = httpx.Limits(
-            max_connections=self.max_concurrency,
-            max_keepalive_connections=self.max_concurrency
-        )
+        client = get_http_client(QUOTA)
 
-        async with httpx.AsyncClient(
-            timeout=self.timeout,
-            limits=limits,
-            follow_redirects=False
-        ) as client:
-            async def query_key(key: str) -> tuple[str, Optional[QuotaInfo]]:
-                async with semaphore:
-                    return key, await self.get_quota(key, client=client)
+        async def query_key(key: str) -> tuple[str, Optional[QuotaInfo]]:
+            async with semaphore:
+                if not use_cache:
+                    return key, await self._fetch_quota(key, self.fingerprint(key), cached=_MISSING, client=client)
+                return key, await self.get_quota(key, client=client)
 
-            tasks = [query_key(key) for key in key_to_reg_ids.keys()]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        tasks = [query_key(key) for key in key_to_reg_ids.keys()]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
         # 构建结果映射
         quota_map: dict[int, Optional[QuotaInfo]] = {}
@@ -782,67 +967,99 @@ class QuotaService:
             return False
 
         window = int(window_seconds or self.online_window_seconds)
-        key_fp = self._fingerprint(api_key)
-        key_suffix = self._key_suffix(api_key)
+        key_fp = self.fingerprint(api_key)
+        stats = self._stats["online"]
 
         # 检查缓存
-        cached = self._online_cache_get(key_fp)
+        cached = await self._online_cache_get(key_fp)
         if cached is not _MISSING:
             entry = cached
             now = time.monotonic()
             if now < entry.fresh_until:
+                stats["hits"] += 1
+                return entry.value
+            if now < entry.stale_until:
+                # 陈旧期内：先返回旧值，后台刷新
+                stats["stale_serves"] += 1
+                self._refresh_online_in_background(api_key, key_fp, window, entry)
                 return entry.value
 
-        owns_client = client is None
-        if owns_client:
-            limits = httpx.Limits(
-                max_connections=self.max_concurrency,
-                max_keepalive_connections=self.max_concurrency
-            )
-            client = httpx.AsyncClient(
-                timeout=self.timeout,
-                limits=limits,
-                follow_redirects=False
-            )
+        stats["misses"] += 1
+        task = self._single_flight(
+            "online",
+            self._online_inflight,
+            key_fp,
+            lambda: self._fetch_online_status(api_key, key_fp, window, cached=cached, client=client),
+        )
+        return await asyncio.shield(task)
 
-        try:
-            last_error: Optional[str] = None
+    def _refresh_online_in_background(
+        self,
+        api_key: str,
+        key_fp: str,
+        window: int,
+        cached: _OnlineCacheEntry,
+    ) -> None:
+        """后台刷新陈旧的在线状态缓存"""
+        if key_fp in self._online_inflight:
+            return
+        self._stats["online"]["refreshes"] += 1
 
-            for base_url in self.base_urls:
-                latest_ts, ok = await self._query_latest_log_ts(
-                    api_key, base_url=base_url, client=client
-                )
-                if not ok:
-                    last_error = "log_query_failed"
-                    continue
+        async def refresh() -> bool:
+            async with self._refresh_semaphore:
+                return await self._fetch_online_status(api_key, key_fp, window, cached=cached, client=None)
 
-                now_ts = time.time()
-                is_online = bool(
-                    latest_ts is not None and (now_ts - latest_ts) <= window
-                )
-                self._online_cache_set(key_fp, is_online, ok=True)
-                logger.debug(
-                    "Online status query success (key=***%s, is_online=%s, latest_ts=%s)",
-                    key_suffix, is_online, latest_ts
-                )
-                return is_online
+        self._single_flight("online", self._online_inflight, key_fp, refresh)
 
-            # 全部失败：优先回退 stale
-            if cached is not _MISSING:
-                entry = cached
-                now = time.monotonic()
-                if now < entry.stale_until:
-                    logger.info(
-                        "Online status query failed, using stale cache (key=***%s, error=%s)",
-                        key_suffix, last_error or entry.last_error or "unknown"
-                    )
-                    return entry.value
+    async def _fetch_online_status(
+        self,
+        api_key: str,
+        key_fp: str,
+        window: int,
+        *,
+        cached: _OnlineCacheEntry | object,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> bool:
+        """向上游查询在线状态并写入缓存"""
+        key_suffix = self._key_suffix(api_key)
 
-            self._online_cache_set(key_fp, False, ok=False, last_error=last_error)
-            return False
-        finally:
-            if owns_client and client is not None:
-                await client.aclose()
+        if client is None:
+            client = get_http_client(QUOTA)
+
+        last_error: Optional[str] = None
+
+        for base_url in self.base_urls:
+            latest_ts, ok = await self._query_latest_log_ts(
+                api_key, base_url=base_url, client=client
+            )
+            if not ok:
+                last_error = "log_query_failed"
+                continue
+
+            now_ts = time.time()
+            is_online = bool(
+                latest_ts is not None and (now_ts - latest_ts) <= window
+            )
+            await self._online_cache_set(key_fp, is_online, ok=True)
+            logger.debug(
+                "Online status query success (key=***%s, is_online=%s, latest_ts=%s)",
+                key_suffix, is_online, latest_ts
+            )
+            return is_online
+
+        # 全部失败：优先回退 stale
+        if cached is not _MISSING:
+            entry = cached
+            now = time.monotonic()
+            if now < entry.stale_until:
+                logger.info(
+                    "Online status query failed, using stale cache (key=***%s, error=%s)",
+                    key_suffix, last_error or entry.last_error or "unknown"
+                )
+                return entry.value
+
+        await self._online_cache_set(key_fp, False, ok=False, last_error=last_error)
+        return False
 
     async def batch_get_online_status(
         self,
@@ -873,26 +1090,18 @@ class QuotaService:
             return status_map
 
         semaphore = asyncio.Semaphore(self.max_concurrency)
-        limits = httpx.Limits(
-            max_connections=self.max_concurrency,
-            max_keepalive_connections=self.max_concurrency
-        )
-
-        async with httpx.AsyncClient(
-            timeout=self.timeout,
-            limits=limits,
-            follow_redirects=False
-        ) as client:
-            async def query_key(key: str) -> tuple[str, bool]:
-                async with semaphore:
-                    return key, await self.get_online_status(
-                        key,
-                        window_seconds=window_seconds,
-                        client=client
-                    )
+        client = get_http_client(QUOTA)
+
+        async def query_key(key: str) -> tuple[str, bool]:
+            async with semaphore:
+                return key, await self.get_online_status(
+                    key,
+                    window_seconds=window_seconds,
+                    client=client
+                )
 
-            tasks = [query_key(key) for key in key_to_reg_ids.keys()]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        tasks = [query_key(key) for key in key_to_reg_ids.keys()]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
         for result in results:
             if isinstance(result, Exception):
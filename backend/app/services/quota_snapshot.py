@@ -0,0 +1,234 @@
+"""
+额度快照服务（后台轮询 + Redis 共享）
+
+定时任务按固定节奏查询全部参赛者的额度，写入 Redis，所有 worker 共享同一份结果：
+- quota:snapshot        哈希，field 为报名ID，value 为 JSON（额度、成功时间、检查时间、key 指纹）
+- quota:snapshot:meta   最近一次轮询的时间与统计
+
+轮询只在调度领导者上按间隔执行（见 scheduler），绕过额度缓存直接查询上游，
+updated_at 记录的是真实的上游查询时间。
+排行榜/监控接口读取快照并返回新鲜度；快照缺失或缺少某些报名时才实时查询这部分。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.registration import Registration, RegistrationStatus
+from app.services.quota_service import QuotaInfo, QuotaService, quota_service
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "quota:snapshot"
+SNAPSHOT_META_KEY = "quota:snapshot:meta"
+
+SNAPSHOT_REGISTRATION_STATUSES = [
+    RegistrationStatus.SUBMITTED.value,
+    RegistrationStatus.APPROVED.value,
+]
+
+
+@dataclass
+class QuotaSnapshotEntry:
+    """单个报名的额度快照"""
+    info: Optional[QuotaInfo]
+    key_fp: str
+    ok: bool  # 最近一次检查是否成功
+    checked_at: float  # 最近一次检查时间（Unix 秒）
+    updated_at: Optional[float]  # 额度数据的获取时间（失败时沿用上次成功的数据）
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "info": asdict(self.info) if self.info else None,
+            "key_fp": self.key_fp,
+            "ok": self.ok,
+            "checked_at": self.checked_at,
+            "updated_at": self.updated_at,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "QuotaSnapshotEntry":
+        data = json.loads(raw)
+        info = data.get("info")
+        return cls(
+            info=QuotaInfo(**info) if info else None,
+            key_fp=data.get("key_fp") or "",
+            ok=bool(data.get("ok")),
+            checked_at=float(data.get("checked_at") or 0),
+            updated_at=data.get("updated_at"),
+        )
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+async def _load_previous(redis) -> dict[int, QuotaSnapshotEntry]:
+    """读取上一轮快照（用于失败时沿用旧数据）"""
+    previous: dict[int, QuotaSnapshotEntry] = {}
+    raw_map = await redis.hgetall(SNAPSHOT_KEY)
+    for field, raw in raw_map.items():
+        try:
+            previous[int(field)] = QuotaSnapshotEntry.from_json(raw)
+        except (TypeError, ValueError) as exc:
+            logger.debug("忽略无法解析的额度快照 %s: %s", field, exc)
+    return previous
+
+
+async def refresh_quota_snapshot(db: AsyncSession) -> dict:
+    """
+    轮询全部参赛者额度并写入快照
+
+    互斥由调度器的领导者选举与任务锁保证，这里不再加锁。
+
+    Returns:
+        本轮统计
+    """
+    interval = max(1, settings.QUOTA_SNAPSHOT_INTERVAL_SECONDS)
+    redis = await get_redis()
+
+    started = time.monotonic()
+    result = await db.execute(
+        select(Registration.id, Registration.api_key).where(
+            Registration.status.in_(SNAPSHOT_REGISTRATION_STATUSES),
+            Registration.api_key.isnot(None),
+            Registration.api_key != "",
+        )
+    )
+    api_keys = [(row.id, row.api_key) for row in result.all()]
+    # 上游查询开始时间：本轮成功的数据不早于此刻
+    fetched_at = time.time()
+    quota_map = await quota_service.batch_get_quota(api_keys, use_cache=False) if api_keys else {}
+    previous = await _load_previous(redis)
+
+    now = time.time()
+    entries: dict[str, str] = {}
+    ok_count = 0
+    for reg_id, api_key in api_keys:
+        key_fp = QuotaService.fingerprint(api_key)
+        info = quota_map.get(reg_id)
+        if info is not None:
+            ok_count += 1
+            entry = QuotaSnapshotEntry(info=info, key_fp=key_fp, ok=True, checked_at=now, updated_at=fetched_at)
+        else:
+            # 查询失败：同一个 key 沿用上次成功的数据，由 updated_at 体现陈旧程度
+            old = previous.get(reg_id)
+            if old is not None and old.key_fp == key_fp and old.info is not None:
+                entry = QuotaSnapshotEntry(
+                    info=old.info, key_fp=key_fp, ok=False, checked_at=now, updated_at=old.updated_at
+                )
+            else:
+                entry = QuotaSnapshotEntry(info=None, key_fp=key_fp, ok=False, checked_at=now, updated_at=None)
+        entries[str(reg_id)] = entry.to_json()
+
+    meta = {
+        "refreshed_at": now,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "total": len(api_keys),
+        "ok_count": ok_count,
+        "error_count": len(api_keys) - ok_count,
+    }
+    ttl = max(interval, settings.QUOTA_SNAPSHOT_TTL_SECONDS)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(SNAPSHOT_KEY)
+        if entries:
+            pipe.hset(SNAPSHOT_KEY, mapping=entries)
+            pipe.expire(SNAPSHOT_KEY, ttl)
+        pipe.set(SNAPSHOT_META_KEY, json.dumps(meta), ex=ttl)
+        await pipe.execute()
+    return meta
+
+
+async def load_quota_snapshot(
+    registration_ids: list[int],
+) -> tuple[dict[int, QuotaSnapshotEntry], Optional[dict]]:
+    """
+    读取指定报名的额度快照
+
+    Returns:
+        (快照条目, 轮询元信息)；快照不存在或 Redis 不可用时元信息为 None
+    """
+    if not registration_ids:
+        return {}, None
+    try:
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.get(SNAPSHOT_META_KEY)
+            pipe.hmget(SNAPSHOT_KEY, [str(reg_id) for reg_id in registration_ids])
+            raw_meta, raw_entries = await pipe.execute()
+    except Exception as exc:
+        logger.warning("读取额度快照失败，回退实时查询: %s", exc)
+        return {}, None
+    if not raw_meta:
+        return {}, None
+
+    entries: dict[int, QuotaSnapshotEntry] = {}
+    for reg_id, raw in zip(registration_ids, raw_entries):
+        if not raw:
+            continue
+        try:
+            entries[reg_id] = QuotaSnapshotEntry.from_json(raw)
+        except (TypeError, ValueError) as exc:
+            logger.debug("忽略无法解析的额度快照 %s: %s", reg_id, exc)
+    return entries, json.loads(raw_meta)
+
+
+async def get_quota_map_from_snapshot(
+    api_keys: list[tuple[int, str]],
+) -> tuple[dict[int, Optional[QuotaInfo]], dict]:
+    """
+    优先从快照获取额度，快照缺失（新报名/换 key/轮询未运行）的部分实时查询
+
+    Returns:
+        ({registration_id: QuotaInfo | None}, 新鲜度元信息)
+    """
+    entries, meta = await load_quota_snapshot([reg_id for reg_id, _ in api_keys])
+
+    quota_map: dict[int, Optional[QuotaInfo]] = {}
+    updated_times: list[float] = []
+    missing: list[tuple[int, str]] = []
+    for reg_id, api_key in api_keys:
+        entry = entries.get(reg_id)
+        if entry is None or entry.key_fp != QuotaService.fingerprint(api_key):
+            missing.append((reg_id, api_key))
+            continue
+        quota_map[reg_id] = entry.info
+        if entry.info is not None and entry.updated_at:
+            updated_times.append(entry.updated_at)
+
+    if missing:
+        quota_map.update(await quota_service.batch_get_quota(missing))
+
+    now = time.time()
+    refreshed_at = meta.get("refreshed_at") if meta else None
+    oldest = min(updated_times) if updated_times else None
+    stale_after = max(1, settings.QUOTA_SNAPSHOT_INTERVAL_SECONDS) * 2
+    if not meta:
+        source = "live"
+    elif missing:
+        source = "mixed"
+    else:
+        source = "snapshot"
+
+    freshness = {
+        "source": source,
+        "refreshed_at": _iso(refreshed_at),
+        "age_seconds": int(now - refreshed_at) if refreshed_at else 0,
+        "oldest_data_at": _iso(oldest),
+        "is_stale": bool(refreshed_at and now - refreshed_at > stale_after),
+        "live_count": len(missing),
+        "interval_seconds": settings.QUOTA_SNAPSHOT_INTERVAL_SECONDS,
+    }
+    return quota_map, freshness
@@ -0,0 +1,178 @@
+"""
+请求日志批量写入管道
+
+中间件只负责把日志行放入进程内有界缓冲区，由后台 flusher 按批量大小或时间间隔
+使用一条多行 INSERT 写入 request_logs，避免每个请求都额外开一次事务。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import random
+from collections import deque
+from typing import Any, Optional
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.request_log import RequestLog
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLogBuffer:
+    """
+    请求日志缓冲区
+
+    - 缓冲区有上限，写满后直接丢弃（计入 dropped）
+    - 超过高水位后，对 4xx/5xx 以外的请求按比例采样（计入 sampled_out）
+    - 达到批量大小立即唤醒 flusher，否则按间隔定时刷写
+    - 关闭时把剩余日志全部写完
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        high_watermark: float,
+        overload_sample_rate: float,
+    ):
+        self.max_size = max(1, max_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.05, flush_interval)
+        self.high_watermark = max(1, int(self.max_size * high_watermark))
+        self.overload_sample_rate = min(1.0, max(0.0, overload_sample_rate))
+
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed = 0
+        self.batches = 0
+
+    def enqueue(self, row: dict[str, Any]) -> bool:
+        """放入一条日志（不阻塞请求），返回是否被接收"""
+        size = len(self._buffer)
+        if size >= self.max_size:
+            self.dropped += 1
+            return False
+        if (
+            size >= self.high_watermark
+            and (row.get("status_code") or 0) < 400
+            and random.random() >= self.overload_sample_rate
+        ):
+            self.sampled_out += 1
+            return False
+
+        self._buffer.append(row)
+        self.queued += 1
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        """启动后台 flusher（需在事件循环内调用）"""
+        self._stopping = False
+        self._ensure_started()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """停止 flusher 并刷写剩余日志"""
+        self._stopping = True
+        task = self._task
+        if task is not None and not task.done():
+            if self._wakeup is not None:
+                self._wakeup.set()
+            try:
+                await asyncio.wait_for(task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("请求日志 flusher 未在 %ss 内退出，强制取消", timeout)
+                task.cancel()
+        self._task = None
+        self._wakeup = None
+        await self.flush_all()
+
+    async def flush_all(self) -> None:
+        """把缓冲区中的日志全部写入数据库"""
+        while self._buffer:
+            await self._flush_batch(self._take_batch())
+
+    def stats(self) -> dict[str, Any]:
+        """管道计数器"""
+        return {
+            "pending": len(self._buffer),
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "failed": self.failed,
+            "batches": self.batches,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    def _ensure_started(self) -> None:
+        if self._stopping:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wakeup = asyncio.Event()
+        # 使用空上下文启动，避免继承首个请求的 SQL 统计等上下文变量
+        self._task = loop.create_task(
+            self._run(), name="request-log-flusher", context=contextvars.Context()
+        )
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        count = min(self.batch_size, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(count)]
+
+    async def _run(self) -> None:
+        wakeup = self._wakeup
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            while self._buffer:
+                await self._flush_batch(self._take_batch())
+                if len(self._buffer) < self.batch_size and not self._stopping:
+                    break
+
+    async def _flush_batch(self, rows: list[dict[str, Any]]) -> None:
+        if not rows:
+            return
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(RequestLog).values(rows))
+                await session.commit()
+            self.flushed += len(rows)
+            self.batches += 1
+        except Exception as e:
+            # 日志写入失败不应影响主流程
+            self.failed += len(rows)
+            logger.warning(f"Failed to flush {len(rows)} request logs: {e}")
+
+
+request_log_buffer = RequestLogBuffer(
+    max_size=settings.REQUEST_LOG_BUFFER_SIZE,
+    batch_size=settings.REQUEST_LOG_BATCH_SIZE,
+    flush_interval=settings.REQUEST_LOG_FLUSH_INTERVAL_SECONDS,
+    high_watermark=settings.REQUEST_LOG_HIGH_WATERMARK,
+    overload_sample_rate=settings.REQUEST_LOG_OVERLOAD_SAMPLE_RATE,
+)
@@ -2,138 +2,96 @@
 定时任务调度器
 
 使用 APScheduler 实现定时任务：
-- 每小时同步所有选手的 GitHub 数据
+- 每小时同步所有选手的 GitHub 数据（启动时续跑中断的一轮）
 - 每日生成战报
+- 比赛阶段在时间边界由一次性定时器切换（低频全量对账兜底）
+- 定时对账作品票数计数缓存
+- 定时轮询参赛者额度快照
+
+多进程部署时所有进程都会创建调度器，但只有通过 Redis 选主成为领导者的进程会触发任务；
+每个任务执行前再获取任务级互斥锁，执行记录写入 Redis（见 scheduler_coordination）。
+SCHEDULER_MODE=external 时 API 进程不运行调度器，由 `python -m app.scheduler` 独立进程执行。
 """
+import asyncio
 import logging
+import time
 from datetime import date, datetime
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import async_session_maker
-from app.models.contest import Contest, ContestPhase
-from app.models.registration import Registration, RegistrationStatus
-from app.models.github_stats import GitHubStats, GitHubSyncLog
-from app.services.github_service import github_service, GitHubService
+from app.core.redis import get_redis
+from app.models.contest import Contest
+from app.models.github_stats import GitHubStats
+from app.services.contest_cache import invalidate_contest
+from app.services.contest_phase import apply_contest_phase, next_phase_boundary
+from app.services.github_sync import run_github_sync
+from app.services.quota_snapshot import refresh_quota_snapshot
+from app.services.scheduler_coordination import (
+    acquire_job_lock,
+    acquire_leadership,
+    record_job_run,
+    release_job_lock,
+    release_leadership,
+    renew_job_lock,
+)
+from app.services.vote_counter import reconcile_vote_counts
 
 logger = logging.getLogger(__name__)
 
 # 全局调度器实例
 scheduler: Optional[AsyncIOScheduler] = None
+# 选主循环
+_leader_task: Optional[asyncio.Task] = None
+# 比赛阶段重新规划订阅（仅领导者）
+_replan_task: Optional[asyncio.Task] = None
+_is_leader = False
+
+# 全部任务 ID（管理接口查询执行记录用）
+JOB_IDS = (
+    "sync_github_stats",
+    "resume_github_sync",
+    "daily_report",
+    "sync_contest_phases",
+    "contest_phase_transition",
+    "reconcile_vote_counts",
+    "poll_quota_snapshot",
+)
 
 
 async def sync_all_github_stats():
     """
     同步所有选手的 GitHub 数据
 
-    遍历所有已提交/已通过的报名，拉取他们的 GitHub 统计数据。
+    由同步引擎并发拉取已提交/已通过报名的 GitHub 统计数据；
+    上一轮因重启或限额中断时先续跑未完成的报名。
     """
     logger.info("开始同步所有选手的 GitHub 数据...")
-
-    async with async_session_maker() as db:
-        try:
-            # 获取所有需要同步的报名
-            query = select(Registration).where(
-                Registration.status.in_([
-                    RegistrationStatus.SUBMITTED.value,
-                    RegistrationStatus.APPROVED.value,
-                ])
-            )
-            result = await db.execute(query)
-            registrations = result.scalars().all()
-
-            logger.info(f"找到 {len(registrations)} 个需要同步的报名")
-
-            today = date.today()
-            success_count = 0
-            fail_count = 0
-
-            for reg in registrations:
-                try:
-                    # 从报名信息中获取 repo_url
-                    repo_url = reg.repo_url
-                    if not repo_url:
-                        logger.debug(f"报名 {reg.id} 没有设置 repo_url，跳过")
-                        continue
-
-                    parsed = GitHubService.parse_repo_url(repo_url)
-                    if not parsed:
-                        logger.warning(f"报名 {reg.id} 的 repo_url 无效: {repo_url}")
-                        continue
-
-                    owner, repo = parsed
-
-                    # 获取每日统计
-                    daily_stats = await github_service.get_daily_stats(owner, repo, today)
-
-                    # 检查是否已存在记录
-                    existing_query = select(GitHubStats).where(
-                        GitHubStats.registration_id == reg.id,
-                        GitHubStats.stat_date == today,
-                    )
-                    existing_result = await db.execute(existing_query)
-                    existing = existing_result.scalar_one_or_none()
-
-                    if existing:
-                        # 更新现有记录
-                        existing.commits_count = daily_stats["commits_count"]
-                        existing.additions = daily_stats["additions"]
-                        existing.deletions = daily_stats["deletions"]
-                        existing.files_changed = daily_stats["files_changed"]
-                        existing.commits_detail = daily_stats["commits_detail"]
-                        existing.hourly_activity = daily_stats["hourly_activity"]
-                    else:
-                        # 创建新记录
-                        new_stat = GitHubStats(
-                            registration_id=reg.id,
-                            stat_date=today,
-                            repo_url=repo_url,
-                            repo_owner=owner,
-                            repo_name=repo,
-                            commits_count=daily_stats["commits_count"],
-                            additions=daily_stats["additions"],
-                            deletions=daily_stats["deletions"],
-                            files_changed=daily_stats["files_changed"],
-                            commits_detail=daily_stats["commits_detail"],
-                            hourly_activity=daily_stats["hourly_activity"],
-                        )
-                        db.add(new_stat)
-
-                    # 记录同步日志
-                    sync_log = GitHubSyncLog(
-                        registration_id=reg.id,
-                        sync_type="hourly",
-                        status="success",
-                        api_calls_used=1 + daily_stats["commits_count"],
-                    )
-                    db.add(sync_log)
-
-                    success_count += 1
-                    logger.debug(f"报名 {reg.id} 同步成功: {daily_stats['commits_count']} commits")
-
-                except Exception as e:
-                    fail_count += 1
-                    logger.error(f"报名 {reg.id} 同步失败: {e}")
-
-                    # 记录失败日志
-                    sync_log = GitHubSyncLog(
-                        registration_id=reg.id,
-                        sync_type="hourly",
-                        status="failed",
-                        error_message=str(e)[:500],
-                    )
-                    db.add(sync_log)
-
-            await db.commit()
-            logger.info(f"GitHub 数据同步完成: 成功 {success_count}, 失败 {fail_count}")
-
-        except Exception as e:
-            logger.error(f"GitHub 数据同步任务异常: {e}")
-            await db.rollback()
+    processed = 0
+    for summary in await run_github_sync("hourly"):
+        logger.info(
+            f"GitHub 数据同步 {summary['run_id']}（{summary['target_date']}）"
+            f"{'完成' if summary['completed'] else '中止'}: "
+            f"成功 {summary['success']}, 失败 {summary['failed']}, 跳过 {summary['skipped']}"
+        )
+        processed += summary["success"]
+    return processed
+
+
+async def resume_github_sync():
+    """续跑中断的 GitHub 同步（成为领导者时执行一次）"""
+    processed = 0
+    for summary in await run_github_sync(resume_only=True):
+        logger.info(f"GitHub 数据同步 {summary['run_id']} 续跑结束: {summary}")
+        processed += summary["success"]
+    return processed
 
 
 async def generate_daily_report():
@@ -155,7 +113,7 @@ async def generate_daily_report():
 
             if not stats:
                 logger.info("今日暂无统计数据")
-                return
+                return 0
 
             # 找出各项第一名
             most_commits = max(stats, key=lambda s: s.commits_count, default=None)
@@ -183,92 +141,221 @@ async def generate_daily_report():
 
             # TODO: 可以将战报存储到数据库或推送到前端
             # TODO: 可以发送通知（邮件、微信等）
+            return len(stats)
+
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def sync_contest_phases():
+    """
+    对账比赛阶段并重新规划定时器
+
+    阶段切换由每个比赛下一个时间边界上的一次性定时器触发；
+    这里低频全量检查一次，兜底修正漏掉的切换与丢失的重新规划通知。
+    """
+    async with async_session_maker() as db:
+        try:
+            result = await db.execute(select(Contest).where(Contest.auto_phase_enabled.is_(True)))
+            contests = result.scalars().all()
 
-        except Exception as e:
-            logger.error(f"生成每日战报异常: {e}")
+            now = datetime.now()
+            changed = [contest for contest in contests if apply_contest_phase(contest, now)]
+            if changed:
+                await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
 
+    for contest in changed:
+        await invalidate_contest(contest.id)
+    for contest in contests:
+        _plan_contest_timer(contest.id, next_phase_boundary(contest, now))
+    logger.info("比赛阶段对账完成：%s 个比赛，更新 %s 个", len(contests), len(changed))
+    return len(changed)
 
-def resolve_contest_phase(contest: Contest, now: datetime) -> Optional[str]:
-    """根据时间配置计算比赛阶段（无时间配置则返回 None）"""
-    if not any([
-        contest.signup_start,
-        contest.signup_end,
-        contest.submit_start,
-        contest.submit_end,
-        contest.vote_start,
-        contest.vote_end,
-    ]):
-        return None
 
-    if contest.vote_end and now >= contest.vote_end:
-        return ContestPhase.ENDED.value
+async def transition_contest_phase(contest_id: int):
+    """比赛阶段定时器：按当前时间写回阶段，并规划下一个边界"""
+    async with async_session_maker() as db:
+        try:
+            contest = await db.get(Contest, contest_id)
+            if contest is None:
+                return 0
+            now = datetime.now()
+            changed = apply_contest_phase(contest, now)
+            if changed:
+                await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
 
-    if contest.vote_start and now >= contest.vote_start:
-        if contest.vote_end is None or now < contest.vote_end:
-            return ContestPhase.VOTING.value
+    if changed:
+        await invalidate_contest(contest_id)
+    _plan_contest_timer(contest_id, next_phase_boundary(contest, now))
+    return 1 if changed else 0
 
-    if contest.submit_start and now >= contest.submit_start:
-        if contest.submit_end is None or now < contest.submit_end:
-            return ContestPhase.SUBMISSION.value
 
-    if contest.signup_start and now >= contest.signup_start:
-        if contest.signup_end is None or now < contest.signup_end:
-            return ContestPhase.SIGNUP.value
+def _plan_contest_timer(contest_id: int, run_at: Optional[datetime]) -> None:
+    """注册（或取消）比赛的一次性阶段切换定时器"""
+    if scheduler is None:
+        return
+    job_id = f"contest_phase:{contest_id}"
+    if run_at is None:
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+        return
 
-    if contest.submit_end and now >= contest.submit_end and contest.vote_start is None:
-        return ContestPhase.ENDED.value
+    async def transition():
+        return await transition_contest_phase(contest_id)
 
-    if contest.signup_end and now >= contest.signup_end and contest.submit_start is None and contest.vote_start is None:
-        return ContestPhase.ENDED.value
+    transition.__name__ = f"transition_contest_phase_{contest_id}"
+    scheduler.add_job(
+        _guarded("contest_phase_transition", transition, lock_id=job_id),
+        DateTrigger(run_date=run_at),
+        id=job_id,
+        name=f"比赛阶段切换 #{contest_id}",
+        misfire_grace_time=None,
+        replace_existing=True,
+    )
 
-    starts = [value for value in [contest.signup_start, contest.submit_start, contest.vote_start] if value]
-    if starts and now < min(starts):
-        return ContestPhase.UPCOMING.value
 
-    return ContestPhase.UPCOMING.value
+async def _contest_replan_listener() -> None:
+    """订阅比赛时间变更通知，立即重新计算该比赛的阶段与定时器（仅领导者运行）"""
+    while True:
+        pubsub = None
+        try:
+            redis_client = await get_redis()
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(settings.CONTEST_PHASE_CHANNEL)
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                try:
+                    contest_id = int(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                _plan_contest_timer(contest_id, datetime.now())
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("比赛阶段通知订阅异常，1 秒后重连: %s", exc)
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
 
 
-async def sync_contest_phases():
+async def reconcile_submission_vote_counts():
     """
-    同步比赛阶段
+    对账作品票数
 
-    根据比赛配置的时间窗口自动更新阶段。
+    以 votes 表为准修复 submissions.vote_count 的偏差。
     """
-    logger.info("开始同步比赛阶段...")
+    async with async_session_maker() as db:
+        try:
+            fixed = await reconcile_vote_counts(db)
+            if fixed:
+                await db.commit()
+                logger.warning("作品票数对账完成：修复 %s 个", fixed)
+            return fixed
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def poll_quota_snapshot():
+    """
+    轮询参赛者额度快照
 
+    查询全部参赛者的额度写入 Redis，排行榜与监控接口直接读取。
+    """
     async with async_session_maker() as db:
+        meta = await refresh_quota_snapshot(db)
+        logger.info(
+            "额度快照刷新完成：%s 个，失败 %s 个，耗时 %sms",
+            meta["total"],
+            meta["error_count"],
+            meta["duration_ms"],
+        )
+        return meta["total"]
+
+
+async def _record_run(job_id: str, started_at: datetime, started: float, outcome: str, **fields) -> None:
+    try:
+        await record_job_run(
+            job_id,
+            started_at=started_at,
+            duration_seconds=time.perf_counter() - started,
+            outcome=outcome,
+            **fields,
+        )
+    except Exception as exc:
+        logger.warning("写入定时任务执行记录失败: job=%s, error=%s", job_id, exc)
+
+
+async def _keep_job_lock(lock_id: str, token: str) -> None:
+    """执行期间续期任务锁"""
+    lease = settings.SCHEDULER_JOB_LOCK_SECONDS
+    while True:
+        await asyncio.sleep(max(1, lease // 3))
         try:
-            result = await db.execute(select(Contest))
-            contests = result.scalars().all()
-            if not contests:
-                logger.info("没有需要同步的比赛")
+            if not await renew_job_lock(lock_id, token, lease):
+                logger.warning("定时任务锁已失效: %s", lock_id)
                 return
+        except Exception as exc:
+            logger.warning("续期定时任务锁失败: lock=%s, error=%s", lock_id, exc)
 
-            now = datetime.now()
-            updated = 0
-            for contest in contests:
-                if hasattr(contest, "auto_phase_enabled") and not contest.auto_phase_enabled:
-                    continue
-                target_phase = resolve_contest_phase(contest, now)
-                if not target_phase:
-                    continue
-                if contest.phase != target_phase:
-                    logger.info(
-                        "比赛 %s 阶段变更：%s -> %s",
-                        contest.id,
-                        contest.phase,
-                        target_phase,
-                    )
-                    contest.phase = target_phase
-                    updated += 1
-
-            if updated:
-                await db.commit()
-            logger.info("比赛阶段同步完成：更新 %s 个", updated)
 
-        except Exception as e:
-            logger.error(f"比赛阶段同步异常: {e}")
-            await db.rollback()
+def _guarded(
+    job_id: str,
+    func: Callable[[], Awaitable[Optional[int]]],
+    lock_id: Optional[str] = None,
+) -> Callable[[], Awaitable[None]]:
+    """
+    包装定时任务：仅领导者执行，执行前获取任务锁，结束后写入执行记录
+
+    lock_id 用于多个任务共享同一把锁（如 GitHub 同步与续跑）。
+    """
+    lock_id = lock_id or job_id
+
+    async def run() -> None:
+        if not _is_leader:
+            return
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            token = await acquire_job_lock(lock_id, settings.SCHEDULER_JOB_LOCK_SECONDS)
+        except Exception as exc:
+            logger.warning("获取定时任务锁失败，本次跳过: job=%s, error=%s", job_id, exc)
+            return
+        if token is None:
+            logger.info("定时任务 %s 仍在执行，本次跳过", job_id)
+            await _record_run(job_id, started_at, started, "skipped")
+            return
+
+        keeper = asyncio.create_task(_keep_job_lock(lock_id, token))
+        try:
+            items = await func()
+        except Exception as exc:
+            logger.exception("定时任务 %s 执行异常", job_id)
+            await _record_run(job_id, started_at, started, "failed", error=str(exc))
+        else:
+            await _record_run(job_id, started_at, started, "success", items=items)
+        finally:
+            keeper.cancel()
+            try:
+                await release_job_lock(lock_id, token)
+            except Exception as exc:
+                logger.warning("释放定时任务锁失败: lock=%s, error=%s", lock_id, exc)
+
+    run.__name__ = func.__name__
+    return run
 
 
 def init_scheduler():
@@ -279,7 +366,7 @@ def init_scheduler():
 
     # 每小时整点同步 GitHub 数据
     scheduler.add_job(
-        sync_all_github_stats,
+        _guarded("sync_github_stats", sync_all_github_stats),
         CronTrigger(minute=0),  # 每小时的第0分钟
         id="sync_github_stats",
         name="同步GitHub数据",
@@ -288,42 +375,144 @@ def init_scheduler():
 
     # 每天 23:55 生成每日战报
     scheduler.add_job(
-        generate_daily_report,
+        _guarded("daily_report", generate_daily_report),
         CronTrigger(hour=23, minute=55),
         id="daily_report",
         name="生成每日战报",
         replace_existing=True,
     )
 
-    # 每分钟同步比赛阶段
+    # 定期对账比赛阶段并规划切换定时器（当选领导者后立即执行一次）
     scheduler.add_job(
-        sync_contest_phases,
-        CronTrigger(minute="*/1"),
+        _guarded("sync_contest_phases", sync_contest_phases),
+        IntervalTrigger(minutes=max(1, settings.CONTEST_PHASE_RECONCILE_MINUTES)),
         id="sync_contest_phases",
-        name="同步比赛阶段",
+        name="对账比赛阶段",
         replace_existing=True,
     )
 
+    # 每 10 分钟对账作品票数
+    scheduler.add_job(
+        _guarded("reconcile_vote_counts", reconcile_submission_vote_counts),
+        CronTrigger(minute="*/10"),
+        id="reconcile_vote_counts",
+        name="对账作品票数",
+        replace_existing=True,
+    )
+
+    # 按配置间隔轮询额度快照（当选领导者后立即执行一次）
+    if settings.QUOTA_SNAPSHOT_INTERVAL_SECONDS > 0:
+        scheduler.add_job(
+            _guarded("poll_quota_snapshot", poll_quota_snapshot),
+            IntervalTrigger(seconds=settings.QUOTA_SNAPSHOT_INTERVAL_SECONDS),
+            id="poll_quota_snapshot",
+            name="轮询额度快照",
+            replace_existing=True,
+        )
+
     logger.info("定时任务调度器初始化完成")
     return scheduler
 
 
-def start_scheduler():
-    """启动定时任务调度器"""
-    global scheduler
+def _on_elected() -> None:
+    """成为领导者：恢复调度，并立即执行启动类任务"""
+    global _is_leader, _replan_task
+    _is_leader = True
+    now = datetime.now()
+    # 续跑中断的 GitHub 同步（与整点同步共用任务锁）
+    scheduler.add_job(
+        _guarded("resume_github_sync", resume_github_sync, lock_id="sync_github_stats"),
+        id="resume_github_sync",
+        name="续跑GitHub同步",
+        next_run_time=now,
+        replace_existing=True,
+    )
+    for job_id in ("sync_contest_phases", "poll_quota_snapshot"):
+        if scheduler.get_job(job_id):
+            scheduler.modify_job(job_id, next_run_time=now)
+    if _replan_task is None:
+        _replan_task = asyncio.create_task(_contest_replan_listener())
+    scheduler.resume()
+    logger.info("当选定时任务领导者，开始调度")
+
+
+def _on_demoted() -> None:
+    """失去领导者：暂停调度（已在执行的任务由任务锁保护）"""
+    global _is_leader
+    _is_leader = False
+    scheduler.pause()
+    _stop_replan_listener()
+    logger.warning("失去定时任务领导者身份，暂停调度")
+
+
+def _stop_replan_listener() -> None:
+    global _replan_task
+    if _replan_task is not None:
+        _replan_task.cancel()
+        _replan_task = None
+
+
+async def _leadership_loop() -> None:
+    """选主循环：按租约 1/3 间隔竞选/续期"""
+    interval = max(1.0, settings.SCHEDULER_LEADER_LEASE_SECONDS / 3)
+    while True:
+        try:
+            elected = await acquire_leadership()
+        except Exception as exc:
+            # 无法确认租约时视为失去领导者，避免与其他进程重复执行
+            logger.warning("定时任务选主失败: %s", exc)
+            elected = False
+        if elected and not _is_leader:
+            _on_elected()
+        elif not elected and _is_leader:
+            _on_demoted()
+        await asyncio.sleep(interval)
+
+
+def start_scheduler(standalone: bool = False):
+    """
+    启动定时任务调度器（需在事件循环中调用）
+
+    调度器以暂停状态启动，竞选成为领导者后才开始触发任务。
+    standalone=True 表示独立调度进程，忽略 SCHEDULER_MODE。
+    """
+    global scheduler, _leader_task
+
+    if not standalone and settings.SCHEDULER_MODE == "external":
+        logger.info("SCHEDULER_MODE=external，本进程不运行定时任务")
+        return
 
     if scheduler is None:
         scheduler = init_scheduler()
 
     if not scheduler.running:
-        scheduler.start()
-        logger.info("定时任务调度器已启动")
+        scheduler.start(paused=True)
+        logger.info("定时任务调度器已启动，等待选主")
 
+    if _leader_task is None:
+        _leader_task = asyncio.create_task(_leadership_loop())
 
-def shutdown_scheduler():
-    """关闭定时任务调度器"""
-    global scheduler
+
+async def shutdown_scheduler():
+    """关闭定时任务调度器，并让出领导者身份"""
+    global _leader_task, _is_leader
+
+    if _leader_task is not None:
+        _leader_task.cancel()
+        try:
+            await _leader_task
+        except asyncio.CancelledError:
+            pass
+        _leader_task = None
+    _stop_replan_listener()
 
     if scheduler and scheduler.running:
-        scheduler.shutdown()
+        scheduler.shutdown(wait=False)
         logger.info("定时任务调度器已关闭")
+
+    if _is_leader:
+        _is_leader = False
+        try:
+            await release_leadership()
+        except Exception as exc:
+            logger.warning("让出定时任务领导者失败: %s", exc)
@@ -0,0 +1,166 @@
+"""
+定时任务集群协调（Redis）
+
+多个 API 进程 / 独立调度进程同时运行调度器时：
+- {prefix}:leader            领导者租约（SET NX PX + 续期），只有领导者触发定时任务
+- {prefix}:lock:{job_id}     任务级互斥（带租约，执行期间续期），防止领导者切换时同一任务重叠执行
+- {prefix}:history:{job_id}  最近执行记录（耗时、结果、处理条数），按 SCHEDULER_HISTORY_LIMIT 截断
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+from app.core.config import settings
+from app.core.redis import get_redis, get_script
+
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_RENEW_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 本进程标识（领导者租约与执行记录中使用）
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _key(suffix: str) -> str:
+    return f"{settings.SCHEDULER_KEY_PREFIX}:{suffix}"
+
+
+def leader_key() -> str:
+    return _key("leader")
+
+
+def job_lock_key(job_id: str) -> str:
+    return _key(f"lock:{job_id}")
+
+
+def job_history_key(job_id: str) -> str:
+    return _key(f"history:{job_id}")
+
+
+async def acquire_leadership() -> bool:
+    """尝试成为领导者（已是领导者时续期）"""
+    lease_ms = settings.SCHEDULER_LEADER_LEASE_SECONDS * 1000
+    redis_client = await get_redis()
+    if await redis_client.set(leader_key(), INSTANCE_ID, nx=True, px=lease_ms):
+        return True
+    return await renew_leadership()
+
+
+async def renew_leadership() -> bool:
+    """续期领导者租约（已易主时返回 False）"""
+    await get_redis()
+    renewed = await get_script("scheduler_renew_lock", _RENEW_LOCK_LUA)(
+        keys=[leader_key()],
+        args=[INSTANCE_ID, settings.SCHEDULER_LEADER_LEASE_SECONDS * 1000],
+    )
+    return bool(renewed)
+
+
+async def release_leadership() -> None:
+    """主动让出领导者（退出时调用，其他进程无需等待租约过期）"""
+    await get_redis()
+    await get_script("scheduler_release_lock", _RELEASE_LOCK_LUA)(
+        keys=[leader_key()],
+        args=[INSTANCE_ID],
+    )
+
+
+async def acquire_job_lock(job_id: str, lease_seconds: int) -> Optional[str]:
+    """获取任务互斥锁，被占用时返回 None"""
+    token = f"{INSTANCE_ID}:{uuid.uuid4().hex[:8]}"
+    redis_client = await get_redis()
+    acquired = await redis_client.set(job_lock_key(job_id), token, nx=True, px=lease_seconds * 1000)
+    return token if acquired else None
+
+
+async def renew_job_lock(job_id: str, token: str, lease_seconds: int) -> bool:
+    """续期任务锁（锁已易主时返回 False）"""
+    await get_redis()
+    renewed = await get_script("scheduler_renew_lock", _RENEW_LOCK_LUA)(
+        keys=[job_lock_key(job_id)],
+        args=[token, lease_seconds * 1000],
+    )
+    return bool(renewed)
+
+
+async def release_job_lock(job_id: str, token: str) -> None:
+    """释放任务锁（仅释放自己持有的锁）"""
+    await get_redis()
+    await get_script("scheduler_release_lock", _RELEASE_LOCK_LUA)(
+        keys=[job_lock_key(job_id)],
+        args=[token],
+    )
+
+
+async def record_job_run(
+    job_id: str,
+    *,
+    started_at: datetime,
+    duration_seconds: float,
+    outcome: str,
+    items: Optional[int] = None,
+    error: Optional[str] = None,
+) -> None:
+    """写入任务执行记录（最新在前）"""
+    entry = {
+        "job_id": job_id,
+        "instance": INSTANCE_ID,
+        "started_at": started_at.isoformat(),
+        "duration_ms": int(duration_seconds * 1000),
+        "outcome": outcome,
+        "items": items,
+        "error": error[:500] if error else None,
+    }
+    limit = max(1, settings.SCHEDULER_HISTORY_LIMIT)
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lpush(job_history_key(job_id), json.dumps(entry, ensure_ascii=False))
+        pipe.ltrim(job_history_key(job_id), 0, limit - 1)
+        await pipe.execute()
+
+
+async def get_scheduler_status(job_ids: list[str], history_limit: int) -> dict[str, Any]:
+    """获取当前领导者、任务锁占用与最近执行记录"""
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(leader_key())
+        pipe.pttl(leader_key())
+        for job_id in job_ids:
+            pipe.get(job_lock_key(job_id))
+            pipe.lrange(job_history_key(job_id), 0, max(0, history_limit - 1))
+        results = await pipe.execute()
+
+    leader, leader_ttl_ms = results[0], results[1]
+    jobs = {}
+    for index, job_id in enumerate(job_ids):
+        lock_holder = results[2 + index * 2]
+        history = [json.loads(item) for item in results[3 + index * 2]]
+        jobs[job_id] = {
+            "running_on": lock_holder.rsplit(":", 1)[0] if lock_holder else None,
+            "last_run": history[0] if history else None,
+            "history": history,
+        }
+    return {
+        "leader": leader,
+        "leader_ttl_ms": leader_ttl_ms if leader_ttl_ms and leader_ttl_ms > 0 else None,
+        "instance": INSTANCE_ID,
+        "checked_at": int(time.time()),
+        "jobs": jobs,
+    }
@@ -10,11 +10,11 @@ import secrets
 from typing import Any, Optional
 
 from fastapi import HTTPException, Request, status
-import httpx
 
 from app.core.config import settings
+from app.core.http_client import CAPTCHA, get_http_client
 from app.core.rate_limit import get_client_ip
-from app.core.redis import get_redis, close_redis
+from app.core.redis import get_redis, get_script
 
 
 logger = logging.getLogger(__name__)
@@ -61,33 +61,37 @@ def _challenge_key(challenge_id: str) -> str:
     return f"security:challenge:data:{challenge_id}"
 
 
-async def _increment_counter(scope: str, identifier: str) -> int:
-    client = await get_redis()
-    try:
-        key = _counter_key(scope, identifier)
-        count = await client.incr(key)
-        if count == 1:
-            await client.expire(key, settings.SECURITY_CHALLENGE_WINDOW_SECONDS)
-        return int(count)
-    finally:
-        await close_redis(client)
+# 已通过挑战返回 -1，否则计数 +1（窗口内首次计数时设置过期），一次往返完成
+_CHECK_AND_COUNT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return -1
+end
+local count = redis.call('INCR', KEYS[2])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return count
+"""
 
 
-async def _mark_passed(scope: str, identifier: str) -> None:
-    client = await get_redis()
-    try:
-        await client.setex(_pass_key(scope, identifier), settings.SECURITY_CHALLENGE_PASS_TTL_SECONDS, "1")
-        await client.delete(_counter_key(scope, identifier))
-    finally:
-        await close_redis(client)
+async def _check_and_count(scope: str, identifier: str) -> Optional[int]:
+    """已通过挑战返回 None，否则返回窗口内累计次数"""
+    script = get_script("challenge_check_and_count", _CHECK_AND_COUNT_SCRIPT)
+    count = int(await script(
+        keys=[_pass_key(scope, identifier), _counter_key(scope, identifier)],
+        args=[settings.SECURITY_CHALLENGE_WINDOW_SECONDS],
+    ))
+    if count < 0:
+        return None
+    return count
 
 
-async def _has_passed(scope: str, identifier: str) -> bool:
+async def _mark_passed(scope: str, identifier: str) -> None:
     client = await get_redis()
-    try:
-        return bool(await client.get(_pass_key(scope, identifier)))
-    finally:
-        await close_redis(client)
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.setex(_pass_key(scope, identifier), settings.SECURITY_CHALLENGE_PASS_TTL_SECONDS, "1")
+        pipe.delete(_counter_key(scope, identifier))
+        await pipe.execute()
 
 
 async def _issue_pow_challenge(scope: str, identifier: str) -> dict[str, Any]:
@@ -102,14 +106,11 @@ async def _issue_pow_challenge(scope: str, identifier: str) -> dict[str, Any]:
         "difficulty": difficulty,
     }
     client = await get_redis()
-    try:
-        await client.setex(
-            _challenge_key(challenge_id),
-            settings.SECURITY_CHALLENGE_TTL_SECONDS,
-            json.dumps(payload, ensure_ascii=False),
-        )
-    finally:
-        await close_redis(client)
+    await client.setex(
+        _challenge_key(challenge_id),
+        settings.SECURITY_CHALLENGE_TTL_SECONDS,
+        json.dumps(payload, ensure_ascii=False),
+    )
     return {
         "type": "pow",
         "challenge_id": challenge_id,
@@ -130,14 +131,11 @@ async def _issue_js_challenge(scope: str, identifier: str) -> dict[str, Any]:
         "token": token,
     }
     client = await get_redis()
-    try:
-        await client.setex(
-            _challenge_key(challenge_id),
-            settings.SECURITY_CHALLENGE_TTL_SECONDS,
-            json.dumps(payload, ensure_ascii=False),
-        )
-    finally:
-        await close_redis(client)
+    await client.setex(
+        _challenge_key(challenge_id),
+        settings.SECURITY_CHALLENGE_TTL_SECONDS,
+        json.dumps(payload, ensure_ascii=False),
+    )
     return {
         "type": "js",
         "challenge_id": challenge_id,
@@ -154,14 +152,11 @@ async def _issue_captcha_challenge(scope: str, identifier: str) -> dict[str, Any
         "identifier": identifier,
     }
     client = await get_redis()
-    try:
-        await client.setex(
-            _challenge_key(challenge_id),
-            settings.SECURITY_CHALLENGE_TTL_SECONDS,
-            json.dumps(payload, ensure_ascii=False),
-        )
-    finally:
-        await close_redis(client)
+    await client.setex(
+        _challenge_key(challenge_id),
+        settings.SECURITY_CHALLENGE_TTL_SECONDS,
+        json.dumps(payload, ensure_ascii=False),
+    )
     return {
         "type": "captcha",
         "challenge_id": challenge_id,
@@ -183,23 +178,17 @@ async def _load_challenge(challenge_id: str) -> Optional[dict[str, Any]]:
     if not challenge_id:
         return None
     client = await get_redis()
-    try:
-        raw = await client.get(_challenge_key(challenge_id))
-        if not raw:
-            return None
-        return json.loads(raw)
-    finally:
-        await close_redis(client)
+    raw = await client.get(_challenge_key(challenge_id))
+    if not raw:
+        return None
+    return json.loads(raw)
 
 
 async def _consume_challenge(challenge_id: str) -> None:
     if not challenge_id:
         return
     client = await get_redis()
-    try:
-        await client.delete(_challenge_key(challenge_id))
-    finally:
-        await close_redis(client)
+    await client.delete(_challenge_key(challenge_id))
 
 
 async def _verify_pow(challenge: dict[str, Any], answer: str) -> bool:
@@ -224,15 +213,15 @@ async def _verify_captcha(request: Request) -> bool:
         logger.warning("验证码未配置，无法校验")
         return False
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                settings.CAPTCHA_VERIFY_URL,
-                data={
-                    "secret": settings.CAPTCHA_SECRET_KEY,
-                    "response": token,
-                    "remoteip": get_client_ip(request),
-                },
-            )
+        client = get_http_client(CAPTCHA)
+        resp = await client.post(
+            settings.CAPTCHA_VERIFY_URL,
+            data={
+                "secret": settings.CAPTCHA_SECRET_KEY,
+                "response": token,
+                "remoteip": get_client_ip(request),
+            },
+        )
         data = resp.json() if resp.status_code == 200 else {}
         return bool(data.get("success"))
     except Exception as exc:
@@ -274,10 +263,8 @@ async def guard_challenge(request: Request, scope: str, user_id: Optional[int] =
 
     identifier = _build_identifier(request, user_id)
     try:
-        if await _has_passed(scope, identifier):
-            return
-        count = await _increment_counter(scope, identifier)
-        if count < settings.SECURITY_CHALLENGE_THRESHOLD:
+        count = await _check_and_count(scope, identifier)
+        if count is None or count < settings.SECURITY_CHALLENGE_THRESHOLD:
             return
         if not _is_enforce():
             logger.warning("挑战触发（监控模式）: scope=%s, id=%s", scope, identifier)
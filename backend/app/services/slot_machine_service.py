@@ -5,10 +5,11 @@
 """
 import random
 import uuid
-from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from decimal import Decimal
 
-from datetime import datetime, date
 from sqlalchemy import select, delete, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,7 +18,62 @@ from app.models.slot_machine import (
     SlotWinType, SlotMachineRule, SlotRuleType
 )
 from app.models.points import PointsReason
+from app.services import daily_play_limit
+from app.services.game_config_cache import SLOT_MACHINE, get_game_config, invalidate_game_config
 from app.services.points_service import PointsService
+from app.services.prize_sampler import WeightedSampler
+
+RuleMatcher = Callable[[List[str]], Tuple[bool, Optional[str]]]
+
+_NO_MATCH: Tuple[bool, Optional[str]] = (False, None)
+
+
+@dataclass(frozen=True)
+class CachedSlotSymbol:
+    """符号快照（只读）"""
+    symbol_key: str
+    emoji: str
+    name: str
+    multiplier: int
+    weight: int
+    sort_order: int
+    is_enabled: bool
+    is_jackpot: bool
+
+
+@dataclass(frozen=True)
+class CompiledSlotRule:
+    """中奖规则快照，match 为加载时预编译的匹配函数"""
+    rule_key: str
+    rule_name: str
+    rule_type: SlotRuleType
+    multiplier: Optional[Decimal]
+    fixed_points: Optional[int]
+    min_amount: Optional[int]
+    max_amount: Optional[int]
+    match: RuleMatcher
+
+
+@dataclass(frozen=True)
+class CachedSlotConfig:
+    """老虎机配置快照：启用符号的别名表 + 按优先级排好的预编译规则"""
+    id: int
+    name: str
+    is_active: bool
+    cost_points: int
+    reels: int
+    two_kind_multiplier: Decimal
+    jackpot_symbol_key: str
+    daily_limit: Optional[int]
+    symbols: Tuple[CachedSlotSymbol, ...]
+    rules: Tuple[CompiledSlotRule, ...]
+    sampler: Optional[WeightedSampler]
+
+    def pick_symbol(self) -> CachedSlotSymbol:
+        """按权重随机选择一个符号（O(1)）"""
+        if self.sampler is None:
+            raise ValueError("老虎机符号权重配置无效")
+        return self.sampler.pick()
 
 
 class SlotMachineService:
@@ -56,34 +112,48 @@ class SlotMachineService:
     @staticmethod
     async def get_today_count(db: AsyncSession, user_id: int, config_id: int) -> int:
         """获取用户今日抽奖次数"""
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        result = await db.execute(
-            select(func.count(SlotMachineDraw.id))
-            .where(
-                and_(
-                    SlotMachineDraw.user_id == user_id,
-                    SlotMachineDraw.config_id == config_id,
-                    SlotMachineDraw.created_at >= today_start
-                )
+        return await daily_play_limit.get_play_count(db, daily_play_limit.SLOT_MACHINE, user_id, config_id)
+
+    @staticmethod
+    async def _load_cached_config(db: AsyncSession) -> Optional[CachedSlotConfig]:
+        """加载当前生效的配置，预编译符号别名表与规则匹配器"""
+        config = await SlotMachineService.get_active_config(db)
+        if not config:
+            return None
+
+        symbols = tuple(
+            CachedSlotSymbol(
+                symbol_key=s.symbol_key, emoji=s.emoji, name=s.name, multiplier=s.multiplier,
+                weight=s.weight, sort_order=s.sort_order, is_enabled=s.is_enabled, is_jackpot=s.is_jackpot,
+            )
+            for s in await SlotMachineService.get_enabled_symbols(db, config.id, include_disabled=False)
+        )
+        rules = tuple(
+            CompiledSlotRule(
+                rule_key=r.rule_key, rule_name=r.rule_name, rule_type=r.rule_type, multiplier=r.multiplier,
+                fixed_points=r.fixed_points, min_amount=r.min_amount, max_amount=r.max_amount,
+                match=SlotMachineService.compile_rule_matcher(r),
             )
+            for r in await SlotMachineService.get_enabled_rules(db, config.id)
+        )
+        return CachedSlotConfig(
+            id=config.id,
+            name=config.name,
+            is_active=config.is_active,
+            cost_points=config.cost_points,
+            reels=config.reels,
+            two_kind_multiplier=config.two_kind_multiplier,
+            jackpot_symbol_key=config.jackpot_symbol_key,
+            daily_limit=config.daily_limit,
+            symbols=symbols,
+            rules=rules,
+            sampler=WeightedSampler.build(symbols, lambda s: s.weight),
         )
-        return result.scalar() or 0
 
     @staticmethod
-    def weighted_random_pick(symbols: List[SlotMachineSymbol]) -> SlotMachineSymbol:
-        """按权重随机选择一个符号"""
-        total_weight = sum(max(0, s.weight) for s in symbols)
-        if total_weight <= 0:
-            raise ValueError("老虎机符号权重配置无效")
-
-        r = random.randint(1, total_weight)
-        cumulative = 0
-        for symbol in symbols:
-            w = max(0, symbol.weight)
-            cumulative += w
-            if r <= cumulative:
-                return symbol
-        return symbols[-1]
+    async def get_cached_config(db: AsyncSession) -> Optional[CachedSlotConfig]:
+        """获取当前生效的配置快照（进程内缓存，管理员修改配置/符号/规则后失效）"""
+        return await get_game_config(db, SLOT_MACHINE, SlotMachineService._load_cached_config)
 
     @staticmethod
     async def get_enabled_rules(
@@ -123,90 +193,89 @@ class SlotMachineService:
         return reels_keys.count(symbol_key)
 
     @staticmethod
-    def check_rule_match(
-        rule: SlotMachineRule,
-        reels_keys: List[str],
-        symbols_map: Dict[str, SlotMachineSymbol]
-    ) -> Tuple[bool, Optional[str]]:
+    def compile_rule_matcher(rule: SlotMachineRule) -> RuleMatcher:
         """
-        检查规则是否匹配
-        返回：(是否匹配, 匹配的符号key)
+        将规则预编译为匹配函数（配置加载时执行一次）
+        匹配函数入参为滚轴符号 key 列表，返回：(是否匹配, 匹配的符号key)
         """
         rule_type = rule.rule_type
         pattern = rule.pattern or []
 
         if rule_type == SlotRuleType.THREE_SAME:
             # 三连规则
-            if pattern:
+            if len(pattern) >= 3:
                 # 指定模式：完全匹配
-                if reels_keys[:3] == pattern[:3] if len(pattern) >= 3 else False:
-                    return True, pattern[0] if pattern else None
-                # 也检查无序的三个相同（如果pattern长度为1，表示任意三个该符号）
-                if len(pattern) == 1 and SlotMachineService.count_symbol(reels_keys, pattern[0]) >= 3:
-                    return True, pattern[0]
-            else:
-                # 任意三连
-                if len(reels_keys) >= 3 and reels_keys[0] == reels_keys[1] == reels_keys[2]:
-                    return True, reels_keys[0]
-            return False, None
+                head, symbol = pattern[:3], pattern[0]
+                return lambda keys: (True, symbol) if keys[:3] == head else _NO_MATCH
+            if len(pattern) == 1:
+                # pattern 长度为1，表示任意三个该符号（无序）
+                symbol = pattern[0]
+                return lambda keys: (True, symbol) if keys.count(symbol) >= 3 else _NO_MATCH
+            if pattern:
+                return lambda keys: _NO_MATCH
+            # 任意三连
+            return lambda keys: (True, keys[0]) if len(keys) >= 3 and keys[0] == keys[1] == keys[2] else _NO_MATCH
 
-        elif rule_type == SlotRuleType.TWO_SAME:
+        if rule_type == SlotRuleType.TWO_SAME:
             # 两连规则
+            if len(pattern) == 1:
+                symbol = pattern[0]
+                return lambda keys: (True, symbol) if keys.count(symbol) >= 2 else _NO_MATCH
             if pattern:
-                if len(pattern) == 1 and SlotMachineService.count_symbol(reels_keys, pattern[0]) >= 2:
-                    return True, pattern[0]
-            else:
-                # 任意两连
-                from collections import Counter
-                counts = Counter(reels_keys)
-                for k, c in counts.items():
+                return lambda keys: _NO_MATCH
+
+            # 任意两连
+            def match_any_two(keys: List[str]) -> Tuple[bool, Optional[str]]:
+                for k, c in Counter(keys).items():
                     if c >= 2:
                         return True, k
-            return False, None
-
-        elif rule_type == SlotRuleType.SPECIAL_COMBO:
-            # 特殊组合（如姬霓太美 j→n→t→m）
-            if pattern:
-                if len(pattern) <= len(reels_keys):
-                    # 检查顺序匹配
-                    if reels_keys[:len(pattern)] == pattern:
-                        return True, None
-                    # 检查无序匹配（包含所有元素）
-                    if set(pattern).issubset(set(reels_keys)) and len(set(pattern)) == len(pattern):
-                        return True, None
-            return False, None
-
-        elif rule_type == SlotRuleType.PENALTY:
-            # 惩罚规则（如律师函）
-            if pattern:
-                symbol = pattern[0] if pattern else None
-                if symbol and symbol in reels_keys:
-                    count = SlotMachineService.count_symbol(reels_keys, symbol)
-                    # 检查概率
-                    prob = float(rule.probability) if rule.probability else 1.0
-                    if random.random() < prob:
-                        return True, symbol
-            return False, None
-
-        elif rule_type == SlotRuleType.BONUS:
-            # 奖励规则（如 Man! 符号）
-            if pattern:
-                symbol = pattern[0] if pattern else None
-                if symbol and symbol in reels_keys:
-                    count = SlotMachineService.count_symbol(reels_keys, symbol)
-                    prob = float(rule.probability) if rule.probability else 1.0
-                    if random.random() < prob:
-                        return True, symbol
-            return False, None
+                return _NO_MATCH
+            return match_any_two
+
+        if rule_type == SlotRuleType.SPECIAL_COMBO:
+            # 特殊组合（如姬霓太美 j→n→t→m）：顺序匹配，或无重复元素时的无序包含
+            if not pattern:
+                return lambda keys: _NO_MATCH
+            size = len(pattern)
+            elements = set(pattern)
+            unordered = len(elements) == size
+
+            def match_combo(keys: List[str]) -> Tuple[bool, Optional[str]]:
+                if size > len(keys):
+                    return _NO_MATCH
+                if keys[:size] == pattern or (unordered and elements.issubset(keys)):
+                    return True, None
+                return _NO_MATCH
+            return match_combo
+
+        if rule_type in (SlotRuleType.PENALTY, SlotRuleType.BONUS):
+            # 惩罚规则（如律师函）/ 奖励规则（如 Man! 符号）：出现即按概率触发
+            symbol = pattern[0] if pattern else None
+            if not symbol:
+                return lambda keys: _NO_MATCH
+            prob = float(rule.probability) if rule.probability else 1.0
+            return lambda keys: (True, symbol) if symbol in keys and random.random() < prob else _NO_MATCH
+
+        return lambda keys: _NO_MATCH
 
-        return False, None
+    @staticmethod
+    def check_rule_match(
+        rule: SlotMachineRule,
+        reels_keys: List[str],
+        symbols_map: Dict[str, SlotMachineSymbol]
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        检查规则是否匹配（单次调用；抽奖热路径使用缓存中的预编译匹配函数）
+        返回：(是否匹配, 匹配的符号key)
+        """
+        return SlotMachineService.compile_rule_matcher(rule)(reels_keys)
 
     @staticmethod
     async def calculate_payout_with_rules(
         db: AsyncSession,
-        config: SlotMachineConfig,
-        reels: List[SlotMachineSymbol],
-        rules: List[SlotMachineRule]
+        config: CachedSlotConfig,
+        reels: List[CachedSlotSymbol],
+        rules: Tuple[CompiledSlotRule, ...]
     ) -> Tuple[SlotWinType, float, int, bool, str, List[Dict]]:
         """
         使用数据库规则计算中奖结果
@@ -214,7 +283,6 @@ class SlotMachineService:
         """
         cost = int(config.cost_points)
         keys = [r.symbol_key for r in reels]
-        symbols_map = {r.symbol_key: r for r in reels}
 
         matched_rules = []
         total_multiplier = 0.0
@@ -224,7 +292,7 @@ class SlotMachineService:
 
         # 按优先级顺序检查规则
         for rule in rules:
-            matched, matched_symbol = SlotMachineService.check_rule_match(rule, keys, symbols_map)
+            matched, matched_symbol = rule.match(keys)
             if matched:
                 multiplier = float(rule.multiplier) if rule.multiplier else 0
 
@@ -300,8 +368,8 @@ class SlotMachineService:
 
     @staticmethod
     def calculate_payout(
-        config: SlotMachineConfig,
-        reels: List[SlotMachineSymbol]
+        config: CachedSlotConfig,
+        reels: List[CachedSlotSymbol]
     ) -> tuple[SlotWinType, float, int, bool]:
         """
         计算中奖结果（简单版本，不使用规则）
@@ -337,11 +405,11 @@ class SlotMachineService:
     @staticmethod
     async def get_public_config(db: AsyncSession, user_id: int = None) -> Dict[str, Any]:
         """获取公开配置（用户端）"""
-        config = await SlotMachineService.get_active_config(db)
+        config = await SlotMachineService.get_cached_config(db)
         if not config:
             return {"active": False, "config": None, "symbols": [], "slot_tickets": 0}
 
-        symbols = await SlotMachineService.get_enabled_symbols(db, config.id, include_disabled=False)
+        symbols = config.symbols
 
         # 获取用户今日次数、余额和老虎机券
         today_count = 0
@@ -413,120 +481,124 @@ class SlotMachineService:
             is_admin: 是否是管理员（管理员不受日限限制）
             use_ticket: 是否使用老虎机券
         """
-        config = await SlotMachineService.get_active_config(db)
+        config = await SlotMachineService.get_cached_config(db)
         if not config:
             raise ValueError("老虎机未启用")
 
-        # 检查日限（管理员不受限制，使用券不计入日限）
         used_ticket = False
-        if config.daily_limit and not is_admin and not use_ticket:
-            today_count = await SlotMachineService.get_today_count(db, user_id, config.id)
-            if today_count >= config.daily_limit:
-                raise ValueError(f"今日次数已用完（{today_count}/{config.daily_limit}）")
-
-        symbols = await SlotMachineService.get_enabled_symbols(db, config.id, include_disabled=False)
-        if not symbols:
+        if not config.symbols:
             raise ValueError("老虎机符号池为空")
 
-        # 获取规则
-        rules = await SlotMachineService.get_enabled_rules(db, config.id)
-
-        cost = int(config.cost_points)
-        reels_count = int(config.reels or 3)
-
-        # 尝试使用券或扣除积分
-        if use_ticket:
-            from app.services.exchange_service import ExchangeService
-            ticket_used = await ExchangeService.use_ticket(db, user_id, "SLOT_TICKET")
-            if ticket_used:
-                used_ticket = True
-                cost = 0  # 使用券免费
+        # 占用当日次数（管理员和使用券不受日限约束，但同样计数）
+        daily_limit = None if is_admin or use_ticket else config.daily_limit
+        play = await daily_play_limit.consume_play(db, daily_play_limit.SLOT_MACHINE, user_id, config.id, daily_limit)
+        if play is None:
+            raise ValueError(f"今日次数已用完（{config.daily_limit}/{config.daily_limit}）")
+
+        try:
+            # 预编译的规则（按优先级降序）
+            rules = config.rules
+
+            cost = int(config.cost_points)
+            reels_count = int(config.reels or 3)
+
+            # 尝试使用券或扣除积分
+            if use_ticket:
+                from app.services.exchange_service import ExchangeService
+                ticket_used = await ExchangeService.use_ticket(db, user_id, "SLOT_TICKET")
+                if ticket_used:
+                    used_ticket = True
+                    cost = 0  # 使用券免费
+                else:
+                    raise ValueError("没有可用的老虎机券")
             else:
-                raise ValueError("没有可用的老虎机券")
-        else:
-            # 扣除积分（使用行锁防并发）
-            try:
-                await PointsService.deduct_points(
-                    db=db,
-                    user_id=user_id,
-                    amount=cost,
-                    reason=PointsReason.LOTTERY_SPEND,
-                    description="老虎机消费",
-                    auto_commit=False,
-                )
-            except ValueError as e:
-                raise ValueError(str(e))
-
-        # 按权重随机生成每个滚轴的结果
-        reels = [SlotMachineService.weighted_random_pick(symbols) for _ in range(reels_count)]
-
-        # 使用规则计算中奖
-        if rules:
-            win_type, multiplier, payout, is_jackpot, win_name, matched_rules = \
-                await SlotMachineService.calculate_payout_with_rules(db, config, reels, rules)
-        else:
-            # 没有规则时使用简单计算
-            win_type, multiplier, payout, is_jackpot = SlotMachineService.calculate_payout(config, reels)
-            win_name = ""
-            matched_rules = []
-
-        # 大奖尝试额外发放 API Key（从 api_key_codes.description="彩蛋" 分配）
-        api_key_code = None
-        api_key_quota = None
-        api_key_message = None  # API Key 发放结果消息
-        if is_jackpot:
-            from app.services.lottery_service import LotteryService
-            api_key_info = await LotteryService._assign_api_key(db, user_id, "彩蛋")
-            if api_key_info:
-                api_key_code = api_key_info["code"]
-                api_key_quota = api_key_info["quota"]
-                api_key_message = f"🎁 额外获得API Key兑换码！"
+                # 扣除积分（使用行锁防并发）
+                try:
+                    await PointsService.deduct_points(
+                        db=db,
+                        user_id=user_id,
+                        amount=cost,
+                        reason=PointsReason.LOTTERY_SPEND,
+                        description="老虎机消费",
+                        auto_commit=False,
+                    )
+                except ValueError as e:
+                    raise ValueError(str(e))
+
+            # 按权重随机生成每个滚轴的结果
+            reels = [config.pick_symbol() for _ in range(reels_count)]
+
+            # 使用规则计算中奖
+            if rules:
+                win_type, multiplier, payout, is_jackpot, win_name, matched_rules = \
+                    await SlotMachineService.calculate_payout_with_rules(db, config, reels, rules)
             else:
-                # API Key 库存不足，仅提示用户
-                api_key_message = f"🎁 抱歉，API Key兑换码已被抽完！"
+                # 没有规则时使用简单计算
+                win_type, multiplier, payout, is_jackpot = SlotMachineService.calculate_payout(config, reels)
+                win_name = ""
+                matched_rules = []
+
+            # 大奖尝试额外发放 API Key（从 api_key_codes.description="彩蛋" 分配）
+            api_key_code = None
+            api_key_quota = None
+            api_key_message = None  # API Key 发放结果消息
+            if is_jackpot:
+                from app.services.lottery_service import LotteryService
+                api_key_info = await LotteryService._assign_api_key(db, user_id, "彩蛋")
+                if api_key_info:
+                    api_key_code = api_key_info["code"]
+                    api_key_quota = api_key_info["quota"]
+                    api_key_message = f"🎁 额外获得API Key兑换码！"
+                else:
+                    # API Key 库存不足，仅提示用户
+                    api_key_message = f"🎁 抱歉，API Key兑换码已被抽完！"
 
-        # 发放奖励或扣除惩罚
-        if payout > 0:
-            await PointsService.add_points(
-                db=db,
-                user_id=user_id,
-                amount=payout,
-                reason=PointsReason.LOTTERY_WIN,
-                description=f"老虎机{'大奖' if is_jackpot else '中奖'}: {win_name}" if win_name else f"老虎机{'大奖' if is_jackpot else '中奖'}",
-                auto_commit=False,
-            )
-        elif payout < 0:
-            # 惩罚扣除积分
-            try:
-                await PointsService.deduct_points(
+            # 发放奖励或扣除惩罚
+            if payout > 0:
+                await PointsService.add_points(
                     db=db,
                     user_id=user_id,
-                    amount=abs(payout),
-                    reason=PointsReason.LOTTERY_SPEND,
-                    description=f"老虎机惩罚: {win_name}" if win_name else "老虎机惩罚",
+                    amount=payout,
+                    reason=PointsReason.LOTTERY_WIN,
+                    description=f"老虎机{'大奖' if is_jackpot else '中奖'}: {win_name}" if win_name else f"老虎机{'大奖' if is_jackpot else '中奖'}",
                     auto_commit=False,
                 )
-            except ValueError:
-                # 积分不足时不额外扣除
-                payout = 0
-
-        # 记录抽奖日志
-        draw = SlotMachineDraw(
-            user_id=user_id,
-            config_id=config.id,
-            cost_points=cost,
-            reel_1=reels[0].symbol_key if len(reels) > 0 else "",
-            reel_2=reels[1].symbol_key if len(reels) > 1 else "",
-            reel_3=reels[2].symbol_key if len(reels) > 2 else "",
-            win_type=win_type,
-            multiplier=Decimal(str(multiplier)),
-            payout_points=payout,
-            is_jackpot=is_jackpot,
-            request_id=request_id or str(uuid.uuid4()),
-        )
-        db.add(draw)
+            elif payout < 0:
+                # 惩罚扣除积分
+                try:
+                    await PointsService.deduct_points(
+                        db=db,
+                        user_id=user_id,
+                        amount=abs(payout),
+                        reason=PointsReason.LOTTERY_SPEND,
+                        description=f"老虎机惩罚: {win_name}" if win_name else "老虎机惩罚",
+                        auto_commit=False,
+                    )
+                except ValueError:
+                    # 积分不足时不额外扣除
+                    payout = 0
+
+            # 记录抽奖日志
+            draw = SlotMachineDraw(
+                user_id=user_id,
+                config_id=config.id,
+                cost_points=cost,
+                reel_1=reels[0].symbol_key if len(reels) > 0 else "",
+                reel_2=reels[1].symbol_key if len(reels) > 1 else "",
+                reel_3=reels[2].symbol_key if len(reels) > 2 else "",
+                win_type=win_type,
+                multiplier=Decimal(str(multiplier)),
+                payout_points=payout,
+                is_jackpot=is_jackpot,
+                request_id=request_id or str(uuid.uuid4()),
+            )
+            db.add(draw)
 
-        await db.commit()
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            await play.release()
+            raise
 
         # 获取最新余额
         balance = await PointsService.get_balance(db, user_id)
@@ -648,6 +720,7 @@ class SlotMachineService:
                 setattr(config, key, value)
 
         await db.commit()
+        await invalidate_game_config(SLOT_MACHINE)
 
     @staticmethod
     async def replace_symbols(db: AsyncSession, symbols_data: List[Dict[str, Any]]) -> None:
@@ -688,6 +761,7 @@ class SlotMachineService:
             ))
 
         await db.commit()
+        await invalidate_game_config(SLOT_MACHINE)
 
     @staticmethod
     async def get_draw_stats(db: AsyncSession, days: int = 7) -> Dict[str, Any]:
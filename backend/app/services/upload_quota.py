@@ -9,12 +9,27 @@ import logging
 from fastapi import HTTPException, status
 
 from app.core.config import settings
-from app.core.redis import get_redis, close_redis
+from app.core.redis import get_redis, get_script
 
 
 logger = logging.getLogger(__name__)
 
 
+# 原子扣减：超过上限直接拒绝（返回 -1），首次写入时设置过期时间
+_COMMIT_QUOTA_SCRIPT = """
+local size = tonumber(ARGV[1])
+local total = redis.call('INCRBY', KEYS[1], size)
+if total == size then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if total > tonumber(ARGV[3]) then
+    redis.call('DECRBY', KEYS[1], size)
+    return -1
+end
+return total
+"""
+
+
 def _build_quota_key(scope: str, user_id: int, now: datetime) -> tuple[str, int]:
     day_key = now.strftime("%Y%m%d")
     key = f"quota:upload:{scope}:user:{user_id}:{day_key}"
@@ -31,8 +46,8 @@ async def ensure_upload_quota(user_id: int, scope: str, size_bytes: int) -> None
     if not limit or limit <= 0:
         return
 
-    client = await get_redis()
     try:
+        client = await get_redis()
         key, _ = _build_quota_key(scope, user_id, datetime.utcnow())
         used = int(await client.get(key) or 0)
         if used + size_bytes > limit:
@@ -44,8 +59,6 @@ async def ensure_upload_quota(user_id: int, scope: str, size_bytes: int) -> None
         raise
     except Exception as exc:
         logger.warning("上传配额检查失败: %s", exc)
-    finally:
-        await close_redis(client)
 
 
 async def commit_upload_quota(user_id: int, scope: str, size_bytes: int) -> None:
@@ -56,14 +69,11 @@ async def commit_upload_quota(user_id: int, scope: str, size_bytes: int) -> None
     if not limit or limit <= 0:
         return
 
-    client = await get_redis()
     try:
         key, ttl_seconds = _build_quota_key(scope, user_id, datetime.utcnow())
-        total = await client.incrby(key, size_bytes)
-        if total == size_bytes:
-            await client.expire(key, ttl_seconds)
-        if total > limit:
-            await client.decrby(key, size_bytes)
+        script = get_script("commit_upload_quota", _COMMIT_QUOTA_SCRIPT)
+        total = await script(keys=[key], args=[size_bytes, ttl_seconds, limit])
+        if int(total) < 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="上传额度已用尽，请稍后再试",
@@ -72,5 +82,3 @@ async def commit_upload_quota(user_id: int, scope: str, size_bytes: int) -> None
         raise
     except Exception as exc:
         logger.warning("上传配额扣减失败: %s", exc)
-    finally:
-        await close_redis(client)
@@ -0,0 +1,173 @@
+"""
+当前用户行缓存
+
+认证依赖每个请求都要按 Token 中的用户 ID 查一次 users 表，这里缓存用户行的列快照，
+命中后以「已持久化、未修改」状态挂回当前会话，后续修改和 commit 与直接查询得到的
+对象完全一致。
+
+后端由 AUTH_USER_CACHE_BACKEND 控制：
+- off：不缓存（默认）
+- memory：进程内 LRU，多 worker 之间仅靠 TTL 收敛
+- redis：所有 worker 共享，失效即时可见
+
+任何会话 flush 了 User 行的修改（资料更新、后台 update_user、角色切换、账号合并等），
+都会在提交后自动失效对应缓存。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import DateTime, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.user import User
+
+
+logger = logging.getLogger(__name__)
+
+_SESSION_INFO_KEY = "user_cache_invalidate_ids"
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+_DATETIME_COLUMNS = {
+    column.key for column in User.__table__.columns if isinstance(column.type, DateTime)
+}
+
+_memory_cache: "OrderedDict[int, tuple[float, dict[str, Any]]]" = OrderedDict()
+
+
+def _backend() -> str:
+    return (settings.AUTH_USER_CACHE_BACKEND or "off").strip().lower()
+
+
+def _redis_key(user_id: int) -> str:
+    return f"auth:user:{user_id}"
+
+
+def _snapshot(user: User) -> dict[str, Any]:
+    return {key: getattr(user, key) for key in _USER_COLUMNS}
+
+
+def _dump(data: dict[str, Any]) -> str:
+    return json.dumps(
+        {key: value.isoformat() if isinstance(value, datetime) else value for key, value in data.items()},
+        ensure_ascii=False,
+    )
+
+
+def _load(raw: str) -> dict[str, Any]:
+    data = json.loads(raw)
+    for key in _DATETIME_COLUMNS:
+        if data.get(key):
+            data[key] = datetime.fromisoformat(data[key])
+    return data
+
+
+async def _get_cached(user_id: int) -> Optional[dict[str, Any]]:
+    backend = _backend()
+    if backend == "memory":
+        cached = _memory_cache.get(user_id)
+        if cached is None:
+            return None
+        expires_at, data = cached
+        if time.time() >= expires_at:
+            _memory_cache.pop(user_id, None)
+            return None
+        _memory_cache.move_to_end(user_id)
+        return data
+    if backend == "redis":
+        client = await get_redis()
+        raw = await client.get(_redis_key(user_id))
+        return _load(raw) if raw else None
+    return None
+
+
+async def _set_cached(user_id: int, data: dict[str, Any]) -> None:
+    backend = _backend()
+    ttl = settings.AUTH_USER_CACHE_TTL_SECONDS
+    if backend == "memory":
+        _memory_cache[user_id] = (time.time() + ttl, dict(data))
+        _memory_cache.move_to_end(user_id)
+        while len(_memory_cache) > settings.AUTH_USER_CACHE_MAX_SIZE:
+            _memory_cache.popitem(last=False)
+    elif backend == "redis":
+        client = await get_redis()
+        await client.setex(_redis_key(user_id), ttl, _dump(data))
+
+
+async def invalidate_user(*user_ids: int) -> None:
+    """失效指定用户的缓存"""
+    ids = [user_id for user_id in user_ids if user_id]
+    if not ids:
+        return
+    for user_id in ids:
+        _memory_cache.pop(user_id, None)
+    if _backend() == "redis":
+        try:
+            client = await get_redis()
+            await client.delete(*[_redis_key(user_id) for user_id in ids])
+        except Exception as exc:
+            logger.warning("用户缓存失效失败: user_ids=%s, error=%s", ids, exc)
+
+
+async def load_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    """按 ID 获取用户（优先读缓存，未命中查库并回填）"""
+    if _backend() not in {"memory", "redis"} or settings.AUTH_USER_CACHE_TTL_SECONDS <= 0:
+        result = await db.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
+
+    try:
+        data = await _get_cached(user_id)
+    except Exception as exc:
+        logger.warning("读取用户缓存失败: user_id=%s, error=%s", user_id, exc)
+        data = None
+
+    if data is not None:
+        user = User(**data)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if user is not None:
+        try:
+            await _set_cached(user_id, _snapshot(user))
+        except Exception as exc:
+            logger.warning("写入用户缓存失败: user_id=%s, error=%s", user_id, exc)
+    return user
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_users(session: Session, flush_context) -> None:
+    """记录本次 flush 中被修改或删除的用户"""
+    changed = [
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, User) and obj.id
+    ]
+    if changed:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    """提交后失效缓存，避免并发请求在提交前把旧数据重新回填"""
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        _memory_cache.pop(user_id, None)
+    if _backend() != "redis":
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(invalidate_user(*user_ids))
+
@@ -12,6 +12,7 @@ from app.models.user import User
 from app.models.achievement import UserAchievement, UserBadgeShowcase, UserStats
 from app.models.points import UserPoints
 from app.models.password_reset import PasswordResetToken
+from app.services.achievement_service import request_full_check
 
 
 ROLE_PRIORITY = {
@@ -262,6 +263,8 @@ async def merge_users(db: AsyncSession, target_user: User, source_user: User) ->
 
     if has_table(UserStats.__tablename__):
         await _merge_user_stats(db, target_user.id, source_user.id)
+        # 合并后的统计可能满足新成就，提交后让目标用户下次检查全量评估
+        request_full_check(db, target_user.id)
     else:
         logger.warning("跳过合并用户统计表，表不存在: %s", UserStats.__tablename__)
 
@@ -0,0 +1,64 @@
+"""
+作品票数计数缓存
+
+submissions.vote_count 作为计数缓存，与投票写入/删除在同一事务内原子加减，
+不再每次投票都 COUNT(*)；定时任务对账修复可能出现的偏差。
+"""
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.submission import Submission
+from app.models.vote import Vote
+
+logger = logging.getLogger(__name__)
+
+
+async def adjust_vote_count(db: AsyncSession, submission_id: int, delta: int) -> None:
+    """原子调整作品票数（需与投票写入处于同一事务）"""
+    await db.execute(
+        update(Submission)
+        .where(Submission.id == submission_id)
+        .values(vote_count=func.greatest(Submission.vote_count + delta, 0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reconcile_vote_counts(db: AsyncSession) -> int:
+    """
+    对账票数计数缓存
+
+    以 votes 表为准修复偏差的作品，返回修复数量（调用方负责提交）。
+    """
+    actual = (
+        select(Vote.submission_id.label("submission_id"), func.count(Vote.id).label("count"))
+        .group_by(Vote.submission_id)
+        .subquery()
+    )
+    actual_count = func.coalesce(actual.c.count, 0)
+    result = await db.execute(
+        select(Submission.id, Submission.vote_count, actual_count.label("actual"))
+        .outerjoin(actual, actual.c.submission_id == Submission.id)
+        .where(Submission.vote_count != actual_count)
+    )
+    drifted = result.all()
+    for row in drifted:
+        logger.warning(
+            "作品票数偏差修复: submission_id=%s, cached=%s, actual=%s",
+            row.id,
+            row.vote_count,
+            row.actual,
+        )
+        # 在 UPDATE 内重新计数，避免覆盖对账期间并发写入的票数
+        await db.execute(
+            update(Submission)
+            .where(Submission.id == row.id)
+            .values(
+                vote_count=select(func.count(Vote.id))
+                .where(Vote.submission_id == row.id)
+                .scalar_subquery()
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return len(drifted)
@@ -1,25 +1,211 @@
 """
 Worker 队列服务
+
+可靠队列（基于 Redis 列表 + BLMOVE）：
+- {queue}              待处理任务（生产者 RPUSH，消费者 BLMOVE 到处理中列表）
+- {queue}:processing   处理中任务，处理完成后确认（ack）才移除
+- {queue}:leases       处理中任务的租约（有序集合，score 为到期时间）；Worker 处理期间续约，
+                       崩溃/失联后租约到期，任务被放回队首重新处理（可见性超时）
+- {queue}:delayed      延迟任务（有序集合，score 为可执行时间）：失败重试退避、项目锁占用时稍后再试
+- {queue}:dead         死信列表：超过最大重试次数或无法处理的任务
+- {queue}:metrics      部署各阶段耗时与结果计数（哈希）
+- {queue}:lock:project:{id}  项目级互斥，同一作品的多个提交串行部署
+- {queue}:prepull      镜像预拉取队列（创建提交时写入，尽力而为，不保证送达）
+- {queue}:images       Worker 拉取/使用过的镜像（有序集合，score 为最近使用时间，供 LRU 回收）
+- {queue}:lock:image_gc     镜像回收互斥
 """
 import json
 import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
 
 from fastapi import HTTPException, status
 
 from app.core.config import settings
-from app.core.redis import close_redis, get_redis
+from app.core.redis import get_redis, get_script
 
 
 logger = logging.getLogger(__name__)
 
+DEAD_LETTER_MAX_ITEMS = 1000
 
-async def enqueue_worker_action(action: str, submission_id: int) -> None:
-    """提交 Worker 任务"""
-    payload = json.dumps(
-        {"action": action, "submission_id": submission_id},
+# 阶段耗时直方图分桶（毫秒，最后一档为 +Inf）
+STAGE_BUCKETS_MS = (1000, 5000, 15000, 60000, 300000)
+
+# 到期的延迟任务移回待处理队列
+_PROMOTE_DELAYED_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('RPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+# 回收租约到期的处理中任务（放回队首）；刚移入处理中列表、尚未登记租约的任务补登一个租约
+_RECLAIM_EXPIRED_LUA = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+local now = tonumber(ARGV[1])
+local reclaimed = 0
+for _, item in ipairs(items) do
+    local deadline = redis.call('ZSCORE', KEYS[2], item)
+    if not deadline then
+        redis.call('ZADD', KEYS[2], ARGV[2], item)
+    elseif tonumber(deadline) < now then
+        redis.call('LREM', KEYS[1], 1, item)
+        redis.call('ZREM', KEYS[2], item)
+        redis.call('LPUSH', KEYS[3], item)
+        reclaimed = reclaimed + 1
+    end
+end
+return reclaimed
+"""
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_RENEW_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _queue_key(suffix: str) -> str:
+    return f"{settings.WORKER_QUEUE_KEY}:{suffix}"
+
+
+def processing_key() -> str:
+    return _queue_key("processing")
+
+
+def leases_key() -> str:
+    return _queue_key("leases")
+
+
+def delayed_key() -> str:
+    return _queue_key("delayed")
+
+
+def dead_letter_key() -> str:
+    return _queue_key("dead")
+
+
+def metrics_key() -> str:
+    return _queue_key("metrics")
+
+
+def project_lock_key(project_id: int) -> str:
+    return _queue_key(f"lock:project:{project_id}")
+
+
+def prepull_key() -> str:
+    return _queue_key("prepull")
+
+
+def images_key() -> str:
+    return _queue_key("images")
+
+
+def image_gc_lock_key() -> str:
+    return _queue_key("lock:image_gc")
+
+
+@dataclass(frozen=True)
+class QueueJob:
+    """队列任务"""
+    action: str
+    submission_id: int
+    raw: str = ""  # 队列中的原始消息（ack/重试时按原文定位）
+    job_id: Optional[str] = None
+    attempt: int = 1
+    enqueued_at: Optional[float] = None
+
+
+def build_job_payload(
+    action: str,
+    submission_id: int,
+    *,
+    job_id: Optional[str] = None,
+    attempt: int = 1,
+    enqueued_at: Optional[float] = None,
+) -> str:
+    """构造队列消息（job_id 保证消息唯一，便于在处理中列表/租约中按原文定位）"""
+    return json.dumps(
+        {
+            "action": action,
+            "submission_id": submission_id,
+            "job_id": job_id or uuid.uuid4().hex,
+            "attempt": attempt,
+            "enqueued_at": enqueued_at if enqueued_at is not None else time.time(),
+        },
         ensure_ascii=False,
     )
-    redis_client = None
+
+
+def parse_queue_item(raw_value) -> Optional[QueueJob]:
+    """解析队列消息（兼容旧格式：纯提交ID 或不带 job_id 的 JSON）"""
+    if raw_value is None:
+        return None
+
+    text = raw_value.decode(errors="ignore") if isinstance(raw_value, (bytes, bytearray)) else str(raw_value)
+    stripped = text.strip()
+    if not stripped:
+        return None
+
+    try:
+        return QueueJob(action="deploy", submission_id=int(stripped), raw=text)
+    except ValueError:
+        pass
+
+    try:
+        data = json.loads(stripped)
+    except json.JSONDecodeError:
+        logger.warning("无效的队列消息: %s", stripped)
+        return None
+
+    if not isinstance(data, dict):
+        logger.warning("无效的队列消息: %s", stripped)
+        return None
+
+    action = str(data.get("action", "")).lower()
+    submission_id = data.get("submission_id")
+    try:
+        submission_id = int(submission_id)
+    except (TypeError, ValueError):
+        logger.warning("无效的提交ID: %s", submission_id)
+        return None
+
+    if action not in {"deploy", "stop"}:
+        logger.warning("未知队列动作: %s", action)
+        return None
+
+    try:
+        attempt = max(1, int(data.get("attempt") or 1))
+    except (TypeError, ValueError):
+        attempt = 1
+    enqueued_at = data.get("enqueued_at")
+    return QueueJob(
+        action=action,
+        submission_id=submission_id,
+        raw=text,
+        job_id=data.get("job_id"),
+        attempt=attempt,
+        enqueued_at=float(enqueued_at) if isinstance(enqueued_at, (int, float)) else None,
+    )
+
+
+async def enqueue_worker_action(action: str, submission_id: int) -> None:
+    """提交 Worker 任务"""
+    payload = build_job_payload(action, submission_id)
     try:
         redis_client = await get_redis()
         await redis_client.rpush(settings.WORKER_QUEUE_KEY, payload)
@@ -34,5 +220,294 @@ async def enqueue_worker_action(action: str, submission_id: int) -> None:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="任务入队失败，请稍后重试",
         ) from exc
-    finally:
-        await close_redis(redis_client)
+
+
+async def enqueue_image_prepull(image_ref: str) -> None:
+    """提交镜像预拉取（失败只记录日志，不影响部署入队）"""
+    if not settings.WORKER_PREPULL_ENABLED:
+        return
+    try:
+        redis_client = await get_redis()
+        await redis_client.rpush(prepull_key(), image_ref)
+    except Exception as exc:
+        logger.warning("镜像预拉取入队失败: image=%s, error=%s", image_ref, exc)
+
+
+# ============================================================================
+# 消费端（Worker）
+# ============================================================================
+
+async def claim_job(block_seconds: int) -> Optional[str]:
+    """取出一个任务移入处理中列表并登记租约，超时无任务返回 None"""
+    redis_client = await get_redis()
+    raw = await redis_client.blmove(
+        settings.WORKER_QUEUE_KEY,
+        processing_key(),
+        block_seconds,
+        src="LEFT",
+        dest="RIGHT",
+    )
+    if raw is None:
+        return None
+    await redis_client.zadd(leases_key(), {raw: time.time() + settings.WORKER_VISIBILITY_TIMEOUT_SECONDS})
+    return raw
+
+
+async def extend_lease(raw: str) -> bool:
+    """续约处理中任务（任务已被回收时返回 False）"""
+    redis_client = await get_redis()
+    updated = await redis_client.zadd(
+        leases_key(),
+        {raw: time.time() + settings.WORKER_VISIBILITY_TIMEOUT_SECONDS},
+        xx=True,
+        ch=True,
+    )
+    return bool(updated)
+
+
+async def ack_job(raw: str) -> None:
+    """确认任务完成，移出处理中列表"""
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lrem(processing_key(), 1, raw)
+        pipe.zrem(leases_key(), raw)
+        await pipe.execute()
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    """第 attempt 次失败后的重试等待（指数退避 + 抖动）"""
+    base = max(1, settings.WORKER_RETRY_BACKOFF_SECONDS)
+    delay = min(settings.WORKER_RETRY_BACKOFF_MAX_SECONDS, base * (2 ** max(0, attempt - 1)))
+    return delay + random.uniform(0, base)
+
+
+async def defer_job(job: QueueJob, delay_seconds: float, *, next_attempt: bool) -> None:
+    """确认当前任务并放入延迟队列（next_attempt=True 时计为一次重试）"""
+    payload = build_job_payload(
+        job.action,
+        job.submission_id,
+        job_id=job.job_id,
+        attempt=job.attempt + 1 if next_attempt else job.attempt,
+        enqueued_at=job.enqueued_at,
+    )
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lrem(processing_key(), 1, job.raw)
+        pipe.zrem(leases_key(), job.raw)
+        pipe.zadd(delayed_key(), {payload: time.time() + delay_seconds})
+        await pipe.execute()
+
+
+async def dead_letter_job(raw: str, error: str, job: Optional[QueueJob] = None) -> None:
+    """确认当前任务并写入死信列表"""
+    entry = json.dumps(
+        {
+            "payload": raw,
+            "action": job.action if job else None,
+            "submission_id": job.submission_id if job else None,
+            "attempt": job.attempt if job else None,
+            "error": error[:500],
+            "failed_at": time.time(),
+        },
+        ensure_ascii=False,
+    )
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.lrem(processing_key(), 1, raw)
+        pipe.zrem(leases_key(), raw)
+        pipe.lpush(dead_letter_key(), entry)
+        pipe.ltrim(dead_letter_key(), 0, DEAD_LETTER_MAX_ITEMS - 1)
+        await pipe.execute()
+
+
+async def run_queue_maintenance(batch_size: int = 100) -> tuple[int, int]:
+    """
+    队列维护：到期延迟任务移回队列、租约到期的处理中任务放回队首
+
+    Returns:
+        (移回的延迟任务数, 回收的超时任务数)
+    """
+    await get_redis()
+    now = time.time()
+    promoted = await get_script("worker_promote_delayed", _PROMOTE_DELAYED_LUA)(
+        keys=[delayed_key(), settings.WORKER_QUEUE_KEY],
+        args=[now, batch_size],
+    )
+    reclaimed = await get_script("worker_reclaim_expired", _RECLAIM_EXPIRED_LUA)(
+        keys=[processing_key(), leases_key(), settings.WORKER_QUEUE_KEY],
+        args=[now, now + settings.WORKER_VISIBILITY_TIMEOUT_SECONDS],
+    )
+    return int(promoted or 0), int(reclaimed or 0)
+
+
+async def acquire_project_lock(project_id: int) -> Optional[str]:
+    """获取项目级部署锁，被占用时返回 None"""
+    token = uuid.uuid4().hex
+    redis_client = await get_redis()
+    acquired = await redis_client.set(
+        project_lock_key(project_id),
+        token,
+        nx=True,
+        px=settings.WORKER_VISIBILITY_TIMEOUT_SECONDS * 1000,
+    )
+    return token if acquired else None
+
+
+async def renew_project_lock(project_id: int, token: str) -> bool:
+    """续期项目锁（锁已易主时返回 False）"""
+    await get_redis()
+    renewed = await get_script("worker_renew_lock", _RENEW_LOCK_LUA)(
+        keys=[project_lock_key(project_id)],
+        args=[token, settings.WORKER_VISIBILITY_TIMEOUT_SECONDS * 1000],
+    )
+    return bool(renewed)
+
+
+async def release_project_lock(project_id: int, token: str) -> None:
+    """释放项目锁（仅释放自己持有的锁）"""
+    await get_redis()
+    await get_script("worker_release_lock", _RELEASE_LOCK_LUA)(
+        keys=[project_lock_key(project_id)],
+        args=[token],
+    )
+
+
+async def claim_prepull(block_seconds: int) -> Optional[str]:
+    """取出一个待预拉取的镜像引用，超时返回 None"""
+    redis_client = await get_redis()
+    item = await redis_client.blpop(prepull_key(), timeout=block_seconds)
+    if not item:
+        return None
+    return item[1]
+
+
+async def touch_cached_image(image_id: str) -> None:
+    """刷新镜像最近使用时间"""
+    try:
+        redis_client = await get_redis()
+        await redis_client.zadd(images_key(), {image_id: time.time()})
+    except Exception as exc:
+        logger.warning("记录镜像使用时间失败: image=%s, error=%s", image_id, exc)
+
+
+async def list_cached_images() -> list[tuple[str, float]]:
+    """按最近使用时间从旧到新列出已记录的镜像"""
+    redis_client = await get_redis()
+    return await redis_client.zrange(images_key(), 0, -1, withscores=True)
+
+
+async def forget_cached_images(image_ids: list[str]) -> None:
+    """移除已删除/不存在的镜像记录"""
+    if not image_ids:
+        return
+    redis_client = await get_redis()
+    await redis_client.zrem(images_key(), *image_ids)
+
+
+async def acquire_image_gc_lock() -> bool:
+    """镜像回收互斥（同一 Docker 主机上的多个 Worker 每个周期只回收一次）"""
+    redis_client = await get_redis()
+    return bool(await redis_client.set(
+        image_gc_lock_key(),
+        "1",
+        nx=True,
+        ex=max(1, settings.WORKER_IMAGE_GC_INTERVAL_SECONDS),
+    ))
+
+
+# ============================================================================
+# 指标
+# ============================================================================
+
+def _bucket_label(duration_ms: float) -> str:
+    for bound in STAGE_BUCKETS_MS:
+        if duration_ms <= bound:
+            return str(bound)
+    return "inf"
+
+
+async def record_job_metrics(stage_seconds: dict[str, float], outcome: str) -> None:
+    """记录一次任务的各阶段耗时与结果（写入失败只记录日志）"""
+    try:
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for stage, seconds in stage_seconds.items():
+                duration_ms = int(seconds * 1000)
+                pipe.hincrby(metrics_key(), f"stage:{stage}:count", 1)
+                pipe.hincrby(metrics_key(), f"stage:{stage}:sum_ms", duration_ms)
+                pipe.hincrby(metrics_key(), f"stage:{stage}:le:{_bucket_label(duration_ms)}", 1)
+            pipe.hincrby(metrics_key(), f"outcome:{outcome}", 1)
+            await pipe.execute()
+    except Exception as exc:
+        logger.warning("记录部署指标失败: %s", exc)
+
+
+async def incr_worker_counter(name: str, amount: int = 1) -> None:
+    """累加结果计数（如 reclaimed/promoted）"""
+    if amount <= 0:
+        return
+    try:
+        redis_client = await get_redis()
+        await redis_client.hincrby(metrics_key(), f"outcome:{name}", amount)
+    except Exception as exc:
+        logger.warning("记录部署指标失败: %s", exc)
+
+
+async def get_worker_queue_stats(dead_letter_limit: int = 20) -> dict:
+    """队列积压、部署阶段耗时分布与最近死信"""
+    redis_client = await get_redis()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.llen(settings.WORKER_QUEUE_KEY)
+        pipe.llen(processing_key())
+        pipe.zcard(delayed_key())
+        pipe.llen(dead_letter_key())
+        pipe.llen(prepull_key())
+        pipe.zcard(images_key())
+        pipe.hgetall(metrics_key())
+        pipe.lrange(dead_letter_key(), 0, max(0, dead_letter_limit - 1))
+        (
+            pending, processing, delayed, dead, prepull, cached_images, raw_metrics, dead_items,
+        ) = await pipe.execute()
+
+    stages: dict[str, dict] = {}
+    outcomes: dict[str, int] = {}
+    for field, value in (raw_metrics or {}).items():
+        parts = field.split(":")
+        if parts[0] == "outcome" and len(parts) == 2:
+            outcomes[parts[1]] = int(value)
+            continue
+        if parts[0] != "stage" or len(parts) < 3:
+            continue
+        stage = stages.setdefault(parts[1], {"count": 0, "sum_ms": 0, "buckets": {}})
+        if parts[2] == "le" and len(parts) == 4:
+            stage["buckets"][parts[3]] = int(value)
+        elif parts[2] in ("count", "sum_ms"):
+            stage[parts[2]] = int(value)
+
+    for stage in stages.values():
+        stage["avg_ms"] = round(stage["sum_ms"] / stage["count"], 1) if stage["count"] else 0
+        stage["buckets"] = {
+            label: stage["buckets"].get(label, 0)
+            for label in [str(bound) for bound in STAGE_BUCKETS_MS] + ["inf"]
+        }
+
+    dead_letters = []
+    for item in dead_items or []:
+        try:
+            dead_letters.append(json.loads(item))
+        except (TypeError, ValueError):
+            dead_letters.append({"payload": item})
+
+    return {
+        "queue": {
+            "pending": pending,
+            "processing": processing,
+            "delayed": delayed,
+            "dead": dead,
+            "prepull": prepull,
+        },
+        "cached_images": cached_images,
+        "stages": stages,
+        "outcomes": outcomes,
+        "dead_letters": dead_letters,
+    }
@@ -2,31 +2,59 @@
 作品部署 Worker
 
 功能:
-- 消费 Redis 队列中的提交
+- 消费 Redis 可靠队列中的提交（处理中列表 + 租约，崩溃后任务自动回收重做）
+- 多个部署槽位并发处理，同一作品的提交通过项目锁串行
 - 拉取镜像并启动容器
-- 驱动提交状态流转并回写日志
+- 驱动提交状态流转并回写日志；失败按退避重试，超过次数写入死信
+- 上报各阶段耗时（排队/拉取/启动/健康检查/总计）
 """
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, Optional
 
 import docker
 import httpx
-from docker.errors import NotFound
+from docker.errors import APIError, ImageNotFound, NotFound
 from docker.types import LogConfig
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 from app.core.config import settings
 from app.core.database import AsyncSessionLocal
-from app.core.redis import close_redis, get_redis
+from app.core.redis import init_redis, shutdown_redis
 from app.models.project import Project
 from app.models.project_submission import ProjectSubmission, ProjectSubmissionStatus
 from app.services.project_domain import build_project_domain
+from app.services.project_submission_status import apply_submission_status
+from app.services.worker_queue import (
+    QueueJob,
+    ack_job,
+    acquire_project_lock,
+    acquire_image_gc_lock,
+    claim_job,
+    claim_prepull,
+    dead_letter_job,
+    defer_job,
+    extend_lease,
+    forget_cached_images,
+    incr_worker_counter,
+    list_cached_images,
+    parse_queue_item,
+    record_job_metrics,
+    release_project_lock,
+    renew_project_lock,
+    retry_delay_seconds,
+    run_queue_maintenance,
+    touch_cached_image,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -59,12 +87,38 @@ def _build_status_url(submission_id: int) -> str:
     return f"{base}{settings.API_V1_PREFIX}/project-submissions/{submission_id}/status"
 
 
+async def _write_status_db(submission_id: int, payload: dict) -> None:
+    """直接写数据库（与回写接口共用状态流转逻辑）"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ProjectSubmission)
+            .options(selectinload(ProjectSubmission.project))
+            .where(ProjectSubmission.id == submission_id)
+        )
+        submission = result.scalar_one_or_none()
+        if submission is None:
+            raise RuntimeError("提交记录不存在")
+        apply_submission_status(
+            submission,
+            ProjectSubmissionStatus(payload["status"]),
+            message=payload.get("status_message"),
+            error_code=payload.get("error_code"),
+            log_append=payload.get("log_append"),
+            domain=payload.get("domain"),
+        )
+        await session.commit()
+
+
 async def _update_status(
     client: httpx.AsyncClient,
     submission_id: int,
     payload: dict,
 ) -> None:
-    """调用状态回写接口"""
+    """回写状态：默认直写数据库，WORKER_STATUS_WRITE_MODE=api 时调用回写接口"""
+    if settings.WORKER_STATUS_WRITE_MODE != "api":
+        await _write_status_db(submission_id, payload)
+        return
+
     if not settings.WORKER_API_TOKEN:
         raise RuntimeError("WORKER_API_TOKEN 未配置，无法回写状态")
 
@@ -87,51 +141,18 @@ async def _safe_update_status(
         logger.error("状态回写失败: submission_id=%s, error=%s", submission_id, exc)
 
 
-@dataclass(frozen=True)
-class QueueJob:
-    """队列任务"""
-    action: str
-    submission_id: int
-
-
-def _parse_queue_item(raw_value: bytes) -> Optional[QueueJob]:
-    """解析队列消息"""
-    if raw_value is None:
-        return None
-
-    text = raw_value.decode(errors="ignore") if isinstance(raw_value, (bytes, bytearray)) else str(raw_value)
-    text = text.strip()
-    if not text:
-        return None
-
-    try:
-        return QueueJob(action="deploy", submission_id=int(text))
-    except ValueError:
-        pass
-
-    try:
-        data = json.loads(text)
-    except json.JSONDecodeError:
-        logger.warning("无效的队列消息: %s", text)
-        return None
+class PermanentJobError(RuntimeError):
+    """不可重试的失败（提交不存在、缺少镜像、健康检查未通过等）"""
 
-    if not isinstance(data, dict):
-        logger.warning("无效的队列消息: %s", text)
-        return None
 
-    action = str(data.get("action", "")).lower()
-    submission_id = data.get("submission_id")
+@contextmanager
+def _stage(timings: dict[str, float], name: str) -> Iterator[None]:
+    """记录阶段耗时（秒）"""
+    started = time.perf_counter()
     try:
-        submission_id = int(submission_id)
-    except (TypeError, ValueError):
-        logger.warning("无效的提交ID: %s", submission_id)
-        return None
-
-    if action not in {"deploy", "stop"}:
-        logger.warning("未知队列动作: %s", action)
-        return None
-
-    return QueueJob(action=action, submission_id=submission_id)
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
 
 
 @dataclass(frozen=True)
@@ -144,6 +165,15 @@ class DeployTarget:
     current_submission_id: Optional[int]
 
 
+async def _load_project_id(submission_id: int) -> Optional[int]:
+    """查询提交所属作品（用于项目级串行）"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ProjectSubmission.project_id).where(ProjectSubmission.id == submission_id)
+        )
+        return result.scalar_one_or_none()
+
+
 async def _load_deploy_target(submission_id: int) -> DeployTarget:
     """加载部署信息"""
     async with AsyncSessionLocal() as session:
@@ -155,12 +185,12 @@ async def _load_deploy_target(submission_id: int) -> DeployTarget:
         row = result.first()
 
     if not row:
-        raise RuntimeError("提交记录不存在")
+        raise PermanentJobError("提交记录不存在")
 
     submission = row[0]
     current_submission_id = row[1]
     if not submission.image_ref:
-        raise RuntimeError("提交缺少镜像引用")
+        raise PermanentJobError("提交缺少镜像引用")
 
     return DeployTarget(
         submission_id=submission.id,
@@ -171,9 +201,30 @@ async def _load_deploy_target(submission_id: int) -> DeployTarget:
     )
 
 
+_docker: Optional[docker.DockerClient] = None
+_docker_lock = threading.Lock()
+
+
 def _docker_client() -> docker.DockerClient:
-    """创建 Docker 客户端"""
-    return docker.DockerClient(base_url=settings.WORKER_DOCKER_HOST)
+    """获取进程内共享的 Docker 客户端（长连接，线程间复用连接池）"""
+    global _docker
+    if _docker is None:
+        with _docker_lock:
+            if _docker is None:
+                _docker = docker.DockerClient(
+                    base_url=settings.WORKER_DOCKER_HOST,
+                    max_pool_size=max(10, settings.WORKER_CONCURRENCY * 2 + settings.WORKER_PREPULL_CONCURRENCY),
+                )
+    return _docker
+
+
+def _close_docker_client() -> None:
+    """关闭共享 Docker 客户端（退出时调用）"""
+    global _docker
+    with _docker_lock:
+        client, _docker = _docker, None
+    if client is not None:
+        client.close()
 
 
 def _resolve_deploy_network(client: docker.DockerClient) -> Optional[str]:
@@ -201,24 +252,44 @@ def _resolve_deploy_network(client: docker.DockerClient) -> Optional[str]:
     return next(iter(networks.keys()))
 
 
-def _build_container_name(submission_id: int) -> str:
-    """生成容器名"""
-    return f"project-{submission_id}"
+# Traefik 路由优先级基数：世代越新优先级越低，新旧容器同时存在时旧容器继续接流量
+ROUTER_PRIORITY_BASE = 10 ** 13
+
+LABEL_SUBMISSION_ID = "com.ikuncode.project_submission_id"
+LABEL_PROJECT_ID = "com.ikuncode.project_id"
+
+
+def _new_generation() -> int:
+    """部署世代（毫秒时间戳），区分同一提交的多次部署"""
+    return int(time.time() * 1000)
+
+
+def _build_container_name(submission_id: int, generation: int) -> str:
+    """生成容器名（每次部署独立命名，新容器就绪前旧容器不受影响）"""
+    return f"project-{submission_id}-{generation}"
 
 
 def _build_container_labels(
     target: DeployTarget,
     network_name: Optional[str],
+    generation: int,
 ) -> dict:
-    """生成容器标签"""
-    router_name = f"project-{target.submission_id}"
+    """
+    生成容器标签
+
+    同一提交的各世代共用域名，但各自拥有独立的路由与服务；
+    旧世代路由优先级更高，删除旧容器即原子地把流量切到新容器。
+    """
+    router_name = f"project-{target.submission_id}-{generation}"
     labels = {
         "traefik.enable": "true",
         f"traefik.http.routers.{router_name}.rule": f"Host(`{target.domain}`)",
         f"traefik.http.routers.{router_name}.entrypoints": "web",
+        f"traefik.http.routers.{router_name}.priority": str(ROUTER_PRIORITY_BASE - generation),
+        f"traefik.http.routers.{router_name}.service": router_name,
         f"traefik.http.services.{router_name}.loadbalancer.server.port": str(settings.WORKER_PROJECT_PORT),
-        "com.ikuncode.project_submission_id": str(target.submission_id),
-        "com.ikuncode.project_id": str(target.project_id),
+        LABEL_SUBMISSION_ID: str(target.submission_id),
+        LABEL_PROJECT_ID: str(target.project_id),
     }
     if network_name:
         labels["traefik.docker.network"] = network_name
@@ -234,75 +305,96 @@ def _remove_container_if_exists(client: docker.DockerClient, container_name: str
     container.remove(force=True)
 
 
-def _docker_pull_sync(image_ref: str) -> None:
-    client = _docker_client()
+def _local_image_id_sync(image_ref: str) -> Optional[str]:
+    """本地已有该镜像时返回镜像 ID（提交镜像均以 digest 固定，存在即内容一致）"""
     try:
-        client.images.pull(image_ref)
-    finally:
-        client.close()
+        return _docker_client().images.get(image_ref).id
+    except ImageNotFound:
+        return None
+
+
+def _docker_pull_sync(image_ref: str) -> str:
+    """拉取镜像（按层增量，已有的层不会重复下载），返回镜像 ID"""
+    return _docker_client().images.pull(image_ref).id
+
 
+# 进程内进行中的拉取（预拉取与部署共用，同一镜像只拉一次）
+_pulls: dict[str, asyncio.Future] = {}
 
-async def _docker_pull(image_ref: str) -> None:
-    """拉取镜像"""
-    await asyncio.to_thread(_docker_pull_sync, image_ref)
 
+async def _pull_image(image_ref: str) -> tuple[str, bool]:
+    image_id = await asyncio.to_thread(_local_image_id_sync, image_ref)
+    if image_id:
+        return image_id, True
+    return await asyncio.to_thread(_docker_pull_sync, image_ref), False
 
-def _start_container_sync(target: DeployTarget) -> str:
+
+async def _ensure_image(image_ref: str) -> bool:
+    """
+    确保镜像在本地，返回是否命中本地缓存
+
+    并发请求同一镜像时共享一次拉取；成功后刷新镜像的最近使用时间（供 LRU 回收）。
+    """
+    future = _pulls.get(image_ref)
+    if future is None:
+        future = asyncio.ensure_future(_pull_image(image_ref))
+        _pulls[image_ref] = future
+        future.add_done_callback(lambda _: _pulls.pop(image_ref, None))
+    image_id, cached = await asyncio.shield(future)
+    await touch_cached_image(image_id)
+    await incr_worker_counter("image_cache_hit" if cached else "image_cache_miss")
+    return cached
+
+
+def _start_container_sync(target: DeployTarget, generation: int) -> str:
     client = _docker_client()
-    try:
-        network_name = _resolve_deploy_network(client)
-        if not network_name:
-            raise RuntimeError("未检测到部署网络，请配置 WORKER_DEPLOY_NETWORK")
-
-        container_name = _build_container_name(target.submission_id)
-        _remove_container_if_exists(client, container_name)
-
-        log_config = LogConfig(
-            type="json-file",
-            config={
-                "max-size": settings.WORKER_CONTAINER_LOG_MAX_SIZE,
-                "max-file": str(settings.WORKER_CONTAINER_LOG_MAX_FILE),
-            },
-        )
+    network_name = _resolve_deploy_network(client)
+    if not network_name:
+        raise RuntimeError("未检测到部署网络，请配置 WORKER_DEPLOY_NETWORK")
+
+    container_name = _build_container_name(target.submission_id, generation)
+    _remove_container_if_exists(client, container_name)
+
+    log_config = LogConfig(
+        type="json-file",
+        config={
+            "max-size": settings.WORKER_CONTAINER_LOG_MAX_SIZE,
+            "max-file": str(settings.WORKER_CONTAINER_LOG_MAX_FILE),
+        },
+    )
 
-        run_kwargs = {
-            "name": container_name,
-            "detach": True,
-            "environment": {"PORT": str(settings.WORKER_PROJECT_PORT)},
-            "labels": _build_container_labels(target, network_name),
-            "read_only": True,
-            "cap_drop": ["ALL"],
-            "security_opt": ["no-new-privileges:true"],
-            "tmpfs": {"/tmp": "rw,noexec,nosuid,size=64m"},
-            "mem_limit": settings.WORKER_CONTAINER_MEMORY_LIMIT,
-            "pids_limit": settings.WORKER_CONTAINER_PIDS_LIMIT,
-            "restart_policy": {"Name": "unless-stopped"},
-            "log_config": log_config,
-        }
-        if network_name:
-            run_kwargs["network"] = network_name
-
-        cpu_limit = settings.WORKER_CONTAINER_CPU_LIMIT
-        if cpu_limit > 0:
-            run_kwargs["nano_cpus"] = int(cpu_limit * 1_000_000_000)
-
-        client.containers.run(target.image_ref, **run_kwargs)
-        return container_name
-    finally:
-        client.close()
+    run_kwargs = {
+        "name": container_name,
+        "detach": True,
+        "environment": {"PORT": str(settings.WORKER_PROJECT_PORT)},
+        "labels": _build_container_labels(target, network_name, generation),
+        "read_only": True,
+        "cap_drop": ["ALL"],
+        "security_opt": ["no-new-privileges:true"],
+        "tmpfs": {"/tmp": "rw,noexec,nosuid,size=64m"},
+        "mem_limit": settings.WORKER_CONTAINER_MEMORY_LIMIT,
+        "pids_limit": settings.WORKER_CONTAINER_PIDS_LIMIT,
+        "restart_policy": {"Name": "unless-stopped"},
+        "log_config": log_config,
+    }
+    if network_name:
+        run_kwargs["network"] = network_name
+
+    cpu_limit = settings.WORKER_CONTAINER_CPU_LIMIT
+    if cpu_limit > 0:
+        run_kwargs["nano_cpus"] = int(cpu_limit * 1_000_000_000)
 
+    client.containers.run(target.image_ref, **run_kwargs)
+    return container_name
 
-async def _start_container(target: DeployTarget) -> str:
+
+async def _start_container(target: DeployTarget, generation: int) -> str:
     """启动容器"""
-    return await asyncio.to_thread(_start_container_sync, target)
+    return await asyncio.to_thread(_start_container_sync, target, generation)
 
 
 def _remove_container_sync(container_name: str) -> None:
-    client = _docker_client()
-    try:
-        _remove_container_if_exists(client, container_name)
-    finally:
-        client.close()
+    _remove_container_if_exists(_docker_client(), container_name)
 
 
 async def _remove_container(container_name: str) -> None:
@@ -310,48 +402,131 @@ async def _remove_container(container_name: str) -> None:
     await asyncio.to_thread(_remove_container_sync, container_name)
 
 
-async def _health_check(client: httpx.AsyncClient, container_name: str) -> bool:
-    """健康检查（可选）"""
-    if not settings.WORKER_HEALTHCHECK_ENABLED:
-        return True
+def _remove_labeled_containers_sync(label: str, value: int, keep: Optional[str]) -> list[str]:
+    """删除带指定标签的容器（保留 keep），返回已删除的容器名"""
+    removed = []
+    for container in _docker_client().containers.list(all=True, filters={"label": f"{label}={value}"}):
+        if container.name == keep:
+            continue
+        try:
+            container.remove(force=True)
+            removed.append(container.name)
+        except NotFound:
+            continue
+    return removed
+
+
+async def _remove_labeled_containers(label: str, value: int, keep: Optional[str] = None) -> list[str]:
+    return await asyncio.to_thread(_remove_labeled_containers_sync, label, value, keep)
+
+
+def _probe_address(container_name: str) -> tuple[str, int]:
+    """就绪探测地址（部署网络内按容器名访问）"""
+    return container_name, settings.WORKER_PROJECT_PORT
 
-    url = f"http://{container_name}:{settings.WORKER_PROJECT_PORT}{settings.WORKER_HEALTHCHECK_PATH}"
-    for _ in range(settings.WORKER_HEALTHCHECK_RETRY):
+
+async def _probe_once(client: httpx.AsyncClient, host: str, port: int) -> bool:
+    """
+    单次就绪探测
+
+    先做 TCP 连接（端口未监听时立即失败，不必等待 HTTP 超时），
+    再按配置请求健康检查路径；两者都关闭时视为就绪。
+    """
+    timeout = settings.WORKER_HEALTHCHECK_TIMEOUT_SECONDS
+    if settings.WORKER_HEALTHCHECK_TCP_ENABLED:
         try:
-            response = await client.get(url, timeout=settings.WORKER_HEALTHCHECK_TIMEOUT_SECONDS)
-            if response.status_code == 200:
-                return True
-        except httpx.HTTPError:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
             pass
-        await asyncio.sleep(settings.WORKER_HEALTHCHECK_INTERVAL_SECONDS)
-    return False
 
+    if not settings.WORKER_HEALTHCHECK_ENABLED:
+        return True
 
-async def _cleanup_old_container(current_id: Optional[int], new_id: int) -> None:
-    """清理旧版本容器"""
-    if not current_id or current_id == new_id:
-        return
-    container_name = _build_container_name(current_id)
+    url = f"http://{host}:{port}{settings.WORKER_HEALTHCHECK_PATH}"
     try:
-        await _remove_container(container_name)
+        response = await client.get(url, timeout=timeout)
+    except httpx.HTTPError:
+        return False
+    return response.status_code == 200
+
+
+async def _wait_ready(client: httpx.AsyncClient, container_name: str) -> bool:
+    """
+    等待新容器就绪
+
+    探测间隔从 WORKER_HEALTHCHECK_INITIAL_INTERVAL_SECONDS 开始指数增长，
+    上限为 WORKER_HEALTHCHECK_INTERVAL_SECONDS；总时长与原先固定间隔重试的上限一致。
+    慢探测不阻塞下一次探测（最多 WORKER_HEALTHCHECK_MAX_INFLIGHT 个并行），任一成功即就绪。
+    """
+    if not settings.WORKER_HEALTHCHECK_ENABLED and not settings.WORKER_HEALTHCHECK_TCP_ENABLED:
+        return True
+
+    host, port = _probe_address(container_name)
+    max_interval = max(0.05, float(settings.WORKER_HEALTHCHECK_INTERVAL_SECONDS))
+    delay = min(max_interval, max(0.05, settings.WORKER_HEALTHCHECK_INITIAL_INTERVAL_SECONDS))
+    deadline = time.monotonic() + settings.WORKER_HEALTHCHECK_RETRY * max_interval
+    inflight: set[asyncio.Task] = set()
+    try:
+        while time.monotonic() < deadline:
+            if len(inflight) < max(1, settings.WORKER_HEALTHCHECK_MAX_INFLIGHT):
+                inflight.add(asyncio.create_task(_probe_once(client, host, port)))
+
+            tick_end = min(deadline, time.monotonic() + delay)
+            while inflight and (remaining := tick_end - time.monotonic()) > 0:
+                done, inflight = await asyncio.wait(
+                    inflight, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if any(not task.cancelled() and task.exception() is None and task.result() for task in done):
+                    return True
+            remaining = tick_end - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            delay = min(max_interval, delay * 2)
+        return False
+    finally:
+        for task in inflight:
+            task.cancel()
+
+
+async def _switch_traffic(target: DeployTarget, container_name: str) -> None:
+    """新容器上线后删除该作品的其他容器（旧世代/旧提交），流量随之切到新容器"""
+    try:
+        removed = await _remove_labeled_containers(LABEL_PROJECT_ID, target.project_id, keep=container_name)
+        if removed:
+            logger.info("已下线旧容器: project_id=%s, containers=%s", target.project_id, removed)
     except Exception as exc:
-        logger.warning("清理旧容器失败: container=%s, error=%s", container_name, exc)
+        logger.warning("清理旧容器失败: project_id=%s, error=%s", target.project_id, exc)
 
 
 async def _stop_submission(submission_id: int) -> None:
-    """停止运行中的容器"""
-    container_name = _build_container_name(submission_id)
+    """停止运行中的容器（该提交的所有世代）"""
     try:
-        await _remove_container(container_name)
+        await _remove_labeled_containers(LABEL_SUBMISSION_ID, submission_id)
         logger.info("已停止容器: submission_id=%s", submission_id)
     except Exception as exc:
         logger.warning("停止容器失败: submission_id=%s, error=%s", submission_id, exc)
 
 
-async def _process_submission(client: httpx.AsyncClient, submission_id: int) -> None:
-    """处理单个提交"""
-    container_name = _build_container_name(submission_id)
-    target = await _load_deploy_target(submission_id)
+async def _process_submission(
+    client: httpx.AsyncClient,
+    submission_id: int,
+    timings: dict[str, float],
+) -> None:
+    """
+    处理单个提交
+
+    蓝绿部署：新容器以新世代启动，旧容器在新容器就绪前继续提供服务；
+    失败时只清理本次创建的容器后抛出异常，由调用方决定重试或标记失败。
+    """
+    generation = _new_generation()
+    container_name = _build_container_name(submission_id, generation)
+    with _stage(timings, "load"):
+        target = await _load_deploy_target(submission_id)
 
     try:
         await _update_status(
@@ -363,7 +538,10 @@ async def _process_submission(client: httpx.AsyncClient, submission_id: int) ->
                 log_append=f"开始拉取镜像: {target.image_ref}",
             ),
         )
-        await _docker_pull(target.image_ref)
+        with _stage(timings, "pull"):
+            cached = await _ensure_image(target.image_ref)
+        if cached:
+            logger.info("镜像已在本地，跳过拉取: %s", target.image_ref)
 
         await _update_status(
             client,
@@ -374,7 +552,8 @@ async def _process_submission(client: httpx.AsyncClient, submission_id: int) ->
                 log_append="创建容器并接入网关",
             ),
         )
-        await _start_container(target)
+        with _stage(timings, "start"):
+            await _start_container(target, generation)
 
         await _update_status(
             client,
@@ -386,9 +565,10 @@ async def _process_submission(client: httpx.AsyncClient, submission_id: int) ->
             ),
         )
 
-        ok = await _health_check(client, container_name)
+        with _stage(timings, "healthcheck"):
+            ok = await _wait_ready(client, container_name)
         if not ok:
-            raise RuntimeError("健康检查失败")
+            raise PermanentJobError("健康检查失败")
 
         await _update_status(
             client,
@@ -400,54 +580,279 @@ async def _process_submission(client: httpx.AsyncClient, submission_id: int) ->
                 domain=target.domain,
             ),
         )
-        await _cleanup_old_container(target.current_submission_id, submission_id)
+        with _stage(timings, "switch"):
+            await _switch_traffic(target, container_name)
     except Exception as exc:
         logger.warning("提交处理失败: submission_id=%s, error=%s", submission_id, exc)
         try:
             await _remove_container(container_name)
         except Exception as cleanup_exc:
             logger.warning("容器清理失败: container=%s, error=%s", container_name, cleanup_exc)
+        raise
+
+
+async def _keep_alive(job: QueueJob, project_id: Optional[int], lock_token: Optional[str]) -> None:
+    """处理期间定期续约任务租约与项目锁"""
+    interval = max(1, settings.WORKER_VISIBILITY_TIMEOUT_SECONDS // 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await extend_lease(job.raw):
+                logger.warning("任务租约已失效，可能被重复处理: submission_id=%s", job.submission_id)
+            if project_id is not None and lock_token and not await renew_project_lock(project_id, lock_token):
+                logger.warning("项目锁已失效: project_id=%s", project_id)
+        except Exception as exc:
+            logger.warning("续约失败: submission_id=%s, error=%s", job.submission_id, exc)
+
+
+async def _handle_deploy_failure(client: httpx.AsyncClient, job: QueueJob, exc: Exception) -> str:
+    """部署失败：可重试时退避后重新入队，否则标记失败并写入死信，返回结果名"""
+    retryable = not isinstance(exc, PermanentJobError)
+    if retryable and job.attempt < settings.WORKER_MAX_ATTEMPTS:
+        delay = retry_delay_seconds(job.attempt)
+        await defer_job(job, delay, next_attempt=True)
         await _safe_update_status(
             client,
-            submission_id,
+            job.submission_id,
             _build_status_payload(
-                status=ProjectSubmissionStatus.FAILED,
-                message="部署失败",
-                error_code="worker_failed",
-                log_append=f"部署失败: {exc}\n已执行清理",
+                status=ProjectSubmissionStatus.QUEUED,
+                message="部署失败，等待重试",
+                log_append=(
+                    f"部署失败: {exc}\n已执行清理，{int(delay)} 秒后重试"
+                    f"（第 {job.attempt + 1}/{settings.WORKER_MAX_ATTEMPTS} 次）"
+                ),
             ),
         )
+        return "retried"
+
+    await dead_letter_job(job.raw, str(exc), job)
+    await _safe_update_status(
+        client,
+        job.submission_id,
+        _build_status_payload(
+            status=ProjectSubmissionStatus.FAILED,
+            message="部署失败",
+            error_code="worker_failed",
+            log_append=f"部署失败: {exc}\n已执行清理",
+        ),
+    )
+    return "failed"
+
+
+async def _run_job(client: httpx.AsyncClient, raw: str) -> None:
+    """处理一条队列消息：项目锁 → 执行 → ack/重试/死信 → 上报指标"""
+    job = parse_queue_item(raw)
+    if not job:
+        await dead_letter_job(raw, "无效的队列消息")
+        return
+
+    timings: dict[str, float] = {}
+    if job.enqueued_at:
+        timings["queue_wait"] = max(0.0, time.time() - job.enqueued_at)
+
+    project_id = await _load_project_id(job.submission_id)
+    lock_token = None
+    if project_id is not None:
+        lock_token = await acquire_project_lock(project_id)
+        if lock_token is None:
+            # 同一作品的其他提交正在处理，稍后再试（不计入重试次数）
+            await defer_job(job, settings.WORKER_PROJECT_LOCK_RETRY_SECONDS, next_attempt=False)
+            return
+
+    keeper = asyncio.create_task(_keep_alive(job, project_id, lock_token))
+    started = time.perf_counter()
+    outcome = "succeeded"
+    try:
+        if job.action == "deploy":
+            try:
+                await _process_submission(client, job.submission_id, timings)
+            except Exception as exc:
+                outcome = await _handle_deploy_failure(client, job, exc)
+            else:
+                await ack_job(job.raw)
+        else:
+            await _stop_submission(job.submission_id)
+            await ack_job(job.raw)
+    finally:
+        keeper.cancel()
+        if lock_token is not None:
+            try:
+                await release_project_lock(project_id, lock_token)
+            except Exception as exc:
+                logger.warning("释放项目锁失败: project_id=%s, error=%s", project_id, exc)
+
+    if job.action == "deploy":
+        timings["total"] = time.perf_counter() - started
+        await record_job_metrics(timings, outcome)
+        logger.info(
+            "部署任务结束: submission_id=%s, attempt=%s, outcome=%s, stages=%s",
+            job.submission_id,
+            job.attempt,
+            outcome,
+            {name: round(seconds, 2) for name, seconds in timings.items()},
+        )
+
+
+def _gc_images_sync(tracked: list[tuple[str, float]], budget_bytes: int) -> tuple[list[str], list[str]]:
+    """
+    按最近使用时间淘汰镜像直到总大小不超过预算（正在被容器使用的镜像跳过）
+
+    Returns:
+        (已删除的镜像, 已不存在的镜像)
+    """
+    client = _docker_client()
+    in_use = {container.attrs.get("Image") for container in client.containers.list(all=True)}
+    sizes: dict[str, int] = {}
+    missing: list[str] = []
+    for image_id, _ in tracked:
+        try:
+            sizes[image_id] = int(client.images.get(image_id).attrs.get("Size") or 0)
+        except ImageNotFound:
+            missing.append(image_id)
+
+    total = sum(sizes.values())
+    removed: list[str] = []
+    for image_id, _ in tracked:
+        if total <= budget_bytes:
+            break
+        if image_id not in sizes or image_id in in_use:
+            continue
+        try:
+            client.images.remove(image_id)
+        except (APIError, ImageNotFound) as exc:
+            logger.warning("删除镜像失败: image=%s, error=%s", image_id, exc)
+            continue
+        total -= sizes[image_id]
+        removed.append(image_id)
+    return removed, missing
+
+
+async def _gc_images() -> None:
+    """镜像缓存超出磁盘预算时按 LRU 回收"""
+    budget_bytes = int(settings.WORKER_IMAGE_CACHE_MAX_GB * 1024 ** 3)
+    if budget_bytes <= 0 or not await acquire_image_gc_lock():
+        return
+    tracked = await list_cached_images()
+    if not tracked:
+        return
+    removed, missing = await asyncio.to_thread(_gc_images_sync, tracked, budget_bytes)
+    await forget_cached_images(removed + missing)
+    if removed:
+        logger.info("镜像缓存超出预算，已回收 %s 个镜像", len(removed))
+        await incr_worker_counter("images_evicted", len(removed))
+
+
+async def _prepull_loop(stop: asyncio.Event) -> None:
+    """消费预拉取队列：部署排队期间提前拉取镜像（与部署共享同一次拉取）"""
+    slots = asyncio.Semaphore(max(1, settings.WORKER_PREPULL_CONCURRENCY))
+
+    async def prepull(image_ref: str) -> None:
+        try:
+            if not await _ensure_image(image_ref):
+                await incr_worker_counter("prepulled")
+                logger.info("镜像预拉取完成: %s", image_ref)
+        except Exception as exc:
+            logger.warning("镜像预拉取失败: image=%s, error=%s", image_ref, exc)
+        finally:
+            slots.release()
+
+    while not stop.is_set():
+        await slots.acquire()
+        try:
+            image_ref = await claim_prepull(settings.WORKER_QUEUE_BLOCK_SECONDS)
+        except Exception as exc:
+            slots.release()
+            logger.warning("读取预拉取队列失败: %s", exc)
+            await asyncio.sleep(1)
+            continue
+        if not image_ref:
+            slots.release()
+            continue
+        asyncio.create_task(prepull(image_ref))
+
+
+async def _maintenance_loop(stop: asyncio.Event) -> None:
+    """定期移回到期的延迟任务、回收租约超时的任务、按预算回收镜像"""
+    next_gc_at = 0.0
+    while not stop.is_set():
+        if time.monotonic() >= next_gc_at:
+            next_gc_at = time.monotonic() + max(1, settings.WORKER_IMAGE_GC_INTERVAL_SECONDS)
+            try:
+                await _gc_images()
+            except Exception as exc:
+                logger.warning("镜像回收失败: %s", exc)
+        try:
+            promoted, reclaimed = await run_queue_maintenance()
+            if reclaimed:
+                logger.warning("回收超时任务 %s 个", reclaimed)
+                await incr_worker_counter("reclaimed", reclaimed)
+            if promoted:
+                logger.debug("延迟任务重新入队 %s 个", promoted)
+        except Exception as exc:
+            logger.warning("队列维护失败: %s", exc)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.WORKER_MAINTENANCE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
 
 async def _worker_loop() -> None:
     """Worker 主循环"""
-    if not settings.WORKER_API_TOKEN:
+    if settings.WORKER_STATUS_WRITE_MODE == "api" and not settings.WORKER_API_TOKEN:
         logger.error("WORKER_API_TOKEN 未配置，Worker 无法回写状态")
         return
 
-    redis_client = None
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    concurrency = max(1, settings.WORKER_CONCURRENCY)
+    slots = asyncio.Semaphore(concurrency)
+    running: set[asyncio.Task] = set()
+
+    def _on_done(task: asyncio.Task) -> None:
+        running.discard(task)
+        slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("任务处理异常（将由租约超时回收）: %s", task.exception())
+
     try:
-        redis_client = await get_redis()
+        await init_redis()
+        maintenance = asyncio.create_task(_maintenance_loop(stop))
+        prepuller = asyncio.create_task(_prepull_loop(stop)) if settings.WORKER_PREPULL_ENABLED else None
+        logger.info("部署 Worker 已启动: concurrency=%s", concurrency)
         async with httpx.AsyncClient() as client:
-            while True:
-                item = await redis_client.blpop(
-                    settings.WORKER_QUEUE_KEY,
-                    timeout=settings.WORKER_QUEUE_BLOCK_SECONDS,
-                )
-                if not item:
+            while not stop.is_set():
+                await slots.acquire()
+                try:
+                    raw = await claim_job(settings.WORKER_QUEUE_BLOCK_SECONDS)
+                except Exception as exc:
+                    slots.release()
+                    logger.warning("读取队列失败: %s", exc)
+                    await asyncio.sleep(1)
                     continue
-
-                _, raw_value = item
-                job = _parse_queue_item(raw_value)
-                if not job:
+                if raw is None:
+                    slots.release()
                     continue
 
-                if job.action == "deploy":
-                    await _process_submission(client, job.submission_id)
-                elif job.action == "stop":
-                    await _stop_submission(job.submission_id)
+                task = asyncio.create_task(_run_job(client, raw))
+                running.add(task)
+                task.add_done_callback(_on_done)
+
+            logger.info("Worker 正在退出，等待 %s 个进行中的任务", len(running))
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        stop.set()
+        await maintenance
+        if prepuller is not None:
+            await prepuller
     finally:
-        await close_redis(redis_client)
+        await asyncio.to_thread(_close_docker_client)
+        await shutdown_redis()
 
 
 def main() -> None:
@@ -0,0 +1,90 @@
+"""
+为已有媒体图片生成缩放 WebP 版本
+
+遍历 MEDIA_ROOT 下各类别目录（跳过 _variants），在进程池中生成 MEDIA_DERIVATIVE_WIDTHS 全部档位。
+已存在的档位文件会跳过，--force 时先删除再重新生成。
+
+用法（在 backend 目录下）：
+    python scripts/backfill_media_derivatives.py                       # 全部类别
+    python scripts/backfill_media_derivatives.py --category avatars --workers 4
+    python scripts/backfill_media_derivatives.py --dry-run
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.services.media_derivatives import (  # noqa: E402
+    delete_variants,
+    derivative_widths,
+    render_variants,
+    variant_dir,
+)
+from app.services.media_service import IMAGE_CONTENT_TYPES, MEDIA_CATEGORIES, _media_root  # noqa: E402
+
+
+def _iter_originals(categories: list[str]):
+    root = _media_root()
+    extensions = set(IMAGE_CONTENT_TYPES.values())
+    for category in categories:
+        directory = root / MEDIA_CATEGORIES[category]
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.iterdir()):
+            if path.is_file() and path.suffix.lower() in extensions:
+                yield path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--category", choices=sorted(MEDIA_CATEGORIES), default=None, help="只处理指定类别")
+    parser.add_argument("--workers", type=int, default=settings.MEDIA_DERIVATIVE_WORKERS, help="进程数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计待处理文件，不生成")
+    parser.add_argument("--force", action="store_true", help="删除已有档位后重新生成")
+    args = parser.parse_args()
+
+    widths = derivative_widths()
+    if not widths:
+        print("MEDIA_DERIVATIVE_WIDTHS 为空，无需生成")
+        return
+
+    categories = [args.category] if args.category else sorted(MEDIA_CATEGORIES)
+    originals = list(_iter_originals(categories))
+    print(f"原图 {len(originals)} 个，档位 {widths}")
+    if args.dry_run:
+        return
+
+    started = time.perf_counter()
+    generated = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {}
+        for path in originals:
+            if args.force:
+                delete_variants(path)
+            future = executor.submit(
+                render_variants, str(path), str(variant_dir(path)), widths, settings.MEDIA_DERIVATIVE_QUALITY
+            )
+            futures[future] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                done = future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"失败 {path}: {exc}")
+                continue
+            if done:
+                generated += 1
+            else:
+                skipped += 1
+
+    elapsed = time.perf_counter() - started
+    print(f"完成：生成 {generated}，跳过（动图/无法解码）{skipped}，失败 {failed}，耗时 {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+出站 HTTP 客户端基准测试
+
+在本机启动一个桩服务（模拟 GitHub API、GitHub/Linux.do OAuth、额度 API、头像下载），
+分别以「每次调用新建客户端（旧实现）」与「共享长连接客户端」两种方式调用真实的服务函数，
+输出各集成的吞吐（次/秒）与平均延迟。桩服务为明文 HTTP，生产环境额外节省的 TLS 握手不计入。
+
+用法（在 backend 目录下）：
+    python scripts/bench_http_clients.py --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from itertools import count
+from typing import Awaitable, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from app.core import http_client  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services import (  # noqa: E402
+    github_oauth,
+    github_service as github_service_module,
+    linux_do_oauth,
+    media_service,
+    quota_service as quota_service_module,
+)
+from app.services.github_service import GitHubService  # noqa: E402
+from app.services.quota_service import QuotaService  # noqa: E402
+
+# 1x1 PNG
+_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+_PATCHED_MODULES = [github_service_module, github_oauth, linux_do_oauth, media_service, quota_service_module]
+
+
+def _stub_routes() -> dict[str, tuple[bytes, bytes]]:
+    now = int(time.time())
+
+    def as_json(data) -> tuple[bytes, bytes]:
+        return json.dumps(data).encode(), b"application/json"
+
+    return {
+        "/repos/o/r": as_json({"id": 1, "full_name": "o/r", "stargazers_count": 3}),
+        "/repos/o/r/commits": as_json([{"sha": f"{i:040x}", "commit": {"message": "m"}} for i in range(30)]),
+        "/repos/o/r/commits/abc": as_json({"sha": "abc", "stats": {"additions": 10, "deletions": 2}, "files": []}),
+        "/rate_limit": as_json({"rate": {"limit": 5000, "remaining": 4999, "reset": now + 3600}}),
+        "/login/oauth/access_token": as_json({"access_token": "gho_bench"}),
+        "/user": as_json({"id": 1, "login": "bench"}),
+        "/oauth2/token": as_json({"access_token": "ld_bench"}),
+        "/api/user": as_json({"id": 1, "username": "bench"}),
+        "/v1/dashboard/billing/subscription": as_json({"hard_limit_usd": 100}),
+        "/v1/dashboard/billing/usage": as_json({"total_usage": 1234}),
+        "/api/log/token": as_json({"success": True, "data": [{"created_at": now, "quota": 5000}]}),
+        "/avatar.png": (_PNG, b"image/png"),
+    }
+
+
+def _make_stub_app():
+    routes = _stub_routes()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body, content_type = routes.get(scope["path"], (b"{}", b"application/json"))
+        status = 200 if scope["path"] in routes else 404
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def _point_integrations_at(base: str) -> tuple[GitHubService, QuotaService]:
+    """把各集成的上游地址指向桩服务"""
+    settings.GITHUB_CLIENT_ID = settings.GITHUB_CLIENT_ID or "bench"
+    settings.GITHUB_CLIENT_SECRET = settings.GITHUB_CLIENT_SECRET or "bench"
+    settings.GITHUB_TOKEN_URL = f"{base}/login/oauth/access_token"
+    settings.GITHUB_USERINFO_URL = f"{base}/user"
+    settings.LINUX_DO_CLIENT_ID = settings.LINUX_DO_CLIENT_ID or "bench"
+    settings.LINUX_DO_CLIENT_SECRET = settings.LINUX_DO_CLIENT_SECRET or "bench"
+    settings.LINUX_DO_REDIRECT_URI = settings.LINUX_DO_REDIRECT_URI or f"{base}/callback"
+    settings.LINUX_DO_TOKEN_URL = f"{base}/oauth2/token"
+    settings.LINUX_DO_USERINFO_URL = f"{base}/api/user"
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix="bench_media_")
+
+    github = GitHubService()
+    github.BASE_URL = base
+    quota = QuotaService()
+    quota.base_urls = [base]
+    quota.query_order = ["openai"]
+    quota.shared_cache_enabled = False
+    return github, quota
+
+
+def _integrations(base: str, github: GitHubService, quota: QuotaService) -> dict[str, Callable[[int], Awaitable]]:
+    async def github_api(_: int):
+        await github.get_repo_info("o", "r")
+        await github.get_commits("o", "r")
+        await github.get_commit_detail("o", "r", "abc")
+        await github.get_rate_limit()
+
+    async def github_oauth_flow(_: int):
+        token = await github_oauth.exchange_code_for_token("code")
+        await github_oauth.fetch_github_userinfo(token)
+
+    async def linux_do_flow(_: int):
+        token = await linux_do_oauth.exchange_code_for_token("code")
+        await linux_do_oauth.fetch_linuxdo_userinfo(token)
+
+    async def quota_query(i: int):
+        # 每次使用不同的 key，绕过缓存直达上游（subscription + usage + log 三次请求）
+        await quota.get_quota(f"sk-bench-{i}")
+
+    async def online_status(i: int):
+        await quota.get_online_status(f"sk-bench-online-{i}")
+
+    async def media_download(_: int):
+        await media_service.download_image_to_media(f"{base}/avatar.png", "avatars", 1024 * 1024)
+
+    return {
+        "github_api(4 req)": github_api,
+        "github_oauth(2 req)": github_oauth_flow,
+        "linux_do_oauth(2 req)": linux_do_flow,
+        "quota(3 req)": quota_query,
+        "online_status(1 req)": online_status,
+        "media(1 req)": media_download,
+    }
+
+
+class _PerCallClients:
+    """模拟旧实现：每次获取客户端都新建（结束后统一关闭）"""
+
+    def __init__(self):
+        self.clients: list[httpx.AsyncClient] = []
+
+    def __call__(self, name: str) -> httpx.AsyncClient:
+        client = http_client._build_client(name)
+        self.clients.append(client)
+        return client
+
+    async def close(self) -> None:
+        for client in self.clients:
+            await client.aclose()
+        self.clients.clear()
+
+
+async def _run(func: Callable[[int], Awaitable], total: int, concurrency: int) -> tuple[float, int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    seq = count()
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with semaphore:
+            try:
+                await func(next(seq))
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    return time.perf_counter() - started, errors
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="每个集成的调用次数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    server = uvicorn.Server(uvicorn.Config(
+        _make_stub_app(), host="127.0.0.1", port=args.port, log_level="warning", lifespan="off"
+    ))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base = f"http://127.0.0.1:{args.port}"
+    github, quota = _point_integrations_at(base)
+    integrations = _integrations(base, github, quota)
+    per_call = _PerCallClients()
+
+    print(f"{'integration':<24}{'mode':<10}{'calls/s':>10}{'avg ms':>10}{'errors':>8}")
+    try:
+        for label, func in integrations.items():
+            for mode in ("per-call", "shared"):
+                getter = per_call if mode == "per-call" else http_client.get_http_client
+                for module in _PATCHED_MODULES:
+                    module.get_http_client = getter
+                quota._cache = type(quota._cache)(quota.MAX_CACHE_ENTRIES)
+                quota._online_cache = type(quota._online_cache)(quota.MAX_CACHE_ENTRIES)
+
+                elapsed, errors = await _run(func, args.requests, args.concurrency)
+                print(
+                    f"{label:<24}{mode:<10}{args.requests / elapsed:>10.1f}"
+                    f"{elapsed / args.requests * args.concurrency * 1000:>10.2f}{errors:>8}"
+                )
+                await per_call.close()
+    finally:
+        for module in _PATCHED_MODULES:
+            module.get_http_client = http_client.get_http_client
+        await http_client.shutdown_http_clients()
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,157 @@
+"""
+竞猜结算基准测试
+
+在测试库中构造指定规模的已关闭竞猜（两个选项、随机下注），测量 settle_market 的耗时，
+并校验结算后余额增量与账本、奖金总额一致。会创建 bench_settle_* 测试用户，
+请勿在生产库运行。
+
+用法（在 backend 目录下）：
+    python scripts/bench_prediction_settle.py --bets 1000 10000 100000 --users 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select  # noqa: E402
+
+from app.core.database import AsyncSessionLocal, engine  # noqa: E402
+from app.models.points import (  # noqa: E402
+    BetStatus,
+    MarketStatus,
+    PointsLedger,
+    PointsReason,
+    PredictionBet,
+    PredictionMarket,
+    PredictionOption,
+    UserPoints,
+)
+from app.models.user import User  # noqa: E402
+from app.services.prediction_service import PredictionService  # noqa: E402
+
+USER_PREFIX = "bench_settle_"
+INSERT_BATCH = 5000
+
+
+async def _ensure_users(count: int) -> list[int]:
+    async with AsyncSessionLocal() as db:
+        existing = (
+            await db.execute(select(func.count(User.id)).where(User.username.like(f"{USER_PREFIX}%")))
+        ).scalar() or 0
+        for start in range(existing, count, INSERT_BATCH):
+            await db.execute(
+                insert(User).prefix_with("IGNORE").values([
+                    {"username": f"{USER_PREFIX}{index}", "role_selected": False}
+                    for index in range(start, min(count, start + INSERT_BATCH))
+                ])
+            )
+        await db.commit()
+        result = await db.execute(
+            select(User.id).where(User.username.like(f"{USER_PREFIX}%")).order_by(User.id).limit(count)
+        )
+        return list(result.scalars().all())
+
+
+async def _create_market(bet_count: int, user_ids: list[int]) -> tuple[int, int]:
+    """创建已关闭的竞猜与下注，返回 (market_id, 赢家选项ID)"""
+    async with AsyncSessionLocal() as db:
+        market = PredictionMarket(
+            title=f"bench settle {bet_count}",
+            status=MarketStatus.CLOSED,
+            fee_rate=Decimal("0.05"),
+            total_pool=0,
+        )
+        db.add(market)
+        await db.flush()
+        options = [PredictionOption(market_id=market.id, label=label) for label in ("A", "B")]
+        db.add_all(options)
+        await db.flush()
+
+        total_pool = 0
+        for start in range(0, bet_count, INSERT_BATCH):
+            rows = []
+            for _ in range(start, min(bet_count, start + INSERT_BATCH)):
+                stake = random.randint(10, 500)
+                total_pool += stake
+                rows.append({
+                    "market_id": market.id,
+                    "option_id": random.choice(options).id,
+                    "user_id": random.choice(user_ids),
+                    "stake_points": stake,
+                    "status": BetStatus.PLACED,
+                })
+            await db.execute(insert(PredictionBet).values(rows))
+        market.total_pool = total_pool
+        await db.commit()
+        return market.id, options[0].id
+
+
+async def _total_balance(user_ids: list[int]) -> int:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(func.coalesce(func.sum(UserPoints.balance), 0)).where(UserPoints.user_id.in_(user_ids))
+        )
+        return int(result.scalar() or 0)
+
+
+async def _ledger_total(market_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        bet_ids = select(PredictionBet.id).where(PredictionBet.market_id == market_id)
+        result = await db.execute(
+            select(func.coalesce(func.sum(PointsLedger.amount), 0)).where(
+                PointsLedger.reason == PointsReason.BET_PAYOUT,
+                PointsLedger.ref_type == "prediction_bet",
+                PointsLedger.ref_id.in_(bet_ids),
+            )
+        )
+        return int(result.scalar() or 0)
+
+
+async def _cleanup(market_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(PredictionMarket).where(PredictionMarket.id == market_id))
+        await db.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bets", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--users", type=int, default=20000, help="参与用户数上限")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="保留测试竞猜数据")
+    args = parser.parse_args()
+
+    user_ids = await _ensure_users(args.users)
+    try:
+        for bet_count in args.bets:
+            market_id, winner_option_id = await _create_market(bet_count, user_ids)
+            before = await _total_balance(user_ids)
+
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                stats = await PredictionService.settle_market(
+                    db, market_id, [winner_option_id], chunk_size=args.chunk_size
+                )
+            elapsed = time.perf_counter() - started
+
+            credited = await _total_balance(user_ids) - before
+            ledger = await _ledger_total(market_id)
+            consistent = credited == ledger == stats["total_payout"]
+            print(
+                f"bets={bet_count:<8} winners={stats['winner_count']:<8} losers={stats['loser_count']:<8} "
+                f"payout={stats['total_payout']:<10} time={elapsed:8.3f}s  "
+                f"{'一致' if consistent else f'不一致 credited={credited} ledger={ledger}'}"
+            )
+            if not args.keep:
+                await _cleanup(market_id)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
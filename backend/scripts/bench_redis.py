@@ -0,0 +1,125 @@
+"""
+Redis 访问基准测试
+
+对比 guard_challenge 与 commit_upload_quota 在旧实现（每次调用新建连接、逐条命令）
+与当前实现（共享连接池 + Lua 单次往返）下的延迟。需要可访问的 REDIS_URL。
+
+用法（在 backend 目录下）：
+    python scripts/bench_redis.py --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redis.asyncio import Redis  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.redis import init_redis, shutdown_redis  # noqa: E402
+from app.services import security_challenge  # noqa: E402
+from app.services.upload_quota import _build_quota_key, commit_upload_quota  # noqa: E402
+
+
+async def _legacy_guard_challenge(scope: str, identifier: str) -> None:
+    """旧实现：_has_passed 与 _increment_counter 各自建连，INCR/EXPIRE 分两次往返"""
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        passed = await client.get(security_challenge._pass_key(scope, identifier))
+    finally:
+        await client.aclose()
+    if passed:
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        key = security_challenge._counter_key(scope, identifier)
+        count = await client.incr(key)
+        if count == 1:
+            await client.expire(key, settings.SECURITY_CHALLENGE_WINDOW_SECONDS)
+    finally:
+        await client.aclose()
+
+
+async def _legacy_commit_upload_quota(user_id: int, scope: str, size_bytes: int) -> None:
+    """旧实现：每次建连，INCRBY/EXPIRE/DECRBY 逐条发送"""
+    from datetime import datetime
+
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        key, ttl_seconds = _build_quota_key(scope, user_id, datetime.utcnow())
+        total = await client.incrby(key, size_bytes)
+        if total == size_bytes:
+            await client.expire(key, ttl_seconds)
+        if total > settings.UPLOAD_DAILY_BYTES_LIMIT:
+            await client.decrby(key, size_bytes)
+    finally:
+        await client.aclose()
+
+
+def _build_request() -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/bench",
+        "headers": [],
+        "query_string": b"",
+        "client": ("127.0.0.1", 12345),
+    })
+
+
+async def _measure(label: str, func, iterations: int) -> None:
+    for _ in range(min(100, iterations)):
+        await func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<36}p50={statistics.median(samples):8.3f}ms  p99={p99:8.3f}ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    # 监控模式 + 极高阈值：只走计数路径，不会真正下发挑战
+    settings.SECURITY_CHALLENGE_MODE = "monitor"
+    settings.SECURITY_CHALLENGE_THRESHOLD = 1 << 30
+    settings.UPLOAD_DAILY_BYTES_LIMIT = 1 << 62
+
+    await init_redis()
+    request = _build_request()
+    try:
+        await _measure(
+            "guard_challenge (before)",
+            lambda: _legacy_guard_challenge("bench", "ip:127.0.0.1"),
+            args.iterations,
+        )
+        await _measure(
+            "guard_challenge (after)",
+            lambda: security_challenge.guard_challenge(request, scope="bench"),
+            args.iterations,
+        )
+        await _measure(
+            "commit_upload_quota (before)",
+            lambda: _legacy_commit_upload_quota(-1, "bench", 1),
+            args.iterations,
+        )
+        await _measure(
+            "commit_upload_quota (after)",
+            lambda: commit_upload_quota(-2, "bench", 1),
+            args.iterations,
+        )
+    finally:
+        await shutdown_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+请求日志中间件基准测试
+
+对比 BaseHTTPMiddleware 旧实现与纯 ASGI 实现的单请求额外开销（p50/p99）。
+日志入队被替换为空操作，只测量中间件本身。
+
+用法（在 backend 目录下）：
+    python scripts/bench_request_logger.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import FileResponse  # noqa: E402
+
+from app.middleware import request_logger  # noqa: E402
+from app.middleware import BaseHTTPRequestLoggerMiddleware, RequestLoggerMiddleware  # noqa: E402
+
+
+def _build_app(middleware_cls, file_path: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/api/v1/file")
+    async def file():
+        return FileResponse(file_path)
+
+    if middleware_cls is not None:
+        app.add_middleware(middleware_cls)
+    return app
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _measure(app: FastAPI, path: str, total: int, warmup: int) -> list[float]:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"User-Agent": "bench", "X-Forwarded-For": "10.0.0.1"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(warmup):
+            await client.get(path, headers=headers)
+        samples = []
+        for _ in range(total):
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            samples.append((time.perf_counter() - started) * 1_000_000)
+            response.raise_for_status()
+    return samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--file-size", type=int, default=1024 * 1024, help="流式文件大小（字节）")
+    args = parser.parse_args()
+
+    # 只测中间件开销，不写数据库
+    request_logger.request_log_buffer.enqueue = lambda row: True
+
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(args.file_size))
+        file_path = tmp.name
+
+    variants = [
+        ("none", None),
+        ("basehttp", BaseHTTPRequestLoggerMiddleware),
+        ("asgi", RequestLoggerMiddleware),
+    ]
+    try:
+        for path in ("/api/v1/ping", "/api/v1/file"):
+            results = {}
+            for name, cls in variants:
+                results[name] = await _measure(_build_app(cls, file_path), path, args.requests, args.warmup)
+
+            base_p50 = statistics.median(results["none"])
+            base_p99 = _percentile(results["none"], 99)
+            print(f"\n{path}  ({args.requests} requests, 单位 µs)")
+            print(f"{'variant':<10}{'p50':>10}{'p99':>10}{'+p50':>10}{'+p99':>10}")
+            for name, _ in variants:
+                p50 = statistics.median(results[name])
+                p99 = _percentile(results[name], 99)
+                print(f"{name:<10}{p50:>10.1f}{p99:>10.1f}{p50 - base_p50:>10.1f}{p99 - base_p99:>10.1f}")
+    finally:
+        os.unlink(file_path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
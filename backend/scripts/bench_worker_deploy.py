@@ -0,0 +1,200 @@
+"""
+部署流水线基准测试（本地假 Docker）
+
+用假 Docker 客户端替换 Worker 的 Docker 连接：拉取镜像按 --pull-seconds 计时，
+"启动容器" 会在 --boot-seconds 后于本机随机端口开始监听 HTTP（模拟应用启动），
+状态回写与指标上报替换为空操作。分别以「固定间隔探测（旧参数）」与「指数退避 + TCP 快速路径」
+执行同一组部署（首次部署 + 重部署），输出上线耗时与各阶段耗时。
+
+用法（在 backend 目录下）：
+    python scripts/bench_worker_deploy.py --deploys 5 --boot-seconds 1.5 --pull-seconds 3
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from docker.errors import ImageNotFound, NotFound  # noqa: E402
+
+from app import worker  # noqa: E402
+from app.core.config import settings  # noqa: E402
+
+
+class _FakeImages:
+    def __init__(self, pull_seconds: float):
+        self.pull_seconds = pull_seconds
+        self.local: dict[str, str] = {}
+
+    def get(self, image_ref: str):
+        image_id = self.local.get(image_ref)
+        if image_id is None:
+            raise ImageNotFound(image_ref)
+        return SimpleNamespace(id=image_id, attrs={"Size": 0})
+
+    def pull(self, image_ref: str):
+        time.sleep(self.pull_seconds)
+        self.local[image_ref] = f"sha256:{abs(hash(image_ref)):064x}"[:71]
+        return self.get(image_ref)
+
+
+class _FakeContainer:
+    def __init__(self, containers: "_FakeContainers", name: str, labels: dict, port: int):
+        self._containers = containers
+        self.name = name
+        self.labels = labels
+        self.port = port
+        self.attrs = {"Image": ""}
+
+    def remove(self, force: bool = False):
+        if self._containers.items.pop(self.name, None) is None:
+            raise NotFound(self.name)
+        self._containers.stop_app(self)
+
+
+class _FakeContainers:
+    def __init__(self, loop: asyncio.AbstractEventLoop, boot_seconds: float):
+        self.loop = loop
+        self.boot_seconds = boot_seconds
+        self.items: dict[str, _FakeContainer] = {}
+        self.servers: dict[str, asyncio.AbstractServer] = {}
+        self.ports = itertools.count(19100)
+
+    def get(self, name: str):
+        container = self.items.get(name)
+        if container is None:
+            raise NotFound(name)
+        return container
+
+    def list(self, all: bool = False, filters: dict | None = None):
+        label = (filters or {}).get("label")
+        if not label:
+            return list(self.items.values())
+        key, _, value = label.partition("=")
+        return [c for c in self.items.values() if c.labels.get(key) == value]
+
+    def run(self, image_ref: str, **kwargs):
+        container = _FakeContainer(self, kwargs["name"], kwargs.get("labels") or {}, next(self.ports))
+        self.items[container.name] = container
+        asyncio.run_coroutine_threadsafe(self._boot(container), self.loop)
+        return container
+
+    async def _boot(self, container: _FakeContainer):
+        await asyncio.sleep(self.boot_seconds)
+        if container.name not in self.items:
+            return
+
+        async def handle(reader, writer):
+            await reader.read(1024)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+            await writer.drain()
+            writer.close()
+
+        self.servers[container.name] = await asyncio.start_server(handle, "127.0.0.1", container.port)
+
+    def stop_app(self, container: _FakeContainer):
+        server = self.servers.pop(container.name, None)
+        if server is not None:
+            self.loop.call_soon_threadsafe(server.close)
+
+
+class _FakeDocker:
+    def __init__(self, loop: asyncio.AbstractEventLoop, boot_seconds: float, pull_seconds: float):
+        self.images = _FakeImages(pull_seconds)
+        self.containers = _FakeContainers(loop, boot_seconds)
+        self.networks = SimpleNamespace(get=lambda name: SimpleNamespace(name=name))
+
+    def close(self):
+        pass
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def _patch_worker(fake: _FakeDocker) -> None:
+    settings.WORKER_DEPLOY_NETWORK = "bench"
+    settings.WORKER_STATUS_WRITE_MODE = "db"
+    worker._docker_client = lambda: fake
+    worker._write_status_db = _noop
+    worker.touch_cached_image = _noop
+    worker.incr_worker_counter = _noop
+    worker._probe_address = lambda name: ("127.0.0.1", fake.containers.items[name].port)
+
+    async def load_target(submission_id: int):
+        return worker.DeployTarget(
+            submission_id=submission_id,
+            project_id=submission_id,
+            image_ref=f"ghcr.io/bench/app-{submission_id}@sha256:{submission_id:064d}",
+            domain=f"project-{submission_id}.bench",
+            current_submission_id=submission_id,
+        )
+
+    worker._load_deploy_target = load_target
+
+
+def _apply_profile(name: str, base: dict) -> None:
+    for key, value in base.items():
+        setattr(settings, key, value)
+    if name == "fixed":
+        # 旧行为：HTTP 探测，固定间隔
+        settings.WORKER_HEALTHCHECK_ENABLED = True
+        settings.WORKER_HEALTHCHECK_TCP_ENABLED = False
+        settings.WORKER_HEALTHCHECK_INITIAL_INTERVAL_SECONDS = float(settings.WORKER_HEALTHCHECK_INTERVAL_SECONDS)
+        settings.WORKER_HEALTHCHECK_MAX_INFLIGHT = 1
+    else:
+        settings.WORKER_HEALTHCHECK_ENABLED = True
+        settings.WORKER_HEALTHCHECK_TCP_ENABLED = True
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deploys", type=int, default=5, help="每种策略部署的提交数（每个提交部署两次）")
+    parser.add_argument("--boot-seconds", type=float, default=1.5, help="模拟应用启动耗时")
+    parser.add_argument("--pull-seconds", type=float, default=3.0, help="模拟镜像拉取耗时")
+    args = parser.parse_args()
+
+    fake = _FakeDocker(asyncio.get_running_loop(), args.boot_seconds, args.pull_seconds)
+    _patch_worker(fake)
+    base = {
+        "WORKER_HEALTHCHECK_INTERVAL_SECONDS": settings.WORKER_HEALTHCHECK_INTERVAL_SECONDS,
+        "WORKER_HEALTHCHECK_INITIAL_INTERVAL_SECONDS": settings.WORKER_HEALTHCHECK_INITIAL_INTERVAL_SECONDS,
+        "WORKER_HEALTHCHECK_MAX_INFLIGHT": settings.WORKER_HEALTHCHECK_MAX_INFLIGHT,
+    }
+
+    print(f"{'profile':<10}{'deploy':<10}{'online s':>10}{'pull s':>10}{'ready s':>10}{'switch ms':>11}")
+    submission_ids = itertools.count(1)
+    async with httpx.AsyncClient() as client:
+        for profile in ("fixed", "adaptive"):
+            _apply_profile(profile, base)
+            results: dict[str, list[dict]] = {"first": [], "redeploy": []}
+            for _ in range(args.deploys):
+                submission_id = next(submission_ids)
+                for kind in ("first", "redeploy"):
+                    timings: dict[str, float] = {}
+                    started = time.perf_counter()
+                    await worker._process_submission(client, submission_id, timings)
+                    timings["online"] = time.perf_counter() - started
+                    results[kind].append(timings)
+
+            for kind, rows in results.items():
+                print(
+                    f"{profile:<10}{kind:<10}"
+                    f"{statistics.mean(r['online'] for r in rows):>10.2f}"
+                    f"{statistics.mean(r['pull'] for r in rows):>10.2f}"
+                    f"{statistics.mean(r['healthcheck'] for r in rows):>10.2f}"
+                    f"{statistics.mean(r['switch'] for r in rows) * 1000:>11.1f}"
+                )
+
+    for container in list(fake.containers.items.values()):
+        container.remove(force=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
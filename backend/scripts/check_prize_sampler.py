@@ -0,0 +1,128 @@
+"""
+校验别名表抽样分布与权重一致（卡方拟合优度检验）
+
+对每组权重抽样 N 次，计算卡方统计量并与显著性水平 0.001 的临界值比较（Wilson–Hilferty 近似），
+同时检查权重为 0 的项从未被抽中。默认校验一组内置权重；--game 时改为校验数据库中当前生效的奖池。
+
+用法（在 backend 目录下）：
+    python scripts/check_prize_sampler.py                        # 内置权重组
+    python scripts/check_prize_sampler.py --weights 1,10,100,0 --samples 2000000
+    python scripts/check_prize_sampler.py --game lottery          # 当前抽奖/刮刮乐/扭蛋机/老虎机奖池
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.prize_sampler import AliasTable  # noqa: E402
+
+# 标准正态分布上 0.001 分位点
+Z_999 = 3.0902
+
+BUILTIN_WEIGHTS = {
+    "均匀": [1, 1, 1, 1, 1, 1],
+    "常见奖池": [5000, 3000, 1500, 400, 90, 10],
+    "极度倾斜": [1_000_000, 1],
+    "含零权重": [30, 0, 50, 0, 20],
+    "小数权重": [0.5, 1.25, 3.75, 2.5],
+    "单项": [7],
+}
+
+
+def chi_square_critical(df: int) -> float:
+    """卡方分布 0.999 分位点（Wilson–Hilferty 近似）"""
+    factor = 2 / (9 * df)
+    return df * (1 - factor + Z_999 * math.sqrt(factor)) ** 3
+
+
+def check_weights(name: str, weights: list, samples: int, rng: random.Random) -> bool:
+    table = AliasTable(weights)
+    counts = Counter(table.sample(rng.random) for _ in range(samples))
+    total = sum(max(0.0, float(w)) for w in weights)
+
+    zero_hits = sum(counts[i] for i, w in enumerate(weights) if float(w) <= 0)
+    positive = [i for i, w in enumerate(weights) if float(w) > 0]
+    statistic = 0.0
+    for index in positive:
+        expected = samples * float(weights[index]) / total
+        statistic += (counts[index] - expected) ** 2 / expected
+
+    df = len(positive) - 1
+    if df == 0:
+        passed = zero_hits == 0 and counts[positive[0]] == samples
+        print(f"[{'通过' if passed else '失败'}] {name}: 单一可抽项，命中 {counts[positive[0]]}/{samples}")
+        return passed
+
+    critical = chi_square_critical(df)
+    passed = statistic <= critical and zero_hits == 0
+    print(
+        f"[{'通过' if passed else '失败'}] {name}: 卡方={statistic:.2f}，临界值={critical:.2f}（自由度 {df}），"
+        f"零权重命中 {zero_hits}"
+    )
+    for index, weight in enumerate(weights):
+        expected = float(weight) / total
+        print(f"    #{index} 权重 {weight}: 期望 {expected:.6f}，实际 {counts[index] / samples:.6f}")
+    return passed
+
+
+async def _load_game_weights(game: str) -> dict:
+    """读取数据库中当前生效的奖池权重（与抽奖使用同一份预编译快照）"""
+    from app.core.database import AsyncSessionLocal
+    from app.api.v1.endpoints.gacha import _load_active_config as load_gacha_config
+    from app.services.lottery_service import _load_lottery_configs
+    from app.services.slot_machine_service import SlotMachineService
+
+    pools = {}
+    async with AsyncSessionLocal() as db:
+        if game == "lottery":
+            for config in await _load_lottery_configs(db):
+                if config.sampler is not None:
+                    pools[f"抽奖配置 {config.id} {config.name}"] = [p.weight for p in config.sampler.items]
+        elif game == "gacha":
+            config = await load_gacha_config(db)
+            if config is not None and config.sampler is not None:
+                pools[f"扭蛋机配置 {config.id} {config.name}"] = [p.weight for p in config.sampler.items]
+        else:
+            config = await SlotMachineService._load_cached_config(db)
+            if config is not None and config.sampler is not None:
+                pools[f"老虎机配置 {config.id} {config.name}"] = [s.weight for s in config.sampler.items]
+    return pools
+
+
+def _parse_weights(value: str) -> list:
+    return [float(item) for item in value.split(",") if item.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", type=_parse_weights, default=None, help="逗号分隔的权重")
+    parser.add_argument("--game", choices=["lottery", "gacha", "slot_machine"], default=None, help="校验数据库中的奖池")
+    parser.add_argument("--samples", type=int, default=1_000_000, help="每组抽样次数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（复现用）")
+    args = parser.parse_args()
+
+    if args.weights:
+        pools = {"自定义": args.weights}
+    elif args.game:
+        pools = asyncio.run(_load_game_weights(args.game))
+        if not pools:
+            print("没有可校验的奖池")
+            return
+    else:
+        pools = BUILTIN_WEIGHTS
+
+    rng = random.Random(args.seed)
+    results = [check_weights(name, weights, args.samples, rng) for name, weights in pools.items()]
+    failed = results.count(False)
+    print(f"完成：{len(results)} 组，失败 {failed} 组")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+投票计数压测
+
+对运行中的 API 并发发送 POST/DELETE /votes/{id}（含重复投票与重复取消），
+结束后对比 submissions.vote_count 与 votes 表 COUNT(*)，验证计数缓存不漂移。
+需要与服务端一致的 SECRET_KEY / DATABASE_URL，且比赛处于投票阶段；
+投票接口有限流，压测环境建议关闭 RATE_LIMIT_ENABLED 或使用足够多的用户。
+
+用法（在 backend 目录下）：
+    python scripts/load_test_votes.py --base-url http://localhost:8000 \\
+        --submission-id 1 --user-ids 2-201 --rounds 20 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.core.database import AsyncSessionLocal, engine  # noqa: E402
+from app.core.security import create_access_token  # noqa: E402
+from app.models.submission import Submission  # noqa: E402
+from app.models.vote import Vote  # noqa: E402
+
+
+def _parse_user_ids(value: str) -> list[int]:
+    user_ids: list[int] = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            user_ids.extend(range(int(start), int(end) + 1))
+        else:
+            user_ids.append(int(part))
+    return user_ids
+
+
+async def _hammer_user(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    url: str,
+    token: str,
+    rounds: int,
+    statuses: Counter,
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(rounds):
+        # 随机投票/取消，并以一定概率并发重复请求，覆盖重复投票与唯一约束冲突路径
+        method = random.choice(("POST", "DELETE"))
+        burst = 2 if random.random() < 0.3 else 1
+        async with semaphore:
+            responses = await asyncio.gather(
+                *[client.request(method, url, headers=headers) for _ in range(burst)],
+                return_exceptions=True,
+            )
+        for response in responses:
+            if isinstance(response, Exception):
+                statuses[type(response).__name__] += 1
+            else:
+                statuses[f"{method} {response.status_code}"] += 1
+
+
+async def _read_counts(submission_id: int) -> tuple[int, int]:
+    async with AsyncSessionLocal() as db:
+        cached = await db.scalar(select(Submission.vote_count).where(Submission.id == submission_id))
+        actual = await db.scalar(select(func.count(Vote.id)).where(Vote.submission_id == submission_id))
+    return int(cached or 0), int(actual or 0)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--submission-id", type=int, required=True)
+    parser.add_argument("--user-ids", required=True, help="投票用户 ID，如 2-201 或 2,3,5")
+    parser.add_argument("--rounds", type=int, default=20, help="每个用户的操作次数")
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    user_ids = _parse_user_ids(args.user_ids)
+    if not user_ids:
+        parser.error("--user-ids 不能为空")
+
+    url = f"{args.base_url.rstrip('/')}/api/v1/votes/{args.submission_id}"
+    tokens = [create_access_token({"sub": str(user_id), "provider": "local"}) for user_id in user_ids]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses: Counter = Counter()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+            await asyncio.gather(*[
+                _hammer_user(client, semaphore, url, token, args.rounds, statuses)
+                for token in tokens
+            ])
+
+        cached, actual = await _read_counts(args.submission_id)
+    finally:
+        await engine.dispose()
+
+    print("请求结果：")
+    for key, count in sorted(statuses.items()):
+        print(f"  {key:<24}{count}")
+    print(f"vote_count={cached}  COUNT(*)={actual}")
+    if cached != actual:
+        print("计数不一致")
+        sys.exit(1)
+    print("计数一致")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
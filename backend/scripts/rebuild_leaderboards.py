@@ -0,0 +1,57 @@
+"""
+重建排行榜缓存
+
+从 MySQL 重新计算热力榜、欧皇榜、码神挑战榜并写入 Redis 有序集合，
+用于数据修复或 Redis 清空后的预热。
+
+用法（在 backend 目录下）：
+    python scripts/rebuild_leaderboards.py                  # 全部榜单（热力榜为所有比赛）
+    python scripts/rebuild_leaderboards.py --board heat --contest-id 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+
+from app.core.database import AsyncSessionLocal, engine  # noqa: E402
+from app.core.redis import init_redis, shutdown_redis  # noqa: E402
+from app.models.contest import Contest  # noqa: E402
+from app.services import leaderboard_service  # noqa: E402
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--board",
+        choices=[leaderboard_service.HEAT, leaderboard_service.LUCKY, leaderboard_service.PUZZLE, "all"],
+        default="all",
+    )
+    parser.add_argument("--contest-id", type=int, default=None, help="只重建指定比赛的热力榜")
+    args = parser.parse_args()
+
+    await init_redis()
+    try:
+        async with AsyncSessionLocal() as db:
+            if args.board in (leaderboard_service.HEAT, "all"):
+                if args.contest_id is not None:
+                    contest_ids = [args.contest_id]
+                else:
+                    contest_ids = (await db.execute(select(Contest.id))).scalars().all()
+                for contest_id in contest_ids:
+                    count = await leaderboard_service.rebuild(leaderboard_service.HEAT, contest_id)
+                    print(f"heat contest={contest_id}: {count}")
+            for board in (leaderboard_service.LUCKY, leaderboard_service.PUZZLE):
+                if args.board in (board, "all"):
+                    count = await leaderboard_service.rebuild(board)
+                    print(f"{board}: {count}")
+    finally:
+        await shutdown_redis()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,13 @@
+-- ============================================================================
+-- 请求日志补充数据库开销字段
+-- 数据库: MySQL 8.x
+-- 描述: request_logs 新增 db_query_count / db_time_ms，用于定位 N+1 接口
+-- ============================================================================
+
+USE `chicken_king`;
+
+ALTER TABLE `request_logs`
+  ADD COLUMN `db_query_count` INT NULL COMMENT 'SQL 条数' AFTER `response_time_ms`,
+  ADD COLUMN `db_time_ms` INT NULL COMMENT 'SQL 累计耗时(毫秒)' AFTER `db_query_count`;
+
+SELECT '036_request_log_db_metrics.sql 迁移完成' AS message;
@@ -0,0 +1,50 @@
+-- ============================================================================
+-- 作品评分汇总（排行榜物化数据）
+-- 数据库: MySQL 8.x
+-- 描述: 新增 project_review_stats 表，并按现有评分回填
+-- ============================================================================
+
+USE `chicken_king`;
+
+CREATE TABLE IF NOT EXISTS `project_review_stats` (
+  `project_id` INT NOT NULL COMMENT '关联作品ID',
+  `contest_id` INT NOT NULL COMMENT '关联比赛ID',
+  `review_count` INT NOT NULL DEFAULT 0 COMMENT '评分数量',
+  `score_sum` INT NOT NULL DEFAULT 0 COMMENT '评分总和',
+  `score_min` INT NULL COMMENT '最低分',
+  `score_max` INT NULL COMMENT '最高分',
+  `final_score` DECIMAL(6,2) NULL COMMENT '最终得分（去掉最高最低后的平均分）',
+  `updated_at` DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`project_id`),
+  KEY `ix_project_review_stats_rank` (`contest_id`, `final_score`, `review_count`, `project_id`),
+  CONSTRAINT `fk_project_review_stats_project_id`
+    FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`)
+    ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='作品评分汇总表';
+
+-- 回填现有评分
+INSERT INTO `project_review_stats`
+  (`project_id`, `contest_id`, `review_count`, `score_sum`, `score_min`, `score_max`, `final_score`)
+SELECT
+  p.`id`,
+  p.`contest_id`,
+  COUNT(r.`id`),
+  SUM(r.`score`),
+  MIN(r.`score`),
+  MAX(r.`score`),
+  CASE
+    WHEN COUNT(r.`id`) >= 3 THEN ROUND((SUM(r.`score`) - MAX(r.`score`) - MIN(r.`score`)) / (COUNT(r.`id`) - 2), 2)
+    ELSE ROUND(AVG(r.`score`), 2)
+  END
+FROM `projects` p
+JOIN `project_reviews` r ON r.`project_id` = p.`id`
+GROUP BY p.`id`, p.`contest_id`
+ON DUPLICATE KEY UPDATE
+  `contest_id` = VALUES(`contest_id`),
+  `review_count` = VALUES(`review_count`),
+  `score_sum` = VALUES(`score_sum`),
+  `score_min` = VALUES(`score_min`),
+  `score_max` = VALUES(`score_max`),
+  `final_score` = VALUES(`final_score`);
+
+SELECT '037_project_review_stats.sql 迁移完成' AS message;
@@ -0,0 +1,31 @@
+-- ============================================================================
+-- GitHub 提交缓存
+-- 数据库: MySQL 8.x
+-- 描述: 新增 github_commits 表，按 (仓库, sha) 缓存提交与代码行数统计，
+--       同步只增量拉取新提交，每日统计与累计数据由此表汇总
+-- ============================================================================
+
+USE `chicken_king`;
+
+CREATE TABLE IF NOT EXISTS `github_commits` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `repo_owner` VARCHAR(100) NOT NULL COMMENT '仓库所有者',
+  `repo_name` VARCHAR(100) NOT NULL COMMENT '仓库名称',
+  `sha` VARCHAR(40) NOT NULL COMMENT '提交 SHA',
+  `authored_at` DATETIME NOT NULL COMMENT '作者提交时间（UTC，用于按日统计）',
+  `committed_at` DATETIME NOT NULL COMMENT '提交者时间（UTC，用于增量拉取游标）',
+  `message` VARCHAR(200) NULL COMMENT '提交说明首行',
+  `additions` INT NOT NULL DEFAULT 0 COMMENT '新增行数',
+  `deletions` INT NOT NULL DEFAULT 0 COMMENT '删除行数',
+  `files_changed` INT NOT NULL DEFAULT 0 COMMENT '修改文件数',
+  `detail_synced` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '是否已获取详情统计',
+  `created_at` DATETIME NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_github_commits_repo_sha` (`repo_owner`, `repo_name`, `sha`),
+  KEY `ix_github_commits_repo_authored` (`repo_owner`, `repo_name`, `authored_at`),
+  KEY `ix_github_commits_repo_committed` (`repo_owner`, `repo_name`, `committed_at`),
+  KEY `ix_github_commits_pending` (`repo_owner`, `repo_name`, `detail_synced`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='GitHub 提交缓存表';
+
+SELECT '038_github_commits.sql 迁移完成' AS message;
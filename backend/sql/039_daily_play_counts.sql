@@ -0,0 +1,51 @@
+-- ============================================================================
+-- 每日游玩次数计数
+-- 数据库: MySQL 8.x
+-- 描述: 新增 daily_play_counts 表，按 (用户, 玩法, 配置, 日期) 记录当日次数，
+--       作为 Redis 日限计数的持久化兜底（Redis 键丢失时据此恢复，Redis 不可用时直接用于校验），
+--       抽奖/刮刮乐/扭蛋机/老虎机的日限校验不再对记录表做 COUNT(*)
+-- ============================================================================
+
+USE `chicken_king`;
+
+CREATE TABLE IF NOT EXISTS `daily_play_counts` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL COMMENT '用户ID',
+  `game` VARCHAR(20) NOT NULL COMMENT '玩法：lottery/scratch/gacha/slot_machine',
+  `config_id` INT NOT NULL COMMENT '玩法配置ID',
+  `play_date` DATE NOT NULL COMMENT '日期',
+  `play_count` INT NOT NULL DEFAULT 0 COMMENT '当日次数',
+  `created_at` DATETIME NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_daily_play_counts_user_game_date` (`user_id`, `game`, `config_id`, `play_date`),
+  KEY `ix_daily_play_counts_date` (`play_date`),
+  CONSTRAINT `fk_daily_play_counts_user_id` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='每日游玩次数计数表';
+
+-- 回填当天已有次数（统计口径与原 COUNT(*) 查询一致：扭蛋机只统计积分消耗的次数）
+INSERT INTO `daily_play_counts` (`user_id`, `game`, `config_id`, `play_date`, `play_count`)
+SELECT `user_id`, 'lottery', `config_id`, CURDATE(), COUNT(*)
+FROM `lottery_draws` WHERE `created_at` >= CURDATE()
+GROUP BY `user_id`, `config_id`
+ON DUPLICATE KEY UPDATE `play_count` = VALUES(`play_count`);
+
+INSERT INTO `daily_play_counts` (`user_id`, `game`, `config_id`, `play_date`, `play_count`)
+SELECT `user_id`, 'scratch', `config_id`, CURDATE(), COUNT(*)
+FROM `scratch_cards` WHERE `created_at` >= CURDATE()
+GROUP BY `user_id`, `config_id`
+ON DUPLICATE KEY UPDATE `play_count` = VALUES(`play_count`);
+
+INSERT INTO `daily_play_counts` (`user_id`, `game`, `config_id`, `play_date`, `play_count`)
+SELECT `user_id`, 'gacha', `config_id`, CURDATE(), COUNT(*)
+FROM `gacha_draws` WHERE `created_at` >= CURDATE() AND `used_ticket` = 0
+GROUP BY `user_id`, `config_id`
+ON DUPLICATE KEY UPDATE `play_count` = VALUES(`play_count`);
+
+INSERT INTO `daily_play_counts` (`user_id`, `game`, `config_id`, `play_date`, `play_count`)
+SELECT `user_id`, 'slot_machine', `config_id`, CURDATE(), COUNT(*)
+FROM `slot_machine_draws` WHERE `created_at` >= CURDATE()
+GROUP BY `user_id`, `config_id`
+ON DUPLICATE KEY UPDATE `play_count` = VALUES(`play_count`);
+
+SELECT '039_daily_play_counts.sql 迁移完成' AS message;